@@ -3,10 +3,11 @@ Admin API endpoints for Firestore backups.
 """
 import logging
 from typing import Optional
-from fastapi import APIRouter, HTTPException, status, Depends, Query
+from fastapi import APIRouter, HTTPException, Request, status, Depends, Query
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 
+from app.middleware.auth_context import get_auth_context
 from app.services.auth.firebase_auth import firebase_auth_service
 from app.services.backup import firestore_backup_service
 
@@ -58,12 +59,12 @@ class BackupHealthResponse(BaseModel):
 
 
 # Dependency for admin-only access
-async def require_admin(authorization: str = Depends()):
+async def require_admin(request: Request):
     """
     Dependency to require admin authentication.
 
     Args:
-        authorization: Authorization header with Bearer token
+        request: Current request (Authorization: Bearer <token>)
 
     Returns:
         Decoded token if admin
@@ -71,17 +72,15 @@ async def require_admin(authorization: str = Depends()):
     Raises:
         HTTPException: If not admin
     """
-    # Extract token from "Bearer <token>"
-    if not authorization or not authorization.startswith("Bearer "):
+    context = get_auth_context(request)
+    if not context.id_token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token de autenticación requerido"
         )
 
-    token = authorization.split(" ")[1]
-
-    # Verify token
-    decoded_token = await firebase_auth_service.verify_token(token)
+    # Verify token (once per request, shared via the auth context)
+    decoded_token = await context.verify_id_token()
 
     # Verify admin role
     await firebase_auth_service.verify_admin(decoded_token)
@@ -5,22 +5,22 @@ PROTECCIÓN: Rate limiting implementado en todos los endpoints.
 """
 from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.responses import JSONResponse
+import json
 import logging
 import os
 from typing import Dict, Any, Optional
-from datetime import datetime
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
 from app.services.payments.paypal_service import paypal_service
-from app.services.firestore.subscription_service import subscription_service
-from app.services.email.email_service import email_service
+from app.services.payments.webhook_processor import paypal_webhook_queue
 from app.models.schemas import AuthenticatedUser
 from app.core.dependencies import get_current_user, get_current_verified_user
-from firebase_admin import auth
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/payments", tags=["payments"])
+# Solo el webhook, para poder servirlo sin el resto de la API de pagos
+webhook_router = APIRouter(tags=["payments"])
 limiter = Limiter(key_func=get_remote_address)
 
 @router.post("/paypal/create-order")
@@ -166,12 +166,14 @@ async def get_paypal_order_details(
         logger.error(f"Error obteniendo detalles de orden {order_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/paypal/webhook")
+@webhook_router.post("/paypal/webhook")
 async def handle_paypal_webhook(request: Request):
     """
     Endpoint para recibir webhooks de PayPal.
-    
-    Maneja eventos como:
+
+    Solo verifica la firma, guarda el evento (deduplicado por su ID) y
+    responde. El procesamiento lo hace en segundo plano paypal_webhook_queue
+    (ver app/services/payments/webhook_processor.py):
     - PAYMENT.CAPTURE.COMPLETED (pago completado)
     - PAYMENT.CAPTURE.DENIED (pago rechazado)
     - PAYMENT.CAPTURE.REFUNDED (reembolso)
@@ -180,139 +182,29 @@ async def handle_paypal_webhook(request: Request):
         # Leer el cuerpo de la solicitud
         body = await request.body()
         headers = dict(request.headers)
-        
+
         # Verificar la firma del webhook
         signature_valid = await paypal_service.verify_webhook_signature(headers, body)
-        
+
         if not signature_valid:
             logger.warning("Webhook de PayPal con firma inválida")
             raise HTTPException(status_code=401, detail="Firma inválida")
-        
-        # Parsear el evento
-        event = await request.json()
-        event_type = event.get("event_type")
-        
-        logger.info(f"Webhook de PayPal recibido: {event_type}")
-        
-        # Procesar diferentes tipos de eventos
-        if event_type == "PAYMENT.CAPTURE.COMPLETED":
-            # Pago completado exitosamente
-            resource = event.get("resource", {})
-            capture_id = resource.get("id")
-            order_id = resource.get("supplementary_data", {}).get("related_ids", {}).get("order_id")
-            amount_data = resource.get("amount", {})
-            amount = amount_data.get("value")
-            currency = amount_data.get("currency_code", "EUR")
-            custom_id = resource.get("custom_id")  # Este es el user_id que pasamos en create_order
-
-            logger.info(f"Pago completado: {capture_id}, orden: {order_id}, monto: {amount} {currency}")
-
-            if custom_id:
-                try:
-                    # 1. Obtener información del usuario
-                    user = auth.get_user(custom_id)
-                    user_email = user.email
-
-                    # 2. Crear/actualizar suscripción en Firestore
-                    payment_data = {
-                        "capture_id": capture_id,
-                        "order_id": order_id,
-                        "amount": amount,
-                        "currency": currency
-                    }
-
-                    subscription_data = await subscription_service.create_subscription(
-                        user_id=custom_id,
-                        payment_data=payment_data,
-                        plan_type="premium",
-                        duration_months=1
-                    )
-
-                    logger.info(f"Suscripción creada para usuario {custom_id}: {subscription_data['id']}")
-
-                    # 3. Actualizar custom claims en Firebase Auth
-                    await subscription_service.update_custom_claims(
-                        user_id=custom_id,
-                        has_active_subscription=True
-                    )
 
-                    logger.info(f"Custom claims actualizados para usuario {custom_id}")
+        event = json.loads(body)
+        if not event.get("id"):
+            raise HTTPException(status_code=400, detail="Evento sin ID")
 
-                    # 4. Enviar email de confirmación
-                    if user_email:
-                        email_sent = await email_service.send_payment_confirmation(
-                            user_email=user_email,
-                            payment_data=payment_data,
-                            subscription_data=subscription_data
-                        )
+        # Guardar y encolar; un reintento de PayPal con el mismo ID no se reprocesa
+        accepted = await paypal_webhook_queue.accept(event)
 
-                        if email_sent:
-                            logger.info(f"Email de confirmación enviado a {user_email}")
-                        else:
-                            logger.warning(f"No se pudo enviar email de confirmación a {user_email}")
+        logger.info(f"Webhook de PayPal {'encolado' if accepted else 'duplicado'}: {event['id']} ({event.get('event_type')})")
 
-                    logger.info(f"Procesamiento completo de pago para usuario {custom_id}")
+        return JSONResponse({"status": "accepted" if accepted else "duplicate"})
 
-                except Exception as e:
-                    logger.error(f"Error procesando pago para usuario {custom_id}: {e}")
-                    # No lanzar excepción para no rechazar el webhook
-                    # PayPal reintentará si falla
-            else:
-                logger.warning(f"Webhook recibido sin custom_id (user_id). Capture: {capture_id}")
-
-        elif event_type == "PAYMENT.CAPTURE.DENIED":
-            # Pago rechazado
-            resource = event.get("resource", {})
-            custom_id = resource.get("custom_id")
-            logger.warning(f"Pago rechazado para usuario {custom_id}: {resource}")
-
-            # Aquí podrías enviar un email al usuario notificando el rechazo
-
-        elif event_type == "PAYMENT.CAPTURE.REFUNDED":
-            # Reembolso procesado
-            resource = event.get("resource", {})
-            custom_id = resource.get("custom_id")
-            refund_amount = resource.get("amount", {}).get("value")
-            refund_id = resource.get("id")
-
-            logger.info(f"Reembolso procesado para usuario {custom_id}: {refund_amount}")
-
-            if custom_id:
-                try:
-                    # 1. Cancelar suscripción
-                    refund_data = {
-                        "refund_id": refund_id,
-                        "amount": refund_amount,
-                        "refunded_at": datetime.now()
-                    }
-
-                    await subscription_service.cancel_subscription(
-                        user_id=custom_id,
-                        refund_data=refund_data
-                    )
-
-                    # 2. Actualizar custom claims
-                    await subscription_service.update_custom_claims(
-                        user_id=custom_id,
-                        has_active_subscription=False
-                    )
-
-                    # 3. Enviar email de notificación
-                    user = auth.get_user(custom_id)
-                    if user.email:
-                        await email_service.send_subscription_cancelled(
-                            user_email=user.email,
-                            refund_data=refund_data
-                        )
-
-                    logger.info(f"Suscripción cancelada por reembolso para usuario {custom_id}")
-
-                except Exception as e:
-                    logger.error(f"Error procesando reembolso para usuario {custom_id}: {e}")
-        
-        return JSONResponse({"status": "processed"})
-        
+    except HTTPException:
+        raise
     except Exception as e:
+        # Sin 2xx PayPal reintenta el envío más tarde
         logger.error(f"Error procesando webhook de PayPal: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -337,4 +229,7 @@ async def get_payment_config(request: Request):
         },
         "currency": "EUR",
         "currency_symbol": "€"
-    })
\ No newline at end of file
+    })
+
+
+router.include_router(webhook_router)
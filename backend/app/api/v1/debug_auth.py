@@ -1,10 +1,11 @@
-from fastapi import APIRouter, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Response
 from pydantic import BaseModel
 import httpx
 import os
 import logging
 from firebase_admin import auth as admin_auth
 from app.services.email.email_service import email_service
+from app.middleware.rate_limit import rate_limit
 
 # Create Router
 router = APIRouter()
@@ -18,7 +19,7 @@ class LoginRequest(BaseModel):
     email: str
     password: str
 
-@router.post("/login", description="Proxy login + Custom Token Minting (Bypasses Domain Block)")
+@router.post("/login", dependencies=[Depends(rate_limit("auth"))], description="Proxy login + Custom Token Minting (Bypasses Domain Block)")
 async def debug_login(credentials: LoginRequest):
     """
     1. Verifies credentials via Firebase V1 REST API.
@@ -3,13 +3,14 @@ TuCitaSegura - Moderation API
 Provides endpoints for content moderation (text, images, etc.)
 """
 
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body
 from pydantic import BaseModel
 from typing import List, Optional
 import logging
 from datetime import datetime
 
 from app.services.ml.message_moderator import message_moderator
+from app.middleware.rate_limit import rate_limit
 
 logger = logging.getLogger(__name__)
 
@@ -29,7 +30,7 @@ class MessageModerationResponse(BaseModel):
     processed_text: str
     moderated_at: datetime
 
-@router.post("/message", response_model=MessageModerationResponse)
+@router.post("/message", response_model=MessageModerationResponse, dependencies=[Depends(rate_limit("messaging"))])
 async def moderate_message_endpoint(request: MessageModerationRequest):
     """
     Modera un mensaje de texto para detectar contenido inapropiado
@@ -12,6 +12,7 @@ import random
 
 # Import Recommendation Engine
 from app.services.ml.recommendation_engine import matching_engine
+from app.middleware.rate_limit import rate_limit
 
 logger = logging.getLogger(__name__)
 
@@ -69,7 +70,7 @@ class CompatibilityResponse(BaseModel):
 # ENDPOINTS
 # ============================================================================
 
-@router.get("/", response_model=RecommendationsResponse)
+@router.get("/", response_model=RecommendationsResponse, dependencies=[Depends(rate_limit("search"))])
 async def get_recommendations(
     user_id: str = Query(..., description="ID del usuario que solicita recomendaciones"),
     limit: int = Query(10, ge=1, le=50, description="Número máximo de recomendaciones"),
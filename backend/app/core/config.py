@@ -21,6 +21,7 @@ class Settings(BaseSettings):
     API_TITLE: str = "TuCitaSegura API"
     API_VERSION: str = "1.0.0"
     API_DESCRIPTION: str = "Backend API para TuCitaSegura - Plataforma de citas seguras"
+    FRONTEND_URL: str = "https://tucitasegura.com"  # PayPal return/cancel URLs
 
     # Firebase
     FIREBASE_PROJECT_ID: str = ""
@@ -42,10 +43,22 @@ class Settings(BaseSettings):
 
     # Google Maps
     GOOGLE_MAPS_API_KEY: str = ""
+    PLACES_CACHE_TTL: int = 86400  # seconds; nearby places barely change day to day
+    PLACES_CACHE_MAX_ENTRIES: int = 5000  # (geohash tile, radius bucket, type) results kept in memory
+    PLACES_CACHE_DIR: str = ""  # optional disk tier (empty = memory only)
+    PLACES_MAX_CONNECTIONS: int = 10
 
     # OpenAI
     OPENAI_API_KEY: str = ""
 
+    # Firebase Auth token verification
+    AUTH_TOKEN_CACHE_SIZE: int = 10000
+    AUTH_REVOCATION_CHECK_INTERVAL: int = 300  # seconds
+    AUTH_VERIFY_WORKERS: int = 8
+    AUTH_LOCAL_JWT_VERIFICATION: bool = True  # verify JWTs against cached Google keys
+    AUTH_JWT_CLOCK_SKEW_SECONDS: int = 5
+    AUTH_KEY_REFRESH_RETRY_SECONDS: int = 60
+
     # JWT
     SECRET_KEY: str = ""
     ALGORITHM: str = "HS256"
@@ -56,6 +69,13 @@ class Settings(BaseSettings):
     SMTP_PORT: int = 587
     SMTP_USER: str = ""
     SMTP_PASSWORD: str = ""
+    SMTP_STARTTLS: bool = True
+    SMTP_POOL_SIZE: int = 4  # long-lived authenticated connections
+    SMTP_PER_DOMAIN_CONCURRENCY: int = 2  # concurrent sends per recipient domain
+    EMAIL_OUTBOX_WORKERS: int = 8
+    EMAIL_OUTBOX_MAX_ATTEMPTS: int = 5  # then the message is marked failed
+    EMAIL_OUTBOX_RETRY_BACKOFF: float = 5.0  # seconds before the first retry, doubled each attempt
+    EMAIL_OUTBOX_LEASE_SECONDS: int = 120  # claim on a message while an instance sends it
 
     # Sentry
     SENTRY_DSN: str = ""
@@ -69,15 +89,75 @@ class Settings(BaseSettings):
     CV_MAX_IMAGE_SIZE: int = 5242880  # 5MB
     CV_ALLOWED_FORMATS: str = "jpg,jpeg,png,webp"
     CV_FACE_DETECTION_CONFIDENCE: float = 0.7
+    CV_VERIFICATION_CACHE_SIZE: int = 1024
+    CV_VERIFICATION_CACHE_DIR: str = ""
+
+    # Image derivatives (thumbnails generated on upload)
+    IMAGE_DERIVATIVE_SIZES: str = "96,320,1080"
+    IMAGE_DERIVATIVE_FORMAT: str = "WEBP"
+    IMAGE_DERIVATIVE_QUALITY: int = 80
+    IMAGE_DERIVATIVE_WORKERS: int = 4
+
+    # Storage I/O
+    STORAGE_BACKEND: str = "gcs"  # "gcs" or "local"
+    STORAGE_LOCAL_ROOT: str = "./local_storage"
+    STORAGE_LOCAL_BASE_URL: str = ""
+    STORAGE_MAX_WORKERS: int = 8
+    STORAGE_RESUMABLE_THRESHOLD: int = 8 * 1024 * 1024  # 8MB
+    STORAGE_CHUNK_SIZE: int = 4 * 1024 * 1024  # multiple of 256KB
 
     # Security
     MAX_LOGIN_ATTEMPTS: int = 5
     LOGIN_ATTEMPT_WINDOW_MINUTES: int = 15
     PASSWORD_MIN_LENGTH: int = 8
 
+    # App Check
+    APP_CHECK_DEFAULT_POLICY: str = "soft"  # policy for routes without a rule: exempt, soft or hard
+    APP_CHECK_HARD_PATHS: str = ""  # comma-separated rules enforced strictly ("/api/admin/", "/api/phones/{id}")
+
+    # Security / audit event logging (batched background writer)
+    SECURITY_LOG_QUEUE_SIZE: int = 10000
+    SECURITY_LOG_BATCH_SIZE: int = 500  # Firestore batch limit
+    SECURITY_LOG_FLUSH_INTERVAL_MS: int = 200
+    SECURITY_LOG_SPILL_PATH: str = ""  # JSONL overflow file (empty = drop on overload)
+
+    # Presence cleanup job
+    PRESENCE_TIMEOUT_MINUTES: int = 60
+    PRESENCE_CLEANUP_PAGE_SIZE: int = 2000
+    PRESENCE_CLEANUP_MAX_IN_FLIGHT: int = 8  # concurrent batch commits
+
+    # Subscription expiry job
+    SUBSCRIPTION_EXPIRY_PAGE_SIZE: int = 500
+    SUBSCRIPTION_CLAIMS_WORKERS: int = 16  # concurrent Firebase Auth claim updates
+    SUBSCRIPTION_CLAIMS_MAX_RETRIES: int = 5
+
+    # Health checks (background probes, read-only)
+    HEALTH_PROBE_INTERVAL: int = 15  # seconds between Firestore/Auth probes
+    HEALTH_EXTERNAL_PROBE_INTERVAL: int = 60  # seconds between PayPal/reCAPTCHA probes
+    HEALTH_PROBE_TIMEOUT: float = 5.0  # seconds
+    HEALTH_HISTORY_SIZE: int = 120  # probe results kept per dependency
+
+    # PayPal webhooks (persisted + deduplicated, processed by a worker pool)
+    PAYPAL_WEBHOOK_WORKERS: int = 4  # also the number of per-resource ordering partitions
+    PAYPAL_WEBHOOK_MAX_ATTEMPTS: int = 5  # then the event is dead-lettered
+    PAYPAL_WEBHOOK_RETRY_BACKOFF: float = 2.0  # seconds before the first retry, doubled each attempt
+    PAYPAL_WEBHOOK_LEASE_SECONDS: int = 300  # claim on an event while an instance processes it
+
+    # CSRF
+    CSRF_ENABLED: bool = True
+    CSRF_SECRET_KEYS: str = ""  # "kid:secret,kid:secret" - first key signs, all keys verify (defaults to SECRET_KEY)
+    CSRF_TOKEN_MAX_AGE: int = 86400  # seconds
+
     # Rate Limiting
     RATE_LIMIT_PER_MINUTE: int = 60
     RATE_LIMIT_PER_HOUR: int = 1000
+    RATE_LIMIT_BACKEND: str = "memory"  # "memory" (per process) or "redis" (shared, uses REDIS_URL)
+    RATE_LIMIT_LOCAL_FRACTION: float = 0.1  # share of a limit each process takes per store round-trip
+
+    # Metrics
+    METRICS_TOKEN: str = ""  # bearer token required by /metrics (if empty, open in development only)
+    METRICS_CLOUD_MONITORING_ENABLED: bool = False
+    METRICS_FLUSH_INTERVAL: int = 60  # seconds
 
     # CORS - Using str to avoid pydantic-settings auto JSON-decoding
     CORS_ORIGINS: str = ""
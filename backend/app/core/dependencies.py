@@ -3,9 +3,10 @@ FastAPI dependencies for authentication and authorization.
 """
 import logging
 from typing import Optional
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
+from app.middleware.auth_context import get_auth_context
 from app.services.auth.firebase_auth import firebase_auth_service
 from app.models.schemas import AuthenticatedUser
 
@@ -16,6 +17,7 @@ security = HTTPBearer()
 
 
 async def get_current_user(
+    request: Request,
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ) -> AuthenticatedUser:
     """
@@ -27,6 +29,7 @@ async def get_current_user(
             return {"user_id": user.uid}
 
     Args:
+        request: Current request (its AuthContext holds the token)
         credentials: HTTP Bearer credentials from request header
 
     Returns:
@@ -35,10 +38,12 @@ async def get_current_user(
     Raises:
         HTTPException: If token is invalid or user not found
     """
-    token = credentials.credentials
+    context = get_auth_context(request)
+    if context.user is not None:
+        return context.user
 
-    # Verify token with Firebase
-    decoded_token = await firebase_auth_service.verify_token(token)
+    # Verify token with Firebase (once per request, shared via the context)
+    decoded_token = await context.verify_id_token()
 
     # Create AuthenticatedUser object
     user = AuthenticatedUser(
@@ -48,11 +53,13 @@ async def get_current_user(
         role=decoded_token.get("role", "regular"),
         custom_claims=decoded_token,
     )
+    context.user = user
 
     return user
 
 
 async def get_current_user_optional(
+    request: Request,
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False))
 ) -> Optional[AuthenticatedUser]:
     """
@@ -66,6 +73,7 @@ async def get_current_user_optional(
             return {"message": "Hello anonymous"}
 
     Args:
+        request: Current request
         credentials: HTTP Bearer credentials from request header (optional)
 
     Returns:
@@ -75,7 +83,7 @@ async def get_current_user_optional(
         return None
 
     try:
-        return await get_current_user(credentials)
+        return await get_current_user(request, credentials)
     except HTTPException:
         return None
 
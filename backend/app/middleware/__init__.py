@@ -3,9 +3,13 @@ Middleware package for TuCitaSegura backend.
 """
 from .security_headers import SecurityHeadersMiddleware, get_security_headers_summary
 from .app_check import AppCheckMiddleware
+from .auth_context import AuthContext, AuthContextMiddleware, get_auth_context
 
 __all__ = [
     "SecurityHeadersMiddleware",
     "get_security_headers_summary",
-    "AppCheckMiddleware"
+    "AppCheckMiddleware",
+    "AuthContext",
+    "AuthContextMiddleware",
+    "get_auth_context"
 ]
@@ -4,18 +4,20 @@ Valida que las peticiones provengan de una instancia legítima de la aplicación
 Incluye logging estructurado y métricas para rastrear solicitudes legadas.
 """
 
-from fastapi import Request, HTTPException, status
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import JSONResponse
-import firebase_admin
-from firebase_admin import auth, app_check
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
 import logging
 import os
-from typing import Optional
+from typing import Iterable, Optional
 from datetime import datetime
 
+from app.core.config import settings
+from app.middleware.auth_context import get_auth_context
+from app.middleware.route_policy import EXEMPT, HARD, RoutePolicyEngine, parse_rules
 from app.utils.app_check_metrics import (
     get_metrics,
+    route_template,
     detect_legacy_sdk,
     extract_client_version
 )
@@ -23,88 +25,102 @@ from app.utils.app_check_metrics import (
 logger = logging.getLogger("security.app_check")
 
 
-def _extract_auth_token(request: Request) -> Optional[str]:
+class AppCheckMiddleware:
     """
-    Extraer token de Firebase Auth del header Authorization si existe.
-    
-    Args:
-        request: FastAPI Request object
-        
-    Returns:
-        Token string o None
-    """
-    auth_header = request.headers.get("Authorization", "")
-    if auth_header.startswith("Bearer "):
-        return auth_header[7:]
-    return None
-
+    Middleware ASGI puro: verifica el token y deja pasar la petición sin
+    envolver la respuesta (streaming y background tasks intactos).
 
-def _get_user_id_from_token(token: Optional[str]) -> Optional[str]:
-    """
-    Intentar extraer user ID del token de Firebase Auth sin validar completamente.
-    Solo para logging - no usar para autorización.
-    
-    Args:
-        token: Firebase ID token
-        
-    Returns:
-        User ID o None
+    La política de cada ruta (exempt/soft/hard) la decide un RoutePolicyEngine
+    compilado al arrancar; "/" en las exenciones es solo la raíz, no un prefijo.
     """
-    if not token:
-        return None
-    
-    try:
-        # Decodificar sin verificar (solo para logging de métricas)
-        import base64
-        import json
-        # JWT tiene formato: header.payload.signature
-        parts = token.split('.')
-        if len(parts) >= 2:
-            # Decodificar payload
-            payload = parts[1]
-            # Agregar padding si es necesario
-            padding = 4 - len(payload) % 4
-            if padding != 4:
-                payload += '=' * padding
-            decoded = base64.urlsafe_b64decode(payload)
-            claims = json.loads(decoded)
-            return claims.get('uid') or claims.get('user_id')
-    except Exception:
-        # Si falla, no es crítico - solo para logging
-        pass
-    
-    return None
-
-
-class AppCheckMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, exempt_paths: list = None):
-        super().__init__(app)
-        self.exempt_paths = exempt_paths or ["/docs", "/redoc", "/openapi.json", "/api/health", "/"]
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        exempt_paths: Optional[Iterable[str]] = None,
+        soft_paths: Iterable[str] = (),
+        hard_paths: Optional[Iterable[str]] = None,
+        default_policy: Optional[str] = None
+    ):
+        self.app = app
+        self.exempt_paths = list(exempt_paths or ["/docs", "/redoc", "/openapi.json", "/api/health", "/"])
+        self.policy = RoutePolicyEngine(
+            exempt=self.exempt_paths,
+            soft=soft_paths,
+            hard=parse_rules(settings.APP_CHECK_HARD_PATHS) if hard_paths is None else hard_paths,
+            default=default_policy or settings.APP_CHECK_DEFAULT_POLICY
+        )
         self.metrics = get_metrics()
 
-    async def dispatch(self, request: Request, call_next):
-        # 1. Verificar si la ruta está exenta
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # 1. Permitir OPTIONS (CORS Preflight)
+        if scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        # 1.5. Política de la ruta (trie compilado al arrancar)
+        path = scope["path"]
+        rule = self.policy.decide(path)
+        if rule.policy == EXEMPT:
+            self.policy.record(rule, "exempt")
+            await self.app(scope, receive, send)
+            return
+
+        enforce = rule.policy == HARD
+        outcome = await self._check(Request(scope), enforce=enforce)
+        if outcome is None or outcome["token_valid"]:
+            self.policy.record(rule, "allowed")
+        elif enforce:
+            self.policy.record(rule, "rejected")
+            self.metrics.record_request(path=rule.pattern, **outcome)
+            response = JSONResponse(
+                status_code=401,
+                content={"detail": "App Check token inválido o ausente"}
+            )
+            await response(scope, receive, send)
+            return
+        else:
+            self.policy.record(rule, "soft_fail")
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # Registrar en métricas tras el enrutado, con la plantilla de la
+            # ruta en vez del path crudo (evita una serie por cada id)
+            if outcome is not None:
+                self.metrics.record_request(path=route_template(scope), **outcome)
+
+    async def _check(self, request: Request, enforce: bool = False) -> Optional[dict]:
+        """
+        Verificar el token App Check y registrar el resultado.
+
+        Args:
+            enforce: La ruta tiene política estricta (solo cambia el logging;
+                el rechazo lo hace __call__)
+
+        Returns:
+            Argumentos para metrics.record_request, o None si no se registra
+        """
         path = request.url.path
-        if any(path.startswith(exempt) for exempt in self.exempt_paths):
-            return await call_next(request)
-            
-        # 1.5. Permitir OPTIONS (CORS Preflight)
-        if request.method == "OPTIONS":
-            return await call_next(request)
         
         # 2. Extraer información del cliente para logging y métricas
         client_host = request.client.host if request.client else "unknown"
         user_agent = request.headers.get("User-Agent", "")
         client_version = extract_client_version(dict(request.headers))
-        auth_token = _extract_auth_token(request)
-        user_id = _get_user_id_from_token(auth_token) if auth_token else None
-        has_auth = bool(auth_token)
+        # Contexto de auth de la petición: el JWT se decodifica una sola vez
+        context = get_auth_context(request)
+        user_id = context.unverified_uid  # Solo para logging - no usar para autorización
+        has_auth = bool(context.id_token)
         
         # 3. Detectar si parece ser una versión antigua del SDK
         is_legacy = detect_legacy_sdk(user_agent, client_version)
         
         # 4. Verificar header X-Firebase-AppCheck
-        app_check_token = request.headers.get("X-Firebase-AppCheck")
+        app_check_token = context.app_check_token
         
         if not app_check_token:
             # Logging estructurado para solicitudes sin App Check
@@ -127,22 +143,24 @@ class AppCheckMiddleware(BaseHTTPMiddleware):
                 extra={"log_data": log_data}
             )
             
-            # Registrar en métricas
-            self.metrics.record_request(
+            outcome = dict(
                 has_app_check=False,
                 client_version=client_version,
-                path=path,
                 is_legacy=is_legacy,
                 token_valid=False
             )
             
-            # SOFT FAIL - Permitir solicitud (Debug Mode)
-            logger.info("⚠️ App Check Missing - Allowing request (Soft Enforcement)")
-            return await call_next(request)
+            if enforce:
+                logger.warning(f"🚫 App Check Missing - Rejecting request (Hard Enforcement): {path}")
+            else:
+                # SOFT FAIL - Permitir solicitud (Debug Mode)
+                logger.info("⚠️ App Check Missing - Allowing request (Soft Enforcement)")
+            return outcome
             
         try:
-            # 5. Validar token con Firebase Admin SDK
-            decoded_token = app_check.verify_token(app_check_token)
+            # 5. Validar token con las claves JWKS en memoria (resultado
+            # guardado en el contexto para require_app_check)
+            decoded_token = await context.verify_app_check()
             app_id = decoded_token.get("app_id")
             
             # Logging estructurado para solicitudes exitosas
@@ -163,19 +181,14 @@ class AppCheckMiddleware(BaseHTTPMiddleware):
                 extra={"log_data": log_data}
             )
             
-            # Registrar en métricas
-            self.metrics.record_request(
+            outcome = dict(
                 has_app_check=True,
                 client_version=client_version,
-                path=path,
                 is_legacy=is_legacy,
                 token_valid=True
             )
-            
-            # Continuar con la petición
-            response = await call_next(request)
-            return response
-            
+            return outcome
+
         except Exception as e:
             # Permitir fallo si es localhost o LAN para development
             is_dev = client_host in ["127.0.0.1", "::1", "localhost"] or client_host.startswith(("192.168.", "10."))
@@ -192,7 +205,7 @@ class AppCheckMiddleware(BaseHTTPMiddleware):
                         }
                     }
                 )
-                return await call_next(request)
+                return
 
             # Logging estructurado para tokens inválidos
             log_data = {
@@ -215,15 +228,16 @@ class AppCheckMiddleware(BaseHTTPMiddleware):
                 extra={"log_data": log_data}
             )
             
-            # Registrar en métricas
-            self.metrics.record_request(
+            outcome = dict(
                 has_app_check=True,  # Tenía token pero inválido
                 client_version=client_version,
-                path=path,
                 is_legacy=is_legacy,
                 token_valid=False
             )
             
-            # SOFT FAIL - Permitir solicitud (Debug Mode)
-            logger.info("⚠️ App Check Invalid - Allowing request (Soft Enforcement)")
-            return await call_next(request)
+            if enforce:
+                logger.warning(f"🚫 App Check Invalid - Rejecting request (Hard Enforcement): {path}")
+            else:
+                # SOFT FAIL - Permitir solicitud (Debug Mode)
+                logger.info("⚠️ App Check Invalid - Allowing request (Soft Enforcement)")
+            return outcome
@@ -0,0 +1,140 @@
+"""
+Request-scoped authentication context.
+
+AuthContextMiddleware reads the Authorization and X-Firebase-AppCheck
+headers once per request and stores an AuthContext in `request.state.auth`.
+Everything that needs the caller's identity goes through it:
+- AppCheckMiddleware (unverified uid for logging, App Check verification)
+- get_current_user / get_current_verified_user / get_current_admin
+- auth_utils.get_current_user and require_app_check in main.py
+
+Decoding and verification are lazy and memoized, so public routes pay
+nothing and each token is decoded/verified at most once per request.
+"""
+import base64
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException, Request
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.services.auth.firebase_auth import firebase_auth_service
+from app.services.auth.jwt_verifier import local_jwt_verifier
+
+logger = logging.getLogger(__name__)
+
+_UNSET = object()
+
+
+class AuthContext:
+    """Identity of the current request; results are computed once and reused."""
+
+    def __init__(self, authorization: Optional[str], app_check_token: Optional[str]):
+        self.id_token: Optional[str] = None
+        if authorization and authorization.startswith("Bearer "):
+            self.id_token = authorization[7:].strip() or None
+        self.app_check_token: Optional[str] = (app_check_token or "").strip() or None
+
+        self._unverified_claims: Any = _UNSET
+        self._claims: Optional[Dict[str, Any]] = None
+        self._claims_error: Optional[HTTPException] = None
+        self._app_check: Any = _UNSET
+        self._app_check_error: Optional[Exception] = None
+
+        # Slot for the typed user built by the dependencies
+        self.user: Any = None
+
+    @classmethod
+    def from_scope(cls, scope: Scope) -> "AuthContext":
+        authorization = app_check_token = None
+        for name, value in scope.get("headers", []):
+            if name == b"authorization":
+                authorization = value.decode("latin-1")
+            elif name == b"x-firebase-appcheck":
+                app_check_token = value.decode("latin-1")
+        return cls(authorization, app_check_token)
+
+    @property
+    def unverified_claims(self) -> Optional[Dict[str, Any]]:
+        """ID token payload decoded WITHOUT verification. Logging only."""
+        if self._unverified_claims is _UNSET:
+            self._unverified_claims = _decode_payload(self.id_token) if self.id_token else None
+        return self._unverified_claims
+
+    @property
+    def unverified_uid(self) -> Optional[str]:
+        """User id for logging/metrics only - never use it for authorization."""
+        claims = self.unverified_claims
+        if not claims:
+            return None
+        return claims.get("uid") or claims.get("user_id") or claims.get("sub")
+
+    async def verify_id_token(self) -> Dict[str, Any]:
+        """
+        Verified ID token claims (FirebaseAuthService.verify_token, memoized).
+
+        Raises:
+            HTTPException: 401/503 as raised by FirebaseAuthService
+        """
+        if self._claims is None and self._claims_error is None:
+            try:
+                self._claims = await firebase_auth_service.verify_token(self.id_token)
+            except HTTPException as e:
+                self._claims_error = e
+        if self._claims_error is not None:
+            raise self._claims_error
+        return self._claims
+
+    async def verify_app_check(self) -> Optional[Dict[str, Any]]:
+        """
+        Verified App Check claims, or None when the header is absent (memoized).
+
+        Raises:
+            Exception: The verification error, if the token is invalid
+        """
+        if self._app_check is _UNSET:
+            if not self.app_check_token:
+                self._app_check = None
+            else:
+                try:
+                    self._app_check = await local_jwt_verifier.verify_app_check_token_async(self.app_check_token)
+                except Exception as e:
+                    self._app_check = None
+                    self._app_check_error = e
+        if self._app_check_error is not None:
+            raise self._app_check_error
+        return self._app_check
+
+
+def _decode_payload(token: str) -> Optional[Dict[str, Any]]:
+    try:
+        # JWT format: header.payload.signature
+        parts = token.split(".")
+        if len(parts) < 2:
+            return None
+        payload = parts[1] + "=" * (-len(parts[1]) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload))
+    except Exception:
+        return None
+
+
+def get_auth_context(request: Request) -> AuthContext:
+    """AuthContext of a request (created on demand if the middleware isn't installed)."""
+    context = getattr(request.state, "auth", None)
+    if context is None:
+        context = AuthContext.from_scope(request.scope)
+        request.state.auth = context
+    return context
+
+
+class AuthContextMiddleware:
+    """Pure ASGI middleware that attaches an AuthContext to every HTTP request."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            scope.setdefault("state", {})["auth"] = AuthContext.from_scope(scope)
+        await self.app(scope, receive, send)
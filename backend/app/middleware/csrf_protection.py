@@ -2,40 +2,210 @@
 CSRF Protection Middleware - TuCitaSegura
 
 Protects against Cross-Site Request Forgery attacks by:
-- Generating CSRF tokens for sessions
+- Issuing stateless, HMAC-signed CSRF tokens (no server-side storage)
 - Validating tokens on state-changing requests (POST, PUT, DELETE, PATCH)
 - Using double-submit cookie pattern
 - SameSite cookie attributes
+
+Token format: `<key id>.<base64url(timestamp[4] | nonce[16] | mac[16])>`
+
+Tokens carry the id of the key that signed them, so several keys can be
+active at once: the first key of CSRF_SECRET_KEYS signs new tokens and every
+listed key is accepted, which allows rotating keys without invalidating the
+tokens already issued.
 """
 
-import secrets
+import base64
 import hashlib
 import hmac
-from typing import Optional, Set
+import secrets
+import struct
+import time
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
 from fastapi import Request, HTTPException, status
-from fastapi.responses import Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.datastructures import Headers
+from fastapi.responses import JSONResponse
+from starlette.requests import cookie_parser
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import logging
 
 from app.core.config import settings
+from app.middleware.path_trie import PathPrefixTrie
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_KEY_ID = 'k0'
 
-class CSRFProtection(BaseHTTPMiddleware):
+
+def parse_key_ring(value: str) -> Dict[str, str]:
     """
-    CSRF Protection Middleware using double-submit cookie pattern
+    Parse CSRF_SECRET_KEYS ("kid:secret,kid:secret")
+
+    Returns:
+        Ordered {key id: secret}; the first entry is the signing key
+    """
+    keys: Dict[str, str] = {}
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        key_id, sep, secret = entry.partition(':')
+        if not sep or not key_id or not secret or '.' in key_id:
+            raise ValueError(f"Invalid CSRF key entry for key id '{key_id}' (expected 'kid:secret')")
+        keys[key_id] = secret
+    return keys
+
+
+class CSRFTokenSigner:
+    """
+    Stateless CSRF token issuer/validator
+
+    Generating a token is one urandom read plus one HMAC; validating it is a
+    base64 decode, one HMAC and a constant-time compare.
+    """
+
+    NONCE_BYTES = 16
+    MAC_BYTES = 16  # truncated HMAC-SHA256 (128 bits)
+    _PAYLOAD = struct.Struct('>I')
+
+    def __init__(
+        self,
+        keys: Dict[str, str],
+        max_age: int = 86400,
+        clock: Callable[[], float] = time.time
+    ):
+        """
+        Args:
+            keys: Ordered {key id: secret}; the first key signs new tokens
+            max_age: Token lifetime in seconds
+            clock: Time source (for tests)
+        """
+        if not keys:
+            raise ValueError("At least one CSRF key is required")
+        if not all(keys.values()):
+            # An empty HMAC key would let anyone forge tokens
+            raise ValueError("CSRF keys must not be empty")
+        self.keys = {key_id: secret.encode('utf-8') for key_id, secret in keys.items()}
+        self.active_key_id = next(iter(self.keys))
+        self.max_age = max_age
+        self.clock = clock
+        self._body_length = self._PAYLOAD.size + self.NONCE_BYTES + self.MAC_BYTES
+
+    @classmethod
+    def from_settings(cls, secret_key: Optional[str] = None) -> "CSRFTokenSigner":
+        """
+        Signer from CSRF_SECRET_KEYS, or a single key from `secret_key`/SECRET_KEY
+
+        Raises:
+            ValueError: If no non-empty signing key is configured
+        """
+        if secret_key is None:
+            keys = parse_key_ring(settings.CSRF_SECRET_KEYS)
+            secret_key = settings.SECRET_KEY
+        else:
+            keys = {}
+        if not keys:
+            if not secret_key:
+                raise ValueError("No CSRF signing key configured (set CSRF_SECRET_KEYS or SECRET_KEY)")
+            keys = {DEFAULT_KEY_ID: secret_key}
+        return cls(keys, max_age=settings.CSRF_TOKEN_MAX_AGE)
+
+    def _mac(self, key: bytes, key_id: str, payload: bytes) -> bytes:
+        return hmac.new(key, key_id.encode('ascii') + b'.' + payload, hashlib.sha256).digest()[:self.MAC_BYTES]
+
+    def generate(self) -> str:
+        """Issue a new token signed with the active key"""
+        payload = self._PAYLOAD.pack(int(self.clock())) + secrets.token_bytes(self.NONCE_BYTES)
+        mac = self._mac(self.keys[self.active_key_id], self.active_key_id, payload)
+        body = base64.urlsafe_b64encode(payload + mac).rstrip(b'=').decode('ascii')
+        return f"{self.active_key_id}.{body}"
+
+    def verify(self, token: str) -> Tuple[str, int]:
+        """
+        Verify signature and age of a token
+
+        Returns:
+            (key id, issued-at timestamp)
+
+        Raises:
+            ValueError: If the token is malformed, forged, from an unknown key or expired
+        """
+        key_id, sep, body = token.partition('.')
+        key = self.keys.get(key_id)
+        if not sep or key is None:
+            raise ValueError("Unknown CSRF key id")
+
+        try:
+            raw = base64.urlsafe_b64decode(body + '=' * (-len(body) % 4))
+        except (ValueError, TypeError):
+            raise ValueError("Invalid token encoding")
+        if len(raw) != self._body_length:
+            raise ValueError("Invalid token length")
+
+        payload, mac = raw[:-self.MAC_BYTES], raw[-self.MAC_BYTES:]
+        if not hmac.compare_digest(mac, self._mac(key, key_id, payload)):
+            raise ValueError("Invalid token signature")
+
+        issued_at = self._PAYLOAD.unpack_from(payload)[0]
+        age = self.clock() - issued_at
+        if age > self.max_age:
+            raise ValueError("Token expired")
+        if age < -60:
+            raise ValueError("Token issued in the future")
+        return key_id, issued_at
+
+    def needs_refresh(self, token: Optional[str]) -> bool:
+        """True if a fresh token should be issued (missing, invalid, old or signed by a retired key)"""
+        if not token:
+            return True
+        try:
+            key_id, issued_at = self.verify(token)
+        except ValueError:
+            return True
+        return key_id != self.active_key_id or self.clock() - issued_at > self.max_age / 2
+
+
+def check_csrf_tokens(signer: CSRFTokenSigner, cookie_token: Optional[str], header_token: Optional[str], header_name: str) -> Optional[str]:
+    """
+    Double-submit check: header token must equal the cookie token and be valid
+
+    Returns:
+        Error detail, or None if the tokens are valid
+    """
+    if not cookie_token:
+        return "CSRF token missing in cookie"
+    if not header_token:
+        return f"CSRF token missing in header ({header_name})"
+
+    # Validate tokens match (double-submit pattern)
+    if not secrets.compare_digest(cookie_token.encode('latin-1'), header_token.encode('latin-1')):
+        return "CSRF token mismatch"
+
+    # Validate token structure, signature and age
+    try:
+        signer.verify(cookie_token)
+    except ValueError as e:
+        logger.warning(f"CSRF token validation error: {e}")
+        return "Invalid CSRF token"
+    return None
+
+
+class CSRFProtection:
+    """
+    CSRF Protection Middleware using double-submit cookie pattern (pure ASGI)
 
     How it works:
-    1. Generates a CSRF token for each session
+    1. Issues a signed CSRF token (cookie + X-CSRF-Token response header)
     2. Stores token in a secure, HttpOnly cookie
     3. Client must send token in X-CSRF-Token header
     4. Validates token on state-changing requests
 
+    Requests authenticated with an `Authorization` header are not checked:
+    browsers never attach that header on their own, so a third-party page
+    cannot forge them. Exempt paths are matched with a precompiled trie.
+
     Security features:
     - Cryptographically secure token generation
-    - HMAC-based token validation
+    - HMAC-signed, timestamped tokens with key rotation
     - SameSite=Lax/Strict cookies
     - Secure flag in production
     - HttpOnly to prevent XSS
@@ -55,6 +225,7 @@ class CSRFProtection(BaseHTTPMiddleware):
         '/debug',                         # Debug endpoint
         '/api/v1/debug/login',            # Debug login (dev only)
         '/api/v1/debug/',                 # All debug endpoints (dev only)
+        '/api/jobs/',                     # Cloud Scheduler jobs (OIDC-authenticated)
     }
 
     # Paths that require CSRF protection (critical endpoints)
@@ -65,198 +236,126 @@ class CSRFProtection(BaseHTTPMiddleware):
         '/api/admin/',  # All admin endpoints
     }
 
-    def __init__(self, app, secret_key: Optional[str] = None):
+    def __init__(
+        self,
+        app: ASGIApp,
+        secret_key: Optional[str] = None,
+        signer: Optional[CSRFTokenSigner] = None,
+        exempt_paths: Optional[Iterable[str]] = None
+    ):
         """
         Initialize CSRF protection
 
         Args:
             app: FastAPI application
-            secret_key: Secret key for HMAC (defaults to settings.SECRET_KEY)
+            secret_key: Single HMAC key (defaults to CSRF_SECRET_KEYS / SECRET_KEY)
+            signer: Token signer (overrides secret_key)
+            exempt_paths: Paths exempt from CSRF (defaults to EXEMPT_PATHS)
         """
-        super().__init__(app)
-        self.secret_key = (secret_key or settings.SECRET_KEY).encode('utf-8')
+        self.app = app
+        self.signer = signer or CSRFTokenSigner.from_settings(secret_key)
         self.token_name = 'csrf_token'
         self.header_name = 'X-CSRF-Token'
         self.cookie_name = 'csrf_token'
-        self.token_length = 32  # 32 bytes = 256 bits
 
-        logger.info("CSRF Protection middleware initialized")
+        self.exempt_paths = PathPrefixTrie.from_paths(
+            self.EXEMPT_PATHS if exempt_paths is None else exempt_paths
+        )
+        self.critical_paths = PathPrefixTrie.from_paths(self.CRITICAL_PATHS)
 
-    async def dispatch(self, request: Request, call_next):
-        """Process request and validate CSRF token if needed"""
+        # Cookie attributes never change, build them once
+        self._cookie_attributes = f"; Max-Age={self.signer.max_age}; Path=/; HttpOnly; SameSite=lax"
+        if settings.ENVIRONMENT == 'production':
+            self._cookie_attributes += "; Secure"  # HTTPS only in production
+        self._header_key = self.header_name.lower().encode('latin-1')
 
-        # Skip CSRF for exempt paths
-        if self._is_exempt_path(request.url.path):
-            return await call_next(request)
+        logger.info(
+            f"CSRF Protection middleware initialized "
+            f"(signing key: {self.signer.active_key_id}, active keys: {len(self.signer.keys)})"
+        )
 
-        # Skip CSRF for safe methods (GET, HEAD, OPTIONS)
-        if request.method not in self.PROTECTED_METHODS:
-            response = await call_next(request)
-            # Set CSRF token cookie for safe requests
-            self._set_csrf_cookie(response, request)
-            return response
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Process request and validate CSRF token if needed"""
+        if scope["type"] != "http" or self.exempt_paths.match(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        cookie_header = header_token = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                # Header-authenticated requests can't be forged cross-site
+                await self.app(scope, receive, send)
+                return
+            if name == b"cookie":
+                cookie_header = value.decode("latin-1")
+            elif name == self._header_key:
+                header_token = value.decode("latin-1")
+
+        cookie_token = cookie_parser(cookie_header).get(self.cookie_name) if cookie_header else None
 
         # Validate CSRF token for state-changing requests
-        try:
-            self._validate_csrf_token(request)
-        except HTTPException as e:
-            logger.warning(
-                f"CSRF validation failed: {e.detail} "
-                f"[Method: {request.method}, Path: {request.url.path}, "
-                f"IP: {request.client.host if request.client else 'unknown'}]"
-            )
-            raise
-
-        # Process request
-        response = await call_next(request)
-
-        # Rotate CSRF token after successful state-changing request
-        self._set_csrf_cookie(response, request)
-
-        return response
+        if scope["method"] in self.PROTECTED_METHODS:
+            error = check_csrf_tokens(self.signer, cookie_token, header_token, self.header_name)
+            if error is not None:
+                client = scope.get("client")
+                logger.warning(
+                    f"CSRF validation failed: {error} "
+                    f"[Method: {scope['method']}, Path: {scope['path']}, "
+                    f"IP: {client[0] if client else 'unknown'}]"
+                )
+                response = JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"detail": error})
+                await response(scope, receive, send)
+                return
+            await self.app(scope, receive, send)
+            return
+
+        # Safe methods (GET, HEAD, OPTIONS): expose the token, issue a new
+        # cookie only when the current one is missing, stale or from a retired key
+        set_cookie = self.signer.needs_refresh(cookie_token)
+        token = self.signer.generate() if set_cookie else cookie_token
+
+        async def send_with_token(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                self._set_csrf_token(message, token, set_cookie)
+            await send(message)
+
+        await self.app(scope, receive, send_with_token)
 
     def _is_exempt_path(self, path: str) -> bool:
         """Check if path is exempt from CSRF protection"""
-        # Exact match
-        if path in self.EXEMPT_PATHS:
-            return True
-
-        # Prefix match for paths like /api/admin/*
-        for exempt_path in self.EXEMPT_PATHS:
-            if exempt_path.endswith('/') and path.startswith(exempt_path):
-                return True
-
-        return False
+        return self.exempt_paths.match(path) is not None
 
     def _is_critical_path(self, path: str) -> bool:
         """Check if path requires strict CSRF protection"""
-        for critical_path in self.CRITICAL_PATHS:
-            if critical_path.endswith('/') and path.startswith(critical_path):
-                return True
-            if path == critical_path:
-                return True
-        return False
+        return self.critical_paths.match(path) is not None
 
     def _generate_csrf_token(self) -> str:
         """
-        Generate a cryptographically secure CSRF token
+        Generate a signed CSRF token
 
         Returns:
-            Hex-encoded CSRF token
-        """
-        # Generate random token
-        random_bytes = secrets.token_bytes(self.token_length)
-
-        # Create HMAC signature to prevent token forgery
-        signature = hmac.new(
-            self.secret_key,
-            random_bytes,
-            hashlib.sha256
-        ).digest()
-
-        # Combine token and signature
-        token = random_bytes + signature
-
-        # Encode as hex
-        return token.hex()
-
-    def _validate_csrf_token(self, request: Request) -> None:
+            Compact token (`<key id>.<base64url payload>`)
         """
-        Validate CSRF token from request
-
-        Args:
-            request: FastAPI request
-
-        Raises:
-            HTTPException: If token is invalid or missing
-        """
-        # Get token from cookie
-        cookie_token = request.cookies.get(self.cookie_name)
-        if not cookie_token:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="CSRF token missing in cookie"
-            )
-
-        # Get token from header
-        header_token = request.headers.get(self.header_name)
-        if not header_token:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"CSRF token missing in header ({self.header_name})"
-            )
+        return self.signer.generate()
 
-        # Validate tokens match (double-submit pattern)
-        if not secrets.compare_digest(cookie_token, header_token):
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="CSRF token mismatch"
-            )
-
-        # Validate token structure and signature
-        try:
-            token_bytes = bytes.fromhex(cookie_token)
-
-            # Token should be: random_bytes (32) + signature (32) = 64 bytes
-            if len(token_bytes) != self.token_length + 32:
-                raise ValueError("Invalid token length")
-
-            # Split token and signature
-            random_bytes = token_bytes[:self.token_length]
-            provided_signature = token_bytes[self.token_length:]
-
-            # Compute expected signature
-            expected_signature = hmac.new(
-                self.secret_key,
-                random_bytes,
-                hashlib.sha256
-            ).digest()
-
-            # Compare signatures
-            if not secrets.compare_digest(provided_signature, expected_signature):
-                raise ValueError("Invalid token signature")
-
-        except (ValueError, TypeError) as e:
-            logger.error(f"CSRF token validation error: {e}")
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Invalid CSRF token"
-            )
-
-    def _set_csrf_cookie(self, response: Response, request: Request) -> None:
+    def _set_csrf_token(self, message: Message, token: str, set_cookie: bool) -> None:
         """
-        Set CSRF token cookie in response
+        Add the CSRF token to the response start message
 
         Args:
-            response: FastAPI response
-            request: FastAPI request
+            message: http.response.start message
+            token: CSRF token
+            set_cookie: Whether to (re)issue the cookie
         """
-        # Check if cookie already exists
-        existing_token = request.cookies.get(self.cookie_name)
-
-        # Generate new token if needed
-        if not existing_token:
-            token = self._generate_csrf_token()
-        else:
-            token = existing_token
-
-        # Set cookie with security attributes
-        is_production = settings.ENVIRONMENT == 'production'
-
-        response.set_cookie(
-            key=self.cookie_name,
-            value=token,
-            max_age=3600 * 24,  # 24 hours
-            httponly=True,      # Prevent JavaScript access (XSS protection)
-            secure=is_production,  # HTTPS only in production
-            samesite='lax',     # CSRF protection (can use 'strict' for more security)
-            path='/',
-            domain=None
-        )
+        headers = list(message.get("headers", []))
+        if set_cookie:
+            headers.append((b"set-cookie", f"{self.cookie_name}={token}{self._cookie_attributes}".encode("latin-1")))
 
         # Also set token in response header for client-side access
         # This allows the frontend to read the token and send it in headers
-        response.headers[self.header_name] = token
+        headers = [(name, value) for name, value in headers if name != self._header_key]
+        headers.append((self._header_key, token.encode("latin-1")))
+        message["headers"] = headers
 
 
 class CSRFProtect:
@@ -274,28 +373,31 @@ class CSRFProtect:
     ```
     """
 
-    def __init__(self, secret_key: Optional[str] = None):
-        self.secret_key = (secret_key or settings.SECRET_KEY).encode('utf-8')
+    def __init__(self, secret_key: Optional[str] = None, signer: Optional[CSRFTokenSigner] = None):
+        self._secret_key = secret_key
+        self._signer = signer
         self.header_name = 'X-CSRF-Token'
         self.cookie_name = 'csrf_token'
 
+    @property
+    def signer(self) -> CSRFTokenSigner:
+        # Built lazily so importing this module doesn't depend on the key settings
+        if self._signer is None:
+            self._signer = CSRFTokenSigner.from_settings(self._secret_key)
+        return self._signer
+
     async def __call__(self, request: Request) -> None:
         """Validate CSRF token"""
-        # Get tokens
-        cookie_token = request.cookies.get(self.cookie_name)
-        header_token = request.headers.get(self.header_name)
-
-        if not cookie_token or not header_token:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="CSRF token missing"
-            )
-
-        # Validate tokens match
-        if not secrets.compare_digest(cookie_token, header_token):
+        error = check_csrf_tokens(
+            self.signer,
+            request.cookies.get(self.cookie_name),
+            request.headers.get(self.header_name),
+            self.header_name
+        )
+        if error is not None:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
-                detail="CSRF token invalid"
+                detail=error
             )
 
 
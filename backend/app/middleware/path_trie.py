@@ -0,0 +1,99 @@
+"""
+Precompiled path-prefix trie used by the middlewares to classify request paths.
+
+Rules are compiled once at startup; a lookup walks the path segments with one
+dict access per segment instead of scanning every configured rule.
+
+- Rules ending in "/" are prefix rules: "/api/admin/" matches "/api/admin/x"
+  and "/api/admin/" but not "/api/admin"
+- Every other rule is exact, including "/" itself
+- "{name}" segments are route-template parameters matching any non-empty
+  segment ("/api/phones/{phone_id}")
+- The deepest match wins (an exact match beats a prefix of it); literal
+  segments are preferred over parameters
+"""
+from typing import Dict, Generic, Iterable, List, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class _Node(Generic[V]):
+    __slots__ = ("children", "param", "exact", "prefix")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node[V]"] = {}
+        self.param: Optional["_Node[V]"] = None
+        self.exact: Optional[V] = None
+        self.prefix: Optional[V] = None
+
+
+class PathPrefixTrie(Generic[V]):
+    """Maps request paths to the value of the most specific matching rule."""
+
+    def __init__(self, rules: Iterable[Tuple[str, V]] = ()):
+        self._root: _Node[V] = _Node()
+        for path, value in rules:
+            self.add(path, value)
+
+    @classmethod
+    def from_paths(cls, paths: Iterable[str]) -> "PathPrefixTrie[bool]":
+        """Trie where every path in `paths` maps to True (membership test)"""
+        return cls((path, True) for path in paths)
+
+    @staticmethod
+    def _segments(path: str) -> List[str]:
+        return path[1:].split("/") if path.startswith("/") else path.split("/")
+
+    def add(self, path: str, value: V, prefix: Optional[bool] = None) -> None:
+        """
+        Add a rule
+
+        Args:
+            path: Path rule ("/docs", "/api/admin/")
+            value: Value returned for matching paths (must not be None)
+            prefix: Force prefix/exact matching (default: prefix if the rule ends in "/")
+        """
+        if prefix is None:
+            prefix = path.endswith("/") and path != "/"
+
+        node = self._root
+        segments = self._segments(path.rstrip("/")) if prefix else self._segments(path)
+        for segment in segments:
+            if prefix and segment == "" and node is self._root:
+                continue
+            if segment.startswith("{") and segment.endswith("}"):
+                if node.param is None:
+                    node.param = _Node()
+                node = node.param
+            else:
+                node = node.children.setdefault(segment, _Node())
+
+        if prefix:
+            node.prefix = value
+        else:
+            node.exact = value
+
+    def match(self, path: str, default: Optional[V] = None) -> Optional[V]:
+        """Value of the most specific rule matching `path`, or `default`"""
+        value = self._walk(self._root, self._segments(path), 0)
+        return default if value is None else value
+
+    def _walk(self, node: _Node[V], segments: List[str], i: int) -> Optional[V]:
+        if i == len(segments):
+            return node.exact
+
+        child = node.children.get(segments[i])
+        if child is not None:
+            value = self._walk(child, segments, i + 1)
+            if value is not None:
+                return value
+        if node.param is not None and segments[i]:
+            value = self._walk(node.param, segments, i + 1)
+            if value is not None:
+                return value
+
+        # A prefix rule applies only when the path continues past it
+        return node.prefix
+
+    def __contains__(self, path: str) -> bool:
+        return self.match(path) is not None
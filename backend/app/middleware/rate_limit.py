@@ -7,16 +7,22 @@ from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
+from fastapi import HTTPException, Request, status
 from fastapi.responses import JSONResponse
 import logging
 
+from app.core.config import settings
+from app.middleware.auth_context import get_auth_context
+from app.services.security.rate_limiter import rate_limiter, parse_rate
+
 logger = logging.getLogger(__name__)
 
 # Initialize rate limiter
+# With RATE_LIMIT_BACKEND=redis the per-IP limits are shared by all workers too
 limiter = Limiter(
     key_func=get_remote_address,
     default_limits=["200/hour"],  # Default limit for all endpoints
-    storage_uri="memory://",  # Use in-memory storage (consider Redis for production)
+    storage_uri=settings.REDIS_URL if settings.RATE_LIMIT_BACKEND == "redis" else "memory://",
     headers_enabled=True  # Add rate limit info to response headers
 )
 
@@ -51,3 +57,44 @@ RATE_LIMITS = {
     "api_general": "100/minute",   # General API calls
     "public": "200/hour"           # Public endpoints
 }
+
+
+async def _rate_limit_identity(request: Request) -> str:
+    """Verified user id when the request is authenticated, client IP otherwise"""
+    context = get_auth_context(request)
+    if context.id_token:
+        try:
+            claims = await context.verify_id_token()
+            return f"user:{claims['uid']}"
+        except HTTPException:
+            # Invalid tokens are rejected by the auth dependency itself
+            pass
+    return f"ip:{get_remote_address(request)}"
+
+
+def rate_limit(category: str):
+    """
+    Dependency enforcing a RATE_LIMITS category per user (per IP when anonymous)
+
+    Usage:
+        @app.post("/api/upload", dependencies=[Depends(rate_limit("upload"))])
+    """
+    limit, period = parse_rate(RATE_LIMITS[category])
+
+    async def check_rate_limit(request: Request) -> None:
+        identity = await _rate_limit_identity(request)
+        result = await rate_limiter.hit(f"{category}:{identity}", limit, period)
+
+        if not result.allowed:
+            retry_after = max(1, int(result.retry_after + 0.999))
+            logger.warning(
+                f"Rate limit '{category}' exceeded for {identity} "
+                f"on path {request.url.path}"
+            )
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Demasiadas solicitudes. Límite de {RATE_LIMITS[category]} excedido",
+                headers={"Retry-After": str(retry_after)}
+            )
+
+    return check_rate_limit
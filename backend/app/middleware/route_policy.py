@@ -0,0 +1,92 @@
+"""
+Motor de políticas de App Check por ruta.
+
+Las reglas se compilan una sola vez en un PathPrefixTrie al arrancar, así que
+decidir la política de una petición cuesta O(longitud del path):
+- exenta ("exempt"): no se verifica App Check
+- suave ("soft"): se verifica y se registra, pero la petición siempre pasa
+- estricta ("hard"): sin token válido se responde 401
+
+Formato de las reglas:
+- exacta: "/docs", "/" (solo la raíz)
+- prefijo: "/api/admin/" o "/api/admin/*"
+- plantilla de ruta: "/api/phones/{phone_id}"
+
+Si una misma regla aparece en varias listas gana la más estricta.
+"""
+import logging
+from typing import Dict, Iterable, NamedTuple
+
+from app.middleware.path_trie import PathPrefixTrie
+from app.utils.metrics_core import metrics_registry
+
+logger = logging.getLogger("security.app_check")
+
+EXEMPT = "exempt"
+SOFT = "soft"
+HARD = "hard"
+
+POLICIES = (EXEMPT, SOFT, HARD)
+
+DEFAULT_RULE = "<default>"
+
+_decisions = metrics_registry.counter(
+    "app_check_policy_decisions_total",
+    "Decisiones de App Check por regla de ruta, política y resultado",
+    ("rule", "policy", "result")
+)
+
+
+class RouteRule(NamedTuple):
+    """Regla que decidió la política de una petición"""
+    pattern: str
+    policy: str
+
+
+def parse_rules(value: str) -> list:
+    """Reglas separadas por comas (variables de configuración)"""
+    return [rule.strip() for rule in value.split(",") if rule.strip()]
+
+
+class RoutePolicyEngine:
+    """Reglas exempt/soft/hard compiladas en un trie"""
+
+    def __init__(
+        self,
+        exempt: Iterable[str] = (),
+        soft: Iterable[str] = (),
+        hard: Iterable[str] = (),
+        default: str = SOFT
+    ):
+        if default not in POLICIES:
+            raise ValueError(f"Política de App Check desconocida: {default}")
+
+        self.default = RouteRule(DEFAULT_RULE, default)
+        self._trie: PathPrefixTrie[RouteRule] = PathPrefixTrie()
+        self.rules: Dict[str, RouteRule] = {}
+
+        # Orden de menor a mayor severidad: la última asignación gana
+        for policy, patterns in ((EXEMPT, exempt), (SOFT, soft), (HARD, hard)):
+            for pattern in patterns:
+                normalized = pattern[:-1] if pattern.endswith("/*") else pattern
+                rule = RouteRule(pattern, policy)
+                self.rules[normalized] = rule
+                self._trie.add(normalized, rule)
+
+    def decide(self, path: str) -> RouteRule:
+        """Regla más específica para el path (o la política por defecto)"""
+        return self._trie.match(path, self.default)
+
+    @staticmethod
+    def record(rule: RouteRule, result: str) -> None:
+        """Contar una decisión (result: exempt, allowed, soft_fail, rejected)"""
+        _decisions.inc(rule.pattern, rule.policy, result)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Decisiones por regla: {regla: {resultado: n}}"""
+        known = set(self.rules.values()) | {self.default}
+        stats: Dict[str, Dict[str, int]] = {}
+        for (pattern, policy, result), value in _decisions.collect().items():
+            if RouteRule(pattern, policy) in known:
+                stats.setdefault(pattern, {})[result] = value
+        return stats
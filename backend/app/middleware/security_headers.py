@@ -12,19 +12,23 @@ Headers Included:
 - Permissions-Policy (Feature control)
 """
 import os
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import Response
-from typing import Callable
+from typing import List, Tuple
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import logging
 
 logger = logging.getLogger(__name__)
 
+RawHeaders = List[Tuple[bytes, bytes]]
 
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
+
+class SecurityHeadersMiddleware:
     """
     Middleware that adds security headers to all responses.
 
+    Pure ASGI: headers are added to the `http.response.start` message, so
+    streaming responses and background tasks pass through untouched. The
+    header block is built once, as raw bytes, when the middleware is created.
+
     Configuration via environment variables:
         ENVIRONMENT: production, staging, or development
         ENABLE_HSTS: Enable HTTP Strict Transport Security (default: true in production)
@@ -32,8 +36,8 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
         CSP_REPORT_URI: URI for CSP violation reports (optional)
     """
 
-    def __init__(self, app, environment: str = None):
-        super().__init__(app)
+    def __init__(self, app: ASGIApp, environment: str = None):
+        self.app = app
         self.environment = environment or os.getenv("ENVIRONMENT", "development").lower()
 
         # HSTS configuration
@@ -43,18 +47,20 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
         # CSP configuration
         self.csp_report_uri = os.getenv("CSP_REPORT_URI", "")
 
+        # Precomputed header blocks (all responses / extra for /api/*)
+        self.static_headers = _encode_headers(self._build_static_headers())
+        self.api_headers = _encode_headers(self._build_api_headers())
+        self._static_names = {name for name, _ in self.static_headers}
+        self._all_names = self._static_names | {name for name, _ in self.api_headers}
+
         logger.info(
             f"Security Headers Middleware initialized - "
             f"Environment: {self.environment}, "
             f"HSTS: {self.enable_hsts}"
         )
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        """Add security headers to response."""
-        response = await call_next(request)
-
-        # IMPORTANT: Don't overwrite existing headers, only ADD security headers
-        # This preserves CORS headers set by CORSMiddleware
+    def _build_static_headers(self) -> dict:
+        """Security headers added to every response."""
         headers = {}
 
         # 1. HSTS - Force HTTPS (only in production over HTTPS)
@@ -121,17 +127,45 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
         # Prevent Flash/PDF from loading content cross-domain
         headers["X-Permitted-Cross-Domain-Policies"] = "none"
 
+        return headers
+
+    def _build_api_headers(self) -> dict:
+        """Extra headers for /api/* responses."""
         # 9. Cache-Control for sensitive endpoints
         # Prevent caching of API responses with sensitive data
-        if request.url.path.startswith("/api/"):
-            headers["Cache-Control"] = "no-store, no-cache, must-revalidate, private"
-            headers["Pragma"] = "no-cache"
-            headers["Expires"] = "0"
-
-        # Update response headers
-        response.headers.update(headers)
-
-        return response
+        return {
+            "Cache-Control": "no-store, no-cache, must-revalidate, private",
+            "Pragma": "no-cache",
+            "Expires": "0",
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if scope["path"].startswith("/api/"):
+            extra = self.static_headers + self.api_headers
+            names = self._all_names
+        else:
+            extra = self.static_headers
+            names = self._static_names
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                # Security headers replace any value set by the app; every
+                # other header (e.g. CORS) is kept as is
+                headers = [h for h in message.get("headers", []) if h[0].lower() not in names]
+                headers.extend(extra)
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+def _encode_headers(headers: dict) -> RawHeaders:
+    """{Name: value} -> [(b"name", b"value")] as used in ASGI messages."""
+    return [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()]
 
 
 def get_security_headers_summary() -> dict:
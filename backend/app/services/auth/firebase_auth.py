@@ -8,6 +8,8 @@ from fastapi import HTTPException, status
 from firebase_admin import auth
 from datetime import datetime
 
+from app.services.auth.token_cache import verified_token_cache
+
 logger = logging.getLogger(__name__)
 
 
@@ -37,11 +39,11 @@ class FirebaseAuthService:
             )
 
         try:
-            # Verify the token with Firebase
-            decoded_token = auth.verify_id_token(token, check_revoked=True)
+            # Verify the token with Firebase (cached; misses run on a thread pool)
+            decoded_token = await verified_token_cache.verify(token)
 
             # Log successful authentication
-            logger.info(f"Token verified successfully for user: {decoded_token.get('uid')}")
+            logger.debug(f"Token verified successfully for user: {decoded_token.get('uid')}")
 
             return decoded_token
 
@@ -69,6 +71,14 @@ class FirebaseAuthService:
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
+        except auth.UserDisabledError:
+            logger.warning("ID token received for a disabled user")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Cuenta deshabilitada",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
         except auth.CertificateFetchError:
             logger.error("Error fetching Firebase certificates")
             raise HTTPException(
@@ -294,6 +304,7 @@ class FirebaseAuthService:
         """
         try:
             auth.revoke_refresh_tokens(uid)
+            verified_token_cache.mark_revoked(uid)
             logger.info(f"Refresh tokens revoked for user: {uid}")
             return True
         except Exception as e:
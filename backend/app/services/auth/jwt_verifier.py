@@ -0,0 +1,393 @@
+"""
+Local verification of Firebase ID tokens and App Check tokens.
+
+Google's signing keys are kept in memory instead of being fetched by the
+SDK on the request path:
+- ID tokens: x509 certificates from the securetoken service account
+- App Check: the Firebase App Check JWKS
+- A background task refreshes each key set on its Cache-Control schedule;
+  if a refresh fails the last known keys keep being used (stale-while-error)
+- RS256 signatures are checked with `cryptography` (through PyJWT) on a
+  dedicated thread pool
+
+Claims are validated like firebase_admin does and the same exceptions are
+raised (auth.*IdTokenError for ID tokens, ValueError for App Check), so
+callers don't change. Falls back to the SDK when no project ID is known or
+the Auth emulator is in use.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import jwt
+from cryptography import x509
+from firebase_admin import app_check, auth
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ID_TOKEN_CERT_URL = (
+    "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+)
+ID_TOKEN_ISSUER_PREFIX = "https://securetoken.google.com/"
+APP_CHECK_JWKS_URL = "https://firebaseappcheck.googleapis.com/v1/jwks"
+APP_CHECK_ISSUER_PREFIX = "https://firebaseappcheck.googleapis.com/"
+
+# Refresh this long before the advertised expiry
+REFRESH_MARGIN_SECONDS = 300
+# Never refresh a key set more often than this
+MIN_REFRESH_INTERVAL_SECONDS = 60
+# Used when the key server sends no usable max-age
+DEFAULT_MAX_AGE_SECONDS = 3600
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+# http_get(url) -> (parsed JSON body, response headers)
+HttpGet = Callable[[str], Tuple[Any, Dict[str, str]]]
+
+
+def _http_get(url: str) -> Tuple[Any, Dict[str, str]]:
+    import httpx
+
+    response = httpx.get(url, timeout=10.0)
+    response.raise_for_status()
+    return response.json(), dict(response.headers)
+
+
+def parse_max_age(cache_control: Optional[str]) -> Optional[int]:
+    """Extract max-age (seconds) from a Cache-Control header."""
+    if not cache_control:
+        return None
+    match = _MAX_AGE_RE.search(cache_control)
+    return int(match.group(1)) if match else None
+
+
+def parse_x509_certificates(data: Dict[str, str]) -> Dict[str, Any]:
+    """{kid: PEM certificate} -> {kid: public key}"""
+    return {
+        kid: x509.load_pem_x509_certificate(pem.encode("utf-8")).public_key()
+        for kid, pem in data.items()
+    }
+
+
+def parse_jwks(data: Dict[str, Any]) -> Dict[str, Any]:
+    """JWKS document -> {kid: public key}"""
+    keys = {}
+    for jwk in data.get("keys", []):
+        if jwk.get("kty") == "RSA" and jwk.get("kid"):
+            keys[jwk["kid"]] = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(jwk))
+    return keys
+
+
+class SigningKeyStore:
+    """In-memory key set for one key endpoint, refreshed from outside the request path."""
+
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        parser: Callable[[Any], Dict[str, Any]],
+        http_get: Optional[HttpGet] = None,
+    ):
+        self.name = name
+        self.url = url
+        self.parser = parser
+        self._http_get = http_get or _http_get
+        self._keys: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._initial_load_lock = threading.Lock()
+
+        self.loaded = False
+        self.next_refresh_at = 0.0  # monotonic
+        self.last_attempt_at = 0.0  # monotonic
+        self.last_error: Optional[str] = None
+        self.refresh_count = 0
+
+    def get(self, kid: str) -> Optional[Any]:
+        return self._keys.get(kid)
+
+    @property
+    def seconds_until_refresh(self) -> float:
+        return max(0.0, self.next_refresh_at - time.monotonic())
+
+    def refresh(self) -> None:
+        """Fetch and swap in the current key set (blocking)."""
+        with self._lock:
+            self.last_attempt_at = time.monotonic()
+            try:
+                body, headers = self._http_get(self.url)
+                keys = self.parser(body)
+                if not keys:
+                    raise ValueError("key set is empty")
+            except Exception as e:
+                self.last_error = str(e)
+                self.next_refresh_at = time.monotonic() + settings.AUTH_KEY_REFRESH_RETRY_SECONDS
+                raise
+
+            max_age = parse_max_age(
+                {k.lower(): v for k, v in headers.items()}.get("cache-control")
+            ) or DEFAULT_MAX_AGE_SECONDS
+            self._keys = keys
+            self.loaded = True
+            self.last_error = None
+            self.refresh_count += 1
+            self.next_refresh_at = time.monotonic() + max(
+                MIN_REFRESH_INTERVAL_SECONDS, max_age - REFRESH_MARGIN_SECONDS
+            )
+            logger.info(f"Loaded {len(keys)} {self.name} signing keys (max-age {max_age}s)")
+
+    def ensure_loaded(self) -> None:
+        """Load the key set once if the background refresher hasn't yet."""
+        if not self.loaded:
+            with self._initial_load_lock:
+                if not self.loaded:
+                    self.refresh()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "keys": len(self._keys),
+            "refreshes": self.refresh_count,
+            "seconds_until_refresh": round(self.seconds_until_refresh, 1),
+            "last_error": self.last_error,
+        }
+
+
+class LocalJWTVerifier:
+    """Verifies Firebase ID and App Check tokens against locally cached keys."""
+
+    def __init__(
+        self,
+        project_id: Optional[str] = None,
+        enabled: bool = settings.AUTH_LOCAL_JWT_VERIFICATION,
+        clock_skew_seconds: int = settings.AUTH_JWT_CLOCK_SKEW_SECONDS,
+        max_workers: int = settings.AUTH_VERIFY_WORKERS,
+        http_get: Optional[HttpGet] = None,
+        get_user_fn: Optional[Callable[[str], Any]] = None,
+    ):
+        self._project_id = project_id
+        self.enabled = enabled
+        self.clock_skew_seconds = clock_skew_seconds
+        self._get_user_fn = get_user_fn or auth.get_user
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="jwt-verify")
+
+        self.id_token_keys = SigningKeyStore("ID token", ID_TOKEN_CERT_URL, parse_x509_certificates, http_get)
+        self.app_check_keys = SigningKeyStore("App Check", APP_CHECK_JWKS_URL, parse_jwks, http_get)
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Dict[str, asyncio.Event] = {}
+        self._tasks: list = []
+
+    @property
+    def project_id(self) -> Optional[str]:
+        if not self._project_id:
+            self._project_id = settings.FIREBASE_PROJECT_ID or None
+        if not self._project_id:
+            try:
+                import firebase_admin
+                self._project_id = firebase_admin.get_app().project_id
+            except Exception:
+                return None
+        return self._project_id
+
+    @property
+    def active(self) -> bool:
+        """Whether tokens are verified locally (otherwise via the SDK)."""
+        return (
+            self.enabled
+            and bool(self.project_id)
+            and not os.getenv("FIREBASE_AUTH_EMULATOR_HOST")
+        )
+
+    # ------------------------------------------------------------------
+    # ID tokens
+    # ------------------------------------------------------------------
+
+    def verify_id_token(self, token: str, check_revoked: bool = False) -> Dict[str, Any]:
+        """
+        Drop-in for auth.verify_id_token (blocking; call from a worker thread).
+
+        Raises:
+            auth.InvalidIdTokenError, auth.ExpiredIdTokenError,
+            auth.RevokedIdTokenError, auth.UserDisabledError,
+            auth.CertificateFetchError
+        """
+        if not self.active:
+            return auth.verify_id_token(token, check_revoked=check_revoked)
+
+        if not isinstance(token, str) or not token:
+            raise auth.InvalidIdTokenError("ID token must be a non-empty string.")
+
+        try:
+            self.id_token_keys.ensure_loaded()
+        except Exception as e:
+            raise auth.CertificateFetchError(f"Could not fetch ID token certificates: {e}", e)
+
+        project_id = self.project_id
+        try:
+            key = self._signing_key(self.id_token_keys, token)
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=["RS256"],
+                audience=project_id,
+                issuer=ID_TOKEN_ISSUER_PREFIX + project_id,
+                leeway=self.clock_skew_seconds,
+                options={"require": ["exp", "iat", "sub", "aud", "iss"]},
+            )
+        except jwt.ExpiredSignatureError as e:
+            raise auth.ExpiredIdTokenError("Token expired.", e)
+        except jwt.InvalidTokenError as e:
+            raise auth.InvalidIdTokenError(f"Invalid ID token: {e}", e)
+
+        subject = claims.get("sub")
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise auth.InvalidIdTokenError('ID token has an invalid "sub" (subject) claim.')
+        claims["uid"] = subject
+
+        if check_revoked:
+            self._check_revoked(claims)
+        return claims
+
+    async def verify_id_token_async(self, token: str, check_revoked: bool = False) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.verify_id_token, token, check_revoked)
+
+    def _check_revoked(self, claims: Dict[str, Any]) -> None:
+        user = self._get_user_fn(claims["uid"])
+        if user.disabled:
+            raise auth.UserDisabledError("The user record is disabled.")
+        valid_after_ms = user.tokens_valid_after_timestamp or 0
+        if claims["iat"] * 1000 < valid_after_ms:
+            raise auth.RevokedIdTokenError("The Firebase ID token has been revoked.")
+
+    # ------------------------------------------------------------------
+    # App Check tokens
+    # ------------------------------------------------------------------
+
+    def verify_app_check_token(self, token: str) -> Dict[str, Any]:
+        """
+        Drop-in for app_check.verify_token (blocking; call from a worker thread).
+
+        Raises:
+            ValueError: If the token is invalid or the keys are unavailable
+        """
+        if not self.active:
+            return app_check.verify_token(token)
+
+        if not isinstance(token, str) or not token:
+            raise ValueError("App Check token must be a non-empty string.")
+
+        try:
+            self.app_check_keys.ensure_loaded()
+        except Exception as e:
+            raise ValueError(f"Could not fetch App Check keys: {e}")
+
+        scoped_project_id = "projects/" + self.project_id
+        try:
+            header = jwt.get_unverified_header(token)
+            if header.get("typ") != "JWT":
+                raise ValueError("The provided App Check token has an incorrect type header")
+            key = self._signing_key(self.app_check_keys, token)
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=["RS256"],
+                audience=scoped_project_id,
+                leeway=self.clock_skew_seconds,
+                options={"require": ["exp", "sub", "aud", "iss"]},
+            )
+        except jwt.InvalidTokenError as e:
+            raise ValueError(f"Verifying App Check token failed. Error: {e}")
+
+        audience = claims.get("aud")
+        if not isinstance(audience, list) or scoped_project_id not in audience:
+            raise ValueError('Firebase App Check token has incorrect "aud" (audience) claim.')
+        if not str(claims.get("iss", "")).startswith(APP_CHECK_ISSUER_PREFIX):
+            raise ValueError('Token does not contain the correct "iss" (issuer).')
+        if not isinstance(claims.get("sub"), str) or not claims["sub"]:
+            raise ValueError('App Check token has an invalid "sub" (subject) claim.')
+
+        claims["app_id"] = claims["sub"]
+        return claims
+
+    async def verify_app_check_token_async(self, token: str) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.verify_app_check_token, token)
+
+    # ------------------------------------------------------------------
+    # Keys and background refresh
+    # ------------------------------------------------------------------
+
+    def _signing_key(self, store: SigningKeyStore, token: str) -> Any:
+        header = jwt.get_unverified_header(token)
+        if header.get("alg") != "RS256":
+            raise jwt.InvalidAlgorithmError(f"Expected RS256 but got {header.get('alg')}")
+        kid = header.get("kid")
+        if not kid:
+            raise jwt.InvalidTokenError('Token has no "kid" header.')
+
+        key = store.get(kid)
+        if key is None:
+            # Possibly a rotation we haven't seen yet: refresh early in the
+            # background instead of fetching on this request
+            self._request_refresh(store)
+            raise jwt.InvalidTokenError(f"No matching {store.name} signing key for kid {kid}")
+        return key
+
+    def _request_refresh(self, store: SigningKeyStore) -> None:
+        if time.monotonic() - store.last_attempt_at < MIN_REFRESH_INTERVAL_SECONDS:
+            return
+        event = self._wake.get(store.name)
+        if self._loop is not None and event is not None:
+            self._loop.call_soon_threadsafe(event.set)
+
+    async def start(self) -> None:
+        """Start the background key refreshers (idempotent)."""
+        if self._tasks or not self.active:
+            return
+        self._loop = asyncio.get_running_loop()
+        for store in (self.id_token_keys, self.app_check_keys):
+            self._wake[store.name] = asyncio.Event()
+            self._tasks.append(self._loop.create_task(self._refresh_loop(store)))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._wake = {}
+        self._loop = None
+
+    async def _refresh_loop(self, store: SigningKeyStore) -> None:
+        event = self._wake[store.name]
+        while True:
+            try:
+                await asyncio.wait_for(event.wait(), timeout=store.seconds_until_refresh)
+            except asyncio.TimeoutError:
+                pass
+            event.clear()
+
+            try:
+                await self._loop.run_in_executor(self.executor, store.refresh)
+            except Exception as e:
+                # Keep serving the last known keys; retried after a short delay
+                logger.warning(f"Refreshing {store.name} signing keys failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "id_token_keys": self.id_token_keys.stats(),
+            "app_check_keys": self.app_check_keys.stats(),
+        }
+
+
+# Global instance
+local_jwt_verifier = LocalJWTVerifier()
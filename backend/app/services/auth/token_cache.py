@@ -0,0 +1,218 @@
+"""
+Verified ID-token cache for FirebaseAuthService.
+
+Keeps decoded Firebase ID tokens in memory so that warm requests skip the
+`verify_id_token(check_revoked=True)` network round-trip:
+- Keyed by SHA-256 of the token (raw tokens are never stored)
+- Entries expire with the token's own `exp` claim
+- Revocation is tracked per user (`tokens_valid_after` / disabled) and
+  re-polled in the background every AUTH_REVOCATION_CHECK_INTERVAL seconds
+- `mark_revoked` applies a revocation immediately (push)
+- Cold verifications run on a thread pool, coalesced per token
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from firebase_admin import auth
+
+from app.core.config import settings
+from app.services.auth.jwt_verifier import local_jwt_verifier
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _UserRevocationState:
+    """Latest known revocation state for a user."""
+    valid_after: float  # epoch seconds; tokens issued before are revoked
+    disabled: bool
+    checked_at: float  # monotonic time of the last check
+
+
+class VerifiedTokenCache:
+    """Decoded-token cache with revocation-aware expiry."""
+
+    def __init__(
+        self,
+        max_entries: int = settings.AUTH_TOKEN_CACHE_SIZE,
+        revocation_check_interval: float = settings.AUTH_REVOCATION_CHECK_INTERVAL,
+        max_workers: int = settings.AUTH_VERIFY_WORKERS,
+        verify_fn: Optional[Callable[..., Dict[str, Any]]] = None,
+        get_user_fn: Optional[Callable[[str], Any]] = None,
+    ):
+        self.max_entries = max_entries
+        self.revocation_check_interval = revocation_check_interval
+        self._verify_fn = verify_fn or local_jwt_verifier.verify_id_token
+        self._get_user_fn = get_user_fn or auth.get_user
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="auth-verify")
+
+        self._tokens: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._users: Dict[str, _UserRevocationState] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._refreshing: set = set()
+        self._background_tasks: set = set()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def token_key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    async def verify(self, token: str) -> Dict[str, Any]:
+        """
+        Return decoded claims for a token, verifying it only on a cache miss.
+
+        Raises the same firebase_admin.auth errors as verify_id_token.
+        """
+        key = self.token_key(token)
+
+        claims = self._lookup(key)
+        if claims is not None:
+            return claims
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, self._verify_with_revocation, token)
+        self._inflight[key] = future
+        try:
+            claims = await future
+        finally:
+            self._inflight.pop(key, None)
+
+        with self._lock:
+            self.misses += 1
+            self._tokens[key] = claims
+            self._tokens.move_to_end(key)
+            while len(self._tokens) > self.max_entries:
+                self._tokens.popitem(last=False)
+        return claims
+
+    def mark_revoked(self, uid: str, valid_after: Optional[float] = None) -> None:
+        """
+        Apply a revocation (e.g. after revoke_refresh_tokens) immediately.
+
+        `valid_after` defaults to the current whole second, like Firebase's
+        tokens_valid_after: `iat` has second precision, so a token issued
+        later in the same second (re-login) must not count as revoked.
+        """
+        with self._lock:
+            state = self._users.get(uid)
+            self._users[uid] = _UserRevocationState(
+                valid_after=valid_after if valid_after is not None else int(time.time()),
+                disabled=state.disabled if state else False,
+                checked_at=time.monotonic(),
+            )
+
+    def invalidate_user(self, uid: str) -> None:
+        """Drop every cached token of a user."""
+        with self._lock:
+            for key in [k for k, c in self._tokens.items() if c.get("uid") == uid]:
+                del self._tokens[key]
+            self._users.pop(uid, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._tokens),
+                "users_tracked": len(self._users),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _verify_with_revocation(self, token: str) -> Dict[str, Any]:
+        """Blocking full verification (runs on the thread pool)."""
+        claims = self._verify_fn(token, check_revoked=True)
+        uid = claims.get("uid")
+        if uid:
+            with self._lock:
+                state = self._users.get(uid)
+                # check_revoked just passed, so the user state is fresh
+                self._users[uid] = _UserRevocationState(
+                    valid_after=state.valid_after if state else 0.0,
+                    disabled=False,
+                    checked_at=time.monotonic(),
+                )
+        return claims
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            claims = self._tokens.get(key)
+            if claims is None:
+                return None
+
+            if time.time() >= claims.get("exp", 0):
+                del self._tokens[key]
+                return None
+
+            uid = claims.get("uid")
+            state = self._users.get(uid)
+            if state is not None:
+                if state.disabled:
+                    del self._tokens[key]
+                    raise auth.UserDisabledError("The user record is disabled.")
+                if claims.get("iat", 0) < state.valid_after:
+                    del self._tokens[key]
+                    raise auth.RevokedIdTokenError("The Firebase ID token has been revoked.")
+
+            self._tokens.move_to_end(key)
+            self.hits += 1
+            stale = state is None or time.monotonic() - state.checked_at >= self.revocation_check_interval
+
+        if stale and uid:
+            self._schedule_revocation_check(uid)
+        return claims
+
+    def _schedule_revocation_check(self, uid: str) -> None:
+        with self._lock:
+            if uid in self._refreshing:
+                return
+            self._refreshing.add(uid)
+
+        task = asyncio.get_running_loop().create_task(self._refresh_user(uid))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _refresh_user(self, uid: str) -> None:
+        """Poll tokens_valid_after/disabled for a user in the background."""
+        try:
+            loop = asyncio.get_running_loop()
+            user = await loop.run_in_executor(self._executor, self._get_user_fn, uid)
+            valid_after_ms = getattr(user, "tokens_valid_after_timestamp", None) or 0
+            with self._lock:
+                self._users[uid] = _UserRevocationState(
+                    valid_after=valid_after_ms / 1000,
+                    disabled=bool(getattr(user, "disabled", False)),
+                    checked_at=time.monotonic(),
+                )
+        except auth.UserNotFoundError:
+            self.invalidate_user(uid)
+        except Exception as e:
+            # Keep serving cached tokens and retry after another interval
+            logger.warning(f"Background revocation check failed for user {uid}: {e}")
+            with self._lock:
+                state = self._users.get(uid)
+                if state is not None:
+                    state.checked_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._refreshing.discard(uid)
+
+
+# Global instance
+verified_token_cache = VerifiedTokenCache()
@@ -1,10 +1,23 @@
 """
 Firestore Backup Service for TuCitaSegura.
 Provides programmatic backup triggers and status monitoring.
+
+Backup listing does not walk the exported objects:
+- Folder names come from delimiter-based prefix listing (one request per
+  backup type, returning only the "backups/<type>/<timestamp>/" prefixes)
+- Sizes, file counts and metadata live in a compact manifest
+  (backups/index.json) updated when a backup is triggered and completes
+- Folders missing from the manifest (e.g. exports started by Cloud
+  Scheduler) are inspected concurrently, once, and written back to it
+- Unfinished folders are re-inspected at most every REINSPECT_INTERVAL and
+  marked "failed" once older than EXPORT_TIMEOUT, so abandoned exports are
+  not listed again on every call
 """
+import asyncio
+import json
 import logging
 import os
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Callable, List, Optional, Tuple
 from datetime import datetime, timedelta
 import httpx
 from google.cloud import storage
@@ -13,14 +26,34 @@ from google.api_core import exceptions as google_exceptions
 
 logger = logging.getLogger(__name__)
 
+# Manifest index of all backups (one JSON object, written with generation preconditions)
+MANIFEST_PATH = "backups/index.json"
+MANIFEST_VERSION = 1
+MANIFEST_WRITE_ATTEMPTS = 3
+
+TIMESTAMP_FORMAT = "%Y%m%d-%H%M%S"
+
+# Statuses that never change again (the folder is not re-inspected)
+TERMINAL_STATUSES = ("completed", "failed")
+# Exports without overall_export_metadata after this long are considered failed
+EXPORT_TIMEOUT = timedelta(hours=24)
+# Minimum time between inspections of an unfinished folder
+REINSPECT_INTERVAL = timedelta(minutes=10)
+
 
 class FirestoreBackupService:
     """Service for Firestore backup operations and monitoring."""
 
-    def __init__(self):
-        """Initialize Firestore backup service."""
+    def __init__(self, max_concurrency: int = 8):
+        """
+        Initialize Firestore backup service.
+
+        Args:
+            max_concurrency: Backup folders inspected in parallel
+        """
         self.project_id = os.getenv('FIREBASE_PROJECT_ID')
         self.bucket_name = f"{self.project_id}-backups" if self.project_id else None
+        self.max_concurrency = max_concurrency
         self.initialized = False
 
         if not self.project_id:
@@ -43,9 +76,175 @@ class FirestoreBackupService:
 
     def _get_backup_bucket_uri(self, backup_type: str = "manual") -> str:
         """Get the Cloud Storage bucket URI for backups."""
-        timestamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+        timestamp = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
         return f"gs://{self.bucket_name}/backups/{backup_type}/{timestamp}"
 
+    @staticmethod
+    def _folder_from_uri(output_uri: str) -> str:
+        """gs://bucket/backups/type/timestamp -> backups/type/timestamp"""
+        return output_uri[5:].split("/", 1)[1].rstrip("/")
+
+    # ------------------------------------------------------------------
+    # Manifest index
+    # ------------------------------------------------------------------
+
+    def _load_manifest(self, bucket) -> Tuple[Dict[str, Dict[str, Any]], int]:
+        """
+        Read the manifest (one request).
+
+        Returns:
+            ({folder: entry}, generation) - generation 0 if it does not exist yet
+        """
+        blob = bucket.blob(MANIFEST_PATH)
+        try:
+            data = json.loads(blob.download_as_bytes())
+        except google_exceptions.NotFound:
+            return {}, 0
+        return data.get("backups", {}), blob.generation or 0
+
+    def _save_manifest(self, bucket, entries: Dict[str, Dict[str, Any]], generation: int) -> None:
+        """Write the manifest only if nobody changed it since it was read."""
+        document = {
+            "version": MANIFEST_VERSION,
+            "updated_at": datetime.utcnow().isoformat(),
+            "backups": entries
+        }
+        bucket.blob(MANIFEST_PATH).upload_from_string(
+            json.dumps(document, separators=(",", ":"), sort_keys=True),
+            content_type="application/json",
+            if_generation_match=generation
+        )
+
+    def _update_manifest(self, mutate: Callable[[Dict[str, Dict[str, Any]]], None]) -> None:
+        """Read-modify-write of the manifest, retried on concurrent updates."""
+        bucket = self.storage_client.bucket(self.bucket_name)
+        for attempt in range(MANIFEST_WRITE_ATTEMPTS):
+            entries, generation = self._load_manifest(bucket)
+            mutate(entries)
+            try:
+                self._save_manifest(bucket, entries, generation)
+                return
+            except google_exceptions.PreconditionFailed:
+                if attempt == MANIFEST_WRITE_ATTEMPTS - 1:
+                    raise
+                logger.info("Backup manifest changed concurrently, retrying update")
+
+    async def record_backup(self, output_uri: str, **fields: Any) -> Dict[str, Any]:
+        """
+        Add or refresh a backup in the manifest.
+
+        Args:
+            output_uri: Export output URI (gs://bucket/backups/type/timestamp)
+            fields: Extra fields stored with the entry (operation_name, ...).
+                Without "status" the folder is inspected for size and completion.
+
+        Returns:
+            The stored manifest entry
+        """
+        folder = self._folder_from_uri(output_uri)
+        entry = dict(fields)
+        if "status" not in entry:
+            entry.update(await asyncio.to_thread(self._inspect_folder, folder))
+
+        def mutate(entries: Dict[str, Dict[str, Any]]) -> None:
+            entries[folder] = {**entries.get(folder, {}), **entry}
+
+        await asyncio.to_thread(self._update_manifest, mutate)
+        return entry
+
+    # ------------------------------------------------------------------
+    # Folder discovery and inspection
+    # ------------------------------------------------------------------
+
+    def _list_prefixes(self, prefix: str) -> List[str]:
+        """Sub-folders directly under `prefix` (delimiter listing, no objects)."""
+        iterator = self.storage_client.list_blobs(self.bucket_name, prefix=prefix, delimiter="/")
+        for _ in iterator.pages:
+            pass
+        return sorted(p.rstrip("/") for p in iterator.prefixes)
+
+    async def _list_backup_folders(self, backup_type: Optional[str] = None) -> List[str]:
+        """All backup folders (backups/<type>/<timestamp>), one listing per type."""
+        if backup_type:
+            types = [backup_type]
+        else:
+            types = [p.split("/")[-1] for p in await asyncio.to_thread(self._list_prefixes, "backups/")]
+        per_type = await asyncio.gather(
+            *[asyncio.to_thread(self._list_prefixes, f"backups/{name}/") for name in types]
+        )
+        return [folder for folders in per_type for folder in folders]
+
+    def _inspect_folder(self, folder: str) -> Dict[str, Any]:
+        """Size, file count, metadata and completion of one backup folder (blocking)."""
+        total_size = 0
+        file_count = 0
+        completed = False
+        metadata_blob = None
+        for blob in self.storage_client.list_blobs(self.bucket_name, prefix=f"{folder}/"):
+            total_size += blob.size or 0
+            file_count += 1
+            if blob.name.endswith("overall_export_metadata"):
+                completed = True
+            elif blob.name == f"{folder}/metadata.json":
+                metadata_blob = blob
+
+        metadata = None
+        if metadata_blob is not None:
+            try:
+                metadata = json.loads(metadata_blob.download_as_text())
+            except Exception as e:
+                logger.warning(f"Could not load metadata for {folder}: {e}")
+
+        parts = folder.split("/")
+        now = datetime.utcnow()
+        status = "completed"
+        if not completed:
+            try:
+                started = datetime.strptime(parts[2], TIMESTAMP_FORMAT)
+            except (IndexError, ValueError):
+                started = now
+            status = "failed" if now - started > EXPORT_TIMEOUT else "in_progress"
+
+        return {
+            "type": parts[1] if len(parts) > 1 else "unknown",
+            "timestamp": parts[2] if len(parts) > 2 else "unknown",
+            "size_bytes": total_size,
+            "file_count": file_count,
+            "metadata": metadata,
+            "status": status,
+            "inspected_at": now.isoformat()
+        }
+
+    @staticmethod
+    def _needs_inspection(entry: Dict[str, Any], now: datetime) -> bool:
+        """Whether a manifest entry is unknown, unfinished and due for a new look."""
+        if entry.get("status") in TERMINAL_STATUSES:
+            return False
+        inspected_at = entry.get("inspected_at")
+        if not inspected_at:
+            return True
+        try:
+            return now - datetime.fromisoformat(inspected_at) >= REINSPECT_INTERVAL
+        except ValueError:
+            return True
+
+    async def _inspect_folders(self, folders: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Inspect several folders concurrently (bounded by max_concurrency)."""
+        slots = asyncio.Semaphore(self.max_concurrency)
+
+        async def inspect(folder: str) -> Dict[str, Any]:
+            async with slots:
+                return await asyncio.to_thread(self._inspect_folder, folder)
+
+        results = await asyncio.gather(*[inspect(folder) for folder in folders], return_exceptions=True)
+        details = {}
+        for folder, result in zip(folders, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Could not inspect backup folder {folder}: {result}")
+                continue
+            details[folder] = result
+        return details
+
     async def trigger_backup(
         self,
         backup_type: str = "manual",
@@ -85,6 +284,17 @@ class FirestoreBackupService:
 
             logger.info(f"Backup operation started: {operation.operation.name}")
 
+            # Register the backup in the manifest; completion fills in sizes
+            try:
+                await self.record_backup(
+                    output_uri,
+                    operation_name=operation.operation.name,
+                    collection_ids=collection_ids or "all",
+                    status="in_progress"
+                )
+            except Exception as e:
+                logger.warning(f"Could not record backup in manifest: {e}")
+
             return {
                 "success": True,
                 "operation_name": operation.operation.name,
@@ -106,6 +316,9 @@ class FirestoreBackupService:
         """
         Get the status of a backup operation.
 
+        When the operation has completed, its manifest entry is finalized
+        with the backup size and metadata.
+
         Args:
             operation_name: The operation name from trigger_backup
 
@@ -125,12 +338,15 @@ class FirestoreBackupService:
             if operation.error.message:
                 error = operation.error.message
 
+            status = "completed" if done and not error else "failed" if error else "in_progress"
+            if status == "completed":
+                await self._finalize_manifest_entry(operation_name)
+
             return {
                 "operation_name": operation_name,
                 "done": done,
                 "error": error,
-                "status": "completed" if done and not error else
-                         "failed" if error else "in_progress"
+                "status": status
             }
 
         except Exception as e:
@@ -141,6 +357,18 @@ class FirestoreBackupService:
                 "status": "error"
             }
 
+    async def _finalize_manifest_entry(self, operation_name: str) -> None:
+        """Fill in size/metadata of the manifest entry of a completed operation."""
+        try:
+            bucket = self.storage_client.bucket(self.bucket_name)
+            entries, _ = await asyncio.to_thread(self._load_manifest, bucket)
+            for folder, entry in entries.items():
+                if entry.get("operation_name") == operation_name and entry.get("status") != "completed":
+                    await self.record_backup(f"gs://{self.bucket_name}/{folder}")
+                    return
+        except Exception as e:
+            logger.warning(f"Could not update backup manifest for {operation_name}: {e}")
+
     async def list_backups(
         self,
         backup_type: Optional[str] = None,
@@ -149,6 +377,10 @@ class FirestoreBackupService:
         """
         List recent backups from Cloud Storage.
 
+        Reads the manifest plus one prefix listing per backup type; only
+        folders the manifest does not know as finished are inspected, at
+        most once per REINSPECT_INTERVAL.
+
         Args:
             backup_type: Filter by backup type (None = all types)
             limit: Maximum number of backups to return
@@ -162,52 +394,53 @@ class FirestoreBackupService:
         try:
             bucket = self.storage_client.bucket(self.bucket_name)
 
-            # List backups
-            prefix = f"backups/{backup_type}/" if backup_type else "backups/"
-            blobs = bucket.list_blobs(prefix=prefix, delimiter="/")
-
-            # Group by backup folder
-            backup_folders = set()
-            for blob in blobs:
-                # Extract backup folder from path
-                parts = blob.name.split("/")
-                if len(parts) >= 4:  # backups/type/timestamp/...
-                    backup_folder = "/".join(parts[:3])
-                    backup_folders.add(backup_folder)
+            (entries, _), folders = await asyncio.gather(
+                asyncio.to_thread(self._load_manifest, bucket),
+                self._list_backup_folders(backup_type)
+            )
 
             # Sort by timestamp (most recent first)
-            sorted_folders = sorted(backup_folders, reverse=True)[:limit]
-
-            # Get details for each backup
-            backups = []
-            for folder in sorted_folders:
-                parts = folder.split("/")
-                backup_type_name = parts[1] if len(parts) > 1 else "unknown"
-                timestamp_str = parts[2] if len(parts) > 2 else "unknown"
-
-                # Get metadata if exists
-                metadata_path = f"{folder}/metadata.json"
-                metadata = None
+            recent = sorted(folders, key=lambda folder: folder.rsplit("/", 1)[-1], reverse=True)[:limit]
+
+            # Inspect only folders the manifest does not cover yet (or due again)
+            now = datetime.utcnow()
+            unknown = [
+                folder for folder in recent
+                if self._needs_inspection(entries.get(folder, {}), now)
+            ]
+            inspected = await self._inspect_folders(unknown) if unknown else {}
+
+            existing = set(folders)
+            scope = f"backups/{backup_type}/" if backup_type else "backups/"
+            removed = [folder for folder in entries if folder.startswith(scope) and folder not in existing]
+            if inspected or removed:
+                # Self-heal the manifest: add discovered folders, drop deleted ones
+                def mutate(current: Dict[str, Dict[str, Any]]) -> None:
+                    for folder, details in inspected.items():
+                        current[folder] = {**current.get(folder, {}), **details}
+                    for folder in removed:
+                        current.pop(folder, None)
 
                 try:
-                    metadata_blob = bucket.blob(metadata_path)
-                    if metadata_blob.exists():
-                        import json
-                        metadata = json.loads(metadata_blob.download_as_text())
+                    await asyncio.to_thread(self._update_manifest, mutate)
                 except Exception as e:
-                    logger.warning(f"Could not load metadata for {folder}: {e}")
+                    logger.warning(f"Could not update backup manifest: {e}")
 
-                # Calculate backup size (sum of all blobs in folder)
-                folder_blobs = bucket.list_blobs(prefix=f"{folder}/")
-                total_size = sum(blob.size for blob in folder_blobs)
+            backups = []
+            for folder in recent:
+                entry = {**entries.get(folder, {}), **inspected.get(folder, {})}
+                parts = folder.split("/")
+                total_size = entry.get("size_bytes", 0)
 
                 backups.append({
                     "path": f"gs://{self.bucket_name}/{folder}",
-                    "type": backup_type_name,
-                    "timestamp": timestamp_str,
+                    "type": parts[1] if len(parts) > 1 else "unknown",
+                    "timestamp": parts[2] if len(parts) > 2 else "unknown",
                     "size_bytes": total_size,
                     "size_mb": round(total_size / (1024 * 1024), 2),
-                    "metadata": metadata
+                    "file_count": entry.get("file_count", 0),
+                    "status": entry.get("status", "unknown"),
+                    "metadata": entry.get("metadata")
                 })
 
             return {
@@ -260,7 +493,7 @@ class FirestoreBackupService:
             # Check if bucket exists
             try:
                 bucket = self.storage_client.bucket(self.bucket_name)
-                bucket.reload()
+                await asyncio.to_thread(bucket.reload)
                 checks["bucket_accessible"] = True
             except google_exceptions.NotFound:
                 errors.append(f"Backup bucket not found: {self.bucket_name}")
@@ -270,7 +503,7 @@ class FirestoreBackupService:
             # Check for recent backups (within last 48 hours)
             if checks["bucket_accessible"]:
                 try:
-                    recent_backups = await self.list_backups(limit=5)
+                    recent_backups = await self.list_backups(limit=1)
                     if recent_backups.get("count", 0) > 0:
                         # Check timestamp of most recent backup
                         latest = recent_backups["backups"][0]
@@ -280,7 +513,7 @@ class FirestoreBackupService:
                             # Parse timestamp (format: YYYYMMDD-HHMMSS)
                             backup_time = datetime.strptime(
                                 timestamp_str,
-                                "%Y%m%d-%H%M%S"
+                                TIMESTAMP_FORMAT
                             )
                             age = datetime.utcnow() - backup_time
 
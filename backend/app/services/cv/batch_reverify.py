@@ -0,0 +1,457 @@
+"""
+TuCitaSegura - Re-verificación masiva del corpus de fotos
+
+Punto de entrada por lotes para volver a pasar todas las fotos de perfil
+por `PhotoVerification` tras cambiar un umbral:
+- Recorre `profile_photos/` en Cloud Storage o en un espejo local
+- Decodifica imágenes en un pool de hilos
+- Ejecuta los analizadores en un pool de procesos; los píxeles se pasan por
+  memoria compartida en lugar de serializarlos con pickle
+- Escribe resultados en bloque (NDJSON o lotes de Firestore)
+- Es reanudable mediante un fichero de checkpoint
+- Informa de imágenes/segundo y del coste de cada analizador
+
+Uso:
+    python -m app.services.cv.batch_reverify --local-root ./mirror --output results.ndjson
+    python -m app.services.cv.batch_reverify --bucket mi-bucket --write-firestore \\
+        --checkpoint reverify.checkpoint.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from multiprocessing import shared_memory
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.cv.photo_verifier import PhotoVerification, PhotoVerificationResult
+from app.services.cv.verification_cache import _json_default
+from app.services.storage.image_derivatives import is_derivative_path
+
+logger = logging.getLogger(__name__)
+
+PROFILE_PHOTOS_PREFIX = "profile_photos"
+
+# Operaciones máximas por lote de escritura de Firestore
+FIRESTORE_BATCH_LIMIT = 500
+
+
+# ============================================================================
+# FUENTES DE FOTOS
+# ============================================================================
+
+class LocalPhotoSource:
+    """Espejo local del bucket: <root>/profile_photos/<user_id>/<photo_type>"""
+
+    def __init__(self, root: str, prefix: str = PROFILE_PHOTOS_PREFIX):
+        self.root = root
+        self.prefix = prefix.strip("/")
+
+    def list_ids(self, start_after: Optional[str] = None) -> Iterator[str]:
+        """Listar ids de foto (rutas relativas) en orden lexicográfico"""
+        base = os.path.join(self.root, self.prefix)
+        photo_ids = []
+        for dirpath, _, filenames in os.walk(base):
+            for filename in filenames:
+                rel = os.path.relpath(os.path.join(dirpath, filename), self.root)
+                if not is_derivative_path(filename):
+                    photo_ids.append(rel.replace(os.sep, "/"))
+        photo_ids.sort()
+        for photo_id in photo_ids:
+            if start_after is None or photo_id > start_after:
+                yield photo_id
+
+    def read(self, photo_id: str) -> bytes:
+        with open(os.path.join(self.root, *photo_id.split("/")), "rb") as fh:
+            return fh.read()
+
+    def url(self, photo_id: str) -> str:
+        return os.path.join(self.root, *photo_id.split("/"))
+
+
+class StoragePhotoSource:
+    """Fotos de perfil en un bucket de Cloud Storage"""
+
+    def __init__(self, bucket, prefix: str = PROFILE_PHOTOS_PREFIX):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+
+    def list_ids(self, start_after: Optional[str] = None) -> Iterator[str]:
+        """Listar blobs; Cloud Storage ya devuelve orden lexicográfico"""
+        blobs = self.bucket.list_blobs(prefix=f"{self.prefix}/", start_offset=start_after)
+        for blob in blobs:
+            if blob.name.endswith("/") or is_derivative_path(blob.name):
+                continue
+            if start_after is None or blob.name > start_after:
+                yield blob.name
+
+    def read(self, photo_id: str) -> bytes:
+        return self.bucket.blob(photo_id).download_as_bytes()
+
+    def url(self, photo_id: str) -> str:
+        return self.bucket.blob(photo_id).public_url
+
+
+def parse_photo_id(photo_id: str) -> Tuple[Optional[str], Optional[str]]:
+    """Extraer (user_id, photo_type) de profile_photos/<user_id>/<photo_type>"""
+    parts = photo_id.split("/")
+    if len(parts) >= 3 and parts[0] == PROFILE_PHOTOS_PREFIX:
+        return parts[1], parts[2]
+    return None, None
+
+
+# ============================================================================
+# DESTINOS DE RESULTADOS
+# ============================================================================
+
+class NdjsonResultSink:
+    """Escribe un resultado por línea en un fichero NDJSON (modo append)"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write_many(self, records: List[Dict[str, Any]]) -> None:
+        if not records:
+            return
+        with open(self.path, "a", encoding="utf-8") as fh:
+            for record in records:
+                fh.write(json.dumps(record, default=_json_default))
+                fh.write("\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+
+
+class FirestoreResultSink:
+    """Escribe auditoría y estado de perfil con lotes `batch()` de Firestore"""
+
+    def __init__(self, db, verifier: PhotoVerification, batch_limit: int = FIRESTORE_BATCH_LIMIT):
+        self.db = db
+        self.verifier = verifier
+        self.batch_limit = batch_limit
+
+    def write_many(self, records: List[Dict[str, Any]]) -> None:
+        batch = self.db.batch()
+        operations = 0
+        for record in records:
+            user_id = record.get("user_id")
+            if not user_id:
+                continue
+            result = PhotoVerificationResult(**record["result"])
+
+            batch.set(
+                self.db.collection("photo_verifications").document(),
+                self.verifier.verification_record(user_id, record["image_url"], result)
+            )
+            batch.update(
+                self.db.collection("users").document(user_id),
+                self.verifier.profile_update(result)
+            )
+            operations += 2
+
+            if operations >= self.batch_limit - 1:
+                batch.commit()
+                batch = self.db.batch()
+                operations = 0
+
+        if operations:
+            batch.commit()
+
+
+class FanOutSink:
+    """Reenvía cada bloque de resultados a varios destinos"""
+
+    def __init__(self, sinks: List[Any]):
+        self.sinks = sinks
+
+    def write_many(self, records: List[Dict[str, Any]]) -> None:
+        for sink in self.sinks:
+            sink.write_many(records)
+
+
+# ============================================================================
+# CHECKPOINT
+# ============================================================================
+
+def load_checkpoint(path: Optional[str], fingerprint: str) -> Dict[str, Any]:
+    """Cargar el checkpoint; se ignora si pertenece a otra huella de pipeline"""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            checkpoint = json.load(fh)
+    except (OSError, ValueError) as e:
+        logger.warning(f"[BatchReverify] Checkpoint ilegible, se empieza de cero: {e}")
+        return {}
+    if checkpoint.get("fingerprint") != fingerprint:
+        logger.warning("[BatchReverify] El checkpoint es de otra versión del pipeline, se empieza de cero")
+        return {}
+    return checkpoint
+
+
+def save_checkpoint(path: Optional[str], checkpoint: Dict[str, Any]) -> None:
+    """Guardar el checkpoint de forma atómica"""
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(checkpoint, fh)
+    os.replace(tmp_path, path)
+
+
+# ============================================================================
+# TRABAJADORES DE ANÁLISIS (procesos)
+# ============================================================================
+
+_worker_verifier: Optional[PhotoVerification] = None
+
+
+def _init_worker(thresholds: Dict[str, Any]) -> None:
+    """Crear el verificador del proceso con los mismos umbrales que el padre"""
+    global _worker_verifier
+    _worker_verifier = PhotoVerification()
+    for name, value in thresholds.items():
+        setattr(_worker_verifier, name, value)
+
+
+def _analyze_shared(shm_name: str, shape: Tuple[int, ...], dtype: str) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """Analizar una imagen alojada en memoria compartida"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        image = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        timings: Dict[str, float] = {}
+        result = _worker_verifier.analyze_image(image, timings=timings)
+        del image
+        # Normalizar escalares de numpy para devolver solo tipos nativos
+        payload = json.loads(json.dumps(asdict(result), default=_json_default))
+        return payload, timings
+    finally:
+        shm.close()
+
+
+# ============================================================================
+# EJECUCIÓN
+# ============================================================================
+
+@dataclass
+class ReverifyReport:
+    """Métricas de una ejecución de re-verificación"""
+    processed: int = 0
+    failed: int = 0
+    elapsed_s: float = 0.0
+    decode_ms: float = 0.0
+    analyzer_ms: Dict[str, float] = field(default_factory=dict)
+    resumed_from: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        images_per_second = self.processed / self.elapsed_s if self.elapsed_s > 0 else 0.0
+        per_image = max(self.processed, 1)
+        return {
+            "processed": self.processed,
+            "failed": self.failed,
+            "elapsed_s": round(self.elapsed_s, 2),
+            "images_per_second": round(images_per_second, 2),
+            "resumed_from": self.resumed_from,
+            "decode_ms": {
+                "total": round(self.decode_ms, 2),
+                "mean": round(self.decode_ms / per_image, 2),
+            },
+            "analyzers": {
+                name: {"total_ms": round(total, 2), "mean_ms": round(total / per_image, 2)}
+                for name, total in sorted(self.analyzer_ms.items())
+            },
+        }
+
+
+class BatchReverifier:
+    """Re-verificación por bloques de un corpus de fotos"""
+
+    def __init__(
+        self,
+        source,
+        sink,
+        verifier: Optional[PhotoVerification] = None,
+        decode_workers: int = 8,
+        analyze_workers: Optional[int] = None,
+        chunk_size: int = 64,
+        checkpoint_path: Optional[str] = None
+    ):
+        self.source = source
+        self.sink = sink
+        self.verifier = verifier or PhotoVerification()
+        self.decode_workers = decode_workers
+        self.analyze_workers = analyze_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.checkpoint_path = checkpoint_path
+
+    def _decode(self, photo_id: str) -> Tuple[str, Optional[np.ndarray], float]:
+        start = time.perf_counter()
+        try:
+            image = self.verifier.preprocess_image_bytes(self.source.read(photo_id))
+        except Exception as e:
+            logger.error(f"[BatchReverify] Error leyendo {photo_id}: {e}")
+            image = None
+        return photo_id, image, (time.perf_counter() - start) * 1000
+
+    def _chunks(self, start_after: Optional[str]) -> Iterator[List[str]]:
+        chunk: List[str] = []
+        for photo_id in self.source.list_ids(start_after=start_after):
+            chunk.append(photo_id)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _process_chunk(self, photo_ids, decode_pool, analyze_pool, report: ReverifyReport) -> List[Dict[str, Any]]:
+        pending = []
+        try:
+            for photo_id, image, decode_ms in decode_pool.map(self._decode, photo_ids):
+                report.decode_ms += decode_ms
+                if image is None:
+                    report.failed += 1
+                    continue
+                shm = shared_memory.SharedMemory(create=True, size=image.nbytes)
+                try:
+                    np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)[:] = image
+                    future = analyze_pool.submit(_analyze_shared, shm.name, image.shape, image.dtype.str)
+                except Exception:
+                    shm.close()
+                    shm.unlink()
+                    raise
+                pending.append((photo_id, shm, future))
+
+            records = []
+            for photo_id, shm, future in pending:
+                try:
+                    payload, timings = future.result()
+                except Exception as e:
+                    logger.error(f"[BatchReverify] Error analizando {photo_id}: {e}")
+                    report.failed += 1
+                    continue
+                for name, elapsed in timings.items():
+                    report.analyzer_ms[name] = report.analyzer_ms.get(name, 0.0) + elapsed
+                user_id, photo_type = parse_photo_id(photo_id)
+                records.append({
+                    "photo_id": photo_id,
+                    "user_id": user_id,
+                    "photo_type": photo_type,
+                    "image_url": self.source.url(photo_id),
+                    "result": payload,
+                })
+            return records
+        finally:
+            for _, shm, _ in pending:
+                shm.close()
+                shm.unlink()
+
+    def run(self) -> Dict[str, Any]:
+        """Ejecutar la re-verificación completa y devolver el informe"""
+        fingerprint = self.verifier.pipeline_fingerprint()
+        checkpoint = load_checkpoint(self.checkpoint_path, fingerprint)
+        report = ReverifyReport(
+            processed=checkpoint.get("processed", 0),
+            failed=checkpoint.get("failed", 0),
+            resumed_from=checkpoint.get("last_id"),
+        )
+        already_processed = report.processed
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.decode_workers) as decode_pool, \
+                ProcessPoolExecutor(
+                    max_workers=self.analyze_workers,
+                    initializer=_init_worker,
+                    initargs=(self.verifier.analyzer_thresholds(),)
+                ) as analyze_pool:
+            for photo_ids in self._chunks(report.resumed_from):
+                records = self._process_chunk(photo_ids, decode_pool, analyze_pool, report)
+                self.sink.write_many(records)
+                report.processed += len(records)
+
+                save_checkpoint(self.checkpoint_path, {
+                    "fingerprint": fingerprint,
+                    "last_id": photo_ids[-1],
+                    "processed": report.processed,
+                    "failed": report.failed,
+                })
+                elapsed = time.perf_counter() - start
+                rate = (report.processed - already_processed) / elapsed if elapsed > 0 else 0.0
+                logger.info(f"[BatchReverify] {report.processed} fotos procesadas ({rate:.1f} img/s), último: {photo_ids[-1]}")
+
+        report.elapsed_s = time.perf_counter() - start
+        # La tasa refleja solo el trabajo de esta ejecución
+        summary = report.to_dict()
+        summary["images_per_second"] = round(
+            (report.processed - already_processed) / report.elapsed_s, 2
+        ) if report.elapsed_s > 0 else 0.0
+        return summary
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Re-verificar el corpus de fotos de perfil")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--local-root", help="Directorio espejo del bucket (contiene profile_photos/)")
+    source.add_argument("--bucket", help="Bucket de Cloud Storage (por defecto FIREBASE_STORAGE_BUCKET)", nargs="?", const="")
+    parser.add_argument("--prefix", default=PROFILE_PHOTOS_PREFIX, help="Prefijo de las fotos")
+    parser.add_argument("--output", help="Fichero NDJSON de resultados")
+    parser.add_argument("--write-firestore", action="store_true", help="Escribir resultados en Firestore por lotes")
+    parser.add_argument("--checkpoint", help="Fichero de checkpoint para reanudar")
+    parser.add_argument("--decode-workers", type=int, default=8)
+    parser.add_argument("--analyze-workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=64)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    args = _build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if not args.output and not args.write_firestore:
+        raise SystemExit("Indica --output y/o --write-firestore")
+
+    needs_firebase = args.bucket is not None or args.write_firestore
+    if needs_firebase:
+        import firebase_admin
+        try:
+            firebase_admin.get_app()
+        except ValueError:
+            firebase_admin.initialize_app()
+
+    if args.local_root:
+        source = LocalPhotoSource(args.local_root, args.prefix)
+    else:
+        from firebase_admin import storage
+        bucket_name = args.bucket or os.getenv("FIREBASE_STORAGE_BUCKET")
+        source = StoragePhotoSource(storage.bucket(bucket_name), args.prefix)
+
+    verifier = PhotoVerification()
+    sinks = []
+    if args.output:
+        sinks.append(NdjsonResultSink(args.output))
+    if args.write_firestore:
+        sinks.append(FirestoreResultSink(verifier.db, verifier))
+
+    reverifier = BatchReverifier(
+        source,
+        FanOutSink(sinks),
+        verifier=verifier,
+        decode_workers=args.decode_workers,
+        analyze_workers=args.analyze_workers,
+        chunk_size=args.chunk_size,
+        checkpoint_path=args.checkpoint
+    )
+    summary = reverifier.run()
+    print(json.dumps(summary, indent=2))
+    return summary
+
+
+if __name__ == "__main__":
+    main()
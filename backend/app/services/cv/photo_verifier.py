@@ -12,8 +12,8 @@ Este módulo implementa verificación de autenticidad de fotos usando:
 
 import cv2
 import numpy as np
-from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass, asdict
 import logging
 from PIL import Image, ImageEnhance
 import requests
@@ -23,9 +23,21 @@ from datetime import datetime
 import firebase_admin
 from firebase_admin import firestore
 import json
+import time
+
+from app.core.config import settings
+from app.services.cv.verification_cache import (
+    PhotoVerificationCache,
+    hash_pixels,
+    pipeline_fingerprint,
+)
 
 logger = logging.getLogger(__name__)
 
+# Versión del pipeline de análisis. Incrementar al cambiar la lógica de los
+# analizadores para invalidar los resultados cacheados.
+PIPELINE_VERSION = "1"
+
 @dataclass
 class FaceDetection:
     """Resultado de detección de rostros"""
@@ -84,7 +96,7 @@ class PhotoVerification:
     """
     
     def __init__(self):
-        self.db = firestore.client()
+        self._db = None
         self.min_face_confidence = 0.7
         self.max_filter_intensity = 0.3
         self.min_quality_score = 0.6
@@ -100,6 +112,35 @@ class PhotoVerification:
         self.filter_detector = None
         self.content_classifier = None
         
+        # Caché de resultados direccionada por contenido
+        self.result_cache = PhotoVerificationCache(
+            fingerprint=self.pipeline_fingerprint(),
+            max_entries=settings.CV_VERIFICATION_CACHE_SIZE,
+            cache_dir=settings.CV_VERIFICATION_CACHE_DIR or None
+        )
+        
+    @property
+    def db(self):
+        """Cliente de Firestore (se resuelve al primer uso; el análisis no lo necesita)"""
+        if self._db is None:
+            self._db = firestore.client()
+        return self._db
+    
+    def analyzer_thresholds(self) -> Dict[str, Any]:
+        """Umbrales actuales de los analizadores (forman parte de la huella del pipeline)"""
+        return {
+            "min_face_confidence": self.min_face_confidence,
+            "max_filter_intensity": self.max_filter_intensity,
+            "min_quality_score": self.min_quality_score,
+            "min_age_confidence": self.min_age_confidence,
+            "max_editing_score": self.max_editing_score,
+            "min_verification_score": self.min_verification_score,
+        }
+    
+    def pipeline_fingerprint(self) -> str:
+        """Huella del pipeline: versión + umbrales actuales"""
+        return pipeline_fingerprint(PIPELINE_VERSION, self.analyzer_thresholds())
+    
     def verify_photo(
         self, 
         image_url: str, 
@@ -127,63 +168,23 @@ class PhotoVerification:
             if image is None:
                 return self._create_error_result("No se pudo descargar o procesar la imagen")
             
-            # 2. Detección de rostros
-            faces = self._detect_faces(image)
-            
-            # 3. Verificar si es persona real
-            is_real = self._verify_real_person(image, faces)
-            
-            # 4. Estimar edad
-            age_result = self._estimate_age(image, faces)
-            
-            # 5. Detectar filtros y edición
-            filter_result = self._detect_filters(image)
+            # Consultar la caché por contenido (los umbrales pueden haber cambiado)
+            self.result_cache.set_fingerprint(self.pipeline_fingerprint())
+            cache_key = self.result_cache.make_key(hash_pixels(image), claimed_age)
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                result = PhotoVerificationResult(**cached)
+                result.processing_time_ms = int((datetime.now() - start_time).total_seconds() * 1000)
+                result.details["cache_hit"] = True
+                logger.info(f"[PhotoVerification] Resultado obtenido de caché en {result.processing_time_ms}ms")
+                if user_id:
+                    self._save_verification_result(user_id, image_url, result, audit=False)
+                return result
             
-            # 6. Análisis de contenido
-            content_result = self._analyze_content(image)
+            # 2-11. Análisis completo
+            result = self.analyze_image(image, claimed_age, start_time=start_time)
             
-            # 7. Evaluar calidad de imagen
-            quality_score = self._assess_image_quality(image)
-            
-            # 8. Verificar consistencia con edad declarada
-            age_consistency = self._check_age_consistency(claimed_age, age_result)
-            
-            # 9. Calcular score final y recomendaciones
-            verification_score = self._calculate_verification_score(
-                is_real, filter_result, content_result, quality_score, age_consistency
-            )
-            
-            # 10. Generar recomendación final
-            recommendation = self._generate_recommendation(verification_score, filter_result, content_result)
-            
-            # 11. Preparar warnings
-            warnings = self._generate_warnings(age_consistency, filter_result, content_result, quality_score)
-            
-            processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
-            
-            result = PhotoVerificationResult(
-                is_real_person=is_real,
-                has_excessive_filters=filter_result.has_filters and filter_result.filter_intensity > self.max_filter_intensity,
-                is_appropriate=content_result.is_appropriate,
-                estimated_age=age_result.predicted_age if age_result else 0,
-                confidence=verification_score,
-                faces_detected=len(faces),
-                warnings=warnings,
-                details={
-                    'face_detection': len(faces),
-                    'filter_analysis': filter_result.__dict__,
-                    'content_analysis': content_result.__dict__,
-                    'quality_score': quality_score,
-                    'age_consistency': age_consistency,
-                    'processing_time_ms': processing_time
-                },
-                verification_score=verification_score,
-                recommendation=recommendation,
-                processing_time_ms=processing_time
-            )
-            
-            # Log del resultado
-            logger.info(f"[PhotoVerification] Verificación completada en {processing_time}ms - Score: {verification_score:.2f}")
+            self.result_cache.set(cache_key, asdict(result))
             
             # Guardar en Firestore para auditoría
             if user_id:
@@ -196,14 +197,116 @@ class PhotoVerification:
             processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
             return self._create_error_result(f"Error en verificación: {str(e)}", processing_time)
     
+    def analyze_image(
+        self,
+        image: np.ndarray,
+        claimed_age: Optional[int] = None,
+        start_time: Optional[datetime] = None,
+        timings: Optional[Dict[str, float]] = None
+    ) -> PhotoVerificationResult:
+        """
+        Ejecutar todos los analizadores sobre una imagen ya preprocesada
+        
+        No accede a red ni a Firestore, por lo que puede ejecutarse en
+        procesos de trabajo (ver batch_reverify).
+        
+        Args:
+            image: Imagen RGB preprocesada
+            claimed_age: Edad declarada por el usuario
+            start_time: Inicio de la verificación (para processing_time_ms)
+            timings: Si se indica, acumula el tiempo en ms de cada analizador
+            
+        Returns:
+            Resultado completo de verificación
+        """
+        start_time = start_time or datetime.now()
+        
+        def timed(name, fn, *args):
+            if timings is None:
+                return fn(*args)
+            step_start = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                timings[name] = timings.get(name, 0.0) + (time.perf_counter() - step_start) * 1000
+        
+        # 2. Detección de rostros
+        faces = timed("detect_faces", self._detect_faces, image)
+        
+        # 3. Verificar si es persona real
+        is_real = timed("verify_real_person", self._verify_real_person, image, faces)
+        
+        # 4. Estimar edad
+        age_result = timed("estimate_age", self._estimate_age, image, faces)
+        
+        # 5. Detectar filtros y edición
+        filter_result = timed("detect_filters", self._detect_filters, image)
+        
+        # 6. Análisis de contenido
+        content_result = timed("analyze_content", self._analyze_content, image)
+        
+        # 7. Evaluar calidad de imagen
+        quality_score = timed("assess_image_quality", self._assess_image_quality, image)
+        
+        # 8. Verificar consistencia con edad declarada
+        age_consistency = self._check_age_consistency(claimed_age, age_result)
+        
+        # 9. Calcular score final y recomendaciones
+        verification_score = self._calculate_verification_score(
+            is_real, filter_result, content_result, quality_score, age_consistency
+        )
+        
+        # 10. Generar recomendación final
+        recommendation = self._generate_recommendation(verification_score, filter_result, content_result)
+        
+        # 11. Preparar warnings
+        warnings = self._generate_warnings(age_consistency, filter_result, content_result, quality_score)
+        
+        processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
+        
+        result = PhotoVerificationResult(
+            is_real_person=is_real,
+            has_excessive_filters=filter_result.has_filters and filter_result.filter_intensity > self.max_filter_intensity,
+            is_appropriate=content_result.is_appropriate,
+            estimated_age=age_result.predicted_age if age_result else 0,
+            confidence=verification_score,
+            faces_detected=len(faces),
+            warnings=warnings,
+            details={
+                'face_detection': len(faces),
+                'filter_analysis': filter_result.__dict__,
+                'content_analysis': content_result.__dict__,
+                'quality_score': quality_score,
+                'age_consistency': age_consistency,
+                'processing_time_ms': processing_time
+            },
+            verification_score=verification_score,
+            recommendation=recommendation,
+            processing_time_ms=processing_time
+        )
+        
+        # Log del resultado
+        logger.info(f"[PhotoVerification] Verificación completada en {processing_time}ms - Score: {verification_score:.2f}")
+        
+        return result
+    
     def _download_and_preprocess_image(self, image_url: str) -> Optional[np.ndarray]:
         """Descargar y preprocesar imagen"""
         try:
             response = requests.get(image_url, timeout=10)
             response.raise_for_status()
             
+            return self.preprocess_image_bytes(response.content)
+            
+        except Exception as e:
+            logger.error(f"[PhotoVerification] Error descargando imagen: {e}")
+            return None
+    
+    def preprocess_image_bytes(self, content: bytes) -> Optional[np.ndarray]:
+        """Decodificar y preprocesar una imagen a partir de sus bytes"""
+        try:
             # Convertir a imagen PIL
-            image = Image.open(BytesIO(response.content))
+            image = Image.open(BytesIO(content))
             
             # Convertir a RGB si es necesario
             if image.mode != 'RGB':
@@ -224,7 +327,7 @@ class PhotoVerification:
             return image_array
             
         except Exception as e:
-            logger.error(f"[PhotoVerification] Error descargando imagen: {e}")
+            logger.error(f"[PhotoVerification] Error decodificando imagen: {e}")
             return None
     
     def _detect_faces(self, image: np.ndarray) -> List[FaceDetection]:
@@ -681,32 +784,44 @@ class PhotoVerification:
         
         return warnings
     
-    def _save_verification_result(self, user_id: str, image_url: str, result: PhotoVerificationResult):
-        """Guardar resultado en Firestore para auditoría"""
+    def _save_verification_result(self, user_id: str, image_url: str, result: PhotoVerificationResult, audit: bool = True):
+        """Guardar resultado en Firestore para auditoría
+
+        Con audit=False (resultado de caché) solo se actualiza el perfil, sin
+        crear un nuevo documento en photo_verifications.
+        """
         try:
-            verification_data = {
-                "userId": user_id,
-                "imageUrl": image_url,
-                "verificationResult": result.__dict__,
-                "timestamp": firestore.SERVER_TIMESTAMP,
-                "status": result.recommendation
-            }
-            
-            self.db.collection('photo_verifications').add(verification_data)
+            if audit:
+                verification_data = self.verification_record(user_id, image_url, result)
+                self.db.collection('photo_verifications').add(verification_data)
             
             # Actualizar perfil del usuario con resultado
             user_ref = self.db.collection('users').document(user_id)
-            user_ref.update({
-                "photoVerificationStatus": result.recommendation,
-                "photoVerificationScore": result.verification_score,
-                "photoVerificationDate": firestore.SERVER_TIMESTAMP
-            })
+            user_ref.update(self.profile_update(result))
             
             logger.info(f"[PhotoVerification] Resultado guardado para usuario {user_id}")
             
         except Exception as e:
             logger.error(f"[PhotoVerification] Error guardando resultado: {e}")
     
+    def verification_record(self, user_id: str, image_url: str, result: PhotoVerificationResult) -> Dict[str, Any]:
+        """Documento de auditoría para la colección photo_verifications"""
+        return {
+            "userId": user_id,
+            "imageUrl": image_url,
+            "verificationResult": result.__dict__,
+            "timestamp": firestore.SERVER_TIMESTAMP,
+            "status": result.recommendation
+        }
+    
+    def profile_update(self, result: PhotoVerificationResult) -> Dict[str, Any]:
+        """Campos del perfil de usuario que reflejan el resultado"""
+        return {
+            "photoVerificationStatus": result.recommendation,
+            "photoVerificationScore": result.verification_score,
+            "photoVerificationDate": firestore.SERVER_TIMESTAMP
+        }
+    
     def _create_error_result(self, error_message: str, processing_time: int = 0) -> PhotoVerificationResult:
         """Crear resultado de error"""
         return PhotoVerificationResult(
@@ -801,26 +916,6 @@ class PhotoVerification:
         spam_keywords = ["promo", "free", "click", "visit", "http"]
         return any(keyword in text.lower() for keyword in spam_keywords)
 
-# Instancia global del verificador de fotos
-photo_verifier = PhotoVerification()
-        try:
-            if not text:
-                return False
-            
-            # Palabras clave de spam comunes
-            spam_keywords = [
-                "click", "link", "http", "www", "free", "money", "earn",
-                "buy", "sell", "discount", "offer", "deal", "promo"
-            ]
-            
-            text_lower = text.lower()
-            spam_score = sum(1 for keyword in spam_keywords if keyword in text_lower)
-            
-            return spam_score >= 2  # Umbral simple
-            
-        except Exception:
-            return False
-
 # Instancia global del verificador
 photo_verifier = PhotoVerification()
 
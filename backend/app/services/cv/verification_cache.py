@@ -0,0 +1,195 @@
+"""
+TuCitaSegura - Caché de resultados de verificación de fotos
+
+Caché direccionada por contenido para `PhotoVerification`:
+- Clave: SHA-256 del buffer de píxeles decodificado + versión del pipeline
+- Nivel en memoria (LRU) y nivel opcional en disco (un JSON por entrada)
+- La huella del pipeline incluye los umbrales de los analizadores, por lo que
+  cambiar por ejemplo `max_filter_intensity` invalida las entradas antiguas
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from copy import deepcopy
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(value: Any) -> Any:
+    """Serializar escalares y arrays de numpy devueltos por los analizadores"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def pipeline_fingerprint(version: str, thresholds: Dict[str, Any]) -> str:
+    """
+    Calcular la huella del pipeline a partir de su versión y umbrales
+
+    Args:
+        version: Versión declarada del pipeline de verificación
+        thresholds: Umbrales de configuración de los analizadores
+
+    Returns:
+        Huella hexadecimal corta y estable
+    """
+    payload = json.dumps({"version": version, "thresholds": thresholds}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def hash_pixels(image: np.ndarray) -> str:
+    """
+    Calcular el SHA-256 del buffer de píxeles decodificado
+
+    La forma y el dtype forman parte del hash para que dos buffers con los
+    mismos bytes pero distinta geometría no colisionen.
+    """
+    pixels = np.ascontiguousarray(image)
+    digest = hashlib.sha256()
+    digest.update(f"{pixels.shape}|{pixels.dtype.str}|".encode("utf-8"))
+    digest.update(pixels)
+    return digest.hexdigest()
+
+
+class PhotoVerificationCache:
+    """
+    Caché de dos niveles (memoria LRU + disco) para resultados de verificación.
+
+    Los valores son diccionarios serializables (`dataclasses.asdict` del
+    `PhotoVerificationResult`); reconstruir el dataclass es responsabilidad
+    del llamador. Las entradas de otra huella de pipeline se descartan al leer.
+    """
+
+    def __init__(self, fingerprint: str, max_entries: int = 1024, cache_dir: Optional[str] = None):
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"[PhotoVerificationCache] Nivel en disco deshabilitado: {e}")
+                self.cache_dir = None
+
+    def make_key(self, pixel_hash: str, claimed_age: Optional[int] = None) -> str:
+        """
+        Construir la clave de caché
+
+        La edad declarada participa en la clave porque la consistencia de
+        edad forma parte del resultado final.
+        """
+        age_part = "na" if claimed_age is None else str(int(claimed_age))
+        return f"{self.fingerprint}-{pixel_hash}-{age_part}"
+
+    def set_fingerprint(self, fingerprint: str) -> None:
+        """Cambiar la huella del pipeline, vaciando el nivel en memoria"""
+        with self._lock:
+            if fingerprint != self.fingerprint:
+                self.fingerprint = fingerprint
+                self._memory.clear()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Obtener un resultado cacheado (memoria primero, luego disco)"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return deepcopy(entry)
+
+        entry = self._read_disk(key)
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self._remember(key, entry)
+            self.hits += 1
+        return deepcopy(entry)
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Guardar un resultado en ambos niveles"""
+        # Normalizar a tipos JSON nativos para que memoria y disco devuelvan lo mismo
+        try:
+            entry = json.loads(json.dumps(value, default=_json_default))
+        except (TypeError, ValueError) as e:
+            logger.warning(f"[PhotoVerificationCache] Resultado no cacheable: {e}")
+            return
+
+        with self._lock:
+            self._remember(key, entry)
+        self._write_disk(key, entry)
+
+    def clear(self) -> None:
+        """Vaciar el nivel en memoria"""
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Estadísticas de uso de la caché"""
+        with self._lock:
+            return {
+                "fingerprint": self.fingerprint,
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_enabled": self.cache_dir is not None,
+            }
+
+    def _remember(self, key: str, entry: Dict[str, Any]) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.cache_dir or not key.startswith(f"{self.fingerprint}-"):
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                payload = json.load(fh)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"[PhotoVerificationCache] Entrada en disco ilegible {path}: {e}")
+            return None
+
+        if payload.get("fingerprint") != self.fingerprint:
+            return None
+        return payload.get("result")
+
+    def _write_disk(self, key: str, entry: Dict[str, Any]) -> None:
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as fh:
+                json.dump({"fingerprint": self.fingerprint, "result": entry}, fh)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"[PhotoVerificationCache] No se pudo escribir en disco: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
@@ -1,4 +1,6 @@
 """Email services package."""
 from .email_service import email_service
+from .outbox import EmailOutbox, SMTPConnectionPool
+from .templates import EmailTemplate, Markup, TemplateRegistry
 
-__all__ = ["email_service"]
+__all__ = ["email_service", "EmailOutbox", "SMTPConnectionPool", "EmailTemplate", "Markup", "TemplateRegistry"]
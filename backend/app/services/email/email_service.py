@@ -1,131 +1,42 @@
 """
 Servicio para enviar emails transaccionales a usuarios.
+
+Los emails no se envían dentro de la petición: se renderizan y se dejan en la
+bandeja de salida (ver outbox.py), que los envía por un pool de conexiones
+SMTP reutilizables. Las plantillas se registran en `templates` y se compilan
+(con el CSS ya en línea) una sola vez por versión; ver templates.py.
 """
 import logging
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from typing import Optional, Dict, Any
-from datetime import datetime
-import os
-try:
-    from firebase_admin import auth as firebase_auth  # type: ignore
-except Exception:
-    firebase_auth = None  # type: ignore
-
-logger = logging.getLogger(__name__)
-
-class EmailService:
-    """Servicio para enviar emails usando SMTP."""
+from typing import Optional, Dict, Any, Iterable
+from datetime import datetime
+import os
 
-    def __init__(self):
-        self.smtp_host = os.getenv("SMTP_HOST", "smtp.gmail.com")
-        self.smtp_port = int(os.getenv("SMTP_PORT", "587"))
-        self.smtp_user = os.getenv("SMTP_USER", "")
-        self.smtp_password = os.getenv("SMTP_PASSWORD", "")
-        self.from_email = os.getenv("FROM_EMAIL", self.smtp_user)
-        self.from_name = os.getenv("FROM_NAME", "TuCitaSegura")
+from app.core.config import settings
+from app.services.email.outbox import EmailOutbox, SMTPConnectionPool
+from app.services.email.templates import CompiledTemplate, EmailTemplate, TemplateRegistry, inline_css
 
-    async def send_email(
-        self,
-        to_email: str,
-        subject: str,
-        html_content: str,
-        text_content: Optional[str] = None
-    ) -> bool:
-        """
-        Envía un email a un destinatario.
-
-        Args:
-            to_email: Email del destinatario
-            subject: Asunto del email
-            html_content: Contenido HTML del email
-            text_content: Contenido en texto plano (fallback)
+try:
+    from firebase_admin import auth as firebase_auth  # type: ignore
+except Exception:
+    firebase_auth = None  # type: ignore
 
-        Returns:
-            True si se envió correctamente
-        """
-        # Si no hay credenciales SMTP configuradas, solo loggear
-        if not self.smtp_user or not self.smtp_password:
-            logger.warning(
-                f"SMTP no configurado. Email que se habría enviado:\n"
-                f"Para: {to_email}\n"
-                f"Asunto: {subject}\n"
-                f"Contenido: {text_content or html_content[:100]}..."
-            )
-            return True
-
-        try:
-            # Crear mensaje
-            message = MIMEMultipart("alternative")
-            message["Subject"] = subject
-            message["From"] = f"{self.from_name} <{self.from_email}>"
-            message["To"] = to_email
-
-            # Agregar contenido
-            if text_content:
-                part1 = MIMEText(text_content, "plain", "utf-8")
-                message.attach(part1)
-
-            part2 = MIMEText(html_content, "html", "utf-8")
-            message.attach(part2)
-
-            # Conectar y enviar
-            with smtplib.SMTP(self.smtp_host, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.smtp_user, self.smtp_password)
-                server.send_message(message)
-
-            logger.info(f"Email enviado a {to_email}: {subject}")
-            return True
-
-        except Exception as e:
-            logger.error(f"Error enviando email a {to_email}: {e}")
-            return False
-
-    async def send_payment_confirmation(
-        self,
-        user_email: str,
-        payment_data: Dict[str, Any],
-        subscription_data: Dict[str, Any]
-    ) -> bool:
-        """
-        Envía email de confirmación de pago y activación de suscripción.
+logger = logging.getLogger(__name__)
 
-        Args:
-            user_email: Email del usuario
-            payment_data: Datos del pago realizado
-            subscription_data: Datos de la suscripción activada
-
-        Returns:
-            True si se envió correctamente
-        """
-        amount = payment_data.get("amount", "0")
-        currency = payment_data.get("currency", "EUR")
-        order_id = payment_data.get("order_id", "N/A")
-        plan_type = subscription_data.get("plan_type", "premium")
-        end_date = subscription_data.get("end_date")
-
-        # Formatear fecha de expiración
-        end_date_str = end_date.strftime("%d/%m/%Y") if end_date else "N/A"
-
-        subject = "¡Pago confirmado! Tu suscripción está activa 🎉"
-
-        html_content = f"""
+PAYMENT_CONFIRMATION_HTML = """
 <!DOCTYPE html>
 <html>
 <head>
     <meta charset="UTF-8">
     <style>
-        body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-        .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-        .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-        .content {{ background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }}
-        .success-box {{ background: #d4edda; border: 1px solid #c3e6cb; color: #155724; padding: 15px; border-radius: 5px; margin: 20px 0; }}
-        .details {{ background: white; padding: 20px; border-radius: 5px; margin: 20px 0; }}
-        .details-row {{ display: flex; justify-content: space-between; padding: 10px 0; border-bottom: 1px solid #eee; }}
-        .button {{ display: inline-block; background: #667eea; color: white; padding: 12px 30px; text-decoration: none; border-radius: 5px; margin: 20px 0; }}
-        .footer {{ text-align: center; color: #666; font-size: 12px; margin-top: 30px; }}
+        body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
+        .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+        .header { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }
+        .content { background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }
+        .success-box { background: #d4edda; border: 1px solid #c3e6cb; color: #155724; padding: 15px; border-radius: 5px; margin: 20px 0; }
+        .details { background: white; padding: 20px; border-radius: 5px; margin: 20px 0; }
+        .details-row { display: flex; justify-content: space-between; padding: 10px 0; border-bottom: 1px solid #eee; }
+        .button { display: inline-block; background: #667eea; color: white; padding: 12px 30px; text-decoration: none; border-radius: 5px; margin: 20px 0; }
+        .footer { text-align: center; color: #666; font-size: 12px; margin-top: 30px; }
     </style>
 </head>
 <body>
@@ -144,23 +55,23 @@ class EmailService:
             <div class="details">
                 <div class="details-row">
                     <span><strong>Monto pagado:</strong></span>
-                    <span>{amount} {currency}</span>
+                    <span>$amount $currency</span>
                 </div>
                 <div class="details-row">
                     <span><strong>ID de transacción:</strong></span>
-                    <span>{order_id}</span>
+                    <span>$order_id</span>
                 </div>
                 <div class="details-row">
                     <span><strong>Plan:</strong></span>
-                    <span>{plan_type.capitalize()}</span>
+                    <span>$plan</span>
                 </div>
                 <div class="details-row">
                     <span><strong>Fecha de activación:</strong></span>
-                    <span>{datetime.now().strftime("%d/%m/%Y")}</span>
+                    <span>$activation_date</span>
                 </div>
                 <div class="details-row">
                     <span><strong>Válido hasta:</strong></span>
-                    <span>{end_date_str}</span>
+                    <span>$end_date</span>
                 </div>
             </div>
 
@@ -191,16 +102,16 @@ class EmailService:
 </html>
 """
 
-        text_content = f"""
+PAYMENT_CONFIRMATION_TEXT = """
 ¡Pago Confirmado!
 
 Hemos recibido tu pago y activado tu suscripción premium a TuCitaSegura.
 
 Detalles del Pago:
-- Monto: {amount} {currency}
-- ID de transacción: {order_id}
-- Plan: {plan_type.capitalize()}
-- Válido hasta: {end_date_str}
+- Monto: $amount $currency
+- ID de transacción: $order_id
+- Plan: $plan
+- Válido hasta: $end_date
 
 Ahora puedes disfrutar de todos los beneficios premium:
 - Acceso ilimitado a todos los perfiles
@@ -218,50 +129,27 @@ Este es un email automático, por favor no respondas.
 Si tienes alguna pregunta, contacta a soporte@tucitasegura.com
 """
 
-        return await self.send_email(user_email, subject, html_content, text_content)
-
-    async def send_subscription_cancelled(
-        self,
-        user_email: str,
-        refund_data: Optional[Dict[str, Any]] = None
-    ) -> bool:
-        """
-        Envía email de notificación de cancelación de suscripción.
-
-        Args:
-            user_email: Email del usuario
-            refund_data: Datos del reembolso si aplica
-
-        Returns:
-            True si se envió correctamente
-        """
-        subject = "Tu suscripción ha sido cancelada"
-
-        refund_info = ""
-        if refund_data:
-            refund_amount = refund_data.get("amount", "N/A")
-            refund_id = refund_data.get("refund_id", "N/A")
-            refund_info = f"""
+REFUND_INFO_HTML = """
             <div class="success-box">
                 <strong>💰 Reembolso procesado</strong><br>
-                Se ha procesado un reembolso de {refund_amount} a tu método de pago original.<br>
-                ID de reembolso: {refund_id}
+                Se ha procesado un reembolso de $refund_amount a tu método de pago original.<br>
+                ID de reembolso: $refund_id
             </div>
             """
 
-        html_content = f"""
+SUBSCRIPTION_CANCELLED_HTML = """
 <!DOCTYPE html>
 <html>
 <head>
     <meta charset="UTF-8">
     <style>
-        body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-        .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-        .header {{ background: #f44336; color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-        .content {{ background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }}
-        .success-box {{ background: #d4edda; border: 1px solid #c3e6cb; color: #155724; padding: 15px; border-radius: 5px; margin: 20px 0; }}
-        .button {{ display: inline-block; background: #667eea; color: white; padding: 12px 30px; text-decoration: none; border-radius: 5px; margin: 20px 0; }}
-        .footer {{ text-align: center; color: #666; font-size: 12px; margin-top: 30px; }}
+        body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
+        .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+        .header { background: #f44336; color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }
+        .content { background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }
+        .success-box { background: #d4edda; border: 1px solid #c3e6cb; color: #155724; padding: 15px; border-radius: 5px; margin: 20px 0; }
+        .button { display: inline-block; background: #667eea; color: white; padding: 12px 30px; text-decoration: none; border-radius: 5px; margin: 20px 0; }
+        .footer { text-align: center; color: #666; font-size: 12px; margin-top: 30px; }
     </style>
 </head>
 <body>
@@ -272,7 +160,7 @@ Si tienes alguna pregunta, contacta a soporte@tucitasegura.com
         <div class="content">
             <p>Lamentamos informarte que tu suscripción a TuCitaSegura ha sido cancelada.</p>
 
-            {refund_info}
+            $refund_info
 
             <p>Aún puedes acceder a la plataforma con una cuenta gratuita, aunque con funcionalidades limitadas.</p>
 
@@ -294,12 +182,12 @@ Si tienes alguna pregunta, contacta a soporte@tucitasegura.com
 </html>
 """
 
-        text_content = f"""
+SUBSCRIPTION_CANCELLED_TEXT = """
 Suscripción Cancelada
 
 Lamentamos informarte que tu suscripción a TuCitaSegura ha sido cancelada.
 
-{"Se ha procesado un reembolso a tu método de pago original." if refund_data else ""}
+$refund_line
 
 Aún puedes acceder a la plataforma con una cuenta gratuita.
 
@@ -309,91 +197,274 @@ Si deseas reactivar tu suscripción, visita: https://tucitasegura.com/pricing
 Si tienes alguna pregunta, contacta a soporte@tucitasegura.com
 """
 
-        return await self.send_email(user_email, subject, html_content, text_content)
-
-    async def send_email_verification(
-        self,
-        user_email: str,
-        display_name: Optional[str] = None,
-        continue_url: Optional[str] = None,
-        dynamic_link_domain: Optional[str] = None
-    ) -> bool:
-        try:
-            verification_url = None
-            if firebase_auth:
-                action_settings: Dict[str, Any] = {
-                    "url": continue_url or os.getenv("VERIFICATION_CONTINUE_URL", "https://tucitasegura-129cc.web.app/verify-email.html"),
-                    "handle_code_in_app": True
-                }
-                if dynamic_link_domain or os.getenv("DYNAMIC_LINK_DOMAIN"):
-                    action_settings["dynamic_link_domain"] = dynamic_link_domain or os.getenv("DYNAMIC_LINK_DOMAIN")
-                verification_url = firebase_auth.generate_email_verification_link(user_email, action_settings)  # type: ignore
-            else:
-                verification_url = (continue_url or os.getenv("VERIFICATION_CONTINUE_URL", "https://tucitasegura-129cc.web.app/verify-email.html")) + "?pending=verifyEmail"
-
-            subject = "Verifica tu email en TuCitaSegura"
-
-            safe_name = (display_name or user_email.split("@")[0]).strip()
-            html_content = f"""
-<!DOCTYPE html>
-<html>
-<head>
-  <meta charset="UTF-8">
-  <style>
-    body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-    .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-    .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 24px; text-align: center; border-radius: 10px 10px 0 0; }}
-    .content {{ background: #f9f9f9; padding: 24px; border-radius: 0 0 10px 10px; }}
-    .button {{ display: inline-block; background: #667eea; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; margin: 16px 0; }}
-    .tips {{ font-size: 14px; color: #555; }}
-    .footer {{ text-align: center; color: #666; font-size: 12px; margin-top: 20px; }}
-  </style>
-  <title>Verificación de Email</title>
-</head>
-<body>
-  <div class="container">
-    <div class="header">
-      <h1>Verifica tu email</h1>
-      <p>Hola {safe_name}, completa este paso para activar tu cuenta</p>
-    </div>
-    <div class="content">
-      <p>Para garantizar tu seguridad y activar todas las funciones, verifica tu dirección de email:</p>
-      <p style="text-align:center;">
-        <a href="{verification_url}" class="button">Verificar mi email</a>
-      </p>
-      <p class="tips">
-        Si el botón no funciona, copia y pega este enlace en tu navegador:<br>
-        <a href="{verification_url}">{verification_url}</a>
-      </p>
-      <p class="tips">
-        Sugerencias:
-        <ul>
-          <li>Revisa tu carpeta de spam si no ves este mensaje en tu bandeja de entrada</li>
-          <li>El enlace expira; si necesitas uno nuevo, solicita reenvío desde la app</li>
-        </ul>
-      </p>
-      <div class="footer">
-        <p>Este es un email automático, por favor no respondas.</p>
-        <p>&copy; 2025 TuCitaSegura</p>
-      </div>
-    </div>
-  </div>
-</body>
-</html>
-"""
-            text_content = f"""Hola {safe_name},
-
-Sigue este enlace para verificar tu email:
-{verification_url}
-
-Si no solicitaste esta verificación, puedes ignorar este email.
-
-TuCitaSegura"""
-
-            return await self.send_email(user_email, subject, html_content, text_content)
-        except Exception as e:
-            logger.error(f"Error preparando/verificando email para {user_email}: {e}")
-            return False
-
-# Instancia global del servicio
-email_service = EmailService()
+EMAIL_VERIFICATION_HTML = """
+<!DOCTYPE html>
+<html>
+<head>
+  <meta charset="UTF-8">
+  <style>
+    body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
+    .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+    .header { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 24px; text-align: center; border-radius: 10px 10px 0 0; }
+    .content { background: #f9f9f9; padding: 24px; border-radius: 0 0 10px 10px; }
+    .button { display: inline-block; background: #667eea; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; margin: 16px 0; }
+    .tips { font-size: 14px; color: #555; }
+    .footer { text-align: center; color: #666; font-size: 12px; margin-top: 20px; }
+  </style>
+  <title>Verificación de Email</title>
+</head>
+<body>
+  <div class="container">
+    <div class="header">
+      <h1>Verifica tu email</h1>
+      <p>Hola $name, completa este paso para activar tu cuenta</p>
+    </div>
+    <div class="content">
+      <p>Para garantizar tu seguridad y activar todas las funciones, verifica tu dirección de email:</p>
+      <p style="text-align:center;">
+        <a href="$verification_url" class="button">Verificar mi email</a>
+      </p>
+      <p class="tips">
+        Si el botón no funciona, copia y pega este enlace en tu navegador:<br>
+        <a href="$verification_url">$verification_url</a>
+      </p>
+      <p class="tips">
+        Sugerencias:
+        <ul>
+          <li>Revisa tu carpeta de spam si no ves este mensaje en tu bandeja de entrada</li>
+          <li>El enlace expira; si necesitas uno nuevo, solicita reenvío desde la app</li>
+        </ul>
+      </p>
+      <div class="footer">
+        <p>Este es un email automático, por favor no respondas.</p>
+        <p>&copy; 2025 TuCitaSegura</p>
+      </div>
+    </div>
+  </div>
+</body>
+</html>
+"""
+
+EMAIL_VERIFICATION_TEXT = """Hola $name,
+
+Sigue este enlace para verificar tu email:
+$verification_url
+
+Si no solicitaste esta verificación, puedes ignorar este email.
+
+TuCitaSegura"""
+
+# Fragmento HTML que se inserta ya renderizado (Markup) en la cancelación
+REFUND_INFO = CompiledTemplate.parse(inline_css(REFUND_INFO_HTML, stylesheet=SUBSCRIPTION_CANCELLED_HTML), escape=True)
+
+templates = TemplateRegistry()
+templates.register(EmailTemplate(
+    "payment_confirmation",
+    subject="¡Pago confirmado! Tu suscripción está activa 🎉",
+    html=PAYMENT_CONFIRMATION_HTML,
+    text=PAYMENT_CONFIRMATION_TEXT
+))
+templates.register(EmailTemplate(
+    "subscription_cancelled",
+    subject="Tu suscripción ha sido cancelada",
+    html=SUBSCRIPTION_CANCELLED_HTML,
+    text=SUBSCRIPTION_CANCELLED_TEXT
+))
+templates.register(EmailTemplate(
+    "email_verification",
+    subject="Verifica tu email en TuCitaSegura",
+    html=EMAIL_VERIFICATION_HTML,
+    text=EMAIL_VERIFICATION_TEXT
+))
+
+
+class EmailService:
+    """Servicio para enviar emails usando SMTP."""
+
+    def __init__(self, outbox: Optional[EmailOutbox] = None):
+        """
+        Args:
+            outbox: Bandeja de salida (por defecto una con pool SMTP según la configuración)
+        """
+        self.smtp_host = os.getenv("SMTP_HOST", "smtp.gmail.com")
+        self.smtp_port = int(os.getenv("SMTP_PORT", "587"))
+        self.smtp_user = os.getenv("SMTP_USER", "")
+        self.smtp_password = os.getenv("SMTP_PASSWORD", "")
+        self.from_email = os.getenv("FROM_EMAIL", self.smtp_user)
+        self.from_name = os.getenv("FROM_NAME", "TuCitaSegura")
+        self.outbox = outbox or EmailOutbox.from_settings(SMTPConnectionPool(
+            self.smtp_host,
+            self.smtp_port,
+            self.smtp_user,
+            self.smtp_password,
+            starttls=settings.SMTP_STARTTLS,
+            size=settings.SMTP_POOL_SIZE
+        ))
+
+    async def send_email(
+        self,
+        to_email: str,
+        subject: str,
+        html_content: str,
+        text_content: Optional[str] = None
+    ) -> bool:
+        """
+        Encola un email para un destinatario (se envía en segundo plano).
+
+        Args:
+            to_email: Email del destinatario
+            subject: Asunto del email
+            html_content: Contenido HTML del email
+            text_content: Contenido en texto plano (fallback)
+
+        Returns:
+            True si quedó en la bandeja de salida
+        """
+        # Si no hay credenciales SMTP configuradas, solo loggear
+        if not self.smtp_user or not self.smtp_password:
+            logger.warning(
+                f"SMTP no configurado. Email que se habría enviado:\n"
+                f"Para: {to_email}\n"
+                f"Asunto: {subject}\n"
+                f"Contenido: {text_content or html_content[:100]}..."
+            )
+            return True
+
+        try:
+            message_id = await self.outbox.enqueue({
+                "to": to_email,
+                "from": f"{self.from_name} <{self.from_email}>",
+                "subject": subject,
+                "html": html_content,
+                "text": text_content
+            })
+            logger.info(f"Email encolado para {to_email}: {subject} ({message_id})")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error encolando email para {to_email}: {e}")
+            return False
+
+    async def send_bulk(
+        self,
+        template_name: str,
+        recipients: Iterable[Dict[str, Any]],
+        common: Optional[Dict[str, Any]] = None
+    ) -> int:
+        """
+        Encola una campaña: una plantilla renderizada por destinatario.
+
+        Los cuerpos se generan a medida que se guardan en la bandeja de salida
+        (en lotes de 500), así que `recipients` puede ser un generador.
+
+        Args:
+            template_name: Plantilla registrada en `templates`
+            recipients: Variables por destinatario, con la dirección en "email"
+            common: Variables iguales para toda la campaña
+
+        Returns:
+            Emails encolados
+        """
+        if not self.smtp_user or not self.smtp_password:
+            logger.warning(f"SMTP no configurado. Campaña {template_name} no enviada")
+            return 0
+
+        messages = templates.render_batch(template_name, recipients, common)
+        sender = f"{self.from_name} <{self.from_email}>"
+        count = await self.outbox.enqueue_many({**message, "from": sender} for message in messages)
+        logger.info(f"Campaña {template_name}: {count} emails encolados")
+        return count
+
+    async def send_payment_confirmation(
+        self,
+        user_email: str,
+        payment_data: Dict[str, Any],
+        subscription_data: Dict[str, Any]
+    ) -> bool:
+        """
+        Envía email de confirmación de pago y activación de suscripción.
+
+        Args:
+            user_email: Email del usuario
+            payment_data: Datos del pago realizado
+            subscription_data: Datos de la suscripción activada
+
+        Returns:
+            True si se envió correctamente
+        """
+        end_date = subscription_data.get("end_date")
+        variables = {
+            "amount": payment_data.get("amount", "0"),
+            "currency": payment_data.get("currency", "EUR"),
+            "order_id": payment_data.get("order_id", "N/A"),
+            "plan": subscription_data.get("plan_type", "premium").capitalize(),
+            "activation_date": datetime.now().strftime("%d/%m/%Y"),
+            # Formatear fecha de expiración
+            "end_date": end_date.strftime("%d/%m/%Y") if end_date else "N/A"
+        }
+
+        message = templates.render("payment_confirmation", variables)
+
+        return await self.send_email(user_email, message["subject"], message["html"], message["text"])
+
+    async def send_subscription_cancelled(
+        self,
+        user_email: str,
+        refund_data: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        Envía email de notificación de cancelación de suscripción.
+
+        Args:
+            user_email: Email del usuario
+            refund_data: Datos del reembolso si aplica
+
+        Returns:
+            True si se envió correctamente
+        """
+        refund_info = ""
+        if refund_data:
+            refund_info = REFUND_INFO.render({
+                "refund_amount": refund_data.get("amount", "N/A"),
+                "refund_id": refund_data.get("refund_id", "N/A")
+            })
+
+        message = templates.render("subscription_cancelled", {
+            "refund_info": refund_info,
+            "refund_line": "Se ha procesado un reembolso a tu método de pago original." if refund_data else ""
+        })
+
+        return await self.send_email(user_email, message["subject"], message["html"], message["text"])
+
+    async def send_email_verification(
+        self,
+        user_email: str,
+        display_name: Optional[str] = None,
+        continue_url: Optional[str] = None,
+        dynamic_link_domain: Optional[str] = None
+    ) -> bool:
+        try:
+            verification_url = None
+            if firebase_auth:
+                action_settings: Dict[str, Any] = {
+                    "url": continue_url or os.getenv("VERIFICATION_CONTINUE_URL", "https://tucitasegura-129cc.web.app/verify-email.html"),
+                    "handle_code_in_app": True
+                }
+                if dynamic_link_domain or os.getenv("DYNAMIC_LINK_DOMAIN"):
+                    action_settings["dynamic_link_domain"] = dynamic_link_domain or os.getenv("DYNAMIC_LINK_DOMAIN")
+                verification_url = firebase_auth.generate_email_verification_link(user_email, action_settings)  # type: ignore
+            else:
+                verification_url = (continue_url or os.getenv("VERIFICATION_CONTINUE_URL", "https://tucitasegura-129cc.web.app/verify-email.html")) + "?pending=verifyEmail"
+
+            message = templates.render("email_verification", {
+                "name": (display_name or user_email.split("@")[0]).strip(),
+                "verification_url": verification_url
+            })
+
+            return await self.send_email(user_email, message["subject"], message["html"], message["text"])
+        except Exception as e:
+            logger.error(f"Error preparando/verificando email para {user_email}: {e}")
+            return False
+
+# Instancia global del servicio
+email_service = EmailService()
@@ -0,0 +1,550 @@
+"""
+Bandeja de salida de emails con pool de conexiones SMTP.
+
+Antes cada email abría una conexión SMTP nueva (TCP + STARTTLS + login),
+enviaba un mensaje y la cerraba, todo bloqueando el event loop. Ahora:
+
+- SMTPConnectionPool mantiene hasta `size` conexiones autenticadas y las
+  reutiliza entre mensajes. smtplib es bloqueante, así que cada operación
+  corre en un hilo (asyncio.to_thread). Las conexiones inactivas más de
+  `idle_timeout` o que ya enviaron `max_messages_per_connection` se cierran,
+  y si el servidor cortó la conexión se reconecta una vez en el acto
+- EmailOutbox guarda cada mensaje ya renderizado en email_outbox/{id}
+  (estado pending) y lo envía con un pool de workers:
+  * máximo `per_domain_limit` envíos simultáneos por dominio de destino
+  * errores temporales (4xx, red) se reintentan con backoff exponencial
+    sin ocupar un worker; los 5xx marcan el mensaje como failed
+  * en memoria solo hay un búfer de `max_buffer` mensajes: el resto se
+    queda en Firestore y se relee por páginas cuando el búfer se vacía, así
+    una campaña grande no se carga entera en memoria
+- Antes de enviar, el worker reclama el mensaje (status sending, `owner` y
+  `lease_until`, ver Repository.claim): con varias instancias cada una
+  puede tener el mismo pending en su búfer, pero solo una lo envía. La
+  concesión se alarga mientras el mensaje espera un reintento, así que
+  tampoco lo reenvía otra instancia durante el backoff
+- `recover()` al arrancar recupera los pending de una ejecución anterior y
+  los sending cuya concesión caducó (la instancia que los tenía murió)
+
+Métricas: email_outbox_messages_total{result} (queued, sent, retried,
+failed, claimed_elsewhere), email_send_latency_ms{result} y smtp_connections_total{event}.
+"""
+import asyncio
+import logging
+import smtplib
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.services.firestore.repository import Document, Repository
+from app.utils.metrics_core import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# Límite de escrituras por batch de Firestore
+BATCH_LIMIT = 500
+
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+
+_messages_total = metrics_registry.counter(
+    "email_outbox_messages_total",
+    "Emails de la bandeja de salida por resultado (queued, sent, retried, failed, claimed_elsewhere)",
+    ("result",)
+)
+_send_latency_ms = metrics_registry.histogram(
+    "email_send_latency_ms",
+    "Milisegundos por envío SMTP (incluida la conexión si no había una libre)",
+    ("result",)
+)
+_connections_total = metrics_registry.counter(
+    "smtp_connections_total",
+    "Conexiones SMTP por evento (opened, reused, closed, reconnected)",
+    ("event",)
+)
+
+
+def build_message(message: Document) -> MIMEMultipart:
+    """Mensaje MIME multipart/alternative a partir del documento de la bandeja"""
+    mime = MIMEMultipart("alternative")
+    mime["Subject"] = message["subject"]
+    mime["From"] = message["from"]
+    mime["To"] = message["to"]
+    if message.get("text"):
+        mime.attach(MIMEText(message["text"], "plain", "utf-8"))
+    mime.attach(MIMEText(message["html"], "html", "utf-8"))
+    return mime
+
+
+def recipient_domain(address: str) -> str:
+    return address.rsplit("@", 1)[-1].strip().lower()
+
+
+def is_permanent_error(error: Exception) -> bool:
+    """Rechazo definitivo del servidor (5xx): reintentar no sirve"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        # Credenciales/configuración: puede corregirse sin perder los mensajes
+        return False
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return False
+
+
+class SMTPConnectionPool:
+    """Conexiones SMTP autenticadas y reutilizables (smtplib en hilos)"""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: str = "",
+        password: str = "",
+        starttls: bool = True,
+        size: int = 4,
+        timeout: float = 30.0,
+        idle_timeout: float = 60.0,
+        max_messages_per_connection: int = 100
+    ):
+        """
+        Args:
+            host, port: Servidor SMTP
+            username, password: Credenciales (sin usuario no se hace login)
+            starttls: Negociar STARTTLS tras conectar
+            size: Conexiones abiertas como máximo (= envíos simultáneos)
+            timeout: Segundos de timeout de socket
+            idle_timeout: Segundos sin uso tras los que una conexión se descarta
+            max_messages_per_connection: Mensajes antes de renovar la conexión
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_messages_per_connection = max_messages_per_connection
+        # (conexión, último uso en time.monotonic(), mensajes enviados)
+        self._idle: Deque[Tuple[smtplib.SMTP, float, int]] = deque()
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            server.ehlo()
+            if self.starttls:
+                server.starttls()
+                server.ehlo()
+            if self.username:
+                server.login(self.username, self.password)
+        except Exception:
+            self._close(server)
+            raise
+        _connections_total.inc("opened")
+        return server
+
+    @staticmethod
+    def _close(server: smtplib.SMTP) -> None:
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+        _connections_total.inc("closed")
+
+    async def _acquire(self) -> Tuple[smtplib.SMTP, int]:
+        now = time.monotonic()
+        while self._idle:
+            server, last_used, sent = self._idle.pop()
+            if now - last_used <= self.idle_timeout:
+                _connections_total.inc("reused")
+                return server, sent
+            await asyncio.to_thread(self._close, server)
+        return await asyncio.to_thread(self._connect), 0
+
+    async def _release(self, server: smtplib.SMTP, sent: int) -> None:
+        if sent >= self.max_messages_per_connection:
+            await asyncio.to_thread(self._close, server)
+        else:
+            self._idle.append((server, time.monotonic(), sent))
+
+    async def send(self, message: MIMEMultipart) -> None:
+        """
+        Enviar un mensaje por una conexión del pool.
+
+        Raises:
+            Las excepciones de smtplib (ver is_permanent_error)
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        async with self._slots:
+            server, sent = await self._acquire()
+            try:
+                try:
+                    await asyncio.to_thread(server.send_message, message)
+                except smtplib.SMTPServerDisconnected:
+                    # El servidor cerró la conexión reutilizada: una nueva y un solo reintento
+                    server.close()
+                    _connections_total.inc("reconnected")
+                    server, sent = await asyncio.to_thread(self._connect), 0
+                    await asyncio.to_thread(server.send_message, message)
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                # El servidor respondió (y smtplib hizo RSET): la conexión sigue sirviendo
+                await self._release(server, sent + 1)
+                raise
+            except Exception:
+                await asyncio.to_thread(self._close, server)
+                raise
+            await self._release(server, sent + 1)
+
+    async def close(self) -> None:
+        """Cerrar las conexiones inactivas"""
+        while self._idle:
+            server, _, _ = self._idle.pop()
+            await asyncio.to_thread(self._close, server)
+
+    def stats(self) -> Dict[str, int]:
+        return {"idle_connections": len(self._idle)}
+
+
+class EmailOutboxRepository(Repository):
+    """Colección email_outbox (mensajes renderizados + estado de envío)"""
+
+    collection_path = "email_outbox"
+
+
+class EmailOutbox:
+    """Bandeja de salida persistente con workers, límite por dominio y reintentos"""
+
+    def __init__(
+        self,
+        sender: Any,
+        repository: Optional[EmailOutboxRepository] = None,
+        workers: int = 8,
+        per_domain_limit: int = 2,
+        max_attempts: int = 5,
+        base_backoff: float = 5.0,
+        max_buffer: int = 1000,
+        lease_seconds: float = 120.0
+    ):
+        """
+        Args:
+            sender: Objeto con `async send(mime_message)` (SMTPConnectionPool)
+            repository: Almacén de mensajes (por defecto la colección en Firestore)
+            workers: Envíos en curso como máximo
+            per_domain_limit: Envíos simultáneos por dominio de destino
+            max_attempts: Intentos por mensaje antes de marcarlo failed
+            base_backoff: Segundos del primer reintento (se duplica en cada intento)
+            max_buffer: Mensajes en memoria; el resto espera en Firestore
+            lease_seconds: Duración de la concesión sobre un mensaje reclamado
+                (debe superar lo que tarda un envío)
+        """
+        self.sender = sender
+        self.repository = repository or EmailOutboxRepository()
+        self.workers = max(1, workers)
+        self.per_domain_limit = max(1, per_domain_limit)
+        self.max_attempts = max(1, max_attempts)
+        self.base_backoff = base_backoff
+        self.max_buffer = max(1, max_buffer)
+        self.lease_seconds = lease_seconds
+        # Identifica a esta instancia en las concesiones
+        self.owner = uuid.uuid4().hex
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._retry_handles: Set[asyncio.TimerHandle] = set()
+        # IDs en el búfer, enviándose o esperando reintento
+        self._pending: Set[str] = set()
+        self._domains: Dict[str, asyncio.Semaphore] = {}
+        # Hay pending en Firestore que no caben en el búfer
+        self._backlog = False
+        self._refill_lock: Optional[asyncio.Lock] = None
+
+    @classmethod
+    def from_settings(cls, sender: Any) -> "EmailOutbox":
+        return cls(
+            sender,
+            workers=settings.EMAIL_OUTBOX_WORKERS,
+            per_domain_limit=settings.SMTP_PER_DOMAIN_CONCURRENCY,
+            max_attempts=settings.EMAIL_OUTBOX_MAX_ATTEMPTS,
+            base_backoff=settings.EMAIL_OUTBOX_RETRY_BACKOFF,
+            lease_seconds=settings.EMAIL_OUTBOX_LEASE_SECONDS
+        )
+
+    # ------------------------------------------------------------------
+    # Encolado
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _document(message: Document) -> Document:
+        return {
+            "to": message["to"],
+            "from": message["from"],
+            "subject": message["subject"],
+            "html": message["html"],
+            "text": message.get("text"),
+            "status": STATUS_PENDING,
+            "attempts": 0,
+            "created_at": datetime.now()
+        }
+
+    def _buffer(self, message_id: str, message: Document) -> None:
+        self.start()
+        if message_id in self._pending:
+            return
+        if self._queue.qsize() >= self.max_buffer:
+            self._backlog = True
+            return
+        self._pending.add(message_id)
+        self._queue.put_nowait((message_id, message))
+
+    async def enqueue(self, message: Document) -> str:
+        """
+        Guardar un mensaje renderizado y ponerlo en cola.
+
+        Args:
+            message: {"to", "from", "subject", "html", "text"}
+
+        Returns:
+            ID del mensaje en email_outbox
+        """
+        document = self._document(message)
+        message_id = await self.repository.add(document)
+        _messages_total.inc("queued")
+        self._buffer(message_id, document)
+        return message_id
+
+    async def enqueue_many(self, messages: Iterable[Document]) -> int:
+        """
+        Guardar muchos mensajes con batch() de hasta 500 escrituras (campañas).
+        Acepta un generador: solo se materializa un batch cada vez.
+
+        Returns:
+            Mensajes encolados
+        """
+        total = 0
+        chunk: List[Tuple[Any, Document]] = []
+        for message in messages:
+            chunk.append((self.repository.ref(), self._document(message)))
+            if len(chunk) == BATCH_LIMIT:
+                total += await self._commit_chunk(chunk)
+                chunk = []
+        if chunk:
+            total += await self._commit_chunk(chunk)
+        return total
+
+    async def _commit_chunk(self, chunk: List[Tuple[Any, Document]]) -> int:
+        batch = self.repository.client.batch()
+        for ref, document in chunk:
+            batch.set(ref, document)
+        await batch.commit()
+        _messages_total.inc("queued", amount=len(chunk))
+        for ref, document in chunk:
+            self._buffer(ref.id, document)
+        return len(chunk)
+
+    # ------------------------------------------------------------------
+    # Envío
+    # ------------------------------------------------------------------
+
+    def _domain_slot(self, address: str) -> asyncio.Semaphore:
+        domain = recipient_domain(address)
+        slot = self._domains.get(domain)
+        if slot is None:
+            slot = self._domains[domain] = asyncio.Semaphore(self.per_domain_limit)
+        return slot
+
+    def _claimable(self, document: Document, now: float) -> bool:
+        """Pending, o sending por esta instancia o con la concesión caducada"""
+        status = document.get("status")
+        if status == STATUS_PENDING:
+            return True
+        return status == STATUS_SENDING and (
+            document.get("owner") == self.owner or document.get("lease_until", 0) <= now
+        )
+
+    async def _claim(self, message_id: str) -> Optional[Document]:
+        """Reclamar el mensaje para enviarlo. None si es de otra instancia o ya no está pendiente"""
+        now = time.time()
+        return await self.repository.claim(
+            message_id,
+            lambda document: self._claimable(document, now),
+            {"status": STATUS_SENDING, "owner": self.owner, "lease_until": now + self.lease_seconds}
+        )
+
+    async def _mark(self, message_id: str, fields: Document) -> None:
+        try:
+            await self.repository.update(message_id, {**fields, "updated_at": datetime.now()})
+        except Exception as e:
+            logger.error(f"Error actualizando el email {message_id} de la bandeja de salida: {e}")
+
+    def _schedule_retry(self, message_id: str, message: Document, delay: float) -> None:
+        def requeue() -> None:
+            self._retry_handles.discard(handle)
+            if self._queue is not None:
+                self._queue.put_nowait((message_id, message))
+
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._retry_handles.add(handle)
+
+    async def _deliver(self, message_id: str, message: Document) -> None:
+        claimed = await self._claim(message_id)
+        if claimed is None:
+            _messages_total.inc("claimed_elsewhere")
+            self._pending.discard(message_id)
+            return
+        # Los intentos de Firestore: otra instancia pudo haberlo intentado antes
+        message = claimed
+        attempt = message.get("attempts", 0) + 1
+        message["attempts"] = attempt
+        started = time.monotonic()
+        try:
+            async with self._domain_slot(message["to"]):
+                await self.sender.send(build_message(message))
+        except Exception as e:
+            _send_latency_ms.observe("error", value=(time.monotonic() - started) * 1000)
+            if is_permanent_error(e) or attempt >= self.max_attempts:
+                _messages_total.inc("failed")
+                logger.error(f"Email {message_id} a {message['to']} fallido tras {attempt} intentos: {e}")
+                self._pending.discard(message_id)
+                await self._mark(message_id, {"status": STATUS_FAILED, "attempts": attempt, "last_error": str(e)})
+                return
+            delay = self.base_backoff * 2 ** (attempt - 1)
+            _messages_total.inc("retried")
+            logger.warning(f"Error enviando email {message_id} a {message['to']} (intento {attempt}), reintento en {delay:.1f}s: {e}")
+            # Sigue reclamado durante el backoff
+            await self._mark(message_id, {
+                "attempts": attempt,
+                "last_error": str(e),
+                "lease_until": time.time() + delay + self.lease_seconds
+            })
+            self._schedule_retry(message_id, message, delay)
+            return
+
+        _send_latency_ms.observe("sent", value=(time.monotonic() - started) * 1000)
+        _messages_total.inc("sent")
+        self._pending.discard(message_id)
+        logger.info(f"Email enviado a {message['to']}: {message['subject']}")
+        await self._mark(message_id, {"status": STATUS_SENT, "attempts": attempt, "sent_at": datetime.now()})
+
+    async def _refill(self) -> None:
+        """
+        Releer de Firestore los pending y los sending con la concesión caducada
+        que no están ya en memoria (los que otra instancia tiene reclamados no
+        salen en ninguna de las dos consultas)
+        """
+        async with self._refill_lock:
+            if not self._backlog or self._queue.qsize() >= self.max_buffer:
+                return
+            room = self.max_buffer - self._queue.qsize()
+            # Los que ya están en memoria también salen en la consulta
+            limit = room + len(self._pending)
+            collection = self.repository.collection()
+            pending = await (
+                collection
+                .where("status", "==", STATUS_PENDING)
+                .order_by("created_at")
+                .limit(limit)
+                .get()
+            )
+            expired = await (
+                collection
+                .where("status", "==", STATUS_SENDING)
+                .where("lease_until", "<=", time.time())
+                .order_by("lease_until")
+                .limit(limit)
+                .get()
+            )
+            for snapshot in [*expired, *pending]:
+                if snapshot.id not in self._pending:
+                    self._pending.add(snapshot.id)
+                    self._queue.put_nowait((snapshot.id, snapshot.to_dict()))
+            # Páginas incompletas: ya no queda nada fuera de memoria
+            self._backlog = len(pending) >= limit or len(expired) >= limit
+
+    async def _run(self) -> None:
+        while True:
+            if self._backlog and self._queue.empty():
+                try:
+                    await self._refill()
+                except Exception as e:
+                    logger.error(f"Error releyendo la bandeja de salida de emails: {e}")
+            message_id, message = await self._queue.get()
+            try:
+                await self._deliver(message_id, message)
+            except Exception as e:
+                logger.error(f"Error en el worker de emails: {e}")
+            finally:
+                self._queue.task_done()
+
+    def start(self) -> None:
+        """Arrancar los workers (llamar desde el event loop; idempotente)"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._refill_lock = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._run()) for _ in range(self.workers)]
+
+    async def recover(self) -> int:
+        """
+        Volver a cargar los pending de una ejecución anterior y los sending
+        con la concesión caducada (hasta llenar el búfer; el resto se relee a
+        medida que se envía).
+
+        Returns:
+            Mensajes cargados en el búfer
+        """
+        self.start()
+        before = len(self._pending)
+        self._backlog = True
+        await self._refill()
+        return len(self._pending) - before
+
+    async def drain(self) -> None:
+        """Esperar a que no quede nada por enviar (incluidos reintentos y backlog)"""
+        while True:
+            await self._queue.join()
+            if self._backlog:
+                await self._refill()
+            if not self._pending and not self._backlog:
+                return
+            await asyncio.sleep(0.01)
+
+    async def stop(self) -> None:
+        """
+        Parar los workers y cerrar las conexiones. Lo no enviado sigue pending
+        en Firestore (o sending hasta que caduque la concesión) y se recupera
+        en el siguiente arranque.
+        """
+        for handle in self._retry_handles:
+            handle.cancel()
+        self._retry_handles.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._pending.clear()
+        self._domains.clear()
+        close = getattr(self.sender, "close", None)
+        if close is not None:
+            await close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores por resultado, latencia de envío y estado del búfer"""
+        stats: Dict[str, Any] = {labels[0]: value for labels, value in _messages_total.collect().items()}
+        stats["latency_ms"] = {labels[0]: summary for labels, summary in _send_latency_ms.summary().items()}
+        stats["buffered"] = self._queue.qsize() if self._queue is not None else 0
+        stats["in_flight"] = len(self._pending)
+        stats["backlog"] = self._backlog
+        sender_stats = getattr(self.sender, "stats", None)
+        if sender_stats is not None:
+            stats.update(sender_stats())
+        return stats
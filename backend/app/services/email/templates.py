@@ -0,0 +1,306 @@
+"""
+Motor de plantillas de email compiladas y cacheadas.
+
+Las plantillas usan la sintaxis de string.Template ($nombre, ${nombre},
+$$ para un $ literal), pero se compilan una sola vez:
+
+- el texto se parte en segmentos estáticos y nombres de variable, así que
+  renderizar es un único "".join sin volver a analizar la plantilla
+- en el HTML las variables se escapan (salvo las Markup, p. ej. otro
+  fragmento ya renderizado) y el CSS de <style> se copia a atributos
+  style="" al compilar, porque muchos clientes de correo ignoran <style>
+- lo compilado se cachea por (nombre, versión); la versión por defecto es
+  un hash del contenido, así que editar una plantilla la recompila
+- `bind(common)` prerenderiza las variables comunes a toda una campaña y
+  `render_batch` es un generador: cada cuerpo se crea cuando se consume
+  (p. ej. por EmailOutbox.enqueue_many) y nunca están todos en memoria
+"""
+import hashlib
+import html
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from app.utils.metrics_core import metrics_registry
+
+_PLACEHOLDER = re.compile(r"\$(?:(\$)|([_a-z][_a-z0-9]*)|\{([_a-z][_a-z0-9]*)\}|)", re.IGNORECASE)
+
+_STYLE_BLOCK = re.compile(r"<style[^>]*>(.*?)</style>", re.IGNORECASE | re.DOTALL)
+_CSS_RULE = re.compile(r"([^{}]+)\{([^{}]*)\}")
+_SIMPLE_SELECTOR = re.compile(r"^([a-z][a-z0-9]*)?(?:\.([_a-z][-_a-z0-9]*))?$", re.IGNORECASE)
+_BODY_START = re.compile(r"<body[^>]*>", re.IGNORECASE)
+_TAG = re.compile(r"<([a-z][a-z0-9]*)(\s[^<>]*?)?(\s*/?)>", re.IGNORECASE)
+_CLASS_ATTR = re.compile(r"""\sclass\s*=\s*(["'])(.*?)\1""", re.IGNORECASE | re.DOTALL)
+_STYLE_ATTR = re.compile(r"""\sstyle\s*=\s*(["'])(.*?)\1""", re.IGNORECASE | re.DOTALL)
+
+_compilations = metrics_registry.counter(
+    "email_template_compilations_total",
+    "Compilaciones de plantillas de email (una por plantilla y versión)",
+    ("template",)
+)
+
+
+class Markup(str):
+    """HTML ya escapado: se inserta tal cual en las plantillas HTML"""
+
+
+def _escape(value: Any) -> str:
+    if isinstance(value, Markup):
+        return value
+    return html.escape(str(value), quote=True)
+
+
+class CompiledTemplate:
+    """Plantilla partida en segmentos: static[0] var[0] static[1] ... static[n]"""
+
+    __slots__ = ("static", "names", "escape")
+
+    def __init__(self, static: Tuple[str, ...], names: Tuple[str, ...], escape: bool):
+        self.static = static
+        self.names = names
+        self.escape = escape
+
+    @classmethod
+    def parse(cls, source: str, escape: bool = False) -> "CompiledTemplate":
+        """
+        Raises:
+            ValueError: Si hay un $ que no es una variable ni $$
+        """
+        static: List[str] = []
+        names: List[str] = []
+        current: List[str] = []
+        position = 0
+        for match in _PLACEHOLDER.finditer(source):
+            current.append(source[position:match.start()])
+            position = match.end()
+            literal, name, braced = match.groups()
+            if literal:
+                current.append("$")
+            elif name or braced:
+                static.append("".join(current))
+                names.append(name or braced)
+                current = []
+            else:
+                line = source.count("\n", 0, match.start()) + 1
+                raise ValueError(f"$ inválido en la línea {line} de la plantilla")
+        current.append(source[position:])
+        static.append("".join(current))
+        return cls(tuple(static), tuple(names), escape)
+
+    @property
+    def variables(self) -> frozenset:
+        return frozenset(self.names)
+
+    def _convert(self, value: Any) -> str:
+        return _escape(value) if self.escape else str(value)
+
+    def render(self, variables: Mapping[str, Any]) -> str:
+        """
+        Raises:
+            KeyError: Si falta alguna variable
+        """
+        static = self.static
+        parts = [static[0]]
+        for index, name in enumerate(self.names, 1):
+            parts.append(self._convert(variables[name]))
+            parts.append(static[index])
+        rendered = "".join(parts)
+        return Markup(rendered) if self.escape else rendered
+
+    def bind(self, variables: Mapping[str, Any]) -> "CompiledTemplate":
+        """Nueva plantilla con las variables disponibles ya sustituidas"""
+        static = [self.static[0]]
+        names: List[str] = []
+        for index, name in enumerate(self.names, 1):
+            if name in variables:
+                static[-1] += self._convert(variables[name]) + self.static[index]
+            else:
+                names.append(name)
+                static.append(self.static[index])
+        return CompiledTemplate(tuple(static), tuple(names), self.escape)
+
+
+def _parse_declarations(text: str) -> "OrderedDict[str, str]":
+    declarations: "OrderedDict[str, str]" = OrderedDict()
+    for declaration in text.split(";"):
+        prop, sep, value = declaration.partition(":")
+        if sep and prop.strip():
+            declarations[prop.strip().lower()] = value.strip()
+    return declarations
+
+
+def _css_rules(source: str) -> List[Tuple[Optional[str], Optional[str], "OrderedDict[str, str]"]]:
+    """Reglas "tag", ".clase" y "tag.clase" de los <style> (el resto se ignora)"""
+    rules = []
+    for block in _STYLE_BLOCK.findall(source):
+        for selectors, body in _CSS_RULE.findall(block):
+            declarations = _parse_declarations(body)
+            for selector in selectors.split(","):
+                match = _SIMPLE_SELECTOR.match(selector.strip())
+                if match and any(match.groups()):
+                    tag, css_class = match.groups()
+                    rules.append((tag.lower() if tag else None, css_class, declarations))
+    # Especificidad simplificada: tag < .clase < tag.clase; a igualdad, orden del CSS
+    rules.sort(key=lambda rule: (rule[0] is not None) + 2 * (rule[1] is not None))
+    return rules
+
+
+def inline_css(source: str, stylesheet: Optional[str] = None) -> str:
+    """
+    Copiar las reglas simples de <style> como style="" en las etiquetas de
+    <body> (el style propio de la etiqueta gana). El bloque <style> se
+    mantiene para los clientes que sí lo soportan.
+
+    Args:
+        source: HTML de la plantilla
+        stylesheet: HTML del que tomar los <style> (por defecto `source`); para
+            fragmentos sin <body> que se insertan en otra plantilla
+    """
+    rules = _css_rules(source if stylesheet is None else stylesheet)
+    body = _BODY_START.search(source)
+    if not rules or (body is None and stylesheet is None):
+        return source
+
+    def apply(match: "re.Match") -> str:
+        tag, attrs, close = match.group(1).lower(), match.group(2) or "", match.group(3)
+        class_match = _CLASS_ATTR.search(attrs)
+        classes = set(class_match.group(2).split()) if class_match else set()
+        declarations: "OrderedDict[str, str]" = OrderedDict()
+        for rule_tag, rule_class, rule_declarations in rules:
+            if (rule_tag is None or rule_tag == tag) and (rule_class is None or rule_class in classes):
+                declarations.update(rule_declarations)
+        if not declarations:
+            return match.group(0)
+        style_match = _STYLE_ATTR.search(attrs)
+        if style_match:
+            declarations.update(_parse_declarations(style_match.group(2)))
+            attrs = attrs[:style_match.start()] + attrs[style_match.end():]
+        style = "; ".join(f"{prop}: {value}" for prop, value in declarations.items())
+        return f'<{match.group(1)}{attrs} style="{html.escape(style, quote=True)}"{close}>'
+
+    start = body.start() if body is not None else 0
+    return source[:start] + _TAG.sub(apply, source[start:])
+
+
+class CompiledEmail:
+    """Asunto, HTML y texto compilados de una plantilla de email"""
+
+    __slots__ = ("subject", "html", "text")
+
+    def __init__(self, subject: CompiledTemplate, html: CompiledTemplate, text: Optional[CompiledTemplate]):
+        self.subject = subject
+        self.html = html
+        self.text = text
+
+    def render(self, variables: Mapping[str, Any]) -> Dict[str, Optional[str]]:
+        return {
+            "subject": self.subject.render(variables),
+            "html": self.html.render(variables),
+            "text": self.text.render(variables) if self.text is not None else None
+        }
+
+    def bind(self, variables: Mapping[str, Any]) -> "CompiledEmail":
+        return CompiledEmail(
+            self.subject.bind(variables),
+            self.html.bind(variables),
+            self.text.bind(variables) if self.text is not None else None
+        )
+
+
+class EmailTemplate:
+    """Fuente de una plantilla de email ($variables en asunto, HTML y texto)"""
+
+    def __init__(
+        self,
+        name: str,
+        subject: str,
+        html: str,
+        text: Optional[str] = None,
+        version: Optional[str] = None,
+        inline_styles: bool = True
+    ):
+        """
+        Args:
+            name: Nombre con el que se registra
+            subject, html, text: Fuentes (text es opcional)
+            version: Clave de caché (por defecto, hash del contenido)
+            inline_styles: Copiar el CSS de <style> a atributos style=""
+        """
+        self.name = name
+        self.subject = subject
+        self.html = html
+        self.text = text
+        self.inline_styles = inline_styles
+        self.version = version or hashlib.sha256(
+            "\0".join((subject, html, text or "", str(inline_styles))).encode()
+        ).hexdigest()[:12]
+
+    def compile(self) -> CompiledEmail:
+        _compilations.inc(self.name)
+        source = inline_css(self.html) if self.inline_styles else self.html
+        return CompiledEmail(
+            CompiledTemplate.parse(self.subject),
+            CompiledTemplate.parse(source, escape=True),
+            CompiledTemplate.parse(self.text) if self.text is not None else None
+        )
+
+
+class TemplateRegistry:
+    """Plantillas por nombre con caché LRU de lo compilado por (nombre, versión)"""
+
+    def __init__(self, max_compiled: int = 64):
+        self.max_compiled = max_compiled
+        self._templates: Dict[str, EmailTemplate] = {}
+        self._compiled: "OrderedDict[Tuple[str, str], CompiledEmail]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, template: EmailTemplate) -> EmailTemplate:
+        """Registrar (o sustituir) una plantilla; se compila en el primer uso"""
+        with self._lock:
+            self._templates[template.name] = template
+        return template
+
+    def get(self, name: str) -> CompiledEmail:
+        """
+        Raises:
+            KeyError: Si no hay ninguna plantilla con ese nombre
+        """
+        template = self._templates[name]
+        key = (name, template.version)
+        with self._lock:
+            compiled = self._compiled.get(key)
+            if compiled is not None:
+                self._compiled.move_to_end(key)
+                return compiled
+            compiled = template.compile()
+            self._compiled[key] = compiled
+            while len(self._compiled) > self.max_compiled:
+                self._compiled.popitem(last=False)
+            return compiled
+
+    def render(self, name: str, variables: Mapping[str, Any]) -> Dict[str, Optional[str]]:
+        """{"subject", "html", "text"} renderizados"""
+        return self.get(name).render(variables)
+
+    def render_batch(
+        self,
+        name: str,
+        recipients: Iterable[Mapping[str, Any]],
+        common: Optional[Mapping[str, Any]] = None,
+        address_key: str = "email"
+    ) -> Iterator[Dict[str, Optional[str]]]:
+        """
+        Generador de mensajes {"to", "subject", "html", "text"}, uno por
+        destinatario y a medida que se consumen.
+
+        Args:
+            recipients: Variables por destinatario (incluida la dirección)
+            common: Variables iguales para todos (se sustituyen una sola vez)
+            address_key: Clave de la dirección de email en cada destinatario
+        """
+        compiled = self.get(name)
+        if common:
+            compiled = compiled.bind(common)
+        for recipient in recipients:
+            yield {"to": recipient[address_key], **compiled.render(recipient)}
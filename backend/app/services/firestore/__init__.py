@@ -1,3 +1,20 @@
 """
 Firestore service utilities
 """
+from .repository import (
+    EmergencyPhoneRepository,
+    Repository,
+    SubscriptionRepository,
+    UserRepository,
+    get_async_client,
+    set_async_client
+)
+
+__all__ = [
+    "EmergencyPhoneRepository",
+    "Repository",
+    "SubscriptionRepository",
+    "UserRepository",
+    "get_async_client",
+    "set_async_client"
+]
@@ -2,23 +2,30 @@
 Servicio para gestionar teléfonos de emergencia en Firestore con seguridad por subcolección privada.
 SECURITY: Números de teléfono encriptados en reposo.
 """
+import asyncio
 import logging
-from typing import List, Optional, Dict, Any
+from typing import Any, Dict, List, Optional
 from datetime import datetime
-import firebase_admin
-from firebase_admin import firestore
-from app.services.security.encryption_service import encryption_service
+from app.services.firestore.repository import EmergencyPhoneRepository, get_async_client
+from app.services.security.encryption_service import ENCRYPTED_PLACEHOLDER, encryption_service
 
 logger = logging.getLogger(__name__)
 
-db = firestore.client()
-
 class EmergencyPhoneService:
     """Servicio para operaciones CRUD de teléfonos de emergencia en Firestore."""
 
-    def __init__(self):
+    def __init__(self, client: Optional[Any] = None):
+        """
+        Args:
+            client: Cliente asíncrono de Firestore (por defecto el compartido del proceso)
+        """
         self.collection_name = "users"
         self.encryption = encryption_service
+        self._client = client
+
+    def _phones(self, user_id: str) -> EmergencyPhoneRepository:
+        """Repositorio de la subcolección privada del usuario"""
+        return EmergencyPhoneRepository(user_id, client=self._client)
     
     async def create_emergency_phone(self, user_id: str, phone_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -33,9 +40,6 @@ class EmergencyPhoneService:
             Teléfono creado con ID de Firestore (con número desencriptado)
         """
         try:
-            # Referencia a la subcolección privada
-            private_collection = db.collection(self.collection_name).document(user_id).collection("private_info")
-
             # Encriptar número de teléfono antes de guardar
             encrypted_data = phone_data.copy()
             if "phone_number" in encrypted_data and encrypted_data["phone_number"]:
@@ -51,9 +55,8 @@ class EmergencyPhoneService:
                 "is_verified": False
             }
 
-            # Crear documento
-            doc_ref = private_collection.document()
-            await doc_ref.set(phone_data_with_meta)
+            # Crear documento en la subcolección privada
+            phone_id = await self._phones(user_id).add(phone_data_with_meta)
 
             # Retornar datos desencriptados para respuesta API
             result_data = phone_data_with_meta.copy()
@@ -61,7 +64,7 @@ class EmergencyPhoneService:
                 result_data["phone_number"] = self.encryption.decrypt(result_data["phone_number"])
 
             return {
-                "id": doc_ref.id,
+                "id": phone_id,
                 "user_id": user_id,
                 **result_data
             }
@@ -82,35 +85,111 @@ class EmergencyPhoneService:
             Lista de teléfonos de emergencia (con números desencriptados)
         """
         try:
-            private_collection = db.collection(self.collection_name).document(user_id).collection("private_info")
-
-            # Query para obtener solo documentos de teléfonos (puedes añadir filtros)
-            docs = private_collection.where("phone_number", ">", "").get()
-
-            phones = []
-            for doc in docs:
-                phone_data = doc.to_dict()
-
-                # Desencriptar número de teléfono
-                if "phone_number" in phone_data and phone_data["phone_number"]:
-                    try:
-                        phone_data["phone_number"] = self.encryption.decrypt(phone_data["phone_number"])
-                    except ValueError:
-                        # Si falla la desencriptación, podría ser un número sin encriptar (migración)
-                        logger.warning(f"Could not decrypt phone for user {user_id}, phone_id {doc.id}")
-                        phone_data["phone_number"] = "[ENCRYPTED]"
-
-                phones.append({
-                    "id": doc.id,
-                    "user_id": user_id,
-                    **phone_data
-                })
-
+            phones = await self._query_user_phones(user_id)
+            await self._decrypt_phones(phones)
             return phones
 
         except Exception as e:
             logger.error(f"Error obteniendo teléfonos de emergencia para usuario {user_id}: {e}")
             raise
+
+    async def get_emergency_phones_for_users(self, user_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Obtiene los teléfonos de emergencia de varios usuarios (p. ej. aviso
+        masivo de seguridad). Las consultas se solapan en el event loop y todos los
+        números se desencriptan en un único lote (caché + pool de hilos).
+
+        Args:
+            user_ids: IDs de los usuarios
+
+        Returns:
+            {user_id: lista de teléfonos (con números desencriptados)}
+        """
+        unique_ids = list(dict.fromkeys(user_ids))
+        results = await asyncio.gather(
+            *[self._query_user_phones(user_id) for user_id in unique_ids],
+            return_exceptions=True
+        )
+
+        phones_by_user: Dict[str, List[Dict[str, Any]]] = {}
+        for user_id, result in zip(unique_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error obteniendo teléfonos de emergencia para usuario {user_id}: {result}")
+                result = []
+            phones_by_user[user_id] = result
+
+        await self._decrypt_phones([phone for phones in phones_by_user.values() for phone in phones])
+        return phones_by_user
+
+    async def _query_user_phones(self, user_id: str) -> List[Dict[str, Any]]:
+        """Documentos de teléfonos del usuario, con el número aún encriptado"""
+        return [
+            {"user_id": user_id, **phone}
+            for phone in await self._phones(user_id).list_phones()
+        ]
+
+    async def _decrypt_phones(self, phones: List[Dict[str, Any]]) -> None:
+        """Desencriptar en un solo lote el número de todos los teléfonos (in situ)"""
+        encrypted = [phone for phone in phones if phone.get("phone_number")]
+        decrypted = await self.encryption.decrypt_many_async(
+            [phone["phone_number"] for phone in encrypted],
+            on_error=ENCRYPTED_PLACEHOLDER
+        )
+        for phone, number in zip(encrypted, decrypted):
+            if number == ENCRYPTED_PLACEHOLDER:
+                # Si falla la desencriptación, podría ser un número sin encriptar (migración)
+                logger.warning(f"Could not decrypt phone for user {phone['user_id']}, phone_id {phone['id']}")
+            phone["phone_number"] = number
+
+    async def reencrypt_all_phones(self, batch_size: int = 500) -> Dict[str, int]:
+        """
+        Re-encripta con la clave actual (ENCRYPTION_KEY) los números cifrados
+        con claves antiguas (ENCRYPTION_OLD_KEYS). Idempotente: los números que
+        ya usan la clave actual no se reescriben.
+
+        Args:
+            batch_size: Documentos por lote de lectura/escritura (máximo 500)
+
+        Returns:
+            Estadísticas: scanned, rotated, failed
+        """
+        stats = {"scanned": 0, "rotated": 0, "failed": 0}
+        db = self._client if self._client is not None else get_async_client()
+        query = db.collection_group("private_info").where("phone_number", ">", "").order_by("phone_number")
+        last_doc = None
+
+        while True:
+            page_query = query.limit(batch_size)
+            if last_doc is not None:
+                page_query = page_query.start_after(last_doc)
+            docs = await page_query.get()
+            if not docs:
+                break
+            last_doc = docs[-1]
+
+            numbers = [doc.to_dict().get("phone_number") for doc in docs]
+            rotated = await self.encryption.rotate_many_async(numbers)
+
+            batch = db.batch()
+            pending = 0
+            for doc, new_number in zip(docs, rotated):
+                stats["scanned"] += 1
+                if new_number == ENCRYPTED_PLACEHOLDER:
+                    stats["failed"] += 1
+                    continue
+                if new_number is None:
+                    continue
+                batch.update(doc.reference, {"phone_number": new_number, "updated_at": datetime.now()})
+                pending += 1
+            if pending:
+                await batch.commit()
+                stats["rotated"] += pending
+
+            logger.info(f"Re-encriptación de teléfonos: {stats}")
+            if len(docs) < batch_size:
+                break
+
+        return stats
     
     async def get_emergency_phone(self, user_id: str, phone_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -125,7 +204,7 @@ class EmergencyPhoneService:
             Datos del teléfono (con número desencriptado) o None si no existe
         """
         try:
-            doc_ref = db.collection(self.collection_name).document(user_id).collection("private_info").document(phone_id)
+            doc_ref = self._phones(user_id).ref(phone_id)
             doc = await doc_ref.get()
 
             if not doc.exists:
@@ -165,7 +244,7 @@ class EmergencyPhoneService:
             Teléfono actualizado (con número desencriptado)
         """
         try:
-            doc_ref = db.collection(self.collection_name).document(user_id).collection("private_info").document(phone_id)
+            doc_ref = self._phones(user_id).ref(phone_id)
 
             # Encriptar número si está en update_data
             encrypted_update = update_data.copy()
@@ -212,7 +291,7 @@ class EmergencyPhoneService:
             True si se eliminó correctamente
         """
         try:
-            doc_ref = db.collection(self.collection_name).document(user_id).collection("private_info").document(phone_id)
+            doc_ref = self._phones(user_id).ref(phone_id)
             await doc_ref.delete()
             return True
             
@@ -232,7 +311,7 @@ class EmergencyPhoneService:
             Teléfono verificado
         """
         try:
-            doc_ref = db.collection(self.collection_name).document(user_id).collection("private_info").document(phone_id)
+            doc_ref = self._phones(user_id).ref(phone_id)
             
             update_data = {
                 "is_verified": True,
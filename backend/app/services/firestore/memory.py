@@ -0,0 +1,386 @@
+"""
+Implementación en memoria del subconjunto de AsyncClient que usa la capa de
+repositorios, para tests sin emulador ni credenciales.
+
+Soporta colecciones y subcolecciones, collection_group, get_all, batch(),
+consultas con where / order_by / limit / start_after y updates con la
+precondición last_update_time de write_option(). `calls` cuenta las RPC
+simuladas para comprobar cuántas lecturas/escrituras hace un servicio.
+"""
+import copy
+import uuid
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+try:
+    from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound  # type: ignore
+except ImportError:
+    class NotFound(Exception):  # type: ignore
+        pass
+
+    class AlreadyExists(Exception):  # type: ignore
+        pass
+
+    class FailedPrecondition(Exception):  # type: ignore
+        pass
+
+_OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "in": lambda a, b: a in b,
+    "not-in": lambda a, b: a not in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+    "array-contains": lambda a, b: isinstance(a, list) and b in a,
+}
+
+_MISSING = object()
+
+
+def _cmp(a: Any, b: Any) -> int:
+    return (a > b) - (a < b)
+
+
+class InMemorySnapshot:
+    def __init__(
+        self,
+        reference: "InMemoryDocumentReference",
+        data: Optional[Dict[str, Any]],
+        update_time: Optional[int] = None
+    ):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self.update_time = update_time
+        self._data = data
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return copy.deepcopy(self._data)
+
+    def get(self, field: str) -> Any:
+        value: Any = self._data or {}
+        for part in field.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        return value
+
+
+class InMemoryDocumentReference:
+    def __init__(self, client: "InMemoryFirestore", path: str):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self) -> "InMemoryCollection":
+        return InMemoryCollection(self._client, self.path.rsplit("/", 1)[0])
+
+    def collection(self, name: str) -> "InMemoryCollection":
+        return InMemoryCollection(self._client, f"{self.path}/{name}")
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, InMemoryDocumentReference) and other.path == self.path
+
+    def __hash__(self) -> int:
+        return hash(self.path)
+
+    async def get(self) -> InMemorySnapshot:
+        self._client.calls["get"] += 1
+        return self._client._snapshot(self.path)
+
+    async def set(self, data: Dict[str, Any], merge: bool = False) -> None:
+        self._client.calls["set"] += 1
+        self._client._set(self.path, data, merge)
+
+    async def create(self, data: Dict[str, Any]) -> None:
+        self._client.calls["set"] += 1
+        self._client._create(self.path, data)
+
+    async def update(self, data: Dict[str, Any], option: Optional["InMemoryWriteOption"] = None) -> None:
+        self._client.calls["update"] += 1
+        if option is not None and self._client._versions.get(self.path) != option.last_update_time:
+            raise FailedPrecondition(f"Document modified since last read: {self.path}")
+        self._client._update(self.path, data)
+
+    async def delete(self) -> None:
+        self._client.calls["delete"] += 1
+        self._client._documents.pop(self.path, None)
+        self._client._versions.pop(self.path, None)
+
+
+class InMemoryWriteOption:
+    """Precondición de escritura: el documento no ha cambiado desde la lectura"""
+
+    def __init__(self, last_update_time: Any):
+        self.last_update_time = last_update_time
+
+
+class InMemoryQuery:
+    def __init__(
+        self,
+        client: "InMemoryFirestore",
+        collection_path: str,
+        group: bool = False,
+        filters: Tuple = (),
+        orders: Tuple = (),
+        limit_to: Optional[int] = None,
+        cursor: Any = None
+    ):
+        self._client = client
+        self._collection_path = collection_path
+        self._group = group
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit_to
+        self._cursor = cursor
+
+    def _copy(self, **changes: Any) -> "InMemoryQuery":
+        state = {
+            "group": self._group,
+            "filters": self._filters,
+            "orders": self._orders,
+            "limit_to": self._limit,
+            "cursor": self._cursor,
+        }
+        state.update(changes)
+        return InMemoryQuery(self._client, self._collection_path, **state)
+
+    def where(self, field: str, op: str, value: Any) -> "InMemoryQuery":
+        if op not in _OPERATORS:
+            raise ValueError(f"Operador no soportado: {op}")
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def order_by(self, field: str, direction: str = "ASCENDING") -> "InMemoryQuery":
+        return self._copy(orders=self._orders + ((field, str(direction).upper() == "DESCENDING"),))
+
+    def limit(self, count: int) -> "InMemoryQuery":
+        return self._copy(limit_to=count)
+
+    def start_after(self, cursor: Any) -> "InMemoryQuery":
+        return self._copy(cursor=cursor)
+
+    def _in_scope(self, path: str) -> bool:
+        parent, _ = path.rsplit("/", 1)
+        if self._group:
+            return parent.rsplit("/", 1)[-1] == self._collection_path
+        return parent == self._collection_path
+
+    def _field(self, snapshot: InMemorySnapshot, field: str) -> Any:
+        if field == "__name__":
+            return snapshot.reference.path
+        if not snapshot.exists:
+            return _MISSING
+        value: Any = snapshot._data
+        for part in field.split("."):
+            if not isinstance(value, dict) or part not in value:
+                return _MISSING
+            value = value[part]
+        return value
+
+    def _order_fields(self) -> List[Tuple[str, bool]]:
+        orders = list(self._orders)
+        # Como Firestore: orden implícito por el campo de la desigualdad y por __name__
+        if not orders:
+            for field, op, _ in self._filters:
+                if op in ("<", "<=", ">", ">=", "!=", "not-in"):
+                    orders.append((field, False))
+                    break
+        if not any(field == "__name__" for field, _ in orders):
+            orders.append(("__name__", orders[-1][1] if orders else False))
+        return orders
+
+    def _compare(self, a: List[Any], b: List[Any], orders: List[Tuple[str, bool]]) -> int:
+        for x, y, (_, descending) in zip(a, b, orders):
+            result = _cmp(x, y)
+            if result:
+                return -result if descending else result
+        return 0
+
+    def _cursor_values(self, orders: List[Tuple[str, bool]]) -> List[Any]:
+        if isinstance(self._cursor, InMemorySnapshot):
+            return [self._field(self._cursor, field) for field, _ in orders]
+        values = []
+        for field, _ in orders:
+            value = self._cursor.get(field)
+            if isinstance(value, InMemoryDocumentReference):
+                value = value.path
+            values.append(value)
+        return values
+
+    def _run(self) -> List[InMemorySnapshot]:
+        snapshots = [
+            self._client._snapshot(path)
+            for path in list(self._client._documents)
+            if self._in_scope(path)
+        ]
+        for field, op, value in self._filters:
+            matcher = _OPERATORS[op]
+            snapshots = [
+                s for s in snapshots
+                if self._field(s, field) is not _MISSING and matcher(self._field(s, field), value)
+            ]
+
+        orders = self._order_fields()
+        # Los documentos sin un campo de ordenación no aparecen en la consulta
+        snapshots = [s for s in snapshots if all(self._field(s, f) is not _MISSING for f, _ in orders)]
+        keyed = [([self._field(s, f) for f, _ in orders], s) for s in snapshots]
+        for index in reversed(range(len(orders))):
+            keyed.sort(key=lambda item: item[0][index], reverse=orders[index][1])
+
+        if self._cursor is not None:
+            cursor = self._cursor_values(orders)
+            keyed = [item for item in keyed if self._compare(item[0], cursor, orders) > 0]
+
+        result = [s for _, s in keyed]
+        return result[:self._limit] if self._limit is not None else result
+
+    async def get(self) -> List[InMemorySnapshot]:
+        self._client.calls["query"] += 1
+        return self._run()
+
+    async def stream(self) -> AsyncIterator[InMemorySnapshot]:
+        self._client.calls["query"] += 1
+        for snapshot in self._run():
+            yield snapshot
+
+
+class InMemoryCollection(InMemoryQuery):
+    def __init__(self, client: "InMemoryFirestore", path: str):
+        super().__init__(client, path)
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def document(self, doc_id: Optional[str] = None) -> InMemoryDocumentReference:
+        return InMemoryDocumentReference(self._client, f"{self.path}/{doc_id or uuid.uuid4().hex[:20]}")
+
+    async def add(self, data: Dict[str, Any]) -> Tuple[None, InMemoryDocumentReference]:
+        ref = self.document()
+        await ref.set(data)
+        return None, ref
+
+
+class InMemoryWriteBatch:
+    def __init__(self, client: "InMemoryFirestore"):
+        self._client = client
+        self._writes: List[Tuple[str, InMemoryDocumentReference, Any]] = []
+
+    def set(self, ref: InMemoryDocumentReference, data: Dict[str, Any], merge: bool = False) -> "InMemoryWriteBatch":
+        self._writes.append(("set_merge" if merge else "set", ref, data))
+        return self
+
+    def create(self, ref: InMemoryDocumentReference, data: Dict[str, Any]) -> "InMemoryWriteBatch":
+        self._writes.append(("create", ref, data))
+        return self
+
+    def update(self, ref: InMemoryDocumentReference, data: Dict[str, Any]) -> "InMemoryWriteBatch":
+        self._writes.append(("update", ref, data))
+        return self
+
+    def delete(self, ref: InMemoryDocumentReference) -> "InMemoryWriteBatch":
+        self._writes.append(("delete", ref, None))
+        return self
+
+    async def commit(self) -> list:
+        if len(self._writes) > 500:
+            raise ValueError("Un batch admite como máximo 500 escrituras")
+        self._client.calls["commit"] += 1
+        # Atómico: se valida todo antes de aplicar nada
+        for kind, ref, _ in self._writes:
+            if kind == "update" and ref.path not in self._client._documents:
+                raise NotFound(f"No document to update: {ref.path}")
+        for kind, ref, data in self._writes:
+            if kind == "delete":
+                self._client._documents.pop(ref.path, None)
+                self._client._versions.pop(ref.path, None)
+            elif kind == "update":
+                self._client._update(ref.path, data)
+            elif kind == "create":
+                self._client._create(ref.path, data)
+            else:
+                self._client._set(ref.path, data, kind == "set_merge")
+        return [None] * len(self._writes)
+
+
+class InMemoryFirestore:
+    """Sustituto en memoria de google.cloud.firestore.AsyncClient"""
+
+    def __init__(self, documents: Optional[Dict[str, Dict[str, Any]]] = None):
+        """
+        Args:
+            documents: Datos iniciales {"coleccion/doc_id": {...}}
+        """
+        self._documents: Dict[str, Dict[str, Any]] = {}
+        # Contador de escrituras por documento (hace de update_time)
+        self._versions: Dict[str, int] = {}
+        self._clock = 0
+        self.calls: Counter = Counter()
+        for path, data in (documents or {}).items():
+            self._set(path, data, merge=False)
+
+    def collection(self, path: str) -> InMemoryCollection:
+        return InMemoryCollection(self, path.strip("/"))
+
+    def document(self, path: str) -> InMemoryDocumentReference:
+        return InMemoryDocumentReference(self, path.strip("/"))
+
+    def collection_group(self, collection_id: str) -> InMemoryQuery:
+        return InMemoryQuery(self, collection_id, group=True)
+
+    def batch(self) -> InMemoryWriteBatch:
+        return InMemoryWriteBatch(self)
+
+    @staticmethod
+    def write_option(last_update_time: Any) -> InMemoryWriteOption:
+        return InMemoryWriteOption(last_update_time)
+
+    async def get_all(self, references: Iterable[InMemoryDocumentReference]) -> AsyncIterator[InMemorySnapshot]:
+        self.calls["get_all"] += 1
+        for ref in references:
+            yield self._snapshot(ref.path)
+
+    def close(self) -> None:
+        pass
+
+    # ------------------------------------------------------------------
+    # Almacenamiento
+    # ------------------------------------------------------------------
+
+    def _snapshot(self, path: str) -> InMemorySnapshot:
+        data = self._documents.get(path)
+        return InMemorySnapshot(
+            InMemoryDocumentReference(self, path),
+            copy.deepcopy(data) if data is not None else None,
+            self._versions.get(path)
+        )
+
+    def _touch(self, path: str) -> None:
+        self._clock += 1
+        self._versions[path] = self._clock
+
+    def _set(self, path: str, data: Dict[str, Any], merge: bool) -> None:
+        if merge and path in self._documents:
+            self._documents[path].update(copy.deepcopy(data))
+        else:
+            self._documents[path] = copy.deepcopy(data)
+        self._touch(path)
+
+    def _create(self, path: str, data: Dict[str, Any]) -> None:
+        if path in self._documents:
+            raise AlreadyExists(f"Document already exists: {path}")
+        self._set(path, data, merge=False)
+
+    def _update(self, path: str, data: Dict[str, Any]) -> None:
+        if path not in self._documents:
+            raise NotFound(f"No document to update: {path}")
+        self._documents[path].update(copy.deepcopy(data))
+        self._touch(path)
+
+    def dump(self, collection_path: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """Copia de los documentos (opcionalmente solo de una colección)"""
+        return {
+            path: copy.deepcopy(data)
+            for path, data in self._documents.items()
+            if collection_path is None or path.rsplit("/", 1)[0] == collection_path
+        }
@@ -0,0 +1,247 @@
+"""
+Job de limpieza de presencia: marca como desconectados (isOnline = False) a
+los usuarios sin actividad reciente.
+
+- Filtro en servidor: isOnline == true AND lastActivity < umbral
+  (índice compuesto users: isOnline + lastActivity en firestore.indexes.json)
+- Paginación con cursores (lastActivity, id del documento)
+- Hasta `max_in_flight` commits de batch en paralelo en un pool de hilos;
+  el event loop de la API nunca se bloquea
+- Checkpoint por página en jobs/presence_cleanup: si el job falla, la
+  siguiente ejecución continúa desde la última página confirmada con el
+  mismo umbral
+- Métricas de conteo y throughput en lugar de volcar los UIDs al log
+
+Los usuarios sin lastActivity no entran en el filtro de rango de Firestore;
+la webapp siempre escribe lastActivity junto con isOnline.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from app.utils.metrics_core import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# Límite de escrituras por batch de Firestore
+BATCH_LIMIT = 500
+
+CHECKPOINT_COLLECTION = "jobs"
+CHECKPOINT_DOCUMENT = "presence_cleanup"
+
+_users_total = metrics_registry.counter(
+    "presence_cleanup_users_total",
+    "Usuarios procesados por el job de limpieza de presencia",
+    ("result",)
+)
+_runs_total = metrics_registry.counter(
+    "presence_cleanup_runs_total",
+    "Ejecuciones del job de limpieza de presencia por estado",
+    ("status",)
+)
+
+
+class PresenceCleanupJob:
+    """Barrido paginado y concurrente de usuarios inactivos"""
+
+    def __init__(
+        self,
+        db: Any,
+        timeout_minutes: int = 60,
+        page_size: int = 2000,
+        max_in_flight: int = 8,
+        commit_retries: int = 3
+    ):
+        """
+        Args:
+            db: Cliente de Firestore
+            timeout_minutes: Minutos sin actividad para marcar desconectado
+            page_size: Documentos leídos por consulta (se escriben en batches de 500)
+            max_in_flight: Commits de batch simultáneos
+            commit_retries: Intentos por batch antes de abortar el job
+        """
+        self.db = db
+        self.timeout_minutes = timeout_minutes
+        self.page_size = page_size
+        self.max_in_flight = max_in_flight
+        self.commit_retries = commit_retries
+
+    # ------------------------------------------------------------------
+    # Checkpoint
+    # ------------------------------------------------------------------
+
+    def _checkpoint_ref(self):
+        return self.db.collection(CHECKPOINT_COLLECTION).document(CHECKPOINT_DOCUMENT)
+
+    def _load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        """Checkpoint de una ejecución anterior que no terminó"""
+        snapshot = self._checkpoint_ref().get()
+        if not snapshot.exists:
+            return None
+        data = snapshot.to_dict() or {}
+        if data.get("status") in ("running", "failed") and data.get("threshold"):
+            return data
+        return None
+
+    def _save_checkpoint(self, data: Dict[str, Any]) -> None:
+        self._checkpoint_ref().set({**data, "updated_at": datetime.now(timezone.utc)})
+
+    # ------------------------------------------------------------------
+    # Consulta y escritura
+    # ------------------------------------------------------------------
+
+    def _fetch_page(self, threshold: datetime, cursor: Optional[Dict[str, Any]]) -> list:
+        users = self.db.collection("users")
+        query = (
+            users.where("isOnline", "==", True)
+            .where("lastActivity", "<", threshold)
+            .order_by("lastActivity")
+            .order_by("__name__")
+            .limit(self.page_size)
+        )
+        if cursor:
+            query = query.start_after({
+                "lastActivity": cursor["last_activity"],
+                "__name__": users.document(cursor["doc_id"]),
+            })
+        return query.get()
+
+    def _commit(self, refs: list) -> int:
+        """Commit de un batch (en el pool) con reintentos y backoff"""
+        for attempt in range(self.commit_retries):
+            batch = self.db.batch()
+            for ref in refs:
+                batch.update(ref, {"isOnline": False})
+            try:
+                batch.commit()
+                return len(refs)
+            except Exception as e:
+                if attempt == self.commit_retries - 1:
+                    raise
+                logger.warning(f"Reintentando batch de limpieza de presencia ({attempt + 1}): {e}")
+                time.sleep(0.5 * 2 ** attempt)
+        return 0
+
+    # ------------------------------------------------------------------
+    # Ejecución
+    # ------------------------------------------------------------------
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Ejecutar el job completo.
+
+        Returns:
+            Estadísticas: status, processed (acumulado entre reanudaciones),
+            updated (en esta ejecución), failed, pages, resumed, threshold,
+            duration_seconds, users_per_second
+
+        Raises:
+            RuntimeError: Si un batch falla tras los reintentos (el checkpoint
+                queda en la última página confirmada)
+        """
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=self.max_in_flight + 1, thread_name_prefix="presence-cleanup")
+        started = time.monotonic()
+
+        def in_pool(func, *args):
+            return loop.run_in_executor(executor, func, *args)
+
+        try:
+            checkpoint = await in_pool(self._load_checkpoint)
+            if checkpoint:
+                threshold = checkpoint["threshold"]
+                cursor = checkpoint.get("cursor")
+                processed = checkpoint.get("processed", 0)
+                logger.info(f"Limpieza de presencia: reanudando desde checkpoint ({processed} ya procesados)")
+            else:
+                threshold = datetime.now(timezone.utc) - timedelta(minutes=self.timeout_minutes)
+                cursor = None
+                processed = 0
+            resumed = checkpoint is not None
+            saved_cursor = cursor
+
+            slots = asyncio.Semaphore(self.max_in_flight)
+            pending: List[asyncio.Task] = []
+            # Las páginas terminan en desorden: el checkpoint solo avanza
+            # hasta la última página con todas las anteriores confirmadas
+            page_done: Dict[int, Optional[Dict[str, Any]]] = {}
+            watermark = 0
+            updated = 0
+            failed = 0
+            pages = 0
+            error: Optional[Exception] = None
+
+            await in_pool(self._save_checkpoint, {
+                "status": "running", "threshold": threshold, "cursor": cursor, "processed": processed
+            })
+
+            async def commit_page(page: int, refs: list, page_cursor: Dict[str, Any]) -> None:
+                nonlocal watermark, processed, saved_cursor, updated, failed, error
+                try:
+                    results = await asyncio.gather(
+                        *[in_pool(self._commit, refs[i:i + BATCH_LIMIT]) for i in range(0, len(refs), BATCH_LIMIT)]
+                    )
+                    updated += sum(results)
+                    processed += sum(results)
+                    _users_total.inc("updated", amount=sum(results))
+                except Exception as e:
+                    failed += len(refs)
+                    _users_total.inc("failed", amount=len(refs))
+                    error = error or e
+                    return
+                finally:
+                    slots.release()
+
+                page_done[page] = page_cursor
+                while watermark + 1 in page_done:
+                    watermark += 1
+                    saved_cursor = page_done.pop(watermark)
+                    await in_pool(self._save_checkpoint, {
+                        "status": "running", "threshold": threshold, "cursor": saved_cursor, "processed": processed
+                    })
+
+            while error is None:
+                docs = await in_pool(self._fetch_page, threshold, cursor)
+                if not docs:
+                    break
+                pages += 1
+                last = docs[-1]
+                cursor = {"last_activity": last.get("lastActivity"), "doc_id": last.id}
+
+                await slots.acquire()
+                pending.append(asyncio.ensure_future(commit_page(pages, [doc.reference for doc in docs], cursor)))
+                if len(docs) < self.page_size:
+                    break
+
+            await asyncio.gather(*pending)
+
+            status = "failed" if error is not None else "completed"
+            final = {"status": status, "threshold": threshold, "processed": processed, "cursor": None}
+            if error is not None:
+                # La próxima ejecución continúa tras la última página confirmada
+                final["cursor"] = saved_cursor
+                final["error"] = str(error)
+            await in_pool(self._save_checkpoint, final)
+        finally:
+            executor.shutdown(wait=False)
+
+        duration = time.monotonic() - started
+        stats = {
+            "status": status,
+            "processed": processed,
+            "updated": updated,
+            "failed": failed,
+            "pages": pages,
+            "resumed": resumed,
+            "threshold": threshold.isoformat() if hasattr(threshold, "isoformat") else str(threshold),
+            "duration_seconds": round(duration, 3),
+            "users_per_second": round(updated / duration, 1) if duration > 0 else 0.0,
+        }
+        _runs_total.inc(status)
+        logger.info(f"Limpieza de presencia: {stats}")
+        if error is not None:
+            raise RuntimeError(f"Presence cleanup failed after {processed} users: {error}") from error
+        return stats
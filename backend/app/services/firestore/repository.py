@@ -0,0 +1,253 @@
+"""
+Capa de acceso a datos asíncrona sobre google.cloud.firestore.AsyncClient.
+
+- Un único AsyncClient por proceso (get_async_client): el canal gRPC y sus
+  conexiones se reutilizan entre peticiones en lugar de crearse ad hoc
+- Repositorios por colección con operaciones tipadas que devuelven dicts
+  planos con el ID del documento en "id"
+- Lecturas múltiples con un solo get_all (una RPC en lugar de N get)
+- `claim` para reclamar un documento entre varias instancias (lectura +
+  update con precondición last_update_time)
+- set_async_client permite inyectar InMemoryFirestore en los tests
+
+Los jobs por lotes que ya corren en un pool de hilos (limpieza de presencia,
+expiración de suscripciones, sumidero de eventos de seguridad) siguen usando
+el cliente síncrono.
+"""
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+
+try:
+    from firebase_admin import firestore_async  # type: ignore
+except ImportError:
+    firestore_async = None  # type: ignore
+
+try:
+    from google.cloud.firestore import AsyncClient  # type: ignore
+except ImportError:
+    AsyncClient = None  # type: ignore
+
+try:
+    from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound  # type: ignore
+except ImportError:
+    class AlreadyExists(Exception):  # type: ignore
+        pass
+
+    class FailedPrecondition(Exception):  # type: ignore
+        pass
+
+    class NotFound(Exception):  # type: ignore
+        pass
+
+logger = logging.getLogger(__name__)
+
+Document = Dict[str, Any]
+# (campo, operador, valor), p. ej. ("status", "==", "active")
+Filter = Tuple[str, str, Any]
+
+_client: Optional[Any] = None
+_client_lock = threading.Lock()
+
+
+def _create_async_client() -> Any:
+    if firestore_async is not None:
+        try:
+            # Reutiliza las credenciales de la app de firebase_admin ya inicializada
+            return firestore_async.client()
+        except ValueError:
+            # firebase_admin no inicializado: cliente con las credenciales por defecto
+            pass
+    if AsyncClient is None:
+        raise RuntimeError("google-cloud-firestore no está instalado")
+    return AsyncClient(project=settings.FIREBASE_PROJECT_ID or None)
+
+
+def get_async_client() -> Any:
+    """Cliente asíncrono de Firestore compartido por todo el proceso"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_async_client()
+                logger.info("Cliente asíncrono de Firestore inicializado")
+    return _client
+
+
+def set_async_client(client: Optional[Any]) -> None:
+    """Sustituir el cliente compartido (tests); None vuelve a crearlo bajo demanda"""
+    global _client
+    with _client_lock:
+        _client = client
+
+
+def snapshot_to_document(snapshot: Any) -> Optional[Document]:
+    """Snapshot → dict con "id", o None si el documento no existe"""
+    if not snapshot.exists:
+        return None
+    return {"id": snapshot.id, **(snapshot.to_dict() or {})}
+
+
+class Repository:
+    """Operaciones asíncronas sobre una colección (o subcolección) de Firestore"""
+
+    collection_path: str = ""
+
+    def __init__(self, client: Optional[Any] = None, collection_path: Optional[str] = None):
+        """
+        Args:
+            client: Cliente asíncrono (por defecto el compartido del proceso)
+            collection_path: Ruta de la colección ("users", "users/{uid}/private_info")
+        """
+        self._client = client
+        if collection_path is not None:
+            self.collection_path = collection_path
+
+    @property
+    def client(self) -> Any:
+        return self._client if self._client is not None else get_async_client()
+
+    def collection(self) -> Any:
+        return self.client.collection(self.collection_path)
+
+    def ref(self, doc_id: Optional[str] = None) -> Any:
+        """Referencia al documento (ID nuevo generado en local si doc_id es None)"""
+        collection = self.collection()
+        return collection.document(doc_id) if doc_id else collection.document()
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+
+    async def get(self, doc_id: str) -> Optional[Document]:
+        """Documento por ID o None si no existe"""
+        return snapshot_to_document(await self.ref(doc_id).get())
+
+    async def get_many(self, doc_ids: Iterable[str]) -> Dict[str, Document]:
+        """
+        Varios documentos en una sola RPC (get_all).
+
+        Returns:
+            {doc_id: documento} solo con los que existen
+        """
+        ids = list(dict.fromkeys(doc_id for doc_id in doc_ids if doc_id))
+        if not ids:
+            return {}
+        documents: Dict[str, Document] = {}
+        async for snapshot in self.client.get_all([self.ref(doc_id) for doc_id in ids]):
+            document = snapshot_to_document(snapshot)
+            if document is not None:
+                documents[document["id"]] = document
+        return documents
+
+    async def find(
+        self,
+        *filters: Filter,
+        order_by: Optional[Sequence[str]] = None,
+        limit: Optional[int] = None
+    ) -> List[Document]:
+        """
+        Documentos que cumplen todos los filtros.
+
+        Args:
+            filters: Tuplas (campo, operador, valor)
+            order_by: Campos de ordenación ("-campo" para descendente)
+            limit: Máximo de documentos
+        """
+        query = self.collection()
+        for field, op, value in filters:
+            query = query.where(field, op, value)
+        for field in order_by or ():
+            if field.startswith("-"):
+                query = query.order_by(field[1:], direction="DESCENDING")
+            else:
+                query = query.order_by(field)
+        if limit is not None:
+            query = query.limit(limit)
+        return [{"id": snapshot.id, **(snapshot.to_dict() or {})} for snapshot in await query.get()]
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+
+    async def add(self, data: Document, doc_id: Optional[str] = None) -> str:
+        """Crear un documento y devolver su ID"""
+        ref = self.ref(doc_id)
+        await ref.set(data)
+        return ref.id
+
+    async def create(self, doc_id: str, data: Document) -> bool:
+        """
+        Crear el documento solo si no existe (escritura con precondición).
+
+        Returns:
+            False si ya existía (no se modifica)
+        """
+        try:
+            await self.ref(doc_id).create(data)
+        except AlreadyExists:
+            return False
+        return True
+
+    async def claim(
+        self,
+        doc_id: str,
+        claimable: Callable[[Document], bool],
+        data: Document
+    ) -> Optional[Document]:
+        """
+        Actualizar el documento solo si `claimable(documento)` y nadie lo ha
+        modificado entre la lectura y la escritura (compare-and-set con la
+        precondición last_update_time). Sirve para que una sola instancia
+        se quede con un trabajo.
+
+        Returns:
+            El documento con `data` aplicado, o None si no existe, no es
+            reclamable o lo ha cambiado otra instancia
+        """
+        ref = self.ref(doc_id)
+        snapshot = await ref.get()
+        document = snapshot_to_document(snapshot)
+        if document is None or not claimable(document):
+            return None
+        try:
+            await ref.update(data, option=self.client.write_option(last_update_time=snapshot.update_time))
+        except (FailedPrecondition, NotFound):
+            return None
+        return {**document, **data}
+
+    async def set(self, doc_id: str, data: Document, merge: bool = False) -> None:
+        await self.ref(doc_id).set(data, merge=merge)
+
+    async def update(self, doc_id: str, data: Document) -> None:
+        """Actualizar campos (falla con NotFound si el documento no existe)"""
+        await self.ref(doc_id).update(data)
+
+    async def delete(self, doc_id: str) -> None:
+        await self.ref(doc_id).delete()
+
+
+class UserRepository(Repository):
+    """Colección users"""
+
+    collection_path = "users"
+
+
+class SubscriptionRepository(Repository):
+    """Colección subscriptions"""
+
+    collection_path = "subscriptions"
+
+
+class EmergencyPhoneRepository(Repository):
+    """Subcolección privada users/{uid}/private_info con los teléfonos de emergencia"""
+
+    def __init__(self, user_id: str, client: Optional[Any] = None):
+        super().__init__(client, f"{UserRepository.collection_path}/{user_id}/private_info")
+        self.user_id = user_id
+
+    async def list_phones(self) -> List[Document]:
+        """Documentos con número de teléfono (aún encriptado)"""
+        return await self.find(("phone_number", ">", ""))
@@ -0,0 +1,299 @@
+"""
+Pipeline de expiración masiva de suscripciones.
+
+1. Pagina las suscripciones activas con end_date vencida (cursor por end_date)
+2. Por página: lee los usuarios con un único get_all y escribe suscripción +
+   usuario en grupos de batch() (2 escrituras por suscripción, máximo 500)
+3. Actualiza los custom claims de Auth con un pool de workers acotado, con
+   reintentos, backoff exponencial con jitter y pausa compartida cuando Auth
+   devuelve límite de cuota
+4. Marcador de idempotencia: la suscripción se marca `claims_pending = True`
+   en el mismo batch que la expira y se limpia cuando los claims están al día.
+   Una ejecución posterior reintenta solo las pendientes.
+
+Si el usuario ya tiene otra suscripción (renovó), no se toca su documento ni
+sus claims: solo se expira la suscripción antigua.
+"""
+import asyncio
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.utils.metrics_core import metrics_registry
+
+try:
+    from firebase_admin import auth, exceptions as firebase_exceptions  # type: ignore
+except ImportError:
+    auth = None  # type: ignore
+    firebase_exceptions = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# Límite de escrituras por batch de Firestore
+BATCH_LIMIT = 500
+
+_expiry_total = metrics_registry.counter(
+    "subscription_expiry_total",
+    "Resultado del pipeline de expiración de suscripciones",
+    ("result",)
+)
+
+
+def set_subscription_claim(auth_client: Any, user_id: str, has_active_subscription: bool) -> None:
+    """
+    Fusionar el claim de suscripción con los custom claims actuales (bloqueante).
+
+    Raises:
+        Las excepciones de firebase_admin.auth (usuario inexistente, cuota...)
+    """
+    user = auth_client.get_user(user_id)
+    current_claims = user.custom_claims or {}
+    auth_client.set_custom_user_claims(user_id, {
+        **current_claims,
+        "hasActiveSubscription": has_active_subscription,
+        "subscriptionUpdatedAt": datetime.now().isoformat()
+    })
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    resource_exhausted = getattr(firebase_exceptions, "ResourceExhaustedError", None)
+    if resource_exhausted is not None and isinstance(error, resource_exhausted):
+        return True
+    status = getattr(getattr(error, "http_response", None), "status_code", None)
+    return status == 429
+
+
+def _is_user_not_found(error: Exception) -> bool:
+    not_found = getattr(auth, "UserNotFoundError", None)
+    return not_found is not None and isinstance(error, not_found)
+
+
+class SubscriptionExpiryPipeline:
+    """Expiración paginada con escrituras por lotes y claims en paralelo"""
+
+    def __init__(
+        self,
+        db: Any,
+        auth_client: Any = None,
+        page_size: int = 500,
+        claims_workers: int = 16,
+        max_retries: int = 5,
+        base_backoff: float = 0.5,
+        subscriptions_collection: str = "subscriptions",
+        users_collection: str = "users"
+    ):
+        """
+        Args:
+            db: Cliente de Firestore
+            auth_client: Módulo/cliente de Firebase Auth (por defecto firebase_admin.auth)
+            page_size: Suscripciones leídas por consulta
+            claims_workers: Llamadas a Auth simultáneas
+            max_retries: Reintentos por usuario antes de dejarlo pendiente
+            base_backoff: Segundos del primer reintento (se duplica en cada intento)
+        """
+        self.db = db
+        self.auth = auth_client or auth
+        self.page_size = page_size
+        self.claims_workers = claims_workers
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.subscriptions_collection = subscriptions_collection
+        self.users_collection = users_collection
+        self._paused_until = 0.0
+
+    # ------------------------------------------------------------------
+    # Firestore (bloqueante, se ejecuta en el pool)
+    # ------------------------------------------------------------------
+
+    def _fetch_expired_page(self, now: datetime, cursor: Any) -> list:
+        query = (
+            self.db.collection(self.subscriptions_collection)
+            .where("status", "==", "active")
+            .where("end_date", "<", now)
+            .order_by("end_date")
+            .limit(self.page_size)
+        )
+        if cursor is not None:
+            query = query.start_after(cursor)
+        return query.get()
+
+    def _fetch_pending_claims_page(self, cursor: Any) -> list:
+        query = (
+            self.db.collection(self.subscriptions_collection)
+            .where("status", "==", "expired")
+            .where("claims_pending", "==", True)
+            .limit(self.page_size)
+        )
+        if cursor is not None:
+            query = query.start_after(cursor)
+        return query.get()
+
+    def _expire_page(self, docs: list, now: datetime) -> List[str]:
+        """
+        Expirar una página en batches.
+
+        Returns:
+            user_ids cuyos claims hay que actualizar (mismo orden que `docs`,
+            None si el usuario ya tiene otra suscripción)
+        """
+        user_ids = [doc.to_dict().get("user_id") for doc in docs]
+        user_refs = {
+            uid: self.db.collection(self.users_collection).document(uid)
+            for uid in dict.fromkeys(uid for uid in user_ids if uid)
+        }
+        current_subscription = {
+            snapshot.id: (snapshot.to_dict() or {}).get("subscription_id")
+            for snapshot in self.db.get_all(list(user_refs.values()))
+            if snapshot.exists
+        }
+
+        claim_targets: List[Optional[str]] = []
+        writes = []
+        seen_users = set()
+        for doc, uid in zip(docs, user_ids):
+            owns_user = (
+                uid in current_subscription
+                and current_subscription[uid] in (None, doc.id)
+                and uid not in seen_users
+            )
+            if owns_user:
+                seen_users.add(uid)
+            writes.append((doc.reference, {
+                "status": "expired",
+                "claims_pending": owns_user,
+                "updated_at": now
+            }))
+            if owns_user:
+                writes.append((user_refs[uid], {
+                    "subscription_status": "expired",
+                    "updated_at": now
+                }))
+            claim_targets.append(uid if owns_user else None)
+
+        for i in range(0, len(writes), BATCH_LIMIT):
+            batch = self.db.batch()
+            for ref, data in writes[i:i + BATCH_LIMIT]:
+                batch.update(ref, data)
+            batch.commit()
+        return claim_targets
+
+    def _clear_pending(self, refs: list) -> None:
+        for i in range(0, len(refs), BATCH_LIMIT):
+            batch = self.db.batch()
+            for ref in refs[i:i + BATCH_LIMIT]:
+                batch.update(ref, {"claims_pending": False})
+            batch.commit()
+
+    # ------------------------------------------------------------------
+    # Claims de Auth
+    # ------------------------------------------------------------------
+
+    async def _update_claims(self, user_id: str, executor: ThreadPoolExecutor) -> bool:
+        """Claims de un usuario con reintentos; False si se agotan"""
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            # Pausa compartida: si Auth limita la cuota, paran todos los workers
+            wait = self._paused_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                await loop.run_in_executor(executor, set_subscription_claim, self.auth, user_id, False)
+                return True
+            except Exception as e:
+                if _is_user_not_found(e):
+                    # Usuario borrado: no hay claims que actualizar
+                    return True
+                if attempt == self.max_retries:
+                    logger.error(f"Claims no actualizados para usuario {user_id} tras {attempt + 1} intentos: {e}")
+                    return False
+                delay = self.base_backoff * 2 ** attempt * (0.5 + random.random())
+                if _is_rate_limited(e):
+                    _expiry_total.inc("claims_rate_limited")
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                await asyncio.sleep(delay)
+        return False
+
+    async def _sync_claims(self, items: list, executor: ThreadPoolExecutor, stats: Dict[str, int]) -> None:
+        """items: [(subscription_ref, user_id)]; limpia el marcador de los que terminan"""
+        slots = asyncio.Semaphore(self.claims_workers)
+
+        async def worker(user_id: str) -> bool:
+            async with slots:
+                return await self._update_claims(user_id, executor)
+
+        results = await asyncio.gather(*[worker(uid) for _, uid in items])
+        done = [ref for (ref, _), ok in zip(items, results) if ok]
+        stats["claims_updated"] += len(done)
+        stats["claims_failed"] += len(items) - len(done)
+        _expiry_total.inc("claims_updated", amount=len(done))
+        _expiry_total.inc("claims_failed", amount=len(items) - len(done))
+        if done:
+            await asyncio.get_running_loop().run_in_executor(executor, self._clear_pending, done)
+
+    # ------------------------------------------------------------------
+    # Ejecución
+    # ------------------------------------------------------------------
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Expirar todas las suscripciones vencidas y sincronizar sus claims.
+
+        Returns:
+            Estadísticas: expired, users_updated, claims_updated,
+            claims_failed, pages, duration_seconds
+        """
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=self.claims_workers + 2, thread_name_prefix="subscription-expiry")
+        stats = {"expired": 0, "users_updated": 0, "claims_updated": 0, "claims_failed": 0, "pages": 0}
+        started = time.monotonic()
+        now = datetime.now()
+
+        try:
+            # 1. Reintentar claims pendientes de ejecuciones anteriores
+            cursor = None
+            while True:
+                docs = await loop.run_in_executor(executor, self._fetch_pending_claims_page, cursor)
+                if not docs:
+                    break
+                cursor = docs[-1]
+                await self._sync_claims(
+                    [(doc.reference, doc.to_dict().get("user_id")) for doc in docs], executor, stats
+                )
+                if len(docs) < self.page_size:
+                    break
+
+            # 2. Expirar por páginas; los claims de una página se sincronizan
+            #    mientras se lee y escribe la siguiente
+            cursor = None
+            claims_task: Optional[asyncio.Task] = None
+            while True:
+                docs = await loop.run_in_executor(executor, self._fetch_expired_page, now, cursor)
+                if not docs:
+                    break
+                cursor = docs[-1]
+                stats["pages"] += 1
+
+                targets = await loop.run_in_executor(executor, self._expire_page, docs, now)
+                items = [(doc.reference, uid) for doc, uid in zip(docs, targets) if uid]
+                stats["expired"] += len(docs)
+                stats["users_updated"] += len(items)
+                _expiry_total.inc("expired", amount=len(docs))
+
+                if claims_task is not None:
+                    await claims_task
+                claims_task = asyncio.ensure_future(self._sync_claims(items, executor, stats))
+
+                if len(docs) < self.page_size:
+                    break
+
+            if claims_task is not None:
+                await claims_task
+        finally:
+            executor.shutdown(wait=False)
+
+        stats["duration_seconds"] = round(time.monotonic() - started, 3)
+        logger.info(f"Expiración de suscripciones: {stats}")
+        return stats
@@ -1,20 +1,32 @@
 """
 Servicio para gestionar suscripciones de usuarios en Firestore.
 """
+import asyncio
 import logging
 from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
 from firebase_admin import firestore, auth
 
+from app.core.config import settings
+from app.services.firestore.repository import SubscriptionRepository, UserRepository
+from app.services.firestore.subscription_expiry import SubscriptionExpiryPipeline, set_subscription_claim
+
 logger = logging.getLogger(__name__)
+# Cliente síncrono: solo para el pipeline de expiración, que corre en su pool de hilos
 db = firestore.client()
 
 class SubscriptionService:
     """Servicio para operaciones de suscripciones de usuarios."""
 
-    def __init__(self):
+    def __init__(self, client: Optional[Any] = None):
+        """
+        Args:
+            client: Cliente asíncrono de Firestore (por defecto el compartido del proceso)
+        """
         self.collection_name = "users"
         self.subscriptions_collection = "subscriptions"
+        self.users = UserRepository(client, self.collection_name)
+        self.subscriptions = SubscriptionRepository(client, self.subscriptions_collection)
 
     async def create_subscription(
         self,
@@ -57,24 +69,26 @@ class SubscriptionService:
                 "updated_at": start_date
             }
 
-            # Guardar en la colección de suscripciones
-            subscription_ref = db.collection(self.subscriptions_collection).document()
-            await subscription_ref.set(subscription_data)
-
-            # Actualizar el documento del usuario con el estado de suscripción
-            user_ref = db.collection(self.collection_name).document(user_id)
-            await user_ref.update({
+            # Suscripción y documento del usuario en un solo batch: o se
+            # escriben los dos o ninguno (el webhook busca la suscripción por
+            # payment_id para no duplicarla al reintentar)
+            subscription_ref = self.subscriptions.ref()
+            subscription_id = subscription_ref.id
+            batch = self.subscriptions.client.batch()
+            batch.set(subscription_ref, subscription_data)
+            batch.update(self.users.ref(user_id), {
                 "subscription_status": "active",
-                "subscription_id": subscription_ref.id,
+                "subscription_id": subscription_id,
                 "subscription_plan": plan_type,
                 "subscription_end_date": end_date,
                 "updated_at": datetime.now()
             })
+            await batch.commit()
 
             logger.info(f"Suscripción creada para usuario {user_id}: plan={plan_type}, hasta={end_date}")
 
             return {
-                "id": subscription_ref.id,
+                "id": subscription_id,
                 **subscription_data
             }
 
@@ -99,19 +113,16 @@ class SubscriptionService:
         """
         try:
             # Actualizar el documento del usuario
-            user_ref = db.collection(self.collection_name).document(user_id)
-            user_doc = await user_ref.get()
+            user_data = await self.users.get(user_id)
 
-            if not user_doc.exists:
+            if user_data is None:
                 raise ValueError(f"Usuario {user_id} no encontrado")
 
-            user_data = user_doc.to_dict()
             subscription_id = user_data.get("subscription_id")
 
             if subscription_id:
                 # Actualizar el documento de suscripción
-                subscription_ref = db.collection(self.subscriptions_collection).document(subscription_id)
-                await subscription_ref.update({
+                await self.subscriptions.update(subscription_id, {
                     "status": "cancelled",
                     "cancelled_at": datetime.now(),
                     "refund_data": refund_data or {},
@@ -119,7 +130,7 @@ class SubscriptionService:
                 })
 
             # Actualizar el usuario
-            await user_ref.update({
+            await self.users.update(user_id, {
                 "subscription_status": "cancelled",
                 "subscription_cancelled_at": datetime.now(),
                 "updated_at": datetime.now()
@@ -149,19 +160,8 @@ class SubscriptionService:
             True si se actualizó correctamente
         """
         try:
-            # Obtener claims actuales
-            user = auth.get_user(user_id)
-            current_claims = user.custom_claims or {}
-
-            # Actualizar solo el claim de suscripción
-            new_claims = {
-                **current_claims,
-                "hasActiveSubscription": has_active_subscription,
-                "subscriptionUpdatedAt": datetime.now().isoformat()
-            }
-
-            # Establecer nuevos claims
-            auth.set_custom_user_claims(user_id, new_claims)
+            # Leer y fusionar claims fuera del event loop (llamadas bloqueantes)
+            await asyncio.to_thread(set_subscription_claim, auth, user_id, has_active_subscription)
 
             logger.info(f"Custom claims actualizados para usuario {user_id}: hasActiveSubscription={has_active_subscription}")
 
@@ -182,35 +182,27 @@ class SubscriptionService:
             Datos de la suscripción o None si no tiene
         """
         try:
-            user_ref = db.collection(self.collection_name).document(user_id)
-            user_doc = await user_ref.get()
+            user_data = await self.users.get(user_id)
 
-            if not user_doc.exists:
+            if user_data is None:
                 return None
 
-            user_data = user_doc.to_dict()
             subscription_id = user_data.get("subscription_id")
 
             if not subscription_id:
                 return None
 
-            # Obtener el documento de suscripción
-            subscription_ref = db.collection(self.subscriptions_collection).document(subscription_id)
-            subscription_doc = await subscription_ref.get()
+            # Obtener el documento de suscripción (incluye "id")
+            subscription_data = await self.subscriptions.get(subscription_id)
 
-            if not subscription_doc.exists:
+            if subscription_data is None:
                 return None
 
-            subscription_data = subscription_doc.to_dict()
-
             # Verificar si la suscripción sigue activa
             if subscription_data.get("status") == "active":
                 end_date = subscription_data.get("end_date")
                 if end_date and end_date > datetime.now():
-                    return {
-                        "id": subscription_id,
-                        **subscription_data
-                    }
+                    return subscription_data
 
             return None
 
@@ -223,43 +215,24 @@ class SubscriptionService:
         Verifica todas las suscripciones y marca como expiradas las que corresponda.
         Esta función debería ejecutarse periódicamente (cron job).
 
+        Usa SubscriptionExpiryPipeline: páginas de suscripciones vencidas,
+        escrituras en batch y claims de Auth en un pool de workers.
+
         Returns:
             Número de suscripciones expiradas
         """
         try:
-            # Buscar suscripciones activas que hayan expirado
-            now = datetime.now()
-            subscriptions = db.collection(self.subscriptions_collection)\
-                .where("status", "==", "active")\
-                .where("end_date", "<", now)\
-                .stream()
-
-            expired_count = 0
-
-            for subscription_doc in subscriptions:
-                subscription_data = subscription_doc.to_dict()
-                user_id = subscription_data.get("user_id")
-
-                # Actualizar suscripción a expirada
-                await subscription_doc.reference.update({
-                    "status": "expired",
-                    "updated_at": now
-                })
-
-                # Actualizar usuario
-                user_ref = db.collection(self.collection_name).document(user_id)
-                await user_ref.update({
-                    "subscription_status": "expired",
-                    "updated_at": now
-                })
-
-                # Actualizar custom claims
-                await self.update_custom_claims(user_id, False)
-
-                expired_count += 1
-                logger.info(f"Suscripción expirada para usuario {user_id}")
-
-            return expired_count
+            pipeline = SubscriptionExpiryPipeline(
+                db,
+                auth,
+                page_size=settings.SUBSCRIPTION_EXPIRY_PAGE_SIZE,
+                claims_workers=settings.SUBSCRIPTION_CLAIMS_WORKERS,
+                max_retries=settings.SUBSCRIPTION_CLAIMS_MAX_RETRIES,
+                subscriptions_collection=self.subscriptions_collection,
+                users_collection=self.collection_name
+            )
+            stats = await pipeline.run()
+            return stats["expired"]
 
         except Exception as e:
             logger.error(f"Error verificando suscripciones expiradas: {e}")
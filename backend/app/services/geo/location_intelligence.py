@@ -9,6 +9,8 @@ import numpy as np
 from geopy.distance import geodesic
 from geopy.geocoders import GoogleV3
 
+from app.services.geo.places_client import GooglePlacesClient, get_places_client
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -39,9 +41,11 @@ class LocationVerification:
     factors: List[str]
 
 class LocationIntelligence:
-    def __init__(self, google_api_key: str):
+    def __init__(self, google_api_key: str, places_client: Optional[GooglePlacesClient] = None):
         self.google_api_key = google_api_key
         self.geocoder = GoogleV3(api_key=google_api_key)
+        # Cliente de Places compartido por API key (pool de conexiones + caché por teselas)
+        self.places = places_client or get_places_client(google_api_key)
         
         # Criterios de seguridad para lugares de encuentro
         self.safety_criteria = {
@@ -66,7 +70,7 @@ class LocationIntelligence:
             'casual_meeting': ['cafe', 'bakery', 'park']
         }
 
-    def suggest_meeting_spots(self, 
+    async def suggest_meeting_spots(self, 
                             user1_location: Tuple[float, float], 
                             user2_location: Tuple[float, float],
                             preferences: Optional[Dict] = None) -> List[MeetingSpot]:
@@ -83,7 +87,7 @@ class LocationIntelligence:
                 logger.warning(f"Users are {total_distance:.1f}km apart - very far for meeting")
             
             # Buscar lugares cercanos al punto medio
-            places = self._find_nearby_places(midpoint, radius_km=2.0)
+            places = await self._find_nearby_places(midpoint, radius_km=2.0)
             
             # Filtrar y puntuar lugares
             filtered_places = self._filter_suitable_places(places, preferences)
@@ -188,10 +192,9 @@ class LocationIntelligence:
         
         return math.degrees(lat_mid), math.degrees(lng_mid)
 
-    def _find_nearby_places(self, location: Tuple[float, float], radius_km: float = 2.0) -> List[Dict]:
-        """Busca lugares cercanos usando Google Places API"""
+    async def _find_nearby_places(self, location: Tuple[float, float], radius_km: float = 2.0) -> List[Dict]:
+        """Busca lugares cercanos usando Google Places API (todos los tipos a la vez, con caché)"""
         try:
-            lat, lng = location
             radius_meters = int(radius_km * 1000)
             
             # Tipos de lugares a buscar
@@ -200,20 +203,10 @@ class LocationIntelligence:
                 'park', 'movie_theater', 'museum', 'art_gallery', 'book_store'
             ]
             
+            results_by_type = await self.places.nearby_many(location, radius_meters, place_types)
             all_places = []
-            
             for place_type in place_types:
-                url = (
-                    f"https://maps.googleapis.com/maps/api/place/nearbysearch/json?"
-                    f"location={lat},{lng}&radius={radius_meters}&type={place_type}"
-                    f"&key={self.google_api_key}&language=es"
-                )
-                
-                response = requests.get(url, timeout=10)
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get('results'):
-                        all_places.extend(data['results'])
+                all_places.extend(results_by_type.get(place_type, []))
             
             # Eliminar duplicados
             seen_places = {}
@@ -431,13 +424,13 @@ class LocationIntelligence:
             logger.error(f"Error getting location info: {str(e)}")
             return None
 
-    def get_safety_recommendations(self, location: Tuple[float, float]) -> List[str]:
+    async def get_safety_recommendations(self, location: Tuple[float, float]) -> List[str]:
         """Obtiene recomendaciones de seguridad para un área"""
         recommendations = []
         
         try:
             # Verificar si es un área urbana segura
-            nearby_places = self._find_nearby_places(location, radius_km=0.5)
+            nearby_places = await self._find_nearby_places(location, radius_km=0.5)
             
             # Contar tipos de lugares
             place_types = []
@@ -479,7 +472,7 @@ class LocationIntelligence:
         return recommendations
 
 # Funciones auxiliares para uso externo
-def suggest_safe_meeting_spots(user1_lat: float, user1_lng: float, 
+async def suggest_safe_meeting_spots(user1_lat: float, user1_lng: float, 
                              user2_lat: float, user2_lng: float,
                              google_api_key: str,
                              preferences: Optional[Dict] = None) -> List[Dict]:
@@ -489,7 +482,7 @@ def suggest_safe_meeting_spots(user1_lat: float, user1_lng: float,
     user1_location = (user1_lat, user1_lng)
     user2_location = (user2_lat, user2_lng)
     
-    spots = geo_service.suggest_meeting_spots(user1_location, user2_location, preferences)
+    spots = await geo_service.suggest_meeting_spots(user1_location, user2_location, preferences)
     
     # Convertir a diccionarios para serialización JSON
     return [{
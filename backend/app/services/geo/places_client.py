@@ -0,0 +1,380 @@
+"""
+TuCitaSegura - Cliente asíncrono de Google Places (Nearby Search)
+
+- Un único httpx.AsyncClient con pool de conexiones keep-alive por API key
+  (get_places_client): sin handshake TLS por consulta
+- Las consultas de varios tipos de lugar se lanzan a la vez (nearby_many):
+  ~1 RTT en lugar de uno por tipo
+- Caché por (tesela geohash, radio redondeado, tipo) con TTL: la ubicación se
+  ajusta al centro de su tesela y el radio al siguiente escalón, así que dos
+  búsquedas cercanas comparten entrada. Nivel en memoria (LRU) y nivel
+  opcional en disco (un JSON por entrada)
+- Peticiones idénticas simultáneas se agrupan en una sola llamada a la API
+- Métricas: places_requests_total{type,result} (hit, miss, coalesced,
+  error) y el histograma places_request_latency_ms{type}
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+
+from app.core.config import settings
+from app.utils.metrics_core import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+NEARBY_SEARCH_URL = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+PLACES_TIMEOUT = 10.0  # segundos
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+# Ancho aproximado (km) de una celda geohash por precisión
+_GEOHASH_CELL_WIDTH_KM = {4: 39.1, 5: 4.89, 6: 1.22, 7: 0.153, 8: 0.038}
+# Escalones de radio (m): el radio pedido se redondea hacia arriba
+RADIUS_BUCKETS_M = (250, 500, 1000, 2000, 5000, 10000, 20000, 50000)
+
+_requests_total = metrics_registry.counter(
+    "places_requests_total",
+    "Búsquedas de Google Places por tipo y resultado (hit, miss, coalesced, error)",
+    ("type", "result")
+)
+_latency = metrics_registry.histogram(
+    "places_request_latency_ms",
+    "Latencia de las llamadas a Google Places Nearby Search (ms) por tipo",
+    ("type",)
+)
+
+Location = Tuple[float, float]
+CacheKey = Tuple[str, int, str]
+
+
+def geohash_encode(lat: float, lng: float, precision: int) -> str:
+    """Geohash de `precision` caracteres"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, value, even = 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        mid = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= mid:
+            value |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def geohash_center(geohash: str) -> Location:
+    """Centro (lat, lng) de la celda de un geohash"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = _GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            interval = lng_range if even else lat_range
+            mid = (interval[0] + interval[1]) / 2
+            if (value >> shift) & 1:
+                interval[0] = mid
+            else:
+                interval[1] = mid
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lng_range[0] + lng_range[1]) / 2
+
+
+def radius_bucket(radius_m: float) -> int:
+    """Siguiente escalón de radio (el máximo de la API es 50 km)"""
+    for bucket in RADIUS_BUCKETS_M:
+        if radius_m <= bucket:
+            return bucket
+    return RADIUS_BUCKETS_M[-1]
+
+
+def tile_precision(radius_m: int) -> int:
+    """
+    Precisión geohash cuya celda no supera el radio: ajustar la ubicación al
+    centro de la tesela la desplaza como mucho ~medio radio
+    """
+    for precision in sorted(_GEOHASH_CELL_WIDTH_KM):
+        if _GEOHASH_CELL_WIDTH_KM[precision] * 1000 <= radius_m:
+            return precision
+    return max(_GEOHASH_CELL_WIDTH_KM)
+
+
+def cache_key(location: Location, radius_m: float, place_type: str) -> CacheKey:
+    bucket = radius_bucket(radius_m)
+    return geohash_encode(location[0], location[1], tile_precision(bucket)), bucket, place_type
+
+
+class PlacesCache:
+    """
+    Caché de dos niveles (memoria LRU + disco) con TTL para resultados de
+    Nearby Search. Las entradas caducadas se descartan al leer.
+    """
+
+    def __init__(self, ttl: float = 86400, max_entries: int = 5000, cache_dir: Optional[str] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        # clave -> (caduca en time.time(), resultados)
+        self._memory: "OrderedDict[CacheKey, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"[PlacesCache] Nivel en disco deshabilitado: {e}")
+                self.cache_dir = None
+
+    @classmethod
+    def from_settings(cls) -> "PlacesCache":
+        return cls(
+            ttl=settings.PLACES_CACHE_TTL,
+            max_entries=settings.PLACES_CACHE_MAX_ENTRIES,
+            cache_dir=settings.PLACES_CACHE_DIR or None
+        )
+
+    def get(self, key: CacheKey) -> Optional[List[Dict[str, Any]]]:
+        """Resultados cacheados y vigentes (memoria primero, luego disco)"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None or entry[0] <= now:
+                self._memory.pop(key, None)
+                self.misses += 1
+                return None
+            self._remember(key, entry)
+            self.hits += 1
+        return entry[1]
+
+    def set(self, key: CacheKey, results: List[Dict[str, Any]]) -> None:
+        entry = (time.time() + self.ttl, results)
+        with self._lock:
+            self._remember(key, entry)
+        self._write_disk(key, entry)
+
+    def clear(self) -> None:
+        """Vaciar el nivel en memoria"""
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_enabled": self.cache_dir is not None,
+            }
+
+    def _remember(self, key: CacheKey, entry: Tuple[float, List[Dict[str, Any]]]) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_path(self, key: CacheKey) -> str:
+        tile, bucket, place_type = key
+        return os.path.join(self.cache_dir, f"{tile}-{bucket}-{place_type}.json")
+
+    def _read_disk(self, key: CacheKey) -> Optional[Tuple[float, List[Dict[str, Any]]]]:
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                payload = json.load(fh)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"[PlacesCache] Entrada en disco ilegible {path}: {e}")
+            return None
+        return payload.get("expires_at", 0), payload.get("results", [])
+
+    def _write_disk(self, key: CacheKey, entry: Tuple[float, List[Dict[str, Any]]]) -> None:
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as fh:
+                json.dump({"expires_at": entry[0], "results": entry[1]}, fh)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"[PlacesCache] No se pudo escribir en disco: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+class GooglePlacesClient:
+    """Nearby Search sobre un cliente HTTP compartido, con caché y agrupación"""
+
+    def __init__(
+        self,
+        api_key: str,
+        cache: Optional[PlacesCache] = None,
+        max_connections: int = 10,
+        language: str = "es",
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        """
+        Args:
+            api_key: API key de Google Maps
+            cache: Caché de resultados (por defecto según la configuración)
+            max_connections: Conexiones simultáneas con la API
+            language: Idioma de los resultados
+            transport: Transporte httpx alternativo (tests)
+        """
+        self.api_key = api_key
+        self.cache = cache or PlacesCache.from_settings()
+        self.max_connections = max_connections
+        self.language = language
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._inflight: Dict[CacheKey, asyncio.Task] = {}
+
+    def _http_client(self) -> httpx.AsyncClient:
+        """Cliente HTTP compartido (se crea al primer uso, dentro del event loop)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=PLACES_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                transport=self._transport
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        """Cerrar el cliente HTTP compartido"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _fetch(self, key: CacheKey) -> List[Dict[str, Any]]:
+        tile, radius_m, place_type = key
+        lat, lng = geohash_center(tile)
+        started = time.monotonic()
+        try:
+            response = await self._http_client().get(NEARBY_SEARCH_URL, params={
+                "location": f"{lat},{lng}",
+                "radius": radius_m,
+                "type": place_type,
+                "key": self.api_key,
+                "language": self.language
+            })
+            response.raise_for_status()
+            data = response.json()
+        finally:
+            _latency.observe(place_type, value=(time.monotonic() - started) * 1000)
+
+        status = data.get("status", "OK")
+        if status not in ("OK", "ZERO_RESULTS"):
+            # OVER_QUERY_LIMIT, REQUEST_DENIED...: no se cachea
+            raise RuntimeError(f"Google Places respondió {status}: {data.get('error_message', '')}")
+        results = data.get("results", [])
+        self.cache.set(key, results)
+        return results
+
+    async def nearby(self, location: Location, radius_m: float, place_type: str) -> List[Dict[str, Any]]:
+        """
+        Lugares de un tipo alrededor de `location` (lat, lng).
+
+        Raises:
+            httpx.HTTPError o RuntimeError si la API falla
+        """
+        key = cache_key(location, radius_m, place_type)
+        results = self.cache.get(key)
+        if results is not None:
+            _requests_total.inc(place_type, "hit")
+            return results
+
+        task = self._inflight.get(key)
+        if task is not None:
+            _requests_total.inc(place_type, "coalesced")
+        else:
+            _requests_total.inc(place_type, "miss")
+            task = asyncio.get_running_loop().create_task(self._fetch(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        try:
+            # shield: cancelar a un llamador no cancela la petición de los demás
+            return await asyncio.shield(task)
+        except Exception:
+            _requests_total.inc(place_type, "error")
+            raise
+
+    async def nearby_many(
+        self,
+        location: Location,
+        radius_m: float,
+        place_types: Iterable[str]
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Varios tipos a la vez. Un tipo que falla se registra y queda vacío.
+
+        Returns:
+            {tipo: resultados}
+        """
+        place_types = list(place_types)
+        responses = await asyncio.gather(
+            *(self.nearby(location, radius_m, place_type) for place_type in place_types),
+            return_exceptions=True
+        )
+        results: Dict[str, List[Dict[str, Any]]] = {}
+        for place_type, response in zip(place_types, responses):
+            if isinstance(response, BaseException):
+                logger.warning(f"Error buscando lugares de tipo {place_type}: {response}")
+                response = []
+            results[place_type] = response
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado de la caché, peticiones en curso y latencia por tipo"""
+        return {
+            "cache": self.cache.stats(),
+            "inflight": len(self._inflight),
+            "latency_ms": {labels[0]: summary for labels, summary in _latency.summary().items()},
+        }
+
+
+_clients: Dict[str, GooglePlacesClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_places_client(api_key: Optional[str] = None) -> GooglePlacesClient:
+    """Cliente compartido por API key (un pool de conexiones y una caché por proceso)"""
+    api_key = api_key or settings.GOOGLE_MAPS_API_KEY
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = _clients[api_key] = GooglePlacesClient(
+                api_key,
+                max_connections=settings.PLACES_MAX_CONNECTIONS
+            )
+        return client
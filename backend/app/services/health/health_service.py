@@ -6,11 +6,22 @@ Comprehensive health monitoring for all system components:
 - External APIs (PayPal, Stripe, reCAPTCHA)
 - Firebase services
 - System resources
+
+Each dependency is probed by a background task on its own schedule and every
+probe is read-only. `check_all` builds its answer from the latest probe
+results, so health endpoints hit by load balancers cost no Firestore or
+external calls. Stale results (background probing not running) are refreshed
+with single-flight: concurrent callers share one in-flight probe per
+dependency. The last HEALTH_HISTORY_SIZE results per dependency are kept in a
+ring buffer that exposes latency percentiles.
 """
 
 import asyncio
+import math
+import random
 import time
-from typing import Dict, Any, Optional
+from collections import deque
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Tuple
 from datetime import datetime
 import logging
 import httpx
@@ -23,9 +34,17 @@ except ImportError:
     FIREBASE_AVAILABLE = False
 
 from app.core.config import settings
+from app.services.firestore.repository import get_async_client
+from app.utils.metrics_core import metrics_registry
 
 logger = logging.getLogger(__name__)
 
+_probes_total = metrics_registry.counter(
+    "health_probes_total",
+    "Health probes run per dependency and resulting status",
+    ("dependency", "status")
+)
+
 
 class HealthStatus:
     """Health status constants"""
@@ -35,6 +54,57 @@ class HealthStatus:
     UNKNOWN = "unknown"
 
 
+class Probe(NamedTuple):
+    """A dependency check (HealthCheckService method name) and how often it runs"""
+    check: str
+    interval: float
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    rank = math.ceil(percent / 100 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+class ProbeHistory:
+    """Ring buffer of the most recent probe results of one dependency"""
+
+    def __init__(self, size: int = 120):
+        self._samples: Deque[Tuple[float, str, float]] = deque(maxlen=size)
+
+    def record(self, status: str, latency_ms: float) -> None:
+        self._samples.append((time.time(), status, latency_ms))
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Latency percentiles and availability over the buffered samples
+
+        Returns:
+            samples, p50_ms, p95_ms, p99_ms, max_ms, healthy_ratio, statuses
+        """
+        if not self._samples:
+            return {"samples": 0}
+
+        latencies = sorted(latency for _, _, latency in self._samples)
+        statuses: Dict[str, int] = {}
+        for _, status, _ in self._samples:
+            statuses[status] = statuses.get(status, 0) + 1
+
+        return {
+            "samples": len(self._samples),
+            "p50_ms": _percentile(latencies, 50),
+            "p95_ms": _percentile(latencies, 95),
+            "p99_ms": _percentile(latencies, 99),
+            "max_ms": latencies[-1],
+            "healthy_ratio": round(statuses.get(HealthStatus.HEALTHY, 0) / len(self._samples), 4),
+            "statuses": statuses,
+            "since": datetime.utcfromtimestamp(self._samples[0][0]).isoformat()
+        }
+
+
 class HealthCheckService:
     """
     Comprehensive health check service
@@ -47,63 +117,144 @@ class HealthCheckService:
     - System resources
     """
 
-    def __init__(self):
-        """Initialize health check service"""
-        self.timeout = 5  # seconds
-        self.cache_ttl = 30  # Cache health results for 30 seconds
-        self._last_check: Optional[Dict[str, Any]] = None
-        self._last_check_time: Optional[float] = None
+    def __init__(
+        self,
+        probe_interval: Optional[float] = None,
+        external_probe_interval: Optional[float] = None,
+        history_size: Optional[int] = None
+    ):
+        """
+        Initialize health check service
+
+        Args:
+            probe_interval: Seconds between Firestore/Auth probes
+            external_probe_interval: Seconds between PayPal/reCAPTCHA probes
+            history_size: Probe results kept per dependency
+        """
+        self.timeout = settings.HEALTH_PROBE_TIMEOUT  # seconds
+        self.cache_ttl = 30  # Results younger than this are served without probing
+        probe_interval = probe_interval or settings.HEALTH_PROBE_INTERVAL
+        external_probe_interval = external_probe_interval or settings.HEALTH_EXTERNAL_PROBE_INTERVAL
+
+        self.probes: Dict[str, Probe] = {
+            "firestore": Probe("check_firestore", probe_interval),
+            "firebase_auth": Probe("check_firebase_auth", probe_interval),
+            "paypal": Probe("check_paypal", external_probe_interval),
+            "recaptcha": Probe("check_recaptcha", external_probe_interval),
+        }
+        self.history: Dict[str, ProbeHistory] = {
+            name: ProbeHistory(history_size or settings.HEALTH_HISTORY_SIZE) for name in self.probes
+        }
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._result_times: Dict[str, float] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._client: Optional[httpx.AsyncClient] = None
+
+    # ------------------------------------------------------------------
+    # Background probing
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        """Start one probe loop per dependency (call from the event loop)"""
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._probe_loop(name)) for name in self.probes]
+        logger.info(f"Health probes started: {', '.join(self.probes)}")
+
+    async def stop(self) -> None:
+        """Stop the probe loops and close the shared HTTP client"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _probe_loop(self, name: str) -> None:
+        interval = self.probes[name].interval
+        # Spread the first probes so dependencies are not all hit at once
+        await asyncio.sleep(random.uniform(0, min(interval, 5)))
+        while True:
+            try:
+                await self.refresh(name)
+            except Exception as e:
+                logger.error(f"Health probe loop error for {name}: {e}")
+            await asyncio.sleep(interval)
+
+    def refresh(self, name: str) -> "asyncio.Future[Dict[str, Any]]":
+        """
+        Probe one dependency now (single-flight)
+
+        Concurrent callers share the probe already in flight for `name`.
+        """
+        task = self._inflight.get(name)
+        if task is None or task.done():
+            task = asyncio.ensure_future(self._run_probe(name))
+            self._inflight[name] = task
+        # A cancelled caller must not cancel the probe other callers wait on
+        return asyncio.shield(task)
+
+    async def _run_probe(self, name: str) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            check = getattr(self, self.probes[name].check)
+            result = await asyncio.wait_for(check(), timeout=self.timeout * 2)
+        except asyncio.TimeoutError:
+            result = {
+                "status": HealthStatus.UNHEALTHY,
+                "message": "Health check timed out",
+                "timestamp": datetime.utcnow().isoformat()
+            }
+        except Exception as e:
+            logger.error(f"Health check failed for {name}: {e}")
+            result = {
+                "status": HealthStatus.UNHEALTHY,
+                "error": str(e),
+                "timestamp": datetime.utcnow().isoformat()
+            }
+        latency = round((time.perf_counter() - start) * 1000, 2)
+
+        self.history[name].record(result["status"], latency)
+        _probes_total.inc(name, result["status"])
+        self._results[name] = result
+        self._result_times[name] = time.monotonic()
+        return result
+
+    def _is_fresh(self, name: str) -> bool:
+        checked = self._result_times.get(name)
+        if checked is None:
+            return False
+        max_age = max(self.cache_ttl, self.probes[name].interval * 2)
+        return time.monotonic() - checked < max_age
+
+    # ------------------------------------------------------------------
+    # Snapshot
+    # ------------------------------------------------------------------
 
     async def check_all(self, use_cache: bool = True) -> Dict[str, Any]:
         """
-        Run all health checks
+        Latest health of all components
 
         Args:
-            use_cache: Use cached results if available
+            use_cache: Serve the latest probe results (only stale or missing
+                results are probed); False probes every dependency now
 
         Returns:
             Dict with health status for all components
         """
-        # Return cached results if recent enough
-        if use_cache and self._last_check and self._last_check_time:
-            age = time.time() - self._last_check_time
-            if age < self.cache_ttl:
-                return self._last_check
-
         start_time = time.time()
 
-        # Run all checks concurrently
-        firestore_check, auth_check, paypal_check, recaptcha_check = await asyncio.gather(
-            self.check_firestore(),
-            self.check_firebase_auth(),
-            self.check_paypal(),
-            self.check_recaptcha(),
-            return_exceptions=True
-        )
-
-        # Process results (handle exceptions)
-        def process_result(result, name):
-            if isinstance(result, Exception):
-                logger.error(f"Health check failed for {name}: {result}")
-                return {
-                    "status": HealthStatus.UNHEALTHY,
-                    "error": str(result),
-                    "timestamp": datetime.utcnow().isoformat()
-                }
-            return result
+        stale = [name for name in self.probes if not use_cache or not self._is_fresh(name)]
+        if stale:
+            await asyncio.gather(*[self.refresh(name) for name in stale])
 
-        firestore_result = process_result(firestore_check, "Firestore")
-        auth_result = process_result(auth_check, "Firebase Auth")
-        paypal_result = process_result(paypal_check, "PayPal")
-        recaptcha_result = process_result(recaptcha_check, "reCAPTCHA")
+        checks = {name: self._results[name] for name in self.probes}
 
         # Determine overall status
-        statuses = [
-            firestore_result["status"],
-            auth_result["status"],
-            paypal_result["status"],
-            recaptcha_result["status"]
-        ]
+        statuses = [check["status"] for check in checks.values()]
 
         if all(s == HealthStatus.HEALTHY for s in statuses):
             overall_status = HealthStatus.HEALTHY
@@ -114,30 +265,57 @@ class HealthCheckService:
 
         elapsed = round((time.time() - start_time) * 1000, 2)
 
-        result = {
+        return {
             "status": overall_status,
             "timestamp": datetime.utcnow().isoformat(),
             "version": settings.API_VERSION,
             "environment": settings.ENVIRONMENT,
-            "checks": {
-                "firestore": firestore_result,
-                "firebase_auth": auth_result,
-                "paypal": paypal_result,
-                "recaptcha": recaptcha_result
-            },
+            "checks": checks,
+            "latency": self.latency_stats(),
             "elapsed_ms": elapsed
         }
 
-        # Cache the result
-        self._last_check = result
-        self._last_check_time = time.time()
+    @staticmethod
+    def public_view(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Subset of a check_all snapshot safe for unauthenticated callers
 
-        return result
+        Only statuses and response times: error text, messages and the
+        latency history stay in the logs and the authenticated view.
+        """
+        checks = {}
+        for name, check in snapshot["checks"].items():
+            checks[name] = {"status": check["status"]}
+            if "response_time_ms" in check:
+                checks[name]["response_time_ms"] = check["response_time_ms"]
+        return {
+            "status": snapshot["status"],
+            "timestamp": snapshot["timestamp"],
+            "checks": checks,
+            "elapsed_ms": snapshot["elapsed_ms"]
+        }
+
+    def latency_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Latency percentiles and availability per dependency"""
+        return {name: history.stats() for name, history in self.history.items()}
+
+    # ------------------------------------------------------------------
+    # Dependency checks (read-only)
+    # ------------------------------------------------------------------
+
+    def _http_client(self) -> httpx.AsyncClient:
+        """HTTP client shared by the external probes (keeps connections alive)"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        return self._client
 
     async def check_firestore(self) -> Dict[str, Any]:
         """
         Check Firestore database connectivity
 
+        A single document read on the shared async client: no writes, and a
+        missing document still proves the round trip.
+
         Returns:
             Health check result for Firestore
         """
@@ -151,34 +329,17 @@ class HealthCheckService:
         try:
             start = time.time()
 
-            # Try to read a document (test connection)
-            db = firestore.client()
-
-            # Use a test collection
-            test_ref = db.collection('_health_check').document('test')
-
-            # Try to set and get
-            test_ref.set({'timestamp': datetime.utcnow(), 'test': True})
-            doc = test_ref.get()
-
-            # Clean up
-            test_ref.delete()
+            db = get_async_client()
+            await db.collection('_health_check').document('probe').get()
 
             elapsed = round((time.time() - start) * 1000, 2)
 
-            if doc.exists:
-                return {
-                    "status": HealthStatus.HEALTHY,
-                    "message": "Firestore connection successful",
-                    "response_time_ms": elapsed,
-                    "timestamp": datetime.utcnow().isoformat()
-                }
-            else:
-                return {
-                    "status": HealthStatus.UNHEALTHY,
-                    "message": "Could not verify Firestore write",
-                    "timestamp": datetime.utcnow().isoformat()
-                }
+            return {
+                "status": HealthStatus.HEALTHY,
+                "message": "Firestore connection successful",
+                "response_time_ms": elapsed,
+                "timestamp": datetime.utcnow().isoformat()
+            }
 
         except Exception as e:
             logger.error(f"Firestore health check failed: {e}")
@@ -207,8 +368,8 @@ class HealthCheckService:
             start = time.time()
 
             # Try to list users (test connection)
-            # Only fetch 1 user to minimize impact
-            users_page = auth.list_users(max_results=1)
+            # Only fetch 1 user to minimize impact; blocking call, off the event loop
+            await asyncio.to_thread(auth.list_users, max_results=1)
 
             elapsed = round((time.time() - start) * 1000, 2)
 
@@ -250,29 +411,28 @@ class HealthCheckService:
             mode = getattr(settings, 'PAYPAL_MODE', 'sandbox')
             base_url = "https://api-m.paypal.com" if mode == "live" else "https://api-m.sandbox.paypal.com"
 
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                # Just check if the endpoint is reachable (don't authenticate)
-                response = await client.get(f"{base_url}/v1/oauth2/token")
-
-                # We expect 401 (unauthorized), which means the endpoint is reachable
-                # 200 would mean success, 401 means endpoint works but auth needed
-                elapsed = round((time.time() - start) * 1000, 2)
-
-                if response.status_code in [200, 401]:
-                    return {
-                        "status": HealthStatus.HEALTHY,
-                        "message": "PayPal API reachable",
-                        "mode": mode,
-                        "response_time_ms": elapsed,
-                        "timestamp": datetime.utcnow().isoformat()
-                    }
-                else:
-                    return {
-                        "status": HealthStatus.DEGRADED,
-                        "message": f"PayPal API returned unexpected status: {response.status_code}",
-                        "mode": mode,
-                        "timestamp": datetime.utcnow().isoformat()
-                    }
+            # Just check if the endpoint is reachable (don't authenticate)
+            response = await self._http_client().get(f"{base_url}/v1/oauth2/token")
+
+            # We expect 401 (unauthorized), which means the endpoint is reachable
+            # 200 would mean success, 401 means endpoint works but auth needed
+            elapsed = round((time.time() - start) * 1000, 2)
+
+            if response.status_code in [200, 401]:
+                return {
+                    "status": HealthStatus.HEALTHY,
+                    "message": "PayPal API reachable",
+                    "mode": mode,
+                    "response_time_ms": elapsed,
+                    "timestamp": datetime.utcnow().isoformat()
+                }
+            else:
+                return {
+                    "status": HealthStatus.DEGRADED,
+                    "message": f"PayPal API returned unexpected status: {response.status_code}",
+                    "mode": mode,
+                    "timestamp": datetime.utcnow().isoformat()
+                }
 
         except httpx.TimeoutException:
             return {
@@ -307,30 +467,28 @@ class HealthCheckService:
         try:
             start = time.time()
 
-            # Try to reach reCAPTCHA API
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                # Just check if endpoint is reachable
-                response = await client.post(
-                    "https://www.google.com/recaptcha/api/siteverify",
-                    data={"secret": "test", "response": "test"}
-                )
-
-                elapsed = round((time.time() - start) * 1000, 2)
-
-                # Any response (even error) means the endpoint is reachable
-                if response.status_code == 200:
-                    return {
-                        "status": HealthStatus.HEALTHY,
-                        "message": "reCAPTCHA API reachable",
-                        "response_time_ms": elapsed,
-                        "timestamp": datetime.utcnow().isoformat()
-                    }
-                else:
-                    return {
-                        "status": HealthStatus.DEGRADED,
-                        "message": f"reCAPTCHA API returned unexpected status: {response.status_code}",
-                        "timestamp": datetime.utcnow().isoformat()
-                    }
+            # Just check if endpoint is reachable
+            response = await self._http_client().post(
+                "https://www.google.com/recaptcha/api/siteverify",
+                data={"secret": "test", "response": "test"}
+            )
+
+            elapsed = round((time.time() - start) * 1000, 2)
+
+            # Any response (even error) means the endpoint is reachable
+            if response.status_code == 200:
+                return {
+                    "status": HealthStatus.HEALTHY,
+                    "message": "reCAPTCHA API reachable",
+                    "response_time_ms": elapsed,
+                    "timestamp": datetime.utcnow().isoformat()
+                }
+            else:
+                return {
+                    "status": HealthStatus.DEGRADED,
+                    "message": f"reCAPTCHA API returned unexpected status: {response.status_code}",
+                    "timestamp": datetime.utcnow().isoformat()
+                }
 
         except httpx.TimeoutException:
             return {
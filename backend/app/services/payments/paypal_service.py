@@ -2,102 +2,288 @@
 Servicio de integración con PayPal para TuCitaSegura.
 Maneja la creación de órdenes de pago, verificación y webhooks.
 SECURITY: HTTP timeouts y validación de expiración de tokens
+
+Rendimiento:
+- Un único httpx.AsyncClient compartido (keep-alive, límites de conexiones,
+  HTTP/2 si el paquete h2 está instalado): sin handshake TLS por llamada
+- Token OAuth con refresco single-flight bajo un asyncio.Lock y renovación
+  anticipada en segundo plano antes de que caduque
+- Reintentos con backoff exponencial y jitter para errores transitorios; las
+  órdenes y capturas se reintentan con el mismo PayPal-Request-Id, así que
+  PayPal las trata como idempotentes
+- Métricas por endpoint: paypal_requests_total y el histograma
+  paypal_request_latency_ms
 """
 import os
 import json
+import asyncio
 import logging
+import random
+import time
+import uuid
 from typing import Dict, Optional, Any
-from datetime import datetime, timedelta
+from datetime import datetime
 import httpx
-from app.core.config import get_settings
+from app.core.config import settings
+from app.utils.metrics_core import metrics_registry
+
+try:
+    import h2  # noqa: F401  (httpx solo negocia HTTP/2 si está instalado)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
 # HTTP timeout configuration (in seconds)
 PAYPAL_TIMEOUT = 15.0  # 15 seconds for PayPal API calls
 
+# Pool de conexiones compartido
+PAYPAL_MAX_CONNECTIONS = 20
+PAYPAL_MAX_KEEPALIVE = 10
+
+# Reintentos (errores de red, 429 y 5xx)
+PAYPAL_MAX_RETRIES = 3
+PAYPAL_BACKOFF_BASE = 0.25  # segundos
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Renovación del token: obligatoria a 5 min de caducar, en segundo plano a 15 min
+TOKEN_REFRESH_MARGIN = 300
+TOKEN_PREFETCH_MARGIN = 900
+
+_requests_total = metrics_registry.counter(
+    "paypal_requests_total",
+    "Llamadas a la API de PayPal por endpoint y resultado",
+    ("endpoint", "outcome")
+)
+_latency = metrics_registry.histogram(
+    "paypal_request_latency_ms",
+    "Latencia de las llamadas a la API de PayPal (ms) por endpoint",
+    ("endpoint",)
+)
+_token_refresh_total = metrics_registry.counter(
+    "paypal_token_refresh_total",
+    "Renovaciones del token OAuth de PayPal por resultado",
+    ("result",)
+)
+
+
 class PayPalService:
     """Servicio para interactuar con la API de PayPal."""
 
-    def __init__(self):
-        self.settings = get_settings()
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        """
+        Args:
+            transport: Transporte httpx alternativo (tests)
+        """
+        self.settings = settings
         self.client_id = os.getenv("PAYPAL_CLIENT_ID")
         self.client_secret = os.getenv("PAYPAL_CLIENT_SECRET")
         self.mode = os.getenv("PAYPAL_MODE", "sandbox")
         self.base_url = self._get_base_url()
         self.access_token = None
         self.token_obtained_at = None
-    
+        self._token_expires_at = 0.0  # time.monotonic()
+        self._token_lock = asyncio.Lock()
+        self._prefetch_task: Optional[asyncio.Task] = None
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+
     def _get_base_url(self) -> str:
         """Obtiene la URL base de la API de PayPal según el modo."""
         if self.mode == "live":
             return "https://api.paypal.com"
         return "https://api.sandbox.paypal.com"
-    
+
+    def _http_client(self) -> httpx.AsyncClient:
+        """Cliente HTTP compartido (se crea al primer uso, dentro del event loop)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=PAYPAL_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=PAYPAL_MAX_CONNECTIONS,
+                    max_keepalive_connections=PAYPAL_MAX_KEEPALIVE
+                ),
+                http2=HTTP2_AVAILABLE and self._transport is None,
+                transport=self._transport
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        """Cerrar el cliente HTTP compartido (shutdown de la aplicación)"""
+        if self._prefetch_task is not None:
+            self._prefetch_task.cancel()
+            self._prefetch_task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # ------------------------------------------------------------------
+    # Token OAuth
+    # ------------------------------------------------------------------
+
+    def _token_remaining(self) -> float:
+        """Segundos de validez que le quedan al token actual"""
+        if not self.access_token:
+            return 0.0
+        return self._token_expires_at - time.monotonic()
+
     def _is_token_expired(self) -> bool:
         """Verifica si el token de acceso ha expirado."""
-        if not self.token_obtained_at or not self.access_token:
-            return True
-
         # Renovar token 5 minutos antes de expiración (margen de seguridad)
-        expiry_time = self.token_obtained_at + timedelta(hours=8) - timedelta(minutes=5)
-        return datetime.now() >= expiry_time
+        return self._token_remaining() <= TOKEN_REFRESH_MARGIN
 
     async def get_access_token(self) -> str:
         """Obtiene un token de acceso de la API de PayPal con verificación de expiración."""
-        # Verificar si el token sigue siendo válido
-        if self.access_token and not self._is_token_expired():
+        remaining = self._token_remaining()
+        if remaining > TOKEN_REFRESH_MARGIN:
+            if remaining <= TOKEN_PREFETCH_MARGIN:
+                self._schedule_prefetch()
             return self.access_token
 
-        auth = httpx.BasicAuth(self.client_id, self.client_secret)
-        data = {"grant_type": "client_credentials"}
+        return await self._refresh_token(TOKEN_REFRESH_MARGIN)
+
+    def _schedule_prefetch(self) -> None:
+        """Renovar el token en segundo plano mientras el actual sigue siendo válido"""
+        if self._prefetch_task is None or self._prefetch_task.done():
+            self._prefetch_task = asyncio.ensure_future(self._prefetch())
 
+    async def _prefetch(self) -> None:
         try:
-            async with httpx.AsyncClient(timeout=PAYPAL_TIMEOUT) as client:
-                response = await client.post(
-                    f"{self.base_url}/v1/oauth2/token",
-                    auth=auth,
-                    data=data,
+            await self._refresh_token(TOKEN_PREFETCH_MARGIN)
+        except Exception as e:
+            # El token actual sigue valiendo; se reintentará en la próxima llamada
+            logger.warning(f"Renovación anticipada del token de PayPal fallida: {e}")
+
+    async def _refresh_token(self, min_remaining: float) -> str:
+        """
+        Pedir un token nuevo (single-flight): las peticiones concurrentes
+        esperan al refresco en curso en lugar de pedir cada una el suyo.
+        """
+        async with self._token_lock:
+            # Otra corrutina pudo renovarlo mientras esperábamos el lock
+            if self._token_remaining() > min_remaining:
+                _token_refresh_total.inc("coalesced")
+                return self.access_token
+
+            try:
+                response = await self._send(
+                    "oauth2_token",
+                    "POST",
+                    "/v1/oauth2/token",
+                    auth=httpx.BasicAuth(self.client_id, self.client_secret),
+                    data={"grant_type": "client_credentials"},
                     headers={"Content-Type": "application/x-www-form-urlencoded"}
                 )
-                response.raise_for_status()
+            except httpx.TimeoutException as e:
+                _token_refresh_total.inc("error")
+                logger.error(f"Timeout obteniendo token de PayPal: {e}")
+                raise Exception("PayPal no responde (timeout)")
+            except httpx.HTTPError as e:
+                _token_refresh_total.inc("error")
+                logger.error(f"Error obteniendo token de PayPal: {e}")
+                raise Exception("No se pudo conectar con PayPal")
 
-                token_data = response.json()
-                self.access_token = token_data["access_token"]
-                self.token_obtained_at = datetime.now()
+            token_data = response.json()
+            expires_in = int(token_data.get("expires_in", 28800))
+            self.access_token = token_data["access_token"]
+            self.token_obtained_at = datetime.now()
+            self._token_expires_at = time.monotonic() + expires_in
+            _token_refresh_total.inc("refreshed")
 
-                logger.info(f"PayPal access token obtained, expires in {token_data.get('expires_in', 28800)}s")
+            logger.info(f"PayPal access token obtained, expires in {expires_in}s")
 
-                return self.access_token
+            return self.access_token
+
+    # ------------------------------------------------------------------
+    # Peticiones
+    # ------------------------------------------------------------------
+
+    async def _send(self, endpoint: str, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """
+        Petición con reintentos (backoff exponencial con jitter completo) para
+        errores de red, timeouts, 429 y 5xx. Lanza httpx.HTTPError si falla.
+        """
+        client = self._http_client()
+        for attempt in range(PAYPAL_MAX_RETRIES + 1):
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                _latency.observe(endpoint, value=(time.perf_counter() - start) * 1000)
+                outcome = "timeout" if isinstance(e, httpx.TimeoutException) else "network_error"
+                _requests_total.inc(endpoint, outcome)
+                if attempt == PAYPAL_MAX_RETRIES:
+                    raise
+            else:
+                _latency.observe(endpoint, value=(time.perf_counter() - start) * 1000)
+                _requests_total.inc(endpoint, str(response.status_code))
+                if response.status_code not in RETRYABLE_STATUS or attempt == PAYPAL_MAX_RETRIES:
+                    response.raise_for_status()
+                    return response
+
+            delay = random.uniform(0, PAYPAL_BACKOFF_BASE * 2 ** attempt)
+            logger.warning(f"Reintentando {endpoint} en PayPal ({attempt + 1}/{PAYPAL_MAX_RETRIES}) en {delay:.2f}s")
+            await asyncio.sleep(delay)
+        raise RuntimeError("unreachable")
+
+    async def _api_request(
+        self,
+        endpoint: str,
+        method: str,
+        url: str,
+        request_id: Optional[str] = None,
+        **kwargs: Any
+    ) -> httpx.Response:
+        """
+        Llamada autenticada. Con request_id se envía PayPal-Request-Id, que
+        hace idempotentes los reintentos de POST (misma orden/captura).
+        Si PayPal rechaza el token (401) se renueva una vez y se repite.
+        """
+        headers = {"Content-Type": "application/json", **kwargs.pop("headers", {})}
+        if request_id:
+            headers["PayPal-Request-Id"] = request_id
+
+        for attempt in range(2):
+            access_token = await self.get_access_token()
+            try:
+                return await self._send(
+                    endpoint, method, url,
+                    headers={**headers, "Authorization": f"Bearer {access_token}"},
+                    **kwargs
+                )
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code != 401 or attempt == 1:
+                    raise
+                # Token revocado o caducado antes de tiempo: forzar renovación
+                if self.access_token == access_token:
+                    self._token_expires_at = 0.0
+        raise RuntimeError("unreachable")
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Latencia (count, mean, p50/p95/p99 en ms) por endpoint"""
+        return {labels[0]: summary for labels, summary in _latency.summary().items()}
 
-        except httpx.TimeoutException as e:
-            logger.error(f"Timeout obteniendo token de PayPal: {e}")
-            raise Exception("PayPal no responde (timeout)")
-        except httpx.HTTPError as e:
-            logger.error(f"Error obteniendo token de PayPal: {e}")
-            raise Exception("No se pudo conectar con PayPal")
-    
     async def create_order(
-        self, 
-        amount: float, 
+        self,
+        amount: float,
         currency: str = "EUR",
         description: str = "Suscripción TuCitaSegura",
         custom_id: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Crea una orden de pago en PayPal.
-        
+
         Args:
             amount: Monto del pago
             currency: Moneda (EUR por defecto)
             description: Descripción del pago
             custom_id: ID personalizado para tracking
-            
+
         Returns:
             Dict con la información de la orden creada
         """
-        access_token = await self.get_access_token()
-        
         order_data = {
             "intent": "CAPTURE",
             "purchase_units": [{
@@ -111,28 +297,24 @@ class PayPalService:
                 "brand_name": "TuCitaSegura",
                 "landing_page": "LOGIN",
                 "user_action": "PAY_NOW",
-                "return_url": f"{self.settings.frontend_url}/payment/success",
-                "cancel_url": f"{self.settings.frontend_url}/payment/cancel"
+                "return_url": f"{self.settings.FRONTEND_URL}/payment/success",
+                "cancel_url": f"{self.settings.FRONTEND_URL}/payment/cancel"
             }
         }
-        
+
         if custom_id:
             order_data["purchase_units"][0]["custom_id"] = custom_id
-        
-        try:
-            async with httpx.AsyncClient(timeout=PAYPAL_TIMEOUT) as client:
-                response = await client.post(
-                    f"{self.base_url}/v2/checkout/orders",
-                    json=order_data,
-                    headers={
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {access_token}",
-                        "Prefer": "return=representation"
-                    }
-                )
-                response.raise_for_status()
 
-                return response.json()
+        try:
+            response = await self._api_request(
+                "create_order",
+                "POST",
+                "/v2/checkout/orders",
+                request_id=str(uuid.uuid4()),
+                json=order_data,
+                headers={"Prefer": "return=representation"}
+            )
+            return response.json()
 
         except httpx.TimeoutException as e:
             logger.error(f"Timeout creando orden en PayPal: {e}")
@@ -140,32 +322,28 @@ class PayPalService:
         except httpx.HTTPError as e:
             logger.error(f"Error creando orden en PayPal: {e}")
             raise Exception("No se pudo crear la orden de pago")
-    
+
     async def capture_order(self, order_id: str) -> Dict[str, Any]:
         """
         Captura una orden de pago de PayPal.
-        
+
         Args:
             order_id: ID de la orden a capturar
-            
+
         Returns:
             Dict con el resultado de la captura
         """
-        access_token = await self.get_access_token()
-        
         try:
-            async with httpx.AsyncClient(timeout=PAYPAL_TIMEOUT) as client:
-                response = await client.post(
-                    f"{self.base_url}/v2/checkout/orders/{order_id}/capture",
-                    headers={
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {access_token}",
-                        "Prefer": "return=representation"
-                    }
-                )
-                response.raise_for_status()
-
-                return response.json()
+            response = await self._api_request(
+                "capture_order",
+                "POST",
+                f"/v2/checkout/orders/{order_id}/capture",
+                # Nuevo por llamada: solo los reintentos de esta captura lo comparten
+                # (tras un INSTRUMENT_DECLINED el comprador vuelve a intentarlo)
+                request_id=str(uuid.uuid4()),
+                headers={"Prefer": "return=representation"}
+            )
+            return response.json()
 
         except httpx.TimeoutException as e:
             logger.error(f"Timeout capturando orden en PayPal: {e}")
@@ -173,49 +351,45 @@ class PayPalService:
         except httpx.HTTPError as e:
             logger.error(f"Error capturando orden en PayPal: {e}")
             raise Exception("No se pudo capturar el pago")
-    
+
     async def verify_webhook_signature(
-        self, 
-        headers: Dict[str, str], 
+        self,
+        headers: Dict[str, str],
         body: bytes
     ) -> bool:
         """
         Verifica la firma de un webhook de PayPal.
-        
+
         Args:
             headers: Headers de la solicitud
             body: Cuerpo de la solicitud en bytes
-            
+
         Returns:
             True si la firma es válida, False otherwise
         """
-        access_token = await self.get_access_token()
         webhook_id = os.getenv("PAYPAL_WEBHOOK_ID")
-        
-        verification_data = {
-            "auth_algo": headers.get("PAYPAL-AUTH-ALGO"),
-            "cert_url": headers.get("PAYPAL-CERT-URL"),
-            "transmission_id": headers.get("PAYPAL-TRANSMISSION-ID"),
-            "transmission_sig": headers.get("PAYPAL-TRANSMISSION-SIG"),
-            "transmission_time": headers.get("PAYPAL-TRANSMISSION-TIME"),
-            "webhook_id": webhook_id,
-            "webhook_event": json.loads(body.decode("utf-8"))
-        }
-        
+
         try:
-            async with httpx.AsyncClient(timeout=PAYPAL_TIMEOUT) as client:
-                response = await client.post(
-                    f"{self.base_url}/v1/notifications/verify-webhook-signature",
-                    json=verification_data,
-                    headers={
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {access_token}"
-                    }
-                )
-                response.raise_for_status()
+            verification_data = {
+                "auth_algo": headers.get("PAYPAL-AUTH-ALGO"),
+                "cert_url": headers.get("PAYPAL-CERT-URL"),
+                "transmission_id": headers.get("PAYPAL-TRANSMISSION-ID"),
+                "transmission_sig": headers.get("PAYPAL-TRANSMISSION-SIG"),
+                "transmission_time": headers.get("PAYPAL-TRANSMISSION-TIME"),
+                "webhook_id": webhook_id,
+                "webhook_event": json.loads(body.decode("utf-8"))
+            }
+
+            # Verificación de solo lectura: se puede reintentar sin efectos
+            response = await self._api_request(
+                "verify_webhook_signature",
+                "POST",
+                "/v1/notifications/verify-webhook-signature",
+                json=verification_data
+            )
 
-                result = response.json()
-                return result.get("verification_status") == "SUCCESS"
+            result = response.json()
+            return result.get("verification_status") == "SUCCESS"
 
         except httpx.TimeoutException as e:
             logger.error(f"Timeout verificando webhook de PayPal: {e}")
@@ -223,23 +397,16 @@ class PayPalService:
         except Exception as e:
             logger.error(f"Error verificando webhook de PayPal: {e}")
             return False
-    
+
     async def get_order_details(self, order_id: str) -> Dict[str, Any]:
         """Obtiene los detalles de una orden específica."""
-        access_token = await self.get_access_token()
-        
         try:
-            async with httpx.AsyncClient(timeout=PAYPAL_TIMEOUT) as client:
-                response = await client.get(
-                    f"{self.base_url}/v2/checkout/orders/{order_id}",
-                    headers={
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {access_token}"
-                    }
-                )
-                response.raise_for_status()
-
-                return response.json()
+            response = await self._api_request(
+                "get_order_details",
+                "GET",
+                f"/v2/checkout/orders/{order_id}"
+            )
+            return response.json()
 
         except httpx.TimeoutException as e:
             logger.error(f"Timeout obteniendo detalles de orden: {e}")
@@ -249,4 +416,4 @@ class PayPalService:
             raise Exception("No se pudieron obtener los detalles de la orden")
 
 # Instancia global del servicio
-paypal_service = PayPalService()
\ No newline at end of file
+paypal_service = PayPalService()
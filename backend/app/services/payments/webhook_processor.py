@@ -0,0 +1,145 @@
+"""
+Procesamiento de los eventos de webhook de PayPal (fuera de la petición).
+
+Los workers de PayPalWebhookQueue llaman a `process_paypal_event` después de
+reclamar el evento, así que dos instancias no procesan el mismo evento a la
+vez. Cada handler lanza la excepción si algo falla para que la cola
+reintente, y un evento también se repite si la instancia que lo tenía muere
+antes de terminarlo, por lo que conviene que toleren ejecutarse de nuevo:
+- el pago completado no crea una segunda suscripción si ya existe una con
+  ese capture_id
+- actualizar los custom claims es idempotente
+- el email es el último paso y un fallo al enviarlo no provoca reintento
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict
+
+from firebase_admin import auth
+
+from app.services.email.email_service import email_service
+from app.services.firestore.subscription_service import subscription_service
+from app.services.payments.webhook_queue import PayPalWebhookQueue, WebhookHandler
+
+logger = logging.getLogger(__name__)
+
+
+async def _user_email(user_id: str) -> str:
+    user = await asyncio.to_thread(auth.get_user, user_id)
+    return user.email
+
+
+async def handle_capture_completed(event: Dict[str, Any]) -> None:
+    """PAYMENT.CAPTURE.COMPLETED: crear la suscripción, activar claims y confirmar por email"""
+    resource = event.get("resource", {})
+    capture_id = resource.get("id")
+    order_id = resource.get("supplementary_data", {}).get("related_ids", {}).get("order_id")
+    amount_data = resource.get("amount", {})
+    amount = amount_data.get("value")
+    currency = amount_data.get("currency_code", "EUR")
+    custom_id = resource.get("custom_id")  # Este es el user_id que pasamos en create_order
+
+    logger.info(f"Pago completado: {capture_id}, orden: {order_id}, monto: {amount} {currency}")
+
+    if not custom_id:
+        logger.warning(f"Webhook recibido sin custom_id (user_id). Capture: {capture_id}")
+        return
+
+    # 1. Obtener información del usuario
+    user_email = await _user_email(custom_id)
+
+    # 2. Crear la suscripción (una sola por captura aunque el evento se reprocese)
+    payment_data = {
+        "capture_id": capture_id,
+        "order_id": order_id,
+        "amount": amount,
+        "currency": currency
+    }
+    existing = await subscription_service.subscriptions.find(("payment_id", "==", capture_id), limit=1)
+    if existing:
+        subscription_data = existing[0]
+        logger.info(f"Suscripción {subscription_data['id']} ya creada para la captura {capture_id}")
+    else:
+        subscription_data = await subscription_service.create_subscription(
+            user_id=custom_id,
+            payment_data=payment_data,
+            plan_type="premium",
+            duration_months=1
+        )
+        logger.info(f"Suscripción creada para usuario {custom_id}: {subscription_data['id']}")
+
+    # 3. Actualizar custom claims en Firebase Auth
+    await subscription_service.update_custom_claims(user_id=custom_id, has_active_subscription=True)
+
+    # 4. Enviar email de confirmación
+    if user_email:
+        email_sent = await email_service.send_payment_confirmation(
+            user_email=user_email,
+            payment_data=payment_data,
+            subscription_data=subscription_data
+        )
+        if email_sent:
+            logger.info(f"Email de confirmación enviado a {user_email}")
+        else:
+            logger.warning(f"No se pudo enviar email de confirmación a {user_email}")
+
+    logger.info(f"Procesamiento completo de pago para usuario {custom_id}")
+
+
+async def handle_capture_denied(event: Dict[str, Any]) -> None:
+    """PAYMENT.CAPTURE.DENIED: solo se registra"""
+    resource = event.get("resource", {})
+    logger.warning(f"Pago rechazado para usuario {resource.get('custom_id')}: {resource}")
+
+
+async def handle_capture_refunded(event: Dict[str, Any]) -> None:
+    """PAYMENT.CAPTURE.REFUNDED: cancelar la suscripción, retirar claims y avisar por email"""
+    resource = event.get("resource", {})
+    custom_id = resource.get("custom_id")
+    refund_amount = resource.get("amount", {}).get("value")
+    refund_id = resource.get("id")
+
+    logger.info(f"Reembolso procesado para usuario {custom_id}: {refund_amount}")
+
+    if not custom_id:
+        return
+
+    # 1. Cancelar suscripción
+    refund_data = {
+        "refund_id": refund_id,
+        "amount": refund_amount,
+        "refunded_at": datetime.now()
+    }
+    await subscription_service.cancel_subscription(user_id=custom_id, refund_data=refund_data)
+
+    # 2. Actualizar custom claims
+    await subscription_service.update_custom_claims(user_id=custom_id, has_active_subscription=False)
+
+    # 3. Enviar email de notificación
+    user_email = await _user_email(custom_id)
+    if user_email:
+        await email_service.send_subscription_cancelled(user_email=user_email, refund_data=refund_data)
+
+    logger.info(f"Suscripción cancelada por reembolso para usuario {custom_id}")
+
+
+EVENT_HANDLERS: Dict[str, WebhookHandler] = {
+    "PAYMENT.CAPTURE.COMPLETED": handle_capture_completed,
+    "PAYMENT.CAPTURE.DENIED": handle_capture_denied,
+    "PAYMENT.CAPTURE.REFUNDED": handle_capture_refunded,
+}
+
+
+async def process_paypal_event(event: Dict[str, Any]) -> None:
+    """Despachar el evento a su handler (los tipos sin handler se ignoran)"""
+    event_type = event.get("event_type")
+    handler = EVENT_HANDLERS.get(event_type)
+    if handler is None:
+        logger.info(f"Webhook de PayPal sin handler: {event_type}")
+        return
+    await handler(event)
+
+
+# Instancia global usada por el endpoint de webhooks
+paypal_webhook_queue = PayPalWebhookQueue.from_settings(process_paypal_event)
@@ -0,0 +1,316 @@
+"""
+Cola de procesamiento de webhooks de PayPal.
+
+El endpoint ya no procesa el evento dentro de la petición (PayPal reintenta si
+la respuesta tarda y eso duplicaba suscripciones). Ahora:
+
+1. Verifica la firma y guarda el evento en bruto en
+   paypal_webhook_events/{event_id} con `create()`: si el documento ya existe
+   es un reintento de PayPal y se responde sin volver a encolarlo
+2. Encola el evento y responde 200 de inmediato
+3. Un pool de workers lo procesa. Los eventos se reparten por recurso
+   (custom_id = usuario, o el ID del recurso) con un hash estable, así que
+   los eventos de un mismo recurso se procesan en orden y uno detrás de otro
+4. Si el handler falla se reintenta con backoff exponencial; tras
+   `max_attempts` el evento queda en estado dead_letter con el último error
+
+El estado de cada evento (received, processing, processed, dead_letter) vive
+en Firestore. Con varias instancias (Cloud Run escala y arranca en frío) un
+evento solo lo procesa quien lo reclama: antes de llamar al handler el worker
+pasa el documento a processing con su `owner` y un `lease_until` (claim con
+precondición, ver Repository.claim) y renueva la concesión antes de cada
+reintento. Si otra instancia lo tiene con la concesión vigente, se descarta.
+Al arrancar, `recover()` reencola los eventos received y los processing cuya
+concesión caducó (la instancia que los tenía murió). La cola en sí es en
+proceso (asyncio.Queue), por lo que en los tests basta con inyectar
+InMemoryFirestore y un handler falso, y esperar con `drain()`.
+
+Métricas: paypal_webhook_events_total{event_type,result} y
+paypal_webhook_lag_ms{event_type} (de la recepción al fin del procesamiento).
+"""
+import asyncio
+import logging
+import time
+import uuid
+import zlib
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from app.core.config import settings
+from app.services.firestore.repository import Document, Repository
+from app.utils.metrics_core import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+WebhookHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+# Estados del documento del evento
+STATUS_RECEIVED = "received"
+STATUS_PROCESSING = "processing"
+STATUS_PROCESSED = "processed"
+STATUS_DEAD_LETTER = "dead_letter"
+
+# Eventos reencolados por página en recover()
+RECOVER_PAGE_SIZE = 500
+
+_events_total = metrics_registry.counter(
+    "paypal_webhook_events_total",
+    "Webhooks de PayPal por tipo y resultado (received, duplicate, claimed_elsewhere, processed, retried, dead_letter)",
+    ("event_type", "result")
+)
+_lag_ms = metrics_registry.histogram(
+    "paypal_webhook_lag_ms",
+    "Milisegundos desde la recepción de un webhook de PayPal hasta el fin de su procesamiento",
+    ("event_type",),
+    buckets=(50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 300000)
+)
+
+
+class WebhookEventRepository(Repository):
+    """Colección paypal_webhook_events (evento en bruto + estado, ID = ID del evento)"""
+
+    collection_path = "paypal_webhook_events"
+
+
+def resource_key(event: Dict[str, Any]) -> str:
+    """
+    Clave de ordenación del evento: el usuario (custom_id) si viene, para que
+    el pago y su reembolso no se procesen a la vez; si no, el ID del recurso.
+    """
+    resource = event.get("resource") or {}
+    return str(resource.get("custom_id") or resource.get("id") or event.get("id") or "")
+
+
+class PayPalWebhookQueue:
+    """Persistencia con deduplicación + pool de workers particionado por recurso"""
+
+    def __init__(
+        self,
+        handler: WebhookHandler,
+        repository: Optional[WebhookEventRepository] = None,
+        workers: int = 4,
+        max_attempts: int = 5,
+        base_backoff: float = 2.0,
+        lease_seconds: float = 300.0
+    ):
+        """
+        Args:
+            handler: Corrutina que procesa un evento (debe lanzar excepción si falla)
+            repository: Almacén de eventos (por defecto la colección en Firestore)
+            workers: Workers en paralelo (= particiones de orden)
+            max_attempts: Intentos por evento antes de mandarlo a dead_letter
+            base_backoff: Segundos del primer reintento (se duplica en cada intento)
+            lease_seconds: Duración de la concesión sobre un evento reclamado
+                (debe superar lo que tarda un intento del handler)
+        """
+        self.handler = handler
+        self.repository = repository or WebhookEventRepository()
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.base_backoff = base_backoff
+        self.lease_seconds = lease_seconds
+        # Identifica a esta instancia en las concesiones
+        self.owner = uuid.uuid4().hex
+        self._queues: List[asyncio.Queue] = []
+        self._pending: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+
+    @classmethod
+    def from_settings(cls, handler: WebhookHandler) -> "PayPalWebhookQueue":
+        return cls(
+            handler,
+            workers=settings.PAYPAL_WEBHOOK_WORKERS,
+            max_attempts=settings.PAYPAL_WEBHOOK_MAX_ATTEMPTS,
+            base_backoff=settings.PAYPAL_WEBHOOK_RETRY_BACKOFF,
+            lease_seconds=settings.PAYPAL_WEBHOOK_LEASE_SECONDS
+        )
+
+    # ------------------------------------------------------------------
+    # Camino de la petición
+    # ------------------------------------------------------------------
+
+    async def accept(self, event: Dict[str, Any]) -> bool:
+        """
+        Guardar el evento y encolarlo.
+
+        Returns:
+            False si el evento ya se había recibido (reintento de PayPal)
+
+        Raises:
+            ValueError: Si el evento no trae ID
+            Las excepciones de Firestore si no se pudo guardar (PayPal reintentará)
+        """
+        event_id = event.get("id")
+        if not event_id:
+            raise ValueError("Evento de PayPal sin ID")
+        event_type = event.get("event_type") or "unknown"
+
+        created = await self.repository.create(event_id, {
+            "event_type": event_type,
+            "resource_key": resource_key(event),
+            "payload": event,
+            "status": STATUS_RECEIVED,
+            "attempts": 0,
+            "received_at": datetime.now()
+        })
+        if not created:
+            _events_total.inc(event_type, "duplicate")
+            logger.info(f"Webhook de PayPal duplicado ignorado: {event_id} ({event_type})")
+            return False
+
+        _events_total.inc(event_type, "received")
+        self._enqueue(event, time.monotonic())
+        return True
+
+    def _partition(self, event: Dict[str, Any]) -> int:
+        # crc32 y no hash(): estable entre procesos y ejecuciones
+        return zlib.crc32(resource_key(event).encode()) % self.workers
+
+    def _enqueue(self, event: Dict[str, Any], received_at: float) -> bool:
+        if event["id"] in self._pending:
+            return False
+        self.start()
+        self._pending.add(event["id"])
+        # (evento, instante de recepción en time.monotonic())
+        self._queues[self._partition(event)].put_nowait((event, received_at))
+        return True
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    def _claimable(self, document: Dict[str, Any], now: float) -> bool:
+        """Pendiente, o en proceso por esta instancia o con la concesión caducada"""
+        status = document.get("status")
+        if status == STATUS_RECEIVED:
+            return True
+        return status == STATUS_PROCESSING and (
+            document.get("owner") == self.owner or document.get("lease_until", 0) <= now
+        )
+
+    async def _claim(self, event_id: str) -> bool:
+        """Reclamar (o renovar) la concesión sobre el evento. False si es de otra instancia"""
+        now = time.time()
+        claimed = await self.repository.claim(
+            event_id,
+            lambda document: self._claimable(document, now),
+            {"status": STATUS_PROCESSING, "owner": self.owner, "lease_until": now + self.lease_seconds}
+        )
+        return claimed is not None
+
+    async def _mark(self, event_id: str, status: str, **fields: Any) -> None:
+        try:
+            await self.repository.update(event_id, {"status": status, "updated_at": datetime.now(), **fields})
+        except Exception as e:
+            logger.error(f"Error actualizando el estado del webhook {event_id} a {status}: {e}")
+
+    async def _process(self, event: Dict[str, Any], received_at: float) -> bool:
+        """Procesar un evento con reintentos. Devuelve True si terminó bien"""
+        event_id = event["id"]
+        event_type = event.get("event_type") or "unknown"
+        error: Optional[Exception] = None
+
+        for attempt in range(1, self.max_attempts + 1):
+            # Reclamar antes del primer intento y renovar antes de cada reintento
+            if not await self._claim(event_id):
+                _events_total.inc(event_type, "claimed_elsewhere")
+                logger.info(f"Webhook {event_id} ({event_type}) ya procesado o en curso en otra instancia")
+                return False
+            try:
+                await self.handler(event)
+                error = None
+                break
+            except Exception as e:
+                error = e
+                if attempt == self.max_attempts:
+                    break
+                _events_total.inc(event_type, "retried")
+                delay = self.base_backoff * 2 ** (attempt - 1)
+                logger.warning(
+                    f"Error procesando webhook {event_id} ({event_type}), intento {attempt}/{self.max_attempts}, "
+                    f"reintento en {delay:.1f}s: {e}"
+                )
+                await asyncio.sleep(delay)
+
+        _lag_ms.observe(event_type, value=(time.monotonic() - received_at) * 1000)
+        if error is None:
+            _events_total.inc(event_type, "processed")
+            await self._mark(event_id, STATUS_PROCESSED, attempts=attempt, processed_at=datetime.now())
+            return True
+
+        _events_total.inc(event_type, "dead_letter")
+        logger.error(f"Webhook {event_id} ({event_type}) enviado a dead letter tras {attempt} intentos: {error}")
+        await self._mark(event_id, STATUS_DEAD_LETTER, attempts=attempt, last_error=str(error))
+        return False
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        while True:
+            event, received_at = await queue.get()
+            try:
+                await self._process(event, received_at)
+            except Exception as e:
+                logger.error(f"Error en el worker de webhooks de PayPal: {e}")
+            finally:
+                self._pending.discard(event["id"])
+                queue.task_done()
+
+    def start(self) -> None:
+        """Arrancar los workers (llamar desde el event loop; idempotente)"""
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        if not self._queues:
+            self._queues = [asyncio.Queue() for _ in range(self.workers)]
+        self._tasks = [loop.create_task(self._run(queue)) for queue in self._queues]
+
+    async def drain(self) -> None:
+        """Esperar a que se procese todo lo encolado"""
+        await asyncio.gather(*(queue.join() for queue in self._queues))
+
+    async def stop(self) -> None:
+        """
+        Parar los workers. Lo que quede en cola sigue en estado received en
+        Firestore (o processing hasta que caduque la concesión) y se recupera
+        en el siguiente arranque.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queues = []
+        self._pending.clear()
+
+    async def recover(self) -> int:
+        """
+        Reencolar los eventos que quedaron en estado received, o processing con
+        la concesión caducada (p. ej. el proceso se reinició antes de
+        terminarlos), en orden de recepción y hasta RECOVER_PAGE_SIZE por
+        llamada. Los que ya están en cola no se duplican y los que otra
+        instancia tiene reclamados se saltan.
+
+        Returns:
+            Eventos reencolados
+        """
+        documents: List[Document] = await self.repository.find(
+            ("status", "in", [STATUS_RECEIVED, STATUS_PROCESSING]),
+            order_by=["received_at"],
+            limit=RECOVER_PAGE_SIZE
+        )
+        now = time.time()
+        received_at = time.monotonic()
+        recovered = sum(
+            self._enqueue(document["payload"], received_at)
+            for document in documents
+            if self._claimable(document, now)
+        )
+        if recovered:
+            logger.info(f"{recovered} webhooks de PayPal pendientes reencolados")
+        return recovered
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores por tipo/resultado, lag y profundidad de cada partición"""
+        return {
+            "events": {"/".join(labels): value for labels, value in _events_total.collect().items()},
+            "lag_ms": {labels[0]: summary for labels, summary in _lag_ms.summary().items()},
+            "queue_depth": [queue.qsize() for queue in self._queues]
+        }
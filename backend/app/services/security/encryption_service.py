@@ -1,15 +1,80 @@
 """
 Servicio de encriptación para datos sensibles.
 Usa Fernet (AES-128) para encriptación simétrica.
+
+- Rotación de claves con MultiFernet: ENCRYPTION_KEY cifra y también se
+  aceptan las claves antiguas de ENCRYPTION_OLD_KEYS (separadas por comas)
+- Operaciones por lotes (encrypt_many / decrypt_many) y variantes async que
+  reparten el trabajo en un pool de hilos (ENCRYPTION_WORKERS)
+- Caché en memoria de valores desencriptados por texto cifrado, con TTL corto
+  (ENCRYPTION_CACHE_TTL segundos, 0 = desactivada)
 """
 import os
+import asyncio
 import logging
-from typing import Optional
-from cryptography.fernet import Fernet, InvalidToken
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 from base64 import b64encode, b64decode
 
 logger = logging.getLogger(__name__)
 
+# Valor que sustituye a un dato que no se pudo desencriptar
+ENCRYPTED_PLACEHOLDER = "[ENCRYPTED]"
+
+# Tamaño mínimo de cada trozo enviado al pool de hilos
+MIN_CHUNK_SIZE = 32
+
+
+class DecryptedValueCache:
+    """LRU con TTL de texto cifrado -> texto plano (thread-safe)"""
+
+    def __init__(self, ttl: float = 60.0, max_size: int = 10000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_size > 0
+
+    def get(self, token: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[1] <= self.clock():
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token: str, plaintext: str) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[token] = (plaintext, self.clock() + self.ttl)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
 class EncryptionService:
     """Servicio para encriptar/desencriptar datos sensibles."""
 
@@ -21,6 +86,7 @@ class EncryptionService:
         Si no existe, se genera una nueva (solo para desarrollo).
         """
         encryption_key = os.getenv("ENCRYPTION_KEY")
+        old_keys = [k.strip() for k in os.getenv("ENCRYPTION_OLD_KEYS", "").split(",") if k.strip()]
 
         if not encryption_key:
             # Modo desarrollo: generar clave temporal
@@ -28,13 +94,14 @@ class EncryptionService:
                 "ENCRYPTION_KEY no configurada. Generando clave temporal. "
                 "⚠️ ESTO DEBE CONFIGURARSE EN PRODUCCIÓN"
             )
-            self.cipher = Fernet(Fernet.generate_key())
+            self.primary_cipher = Fernet(Fernet.generate_key())
+            old_keys = []
             self._is_temp_key = True
         else:
             try:
                 # Verificar que la clave es válida
                 key_bytes = encryption_key.encode('utf-8')
-                self.cipher = Fernet(key_bytes)
+                self.primary_cipher = Fernet(key_bytes)
                 self._is_temp_key = False
                 logger.info("Encryption service initialized with production key")
             except Exception as e:
@@ -44,6 +111,23 @@ class EncryptionService:
                     "python -c 'from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())'"
                 )
 
+        try:
+            old_ciphers = [Fernet(key.encode('utf-8')) for key in old_keys]
+        except Exception as e:
+            logger.error(f"Error initializing old encryption keys: {e}")
+            raise ValueError("ENCRYPTION_OLD_KEYS contiene una clave inválida")
+        if old_ciphers:
+            logger.info(f"Encryption key rotation enabled ({len(old_ciphers)} old key(s) accepted)")
+
+        # La primera clave cifra; todas descifran
+        self.cipher = MultiFernet([self.primary_cipher, *old_ciphers])
+        self.cache = DecryptedValueCache(
+            ttl=float(os.getenv("ENCRYPTION_CACHE_TTL", "60")),
+            max_size=int(os.getenv("ENCRYPTION_CACHE_SIZE", "10000"))
+        )
+        self._workers = int(os.getenv("ENCRYPTION_WORKERS", "4"))
+        self._executor: Optional[ThreadPoolExecutor] = None
+
     def encrypt(self, data: str) -> str:
         """
         Encripta datos en texto plano.
@@ -66,7 +150,10 @@ class EncryptionService:
         try:
             # Encriptar y retornar como string base64
             encrypted_bytes = self.cipher.encrypt(data.encode('utf-8'))
-            return encrypted_bytes.decode('utf-8')
+            encrypted = encrypted_bytes.decode('utf-8')
+            # Lo normal es devolver el valor recién guardado: evitar descifrarlo
+            self.cache.put(encrypted, data)
+            return encrypted
         except Exception as e:
             logger.error(f"Error encrypting data: {e}")
             raise ValueError("Failed to encrypt data")
@@ -93,10 +180,16 @@ class EncryptionService:
         if not encrypted_data:
             return ""
 
+        cached = self.cache.get(encrypted_data) if self.cache.enabled else None
+        if cached is not None:
+            return cached
+
         try:
             # Desencriptar desde base64
             decrypted_bytes = self.cipher.decrypt(encrypted_data.encode('utf-8'))
-            return decrypted_bytes.decode('utf-8')
+            decrypted = decrypted_bytes.decode('utf-8')
+            self.cache.put(encrypted_data, decrypted)
+            return decrypted
         except InvalidToken:
             logger.error("Invalid encryption token - data may be corrupted or key is wrong")
             raise ValueError("Cannot decrypt data - invalid encryption key")
@@ -104,6 +197,125 @@ class EncryptionService:
             logger.error(f"Error decrypting data: {e}")
             raise ValueError("Failed to decrypt data")
 
+    def encrypt_many(self, values: List[str]) -> List[str]:
+        """
+        Encripta una lista de valores en una sola llamada.
+
+        Args:
+            values: Textos a encriptar
+
+        Returns:
+            Textos encriptados, en el mismo orden
+        """
+        return [self.encrypt(value) for value in values]
+
+    def decrypt_many(self, encrypted_values: List[str], on_error: Optional[str] = None) -> List[str]:
+        """
+        Desencripta una lista de valores; los repetidos y los que están en
+        caché solo se descifran una vez.
+
+        Args:
+            encrypted_values: Textos encriptados
+            on_error: Valor para los datos que no se pueden desencriptar
+                (None = lanzar ValueError)
+
+        Returns:
+            Textos desencriptados, en el mismo orden
+
+        Raises:
+            ValueError: Si algún dato no se puede desencriptar y on_error es None
+        """
+        results: dict = {}
+        for token in encrypted_values:
+            if token in results:
+                continue
+            try:
+                results[token] = self.decrypt(token)
+            except ValueError:
+                if on_error is None:
+                    raise
+                results[token] = on_error
+        return [results[token] for token in encrypted_values]
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="encryption")
+        return self._executor
+
+    async def _map_chunks(self, func, values: List[str], *args) -> List[str]:
+        """Repartir `values` en trozos y procesarlos en el pool de hilos"""
+        if not values:
+            return []
+        chunk_size = max(MIN_CHUNK_SIZE, -(-len(values) // self._workers))
+        loop = asyncio.get_running_loop()
+        chunks = await asyncio.gather(*[
+            loop.run_in_executor(self._pool(), func, values[i:i + chunk_size], *args)
+            for i in range(0, len(values), chunk_size)
+        ])
+        return [value for chunk in chunks for value in chunk]
+
+    async def encrypt_many_async(self, values: List[str]) -> List[str]:
+        """encrypt_many fuera del event loop (pool de hilos)"""
+        return await self._map_chunks(self.encrypt_many, values)
+
+    async def decrypt_many_async(self, encrypted_values: List[str], on_error: Optional[str] = None) -> List[str]:
+        """decrypt_many fuera del event loop; los valores en caché no van al pool"""
+        decrypted = {}
+        pending = []
+        for token in dict.fromkeys(encrypted_values):
+            value = self.cache.get(token) if token and self.cache.enabled else None
+            if value is not None:
+                decrypted[token] = value
+            elif token:
+                pending.append(token)
+            else:
+                decrypted[token] = ""
+        if pending:
+            decrypted.update(zip(pending, await self._map_chunks(self.decrypt_many, pending, on_error)))
+        return [decrypted[token] for token in encrypted_values]
+
+    def rotate(self, encrypted_data: str) -> Optional[str]:
+        """
+        Re-encripta un valor con la clave actual.
+
+        Returns:
+            Nuevo texto encriptado, o None si ya usa la clave actual
+
+        Raises:
+            ValueError: Si ninguna clave puede desencriptarlo
+        """
+        token = encrypted_data.encode('utf-8')
+        try:
+            self.primary_cipher.decrypt(token)
+            return None
+        except InvalidToken:
+            pass
+        try:
+            return self.cipher.rotate(token).decode('utf-8')
+        except InvalidToken:
+            raise ValueError("Cannot rotate data - no key can decrypt it")
+
+    def rotate_many(self, encrypted_values: List[str]) -> List[Optional[str]]:
+        """
+        rotate() sobre una lista.
+
+        Returns:
+            Por valor: nuevo texto encriptado, None si no necesita cambio o
+            ENCRYPTED_PLACEHOLDER si ninguna clave puede desencriptarlo
+        """
+        rotated = []
+        for token in encrypted_values:
+            try:
+                rotated.append(self.rotate(token) if token else None)
+            except ValueError:
+                logger.error("Cannot rotate encrypted value - no key can decrypt it")
+                rotated.append(ENCRYPTED_PLACEHOLDER)
+        return rotated
+
+    async def rotate_many_async(self, encrypted_values: List[str]) -> List[Optional[str]]:
+        """rotate_many en el pool de hilos"""
+        return await self._map_chunks(self.rotate_many, encrypted_values)
+
     def encrypt_dict_fields(self, data: dict, fields_to_encrypt: list) -> dict:
         """
         Encripta campos específicos de un diccionario.
@@ -122,15 +334,18 @@ class EncryptionService:
             {"name": "John", "phone": "gAAAAABl...", "_encrypted_fields": ["phone"]}
         """
         result = data.copy()
+        fields = [field for field in fields_to_encrypt if field in result and result[field]]
         encrypted_fields = []
 
-        for field in fields_to_encrypt:
-            if field in result and result[field]:
-                try:
-                    result[field] = self.encrypt(str(result[field]))
-                    encrypted_fields.append(field)
-                except Exception as e:
-                    logger.error(f"Error encrypting field {field}: {e}")
+        try:
+            encrypted_values = self.encrypt_many([str(result[field]) for field in fields])
+        except Exception as e:
+            logger.error(f"Error encrypting fields {fields}: {e}")
+            encrypted_values = []
+
+        for field, value in zip(fields, encrypted_values):
+            result[field] = value
+            encrypted_fields.append(field)
 
         # Marcar qué campos están encriptados
         if encrypted_fields:
@@ -161,14 +376,13 @@ class EncryptionService:
         if fields_to_decrypt is None:
             fields_to_decrypt = result.get("_encrypted_fields", [])
 
-        for field in fields_to_decrypt:
-            if field in result and result[field]:
-                try:
-                    result[field] = self.decrypt(str(result[field]))
-                except Exception as e:
-                    logger.error(f"Error decrypting field {field}: {e}")
-                    # Mantener el valor encriptado si falla la desencriptación
-                    result[field] = "[ENCRYPTED]"
+        fields = [field for field in fields_to_decrypt if field in result and result[field]]
+        # Si falla la desencriptación se marca el campo como encriptado
+        decrypted = self.decrypt_many([str(result[field]) for field in fields], on_error=ENCRYPTED_PLACEHOLDER)
+        for field, value in zip(fields, decrypted):
+            if value == ENCRYPTED_PLACEHOLDER:
+                logger.error(f"Error decrypting field {field}")
+            result[field] = value
 
         # Remover metadatos de encriptación
         result.pop("_encrypted_fields", None)
@@ -213,5 +427,10 @@ if __name__ == "__main__":
         print("Agrega esta línea a tu archivo .env")
         print("⚠️  NUNCA compartas esta clave ni la subas a GitHub")
         print("=" * 80)
+    elif len(sys.argv) > 1 and sys.argv[1] == "reencrypt":
+        # Tras mover la clave anterior a ENCRYPTION_OLD_KEYS y poner la nueva en ENCRYPTION_KEY
+        from app.services.firestore.emergency_phones_service import emergency_phone_service
+
+        print(asyncio.run(emergency_phone_service.reencrypt_all_phones()))
     else:
-        print("Usage: python encryption_service.py generate-key")
+        print("Usage: python -m app.services.security.encryption_service generate-key|reencrypt")
@@ -0,0 +1,220 @@
+"""
+Sumidero asíncrono de eventos de seguridad y auditoría.
+
+SecurityLogger y AuditLogger ya no escriben en Firestore dentro de la
+petición: crean la referencia del documento (el ID se genera en local, sin
+RPC), encolan el evento y devuelven el ID. Una tarea en segundo plano vacía la
+cola con `batch()` de hasta 500 documentos cada SECURITY_LOG_FLUSH_INTERVAL_MS.
+
+Política bajo sobrecarga (cola llena o Firestore caído):
+- si SECURITY_LOG_SPILL_PATH está configurado, los eventos se vuelcan a un
+  fichero JSONL y se reinyectan en el siguiente vaciado sin errores
+- si no, se descartan
+
+Todo se cuenta en security_log_events_total{result=...} (expuesto en /metrics).
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.utils.metrics_core import metrics_registry
+
+try:
+    from firebase_admin import firestore  # type: ignore
+except Exception:
+    firestore = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# Límite de escrituras por batch de Firestore
+MAX_BATCH_SIZE = 500
+
+_events = metrics_registry.counter(
+    "security_log_events_total",
+    "Eventos de seguridad/auditoría por resultado (queued, written, spilled, replayed, dropped)",
+    ("result",)
+)
+
+PendingEvent = Tuple[Any, Dict[str, Any]]
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def _decode(obj: Dict[str, Any]) -> Any:
+    if set(obj) == {"__datetime__"}:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+class SecurityEventSink:
+    """Cola acotada + escritor por lotes en segundo plano"""
+
+    def __init__(
+        self,
+        client_factory: Optional[Callable[[], Any]] = None,
+        max_queue_size: int = 10000,
+        batch_size: int = MAX_BATCH_SIZE,
+        flush_interval: float = 0.2,
+        spill_path: Optional[str] = None
+    ):
+        """
+        Args:
+            client_factory: Devuelve el cliente de Firestore (por defecto firestore.client)
+            max_queue_size: Eventos en memoria antes de volcar/descartar
+            batch_size: Documentos por batch (máximo 500)
+            flush_interval: Segundos máximos que un evento espera en la cola
+            spill_path: Fichero JSONL de desbordamiento (None = descartar)
+        """
+        self._client_factory = client_factory
+        self.max_queue_size = max_queue_size
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self._queue: Deque[PendingEvent] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+
+    @classmethod
+    def from_settings(cls) -> "SecurityEventSink":
+        return cls(
+            max_queue_size=settings.SECURITY_LOG_QUEUE_SIZE,
+            batch_size=settings.SECURITY_LOG_BATCH_SIZE,
+            flush_interval=settings.SECURITY_LOG_FLUSH_INTERVAL_MS / 1000,
+            spill_path=settings.SECURITY_LOG_SPILL_PATH or None
+        )
+
+    def _client(self) -> Any:
+        if self._client_factory is not None:
+            return self._client_factory()
+        return firestore.client()  # type: ignore
+
+    # ------------------------------------------------------------------
+    # Camino de la petición
+    # ------------------------------------------------------------------
+
+    def submit(self, doc_ref: Any, data: Dict[str, Any]) -> None:
+        """Encolar la escritura de `data` en `doc_ref` (no bloquea)"""
+        if len(self._queue) >= self.max_queue_size:
+            self._overflow([(doc_ref, data)])
+            return
+        self._queue.append((doc_ref, data))
+        _events.inc("queued")
+        if self._wakeup is not None and len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def _overflow(self, events: list) -> None:
+        """Volcar a disco o descartar eventos que no caben / no se pudieron escribir"""
+        if self.spill_path:
+            try:
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    for doc_ref, data in events:
+                        f.write(json.dumps({"path": doc_ref.path, "data": data}, default=_encode) + "\n")
+                _events.inc("spilled", amount=len(events))
+                return
+            except Exception as e:
+                logger.error(f"Error volcando eventos de seguridad a {self.spill_path}: {e}")
+        _events.inc("dropped", amount=len(events))
+        logger.warning(f"{len(events)} eventos de seguridad descartados (cola llena o Firestore no disponible)")
+
+    # ------------------------------------------------------------------
+    # Escritura por lotes
+    # ------------------------------------------------------------------
+
+    def _commit(self, events: list) -> None:
+        batch = self._client().batch()
+        for doc_ref, data in events:
+            batch.set(doc_ref, data)
+        batch.commit()
+
+    async def flush(self) -> int:
+        """Escribir todo lo encolado ahora. Devuelve los eventos escritos"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        written = 0
+        async with self._flush_lock:
+            while self._queue:
+                events = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                try:
+                    await asyncio.to_thread(self._commit, events)
+                except Exception as e:
+                    logger.error(f"Error escribiendo lote de {len(events)} eventos de seguridad: {e}")
+                    self._overflow(events)
+                    return written
+                written += len(events)
+                _events.inc("written", amount=len(events))
+            # Firestore responde: recuperar lo que se volcó a disco
+            self._replay_spill()
+        return written
+
+    def _replay_spill(self) -> int:
+        """Reinyectar en la cola los eventos volcados a disco (los que quepan)"""
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return 0
+        try:
+            with open(self.spill_path, encoding="utf-8") as f:
+                lines = f.readlines()
+            client = self._client()
+            room = self.max_queue_size - len(self._queue)
+            for line in lines[:room]:
+                record = json.loads(line, object_hook=_decode)
+                self._queue.append((client.document(record["path"]), record["data"]))
+            rest = lines[room:]
+            if rest:
+                with open(self.spill_path, "w", encoding="utf-8") as f:
+                    f.writelines(rest)
+            else:
+                os.remove(self.spill_path)
+        except Exception as e:
+            logger.error(f"Error reinyectando eventos de seguridad desde {self.spill_path}: {e}")
+            return 0
+        replayed = min(room, len(lines))
+        _events.inc("replayed", amount=replayed)
+        return replayed
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error en el escritor de eventos de seguridad: {e}")
+
+    def start(self) -> None:
+        """Arrancar el escritor en segundo plano (llamar desde el event loop)"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Parar el escritor y vaciar la cola"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._wakeup = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores de eventos y tamaño actual de la cola"""
+        stats = {labels[0]: value for labels, value in _events.collect().items()}
+        stats["queue_size"] = len(self._queue)
+        return stats
+
+
+# Instancia global compartida por SecurityLogger y AuditLogger
+security_event_sink = SecurityEventSink.from_settings()
@@ -7,22 +7,62 @@ Comprehensive file validation including:
 - Format whitelisting
 - Security checks against malicious files
 - Image validation
+- Streaming validation of uploads (bounded memory)
 """
 
-import magic
+import hashlib
 import mimetypes
 from typing import Optional, List, Dict, Any, BinaryIO
 from pathlib import Path
 from io import BytesIO
 import logging
-from PIL import Image
+from PIL import Image, ImageFile
 from fastapi import UploadFile, HTTPException
 from dataclasses import dataclass
 
+try:
+    import magic
+    MAGIC_AVAILABLE = True
+except ImportError:
+    magic = None
+    MAGIC_AVAILABLE = False
+
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Chunk size used when streaming uploads
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Bytes needed to sniff the MIME type from the start of a file
+SNIFF_BYTES = 2048
+
+# Magic numbers of the image formats we accept (offset, signature, mime)
+IMAGE_SIGNATURES = (
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (8, b'WEBP', 'image/webp'),
+)
+
+
+def sniff_mime_type(head: bytes) -> str:
+    """
+    Detect the MIME type from the first bytes of a file
+
+    Known image signatures are matched directly; anything else falls back
+    to libmagic when it is installed.
+    """
+    for offset, signature, mime in IMAGE_SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            if mime == 'image/webp' and not head.startswith(b'RIFF'):
+                continue
+            return mime
+    if MAGIC_AVAILABLE:
+        return magic.from_buffer(head, mime=True)
+    return 'application/octet-stream'
+
 
 @dataclass
 class FileValidationResult:
@@ -99,107 +139,150 @@ class FileValidator:
 
         logger.info(f"FileValidator initialized with max image size: {self.max_image_size}")
 
-    async def validate_upload_file(
+    async def validate_upload_stream(
         self,
         file: UploadFile,
         category: str = 'image',
-        max_size: Optional[int] = None
+        max_size: Optional[int] = None,
+        chunk_size: int = STREAM_CHUNK_SIZE
     ) -> FileValidationResult:
         """
-        Validate an uploaded file
+        Validate an uploaded file by streaming it in chunks
+
+        The upload is never buffered whole: the MIME type is sniffed from
+        the first bytes, reading stops as soon as the size limit is crossed
+        or the type is rejected, and the SHA-256 and image header metadata
+        are computed incrementally.
+        The file is rewound afterwards so the same stream can be handed to
+        the storage upload.
 
         Args:
             file: FastAPI UploadFile object
             category: File category ('image', 'document')
             max_size: Optional custom max size in bytes
+            chunk_size: Bytes read per iteration
 
         Returns:
-            FileValidationResult
+            FileValidationResult (metadata includes sha256 and, for
+            images, width/height/format/mode)
 
         Raises:
-            HTTPException: If file is invalid
+            HTTPException: If the file cannot be read
         """
         errors = []
         warnings = []
         metadata = {}
 
-        # Read file content
-        try:
-            content = await file.read()
-            await file.seek(0)  # Reset file pointer
-        except Exception as e:
-            logger.error(f"Error reading file: {e}")
-            raise HTTPException(status_code=400, detail="Could not read file")
-
-        # Validate size
-        size_bytes = len(content)
-        metadata['size_bytes'] = size_bytes
-        metadata['size_mb'] = round(size_bytes / (1024 * 1024), 2)
-
         max_allowed_size = max_size or (
             self.max_image_size if category == 'image' else self.max_document_size
         )
+        allowed_types = (
+            self.ALLOWED_IMAGE_TYPES if category == 'image' else self.ALLOWED_DOCUMENT_TYPES
+        )
+
+        file_path = Path(file.filename) if file.filename else Path('unknown')
+        extension = file_path.suffix.lower()
+        metadata['extension'] = extension
+        metadata['filename'] = file.filename
 
-        if size_bytes > max_allowed_size:
+        if extension in self.DANGEROUS_EXTENSIONS:
+            errors.append(f"Dangerous file extension: {extension}")
+        if (
+            category == 'image' and extension
+            and extension.lstrip('.') not in self.allowed_image_formats
+        ):
             errors.append(
-                f"File too large: {metadata['size_mb']}MB "
-                f"(max: {max_allowed_size / (1024 * 1024)}MB)"
+                f"Invalid image format: {extension}. "
+                f"Allowed: {', '.join(self.allowed_image_formats)}"
             )
 
-        if size_bytes == 0:
-            errors.append("File is empty")
+        digest = hashlib.sha256()
+        header_parser = ImageFile.Parser() if category == 'image' else None
+        mime = None
+        size_bytes = 0
+        tail = b''
 
-        # Detect real MIME type from content
         try:
-            mime = magic.from_buffer(content, mime=True)
-            metadata['detected_mime'] = mime
+            await file.seek(0)
+            while not errors:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+
+                size_bytes += len(chunk)
+                if size_bytes > max_allowed_size:
+                    errors.append(
+                        f"File too large: more than "
+                        f"{max_allowed_size / (1024 * 1024)}MB"
+                    )
+                    metadata['truncated'] = True
+                    break
+
+                if mime is None:
+                    mime = sniff_mime_type(chunk[:SNIFF_BYTES])
+                    metadata['detected_mime'] = mime
+                    if mime in self.DANGEROUS_TYPES:
+                        errors.append(f"Dangerous file type detected: {mime}")
+                    elif mime not in allowed_types:
+                        errors.append(
+                            f"Invalid {category} type: {mime}. "
+                            f"Allowed: {', '.join(sorted(allowed_types))}"
+                        )
+                    if errors:
+                        break
+
+                digest.update(chunk)
+
+                if header_parser is not None and header_parser.image is None:
+                    try:
+                        header_parser.feed(chunk)
+                    except Exception as e:
+                        errors.append(f"Invalid or corrupted image: {str(e)}")
+                        break
+
+                if category == 'document':
+                    # Keep a small overlap so markers split across chunks are found
+                    window = (tail + chunk).lower()
+                    if b'<script' in window or b'javascript:' in window:
+                        errors.append("Document contains potentially malicious scripts")
+                        break
+                    tail = window[-16:]
+
+            await file.seek(0)
         except Exception as e:
-            logger.error(f"Error detecting MIME type: {e}")
-            errors.append("Could not detect file type")
-            mime = 'application/octet-stream'
+            logger.error(f"Error reading file: {e}")
+            raise HTTPException(status_code=400, detail="Could not read file")
 
-        # Get extension from filename
-        file_path = Path(file.filename) if file.filename else Path('unknown')
-        extension = file_path.suffix.lower()
-        metadata['extension'] = extension
-        metadata['filename'] = file.filename
+        metadata['size_bytes'] = size_bytes
+        metadata['size_mb'] = round(size_bytes / (1024 * 1024), 2)
 
-        # Check for dangerous extensions
-        if extension in self.DANGEROUS_EXTENSIONS:
-            errors.append(f"Dangerous file extension: {extension}")
+        if size_bytes == 0 and not errors:
+            errors.append("File is empty")
 
-        # Check for dangerous MIME types
-        if mime in self.DANGEROUS_TYPES:
-            errors.append(f"Dangerous file type detected: {mime}")
+        if not errors:
+            metadata['sha256'] = digest.hexdigest()
 
-        # Validate based on category
-        if category == 'image':
-            image_errors, image_warnings, image_metadata = self._validate_image(
-                content, mime, extension
-            )
-            errors.extend(image_errors)
-            warnings.extend(image_warnings)
-            metadata.update(image_metadata)
-        elif category == 'document':
-            doc_errors, doc_metadata = self._validate_document(
-                content, mime, extension
-            )
-            errors.extend(doc_errors)
-            metadata.update(doc_metadata)
+        if header_parser is not None and not errors:
+            img = header_parser.image
+            if img is None:
+                errors.append("Invalid or corrupted image: unreadable header")
+            else:
+                metadata['width'] = img.width
+                metadata['height'] = img.height
+                metadata['format'] = img.format
+                metadata['mode'] = img.mode
+                warnings.extend(self._image_dimension_warnings(img.width, img.height))
 
-        # Check MIME type vs extension mismatch
         expected_mime = mimetypes.guess_type(file.filename)[0] if file.filename else None
-        if expected_mime and mime != expected_mime:
+        if mime and expected_mime and mime != expected_mime:
             warnings.append(
                 f"MIME type mismatch: extension suggests {expected_mime}, "
                 f"but content is {mime}"
             )
 
-        is_valid = len(errors) == 0
-
         return FileValidationResult(
-            is_valid=is_valid,
-            mime_type=mime,
+            is_valid=len(errors) == 0,
+            mime_type=mime or 'application/octet-stream',
             extension=extension,
             size_bytes=size_bytes,
             errors=errors,
@@ -207,6 +290,32 @@ class FileValidator:
             metadata=metadata
         )
 
+    def _image_dimension_warnings(self, width: int, height: int) -> List[str]:
+        """Warnings about image dimensions and aspect ratio"""
+        warnings = []
+
+        if width < 100 or height < 100:
+            warnings.append(
+                f"Image too small: {width}x{height} "
+                "(minimum recommended: 100x100)"
+            )
+
+        if width > 8000 or height > 8000:
+            warnings.append(
+                f"Image very large: {width}x{height} "
+                "(may cause performance issues)"
+            )
+
+        # Validate aspect ratio (prevent extreme ratios)
+        aspect_ratio = width / height
+        if aspect_ratio > 5 or aspect_ratio < 0.2:
+            warnings.append(
+                f"Unusual aspect ratio: {aspect_ratio:.2f} "
+                "(image may be distorted)"
+            )
+
+        return warnings
+
     def _validate_image(
         self,
         content: bytes,
@@ -241,26 +350,8 @@ class FileValidator:
             metadata['format'] = img.format
             metadata['mode'] = img.mode
 
-            # Validate dimensions
-            if img.width < 100 or img.height < 100:
-                warnings.append(
-                    f"Image too small: {img.width}x{img.height} "
-                    "(minimum recommended: 100x100)"
-                )
-
-            if img.width > 8000 or img.height > 8000:
-                warnings.append(
-                    f"Image very large: {img.width}x{img.height} "
-                    "(may cause performance issues)"
-                )
-
-            # Validate aspect ratio (prevent extreme ratios)
-            aspect_ratio = img.width / img.height
-            if aspect_ratio > 5 or aspect_ratio < 0.2:
-                warnings.append(
-                    f"Unusual aspect ratio: {aspect_ratio:.2f} "
-                    "(image may be distorted)"
-                )
+            # Validate dimensions and aspect ratio
+            warnings.extend(self._image_dimension_warnings(img.width, img.height))
 
             # Verify image can be loaded (detect corrupted files)
             img.verify()
@@ -271,29 +362,6 @@ class FileValidator:
 
         return errors, warnings, metadata
 
-    def _validate_document(
-        self,
-        content: bytes,
-        mime: str,
-        extension: str
-    ) -> tuple[List[str], Dict[str, Any]]:
-        """Validate document file"""
-        errors = []
-        metadata = {}
-
-        # Check MIME type
-        if mime not in self.ALLOWED_DOCUMENT_TYPES:
-            errors.append(
-                f"Invalid document type: {mime}. "
-                f"Allowed: {', '.join(self.ALLOWED_DOCUMENT_TYPES)}"
-            )
-
-        # Check for embedded scripts (basic check)
-        if b'<script' in content.lower() or b'javascript:' in content.lower():
-            errors.append("Document contains potentially malicious scripts")
-
-        return errors, metadata
-
     def validate_file_sync(
         self,
         file_path: str,
@@ -350,7 +418,7 @@ class FileValidator:
 
         # Detect MIME type
         try:
-            mime = magic.from_file(file_path, mime=True)
+            mime = sniff_mime_type(content[:SNIFF_BYTES])
             metadata['detected_mime'] = mime
         except Exception as e:
             logger.error(f"Error detecting MIME type: {e}")
@@ -0,0 +1,240 @@
+"""
+Distributed Rate Limiter - TuCitaSegura
+
+Rate limits shared by every worker/instance instead of per process:
+- GCRA (generic cell rate algorithm) evaluated atomically in the shared
+  store: a Lua script on Redis, or an in-process equivalent for tests and
+  single-process development
+- Local token-bucket fast path: each process takes a small batch of tokens
+  from the shared store at once and serves the next requests from it, so
+  most requests never touch Redis
+- Fails open to the in-process store if Redis is unreachable
+
+Batched tokens are already charged to the shared budget, so the global limit
+is never exceeded; at worst it is conservative by the tokens a process holds
+but doesn't use before they expire.
+"""
+
+import logging
+import re
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Tuple
+
+from app.core.config import settings
+
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {
+    "second": 1,
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400,
+}
+
+_RATE_RE = re.compile(r"^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*$")
+
+# Drop expired local allowances once this many keys are held
+MAX_LOCAL_KEYS = 10000
+
+# Drop idle buckets from the in-memory store once this many keys are held
+MAX_STORE_KEYS = 10000
+
+# KEYS[1] = bucket key
+# ARGV = emission interval (ms), period (ms), tokens requested
+# Returns {tokens granted, retry after (ms)}
+GCRA_SCRIPT = """
+local t = redis.call('TIME')
+local now = t[1] * 1000 + t[2] / 1000
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+
+local tat = tonumber(redis.call('GET', KEYS[1]) or '0')
+if tat < now then tat = now end
+
+local available = math.floor((now + period - tat) / interval)
+local granted = math.min(requested, available)
+if granted > 0 then
+  tat = tat + granted * interval
+  redis.call('SET', KEYS[1], tostring(tat), 'PX', math.ceil(tat - now))
+  return {granted, 0}
+end
+return {0, math.ceil(tat + interval - now - period)}
+"""
+
+
+def parse_rate(rate: str) -> Tuple[int, int]:
+    """
+    Parse a slowapi-style limit ("5/minute", "200/hour", "10/5minutes")
+
+    Returns:
+        (limit, period in seconds)
+    """
+    match = _RATE_RE.match(rate)
+    if not match:
+        raise ValueError(f"Invalid rate limit: {rate}")
+    limit, multiplier, unit = match.groups()
+    return int(limit), int(multiplier or 1) * PERIODS[unit]
+
+
+@dataclass
+class RateLimitResult:
+    """Outcome of a rate limit check"""
+    allowed: bool
+    retry_after: float = 0.0  # seconds
+
+
+class InMemoryRateLimitStore:
+    """Shared-store stand-in that runs GCRA in process (tests / single worker)"""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic, max_keys: int = MAX_STORE_KEYS):
+        self.clock = clock
+        self.max_keys = max_keys
+        self._tat: Dict[str, float] = {}
+        # Size that triggers the next prune (grows if most buckets are live)
+        self._prune_at = max_keys
+
+    async def acquire(self, key: str, limit: int, period: float, requested: int) -> Tuple[int, float]:
+        """Take up to `requested` tokens; returns (granted, retry_after seconds)"""
+        now = self.clock()
+        interval = period / limit
+        tat = max(self._tat.get(key, now), now)
+
+        available = int((now + period - tat) // interval)
+        granted = min(requested, available)
+        if granted > 0:
+            self._tat[key] = tat + granted * interval
+            if len(self._tat) > self._prune_at:
+                self._prune(now)
+            return granted, 0.0
+        return 0, tat + interval - now - period
+
+    def _prune(self, now: float) -> None:
+        # A bucket whose TAT has passed is full again: same as a missing key
+        # (what the PX expiry does on Redis)
+        for key in [k for k, tat in self._tat.items() if tat <= now]:
+            del self._tat[key]
+        self._prune_at = max(self.max_keys, 2 * len(self._tat))
+
+    def reset(self) -> None:
+        self._tat.clear()
+        self._prune_at = self.max_keys
+
+
+class RedisRateLimitStore:
+    """Redis-backed store; GCRA runs atomically as a Lua script"""
+
+    def __init__(self, url: str = settings.REDIS_URL, password: str = settings.REDIS_PASSWORD, prefix: str = "ratelimit:"):
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("redis package is not installed")
+        self.prefix = prefix
+        self.client = aioredis.from_url(url, password=password or None)
+        self.script = self.client.register_script(GCRA_SCRIPT)
+
+    async def acquire(self, key: str, limit: int, period: float, requested: int) -> Tuple[int, float]:
+        granted, retry_ms = await self.script(
+            keys=[self.prefix + key],
+            args=[period * 1000 / limit, period * 1000, requested]
+        )
+        return int(granted), int(retry_ms) / 1000
+
+
+@dataclass
+class _LocalAllowance:
+    tokens: int
+    expires_at: float
+
+
+class DistributedRateLimiter:
+    """Shared-store rate limiter with a per-process token-bucket fast path"""
+
+    def __init__(
+        self,
+        store=None,
+        local_fraction: float = settings.RATE_LIMIT_LOCAL_FRACTION,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.store = store or InMemoryRateLimitStore(clock)
+        self.fallback_store = self.store if isinstance(self.store, InMemoryRateLimitStore) else InMemoryRateLimitStore(clock)
+        self.local_fraction = local_fraction
+        self.clock = clock
+        self._local: Dict[str, _LocalAllowance] = {}
+
+        self.local_hits = 0
+        self.store_calls = 0
+        self.store_errors = 0
+        self.rejected = 0
+
+    def batch_size(self, limit: int) -> int:
+        """Tokens taken from the shared store per refill"""
+        return max(1, int(limit * self.local_fraction))
+
+    async def hit(self, key: str, limit: int, period: float) -> RateLimitResult:
+        """Consume one request for `key` under `limit` requests per `period` seconds"""
+        now = self.clock()
+
+        allowance = self._local.get(key)
+        if allowance is not None and allowance.tokens > 0 and allowance.expires_at > now:
+            allowance.tokens -= 1
+            self.local_hits += 1
+            return RateLimitResult(allowed=True)
+
+        batch = self.batch_size(limit)
+        self.store_calls += 1
+        try:
+            granted, retry_after = await self.store.acquire(key, limit, period, batch)
+        except Exception as e:
+            # Shared store unavailable: fail open to per-process limits
+            self.store_errors += 1
+            logger.warning(f"Rate limit store unavailable, using local limits: {e}")
+            granted, retry_after = await self.fallback_store.acquire(key, limit, period, batch)
+
+        if granted <= 0:
+            self._local.pop(key, None)
+            self.rejected += 1
+            return RateLimitResult(allowed=False, retry_after=max(retry_after, 0.0))
+
+        if granted > 1:
+            # Unused tokens are released after the time they took to accrue
+            self._local[key] = _LocalAllowance(
+                tokens=granted - 1,
+                expires_at=now + period * granted / limit
+            )
+            if len(self._local) > MAX_LOCAL_KEYS:
+                self._prune(now)
+        else:
+            self._local.pop(key, None)
+        return RateLimitResult(allowed=True)
+
+    def _prune(self, now: float) -> None:
+        for key in [k for k, a in self._local.items() if a.expires_at <= now or a.tokens <= 0]:
+            del self._local[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "local_hits": self.local_hits,
+            "store_calls": self.store_calls,
+            "store_errors": self.store_errors,
+            "rejected": self.rejected,
+            "local_keys": len(self._local),
+        }
+
+
+def create_rate_limit_store():
+    """Build the store selected by RATE_LIMIT_BACKEND ("memory" or "redis")"""
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        if REDIS_AVAILABLE:
+            return RedisRateLimitStore()
+        logger.warning("RATE_LIMIT_BACKEND=redis but the redis package is not installed; using memory")
+    return InMemoryRateLimitStore()
+
+
+# Global instance
+rate_limiter = DistributedRateLimiter(create_rate_limit_store())
@@ -2,6 +2,8 @@ import logging
 from typing import Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
+
+from app.services.security.event_sink import SecurityEventSink, security_event_sink
 try:
     import firebase_admin  # type: ignore
     from firebase_admin import firestore  # type: ignore
@@ -56,8 +58,9 @@ class SecuritySeverity(str, Enum):
 
 
 class SecurityLogger:
-    def __init__(self):
+    def __init__(self, sink: Optional[SecurityEventSink] = None):
         self.collection_name = "security_logs"
+        self.sink = sink or security_event_sink
 
     async def log_event(
         self,
@@ -70,7 +73,7 @@ class SecurityLogger:
         success: bool = True
     ) -> str:
         """
-        Registra un evento de seguridad en Firestore.
+        Registra un evento de seguridad en Firestore (escritura por lotes en segundo plano).
 
         Args:
             event_type: Tipo de evento de seguridad
@@ -82,7 +85,7 @@ class SecurityLogger:
             success: Si la acción fue exitosa o no
 
         Returns:
-            ID del documento creado en Firestore
+            ID del documento en Firestore (generado en local, sin esperar a la escritura)
 
         Example:
             >>> await security_logger.log_event(
@@ -106,9 +109,9 @@ class SecurityLogger:
                 "details": details or {}
             }
 
-            # Guardar en Firestore
+            # Encolar para el escritor por lotes (el ID se genera sin RPC)
             doc_ref = db.collection(self.collection_name).document()
-            await doc_ref.set(event_data)
+            self.sink.submit(doc_ref, event_data)
 
             # Log en consola para eventos críticos
             if severity in [SecuritySeverity.HIGH, SecuritySeverity.CRITICAL]:
@@ -425,8 +428,9 @@ security_logger = SecurityLogger()
 
 
 class AuditLogger:
-    def __init__(self):
+    def __init__(self, sink: Optional[SecurityEventSink] = None):
         self.collection_name = "audit_logs"
+        self.sink = sink or security_event_sink
 
     async def log_action(
         self,
@@ -446,7 +450,7 @@ class AuditLogger:
                 "context": context or {}
             }
             doc_ref = db.collection(self.collection_name).document()  # type: ignore
-            await doc_ref.set(event_data)  # type: ignore
+            self.sink.submit(doc_ref, event_data)
             return doc_ref.id  # type: ignore
         except Exception as e:
             logger.error(f"Error logging audit action {action}: {e}")
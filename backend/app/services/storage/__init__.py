@@ -0,0 +1,26 @@
+"""Storage services: image derivatives and Cloud Storage I/O."""
+from .image_derivatives import (
+    DERIVATIVE_SIZES,
+    ImageDerivativePipeline,
+    derivative_path,
+    is_derivative_path,
+    image_derivative_pipeline
+)
+from .storage_io import (
+    GCSStorageBackend,
+    LocalStorageBackend,
+    StorageIO,
+    create_storage_backend
+)
+
+__all__ = [
+    "DERIVATIVE_SIZES",
+    "ImageDerivativePipeline",
+    "derivative_path",
+    "is_derivative_path",
+    "image_derivative_pipeline",
+    "GCSStorageBackend",
+    "LocalStorageBackend",
+    "StorageIO",
+    "create_storage_backend"
+]
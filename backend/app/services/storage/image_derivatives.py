@@ -0,0 +1,135 @@
+"""
+Image Derivatives - TuCitaSegura
+
+Upload-time derivative pipeline for profile photos:
+- Several sizes per original (96, 320 and 1080 px on the longest side)
+- WebP (or JPEG) encoding, EXIF stripped after applying its orientation
+- Predictable paths next to the original:
+  profile_photos/{uid}/{photo_type} -> profile_photos/{uid}/{photo_type}_{size}.webp
+- Resizing, encoding and storing run in a bounded worker pool
+"""
+
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import BinaryIO, Callable, Dict, Iterable, Optional, Union
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_SIZES = tuple(
+    int(size) for size in settings.IMAGE_DERIVATIVE_SIZES.split(",") if size.strip()
+)
+
+FORMAT_EXTENSIONS = {
+    "WEBP": ("webp", "image/webp"),
+    "JPEG": ("jpg", "image/jpeg"),
+}
+
+_DERIVATIVE_RE = re.compile(r"_\d+\.(webp|jpg)$")
+
+# Callback that stores one derivative and returns its public URL:
+# store(path, data, content_type) -> url
+StoreCallback = Callable[[str, bytes, str], str]
+
+
+def derivative_path(original_path: str, size: int, fmt: str = "WEBP") -> str:
+    """Path of the derivative of `original_path` at `size` px"""
+    extension, _ = FORMAT_EXTENSIONS[fmt.upper()]
+    return f"{original_path}_{size}.{extension}"
+
+
+def is_derivative_path(path: str) -> bool:
+    """Whether a storage path is a generated derivative (not an original)"""
+    return bool(_DERIVATIVE_RE.search(path))
+
+
+class ImageDerivativePipeline:
+    """Generate and store resized, EXIF-free variants of an image"""
+
+    def __init__(
+        self,
+        sizes: Iterable[int] = DERIVATIVE_SIZES,
+        fmt: str = settings.IMAGE_DERIVATIVE_FORMAT,
+        quality: int = settings.IMAGE_DERIVATIVE_QUALITY,
+        max_workers: int = settings.IMAGE_DERIVATIVE_WORKERS
+    ):
+        self.sizes = tuple(sorted(sizes))
+        self.fmt = fmt.upper()
+        if self.fmt not in FORMAT_EXTENSIONS:
+            raise ValueError(f"Unsupported derivative format: {fmt}")
+        self.quality = quality
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Worker pool (Pillow releases the GIL while resizing and encoding)"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="image-derivatives"
+            )
+        return self._executor
+
+    def load(self, source: Union[bytes, BinaryIO]):
+        """Decode the original, apply EXIF orientation and normalize to RGB"""
+        from PIL import Image, ImageOps
+
+        stream = BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+        image = Image.open(stream)
+        image = ImageOps.exif_transpose(image)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.load()
+        return image
+
+    def render(self, image, size: int) -> bytes:
+        """Resize (never upscale) and encode one derivative without metadata"""
+        from PIL import Image
+
+        derivative = image.copy()
+        derivative.thumbnail((size, size), Image.Resampling.LANCZOS)
+
+        buffer = BytesIO()
+        if self.fmt == "WEBP":
+            derivative.save(buffer, format="WEBP", quality=self.quality, method=4)
+        else:
+            derivative.save(buffer, format="JPEG", quality=self.quality, optimize=True, progressive=True)
+        return buffer.getvalue()
+
+    def generate(self, source: Union[bytes, BinaryIO], original_path: str, store: StoreCallback) -> Dict[str, str]:
+        """
+        Generate every derivative of an original and store it
+
+        Args:
+            source: Original image bytes or a readable binary stream
+            original_path: Storage path of the original
+            store: Callback that uploads one derivative and returns its URL
+
+        Returns:
+            Dict mapping size (as string) to the derivative URL. Sizes that
+            failed are left out.
+        """
+        image = self.load(source)
+        _, content_type = FORMAT_EXTENSIONS[self.fmt]
+
+        def build(size: int) -> str:
+            path = derivative_path(original_path, size, self.fmt)
+            return store(path, self.render(image, size), content_type)
+
+        futures = {size: self.executor.submit(build, size) for size in self.sizes}
+
+        urls = {}
+        for size, future in futures.items():
+            try:
+                urls[str(size)] = future.result()
+            except Exception as e:
+                logger.error(f"Error generating {size}px derivative of {original_path}: {e}")
+        return urls
+
+
+# Global instance
+image_derivative_pipeline = ImageDerivativePipeline()
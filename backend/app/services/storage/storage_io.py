@@ -0,0 +1,155 @@
+"""
+Storage I/O - TuCitaSegura
+
+Non-blocking access to Cloud Storage for async handlers:
+- One bucket/client per process, resolved once and reused
+- Blocking SDK calls run in a bounded thread pool, off the event loop
+- Resumable chunked uploads for large (or unknown-size) files
+- Public ACL applied in the upload request itself (no make_public round-trip)
+- Local filesystem backend for tests and development
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import BinaryIO, Callable, Optional, TypeVar, Union
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Resumable upload chunks must be a multiple of 256 KiB
+_CHUNK_ALIGNMENT = 256 * 1024
+
+
+class GCSStorageBackend:
+    """Cloud Storage backend built on the Firebase Admin bucket"""
+
+    def __init__(
+        self,
+        bucket_name: str,
+        resumable_threshold: int = settings.STORAGE_RESUMABLE_THRESHOLD,
+        chunk_size: int = settings.STORAGE_CHUNK_SIZE
+    ):
+        self.bucket_name = bucket_name
+        self.resumable_threshold = resumable_threshold
+        self.chunk_size = max(_CHUNK_ALIGNMENT, chunk_size - chunk_size % _CHUNK_ALIGNMENT)
+        self._bucket = None
+        self._lock = threading.Lock()
+
+    @property
+    def bucket(self):
+        """Bucket handle, created once per process"""
+        if self._bucket is None:
+            with self._lock:
+                if self._bucket is None:
+                    from firebase_admin import storage
+                    self._bucket = storage.bucket(self.bucket_name)
+        return self._bucket
+
+    def upload(
+        self,
+        path: str,
+        data: Union[bytes, BinaryIO],
+        content_type: Optional[str] = None,
+        size: Optional[int] = None,
+        public: bool = True
+    ) -> str:
+        """Upload bytes or a stream and return the public URL"""
+        blob = self.bucket.blob(path)
+        stream = BytesIO(data) if isinstance(data, (bytes, bytearray)) else data
+        if isinstance(data, (bytes, bytearray)):
+            size = len(data)
+
+        # Large or unknown-size payloads go through a resumable session so
+        # they are sent in chunks instead of being read into memory at once
+        if size is None or size > self.resumable_threshold:
+            blob.chunk_size = self.chunk_size
+
+        blob.upload_from_file(
+            stream,
+            size=size,
+            content_type=content_type,
+            predefined_acl="publicRead" if public else None
+        )
+        return blob.public_url
+
+    def delete(self, path: str) -> None:
+        self.bucket.blob(path).delete()
+
+
+class LocalStorageBackend:
+    """Filesystem backend with the same interface, for tests and development"""
+
+    def __init__(self, root: str, base_url: Optional[str] = None):
+        self.root = os.path.abspath(root)
+        self.base_url = (base_url or f"file://{self.root}").rstrip("/")
+
+    def _full_path(self, path: str) -> str:
+        full_path = os.path.abspath(os.path.join(self.root, *path.split("/")))
+        if not full_path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid storage path: {path}")
+        return full_path
+
+    def upload(
+        self,
+        path: str,
+        data: Union[bytes, BinaryIO],
+        content_type: Optional[str] = None,
+        size: Optional[int] = None,
+        public: bool = True
+    ) -> str:
+        full_path = self._full_path(path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "wb") as fh:
+            if isinstance(data, (bytes, bytearray)):
+                fh.write(data)
+            else:
+                shutil.copyfileobj(data, fh, length=_CHUNK_ALIGNMENT)
+        return f"{self.base_url}/{path}"
+
+    def delete(self, path: str) -> None:
+        os.remove(self._full_path(path))
+
+
+class StorageIO:
+    """Runs a storage backend's blocking calls on a bounded thread pool"""
+
+    def __init__(self, backend, max_workers: int = settings.STORAGE_MAX_WORKERS):
+        self.backend = backend
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="storage-io"
+        )
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Run any blocking callable on the storage pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: fn(*args, **kwargs))
+
+    async def upload(
+        self,
+        path: str,
+        data: Union[bytes, BinaryIO],
+        content_type: Optional[str] = None,
+        size: Optional[int] = None,
+        public: bool = True
+    ) -> str:
+        """Upload without blocking the event loop; returns the public URL"""
+        return await self.run(self.backend.upload, path, data, content_type, size, public)
+
+    async def delete(self, path: str) -> None:
+        await self.run(self.backend.delete, path)
+
+
+def create_storage_backend(bucket_name: str):
+    """Build the backend selected by STORAGE_BACKEND ("gcs" or "local")"""
+    if settings.STORAGE_BACKEND == "local":
+        return LocalStorageBackend(settings.STORAGE_LOCAL_ROOT, settings.STORAGE_LOCAL_BASE_URL or None)
+    return GCSStorageBackend(bucket_name)
@@ -18,7 +18,14 @@ from .app_check_metrics import (
     AppCheckMetrics,
     get_metrics,
     detect_legacy_sdk,
-    extract_client_version
+    extract_client_version,
+    route_template
+)
+from .metrics_core import (
+    LabeledCounter,
+    MetricsRegistry,
+    metrics_registry,
+    render_prometheus
 )
 
 __all__ = [
@@ -36,5 +43,10 @@ __all__ = [
     "AppCheckMetrics",
     "get_metrics",
     "detect_legacy_sdk",
-    "extract_client_version"
+    "extract_client_version",
+    "route_template",
+    "LabeledCounter",
+    "MetricsRegistry",
+    "metrics_registry",
+    "render_prometheus"
 ]
@@ -4,32 +4,75 @@ Utilidad para monitorear la migración de versiones antiguas del SDK.
 """
 from typing import Dict, Optional
 from datetime import datetime
-from collections import defaultdict
-import threading
 import logging
 
+from app.utils.metrics_core import MetricsRegistry, metrics_registry
+
 logger = logging.getLogger("metrics.app_check")
 
+# Límites de cardinalidad (el resto va a la serie "__overflow__")
+MAX_PATH_SERIES = 200
+MAX_CLIENT_VERSION_SERIES = 100
+
+# Etiqueta de path para peticiones que no coinciden con ninguna ruta
+UNMATCHED_PATH = "<unmatched>"
+
+
+def route_template(scope: Dict) -> str:
+    """
+    Plantilla de la ruta que atendió la petición ("/api/emergency/phones/{phone_id}")
+    en lugar del path crudo, para no crear una serie por cada id.
+
+    Solo está disponible después del enrutado (scope["route"] lo pone FastAPI).
+    """
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path:
+        return scope.get("root_path", "") + path
+    return UNMATCHED_PATH
+
+
+def _result(has_app_check: bool, token_valid: bool) -> str:
+    if has_app_check:
+        return 'with_app_check' if token_valid else 'invalid_token'
+    return 'without_app_check'
+
 
 class AppCheckMetrics:
     """
-    Clase thread-safe para rastrear métricas de App Check.
-    Mantiene contadores simples que pueden extenderse a Prometheus/Cloud Monitoring.
+    Métricas de App Check sobre contadores particionados por hilo.
+    record_request no toma ningún lock global; los shards se suman al leer
+    (get_stats, /metrics o el flush a Cloud Monitoring).
     """
     
-    def __init__(self):
-        self._lock = threading.Lock()
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        registry = registry or MetricsRegistry()
+        self.registry = registry
         # Contadores por tipo de solicitud
-        self._counters = {
-            'with_app_check': 0,
-            'without_app_check': 0,
-            'invalid_token': 0,
-            'legacy_sdk': 0,  # Solicitudes que parecen ser de versiones antiguas
-        }
+        self._requests = registry.counter(
+            "app_check_requests_total",
+            "Solicitudes por resultado de App Check",
+            ("result",)
+        )
+        # Solicitudes que parecen ser de versiones antiguas
+        self._legacy = registry.counter(
+            "app_check_legacy_sdk_total",
+            "Solicitudes sin App Check de SDKs antiguos"
+        )
         # Agregación por versión del cliente
-        self._by_client_version: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
-        # Agregación por path
-        self._by_path: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._by_client_version = registry.counter(
+            "app_check_requests_by_client_version_total",
+            "Solicitudes por versión del cliente y resultado",
+            ("client_version", "result"),
+            max_series=MAX_CLIENT_VERSION_SERIES
+        )
+        # Agregación por plantilla de ruta
+        self._by_path = registry.counter(
+            "app_check_requests_by_path_total",
+            "Solicitudes por ruta y resultado",
+            ("path", "result"),
+            max_series=MAX_PATH_SERIES
+        )
         # Timestamp de la última solicitud sin App Check
         self._last_missing_app_check: Optional[datetime] = None
     
@@ -47,41 +90,40 @@ class AppCheckMetrics:
         Args:
             has_app_check: Si la solicitud tiene token de App Check
             client_version: Versión del cliente (ej: "webapp/1.0.0" o "firebase-js/9.0.0")
-            path: Path de la solicitud
+            path: Plantilla de la ruta (ver route_template)
             is_legacy: Si parece ser de una versión antigua del SDK
             token_valid: Si el token de App Check es válido (solo relevante si has_app_check=True)
         """
-        with self._lock:
-            if has_app_check:
-                if token_valid:
-                    self._counters['with_app_check'] += 1
-                else:
-                    self._counters['invalid_token'] += 1
-            else:
-                self._counters['without_app_check'] += 1
-                self._last_missing_app_check = datetime.utcnow()
-                if is_legacy:
-                    self._counters['legacy_sdk'] += 1
-            
-            # Agregación por versión del cliente
-            if client_version:
-                if has_app_check and token_valid:
-                    self._by_client_version[client_version]['with_app_check'] += 1
-                elif has_app_check and not token_valid:
-                    self._by_client_version[client_version]['invalid_token'] += 1
-                else:
-                    self._by_client_version[client_version]['without_app_check'] += 1
-                    if is_legacy:
-                        self._by_client_version[client_version]['legacy_sdk'] += 1
-            
-            # Agregación por path
-            if path:
-                if has_app_check and token_valid:
-                    self._by_path[path]['with_app_check'] += 1
-                elif has_app_check and not token_valid:
-                    self._by_path[path]['invalid_token'] += 1
-                else:
-                    self._by_path[path]['without_app_check'] += 1
+        result = _result(has_app_check, token_valid)
+        self._requests.inc(result)
+        if not has_app_check:
+            self._last_missing_app_check = datetime.utcnow()
+            if is_legacy:
+                self._legacy.inc()
+        
+        # Agregación por versión del cliente
+        if client_version:
+            self._by_client_version.inc(client_version, result)
+            if not has_app_check and is_legacy:
+                self._by_client_version.inc(client_version, 'legacy_sdk')
+        
+        # Agregación por path
+        if path:
+            self._by_path.inc(path, result)
+    
+    def _counters(self) -> Dict[str, int]:
+        counters = {'with_app_check': 0, 'without_app_check': 0, 'invalid_token': 0}
+        for (result,), value in self._requests.collect().items():
+            counters[result] = counters.get(result, 0) + value
+        counters['legacy_sdk'] = self._legacy.total()
+        return counters
+    
+    @staticmethod
+    def _nested(collected: Dict) -> Dict[str, Dict[str, int]]:
+        nested: Dict[str, Dict[str, int]] = {}
+        for (label, result), value in collected.items():
+            nested.setdefault(label, {})[result] = value
+        return nested
     
     def get_stats(self) -> Dict:
         """
@@ -90,36 +132,30 @@ class AppCheckMetrics:
         Returns:
             Dict con contadores y agregaciones
         """
-        with self._lock:
-            total = sum(self._counters.values())
-            return {
-                'counters': dict(self._counters),
-                'total_requests': total,
-                'coverage_percentage': (
-                    (self._counters['with_app_check'] / total * 100) 
-                    if total > 0 else 0
-                ),
-                'last_missing_app_check': (
-                    self._last_missing_app_check.isoformat() 
-                    if self._last_missing_app_check else None
-                ),
-                'by_client_version': {
-                    version: dict(stats) 
-                    for version, stats in self._by_client_version.items()
-                },
-                'by_path': {
-                    path: dict(stats) 
-                    for path, stats in list(self._by_path.items())[:20]  # Limitar a top 20
-                }
-            }
+        counters = self._counters()
+        total = sum(counters.values())
+        by_path = self._nested(self._by_path.collect())
+        top_paths = sorted(by_path.items(), key=lambda item: sum(item[1].values()), reverse=True)[:20]
+        return {
+            'counters': counters,
+            'total_requests': total,
+            'coverage_percentage': (
+                (counters['with_app_check'] / total * 100) 
+                if total > 0 else 0
+            ),
+            'last_missing_app_check': (
+                self._last_missing_app_check.isoformat() 
+                if self._last_missing_app_check else None
+            ),
+            'by_client_version': self._nested(self._by_client_version.collect()),
+            'by_path': dict(top_paths)  # Limitar a top 20
+        }
     
     def reset(self):
         """Resetear todas las métricas (útil para testing)."""
-        with self._lock:
-            self._counters.clear()
-            self._by_client_version.clear()
-            self._by_path.clear()
-            self._last_missing_app_check = None
+        for counter in (self._requests, self._legacy, self._by_client_version, self._by_path):
+            counter.reset()
+        self._last_missing_app_check = None
     
     def get_coverage_percentage(self) -> float:
         """
@@ -128,14 +164,14 @@ class AppCheckMetrics:
         Returns:
             Porcentaje entre 0 y 100
         """
-        with self._lock:
-            total = sum(self._counters.values())
-            if total == 0:
-                return 0.0
-            return (self._counters['with_app_check'] / total) * 100
+        counters = self._counters()
+        total = sum(counters.values())
+        if total == 0:
+            return 0.0
+        return (counters['with_app_check'] / total) * 100
 
 
-# Instancia global (thread-safe)
+# Instancia global (registrada en el registro exportado por /metrics)
 _metrics_instance: Optional[AppCheckMetrics] = None
 
 
@@ -148,7 +184,7 @@ def get_metrics() -> AppCheckMetrics:
     """
     global _metrics_instance
     if _metrics_instance is None:
-        _metrics_instance = AppCheckMetrics()
+        _metrics_instance = AppCheckMetrics(metrics_registry)
     return _metrics_instance
 
 
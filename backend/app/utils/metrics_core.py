@@ -0,0 +1,342 @@
+"""
+Núcleo de métricas: contadores con etiquetas sin lock en el camino caliente.
+
+- Cada hilo incrementa su propio shard (dict) y los shards se suman al leer
+- Cardinalidad acotada por contador: las series nuevas que superan el máximo
+  se agrupan en la etiqueta OVERFLOW_LABEL
+- Histogramas de latencia acumulativos construidos sobre contadores; se
+  exponen como una familia `histogram` (series _bucket{le=...}, _sum y
+  _count) y como DISTRIBUTION en Cloud Monitoring
+- Exposición en formato de texto de Prometheus (render_prometheus)
+- Exportador opcional a Cloud Monitoring con flush periódico
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("metrics.core")
+
+OVERFLOW_LABEL = "__overflow__"
+
+# Límites (ms) por defecto de los histogramas de latencia
+DEFAULT_LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+LabelValues = Tuple[str, ...]
+
+
+class LabeledCounter:
+    """
+    Contador monotónico con etiquetas, particionado por hilo.
+
+    inc() solo toca el dict del hilo actual (un único escritor por shard),
+    así que no necesita lock; el lock solo se toma al registrar un hilo
+    nuevo o una serie nueva.
+    """
+
+    def __init__(self, name: str, help_text: str, label_names: Iterable[str] = (), max_series: int = 1000):
+        self.name = name
+        self.help_text = help_text
+        self.label_names: Tuple[str, ...] = tuple(label_names)
+        self.max_series = max_series
+        self._local = threading.local()
+        self._shards: List[Dict[LabelValues, int]] = []
+        self._series: set = set()
+        self._lock = threading.Lock()
+
+    def _shard(self) -> Dict[LabelValues, int]:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def _bounded(self, labels: LabelValues) -> LabelValues:
+        if labels in self._series:
+            return labels
+        with self._lock:
+            if labels in self._series:
+                return labels
+            if len(self._series) < self.max_series:
+                self._series.add(labels)
+                return labels
+            overflow = (OVERFLOW_LABEL,) * len(labels)
+            self._series.add(overflow)
+            return overflow
+
+    def inc(self, *labels: str, amount: int = 1) -> None:
+        """Incrementar la serie con los valores de etiqueta dados (en orden)"""
+        key = self._bounded(tuple(labels))
+        shard = self._shard()
+        shard[key] = shard.get(key, 0) + amount
+
+    def collect(self) -> Dict[LabelValues, int]:
+        """Sumar todos los shards"""
+        with self._lock:
+            shards = list(self._shards)
+        totals: Dict[LabelValues, int] = {}
+        for shard in shards:
+            for key, value in dict(shard).items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def total(self) -> int:
+        return sum(self.collect().values())
+
+    def reset(self) -> None:
+        with self._lock:
+            for shard in self._shards:
+                shard.clear()
+            self._series.clear()
+
+
+class LabeledHistogram:
+    """
+    Histograma acumulativo con etiquetas sobre tres contadores internos
+    (buckets con etiqueta le, suma y número de observaciones). No se
+    registran como contadores: se exportan juntos como un histograma.
+
+    Los valores se redondean a enteros (usar milisegundos para latencias).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        label_names: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS_MS
+    ):
+        self.name = name
+        self.help_text = help_text
+        self.label_names: Tuple[str, ...] = tuple(label_names)
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        self._bucket = LabeledCounter(f"{name}_bucket", help_text, self.label_names + ("le",))
+        self._sum = LabeledCounter(f"{name}_sum", help_text, self.label_names)
+        self._count = LabeledCounter(f"{name}_count", help_text, self.label_names)
+
+    def observe(self, *labels: str, value: float) -> None:
+        """Registrar una observación para la serie con esas etiquetas"""
+        for bound in self.buckets:
+            if value <= bound:
+                self._bucket.inc(*labels, str(bound))
+        self._bucket.inc(*labels, "+Inf")
+        self._sum.inc(*labels, amount=int(round(value)))
+        self._count.inc(*labels)
+
+    def collect(self) -> Dict[LabelValues, Tuple[List[int], int, int]]:
+        """
+        Por serie: (conteos acumulados por bucket, +Inf incluido al final;
+        suma; número de observaciones)
+        """
+        buckets = self._bucket.collect()
+        sums = self._sum.collect()
+        return {
+            labels: (
+                [buckets.get(labels + (str(bound),), 0) for bound in self.buckets] + [count],
+                sums.get(labels, 0),
+                count
+            )
+            for labels, count in self._count.collect().items()
+        }
+
+    def summary(self) -> Dict[LabelValues, Dict[str, Optional[float]]]:
+        """
+        Resumen por serie: count, mean y p50/p95/p99 estimados como el
+        límite superior del bucket donde cae el percentil (None = por
+        encima del último bucket)
+        """
+        buckets = self._bucket.collect()
+        sums = self._sum.collect()
+        result: Dict[LabelValues, Dict[str, Optional[float]]] = {}
+        for labels, count in self._count.collect().items():
+            if not count:
+                continue
+            stats: Dict[str, Optional[float]] = {
+                "count": count,
+                "mean": round(sums.get(labels, 0) / count, 2)
+            }
+            for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+                stats[name] = next(
+                    (bound for bound in self.buckets if buckets.get(labels + (str(bound),), 0) >= fraction * count),
+                    None
+                )
+            result[labels] = stats
+        return result
+
+
+class MetricsRegistry:
+    """Conjunto de contadores exportables"""
+
+    def __init__(self):
+        self._counters: Dict[str, LabeledCounter] = {}
+        self._histograms: Dict[str, LabeledHistogram] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str, label_names: Iterable[str] = (), max_series: int = 1000) -> LabeledCounter:
+        """Obtener (o crear) un contador por nombre"""
+        with self._lock:
+            counter = self._counters.get(name)
+            if counter is None:
+                counter = LabeledCounter(name, help_text, label_names, max_series)
+                self._counters[name] = counter
+            return counter
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        label_names: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS_MS
+    ) -> LabeledHistogram:
+        """Obtener (o crear) un histograma por nombre"""
+        with self._lock:
+            histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = LabeledHistogram(name, help_text, label_names, buckets)
+            with self._lock:
+                histogram = self._histograms.setdefault(name, histogram)
+        return histogram
+
+    def counters(self) -> List[LabeledCounter]:
+        with self._lock:
+            return list(self._counters.values())
+
+    def histograms(self) -> List[LabeledHistogram]:
+        with self._lock:
+            return list(self._histograms.values())
+
+
+def _escape_label_value(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _render_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    rendered = ",".join(f'{name}="{_escape_label_value(v)}"' for name, v in zip(names, values))
+    return f"{{{rendered}}}" if rendered else ""
+
+
+def render_prometheus(registry: "MetricsRegistry") -> str:
+    """Exportar contadores e histogramas en formato de texto de Prometheus 0.0.4"""
+    lines = []
+    for counter in registry.counters():
+        lines.append(f"# HELP {counter.name} {counter.help_text}")
+        lines.append(f"# TYPE {counter.name} counter")
+        for labels, value in sorted(counter.collect().items()):
+            lines.append(f"{counter.name}{_render_labels(counter.label_names, labels)} {value}")
+    for histogram in registry.histograms():
+        lines.append(f"# HELP {histogram.name} {histogram.help_text}")
+        lines.append(f"# TYPE {histogram.name} histogram")
+        bounds = [str(bound) for bound in histogram.buckets] + ["+Inf"]
+        for labels, (cumulative, total, count) in sorted(histogram.collect().items()):
+            bucket_names = histogram.label_names + ("le",)
+            for bound, value in zip(bounds, cumulative):
+                lines.append(f"{histogram.name}_bucket{_render_labels(bucket_names, labels + (bound,))} {value}")
+            rendered = _render_labels(histogram.label_names, labels)
+            lines.append(f"{histogram.name}_sum{rendered} {total}")
+            lines.append(f"{histogram.name}_count{rendered} {count}")
+    return "\n".join(lines) + "\n"
+
+
+class CloudMonitoringExporter:
+    """
+    Flush periódico de los contadores (INT64) y los histogramas
+    (DISTRIBUTION) a Cloud Monitoring como métricas
+    custom.googleapis.com/{prefix}/{nombre} (CUMULATIVE).
+
+    Requiere google-cloud-monitoring; si no está instalado no hace nada.
+    """
+
+    BATCH_SIZE = 200  # máximo de series por create_time_series
+
+    def __init__(self, registry: "MetricsRegistry", project_id: str, prefix: str = "tucitasegura", interval: float = 60.0):
+        self.registry = registry
+        self.project_id = project_id
+        self.prefix = prefix
+        self.interval = interval
+        self.start_time = time.time()
+        self._client = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _time_series(self) -> list:
+        from google.cloud import monitoring_v3
+
+        now = time.time()
+        interval = monitoring_v3.TimeInterval({
+            "start_time": {"seconds": int(self.start_time)},
+            "end_time": {"seconds": int(now), "nanos": int((now % 1) * 1e9)},
+        })
+        series_list = []
+        for counter in self.registry.counters():
+            for labels, value in counter.collect().items():
+                series = monitoring_v3.TimeSeries()
+                series.metric.type = f"custom.googleapis.com/{self.prefix}/{counter.name}"
+                series.metric.labels.update(dict(zip(counter.label_names, labels)))
+                series.resource.type = "global"
+                series.metric_kind = monitoring_v3.MetricDescriptor.MetricKind.CUMULATIVE
+                series.points = [monitoring_v3.Point({"interval": interval, "value": {"int64_value": value}})]
+                series_list.append(series)
+        for histogram in self.registry.histograms():
+            for labels, (cumulative, total, count) in histogram.collect().items():
+                # Cloud Monitoring espera conteos por bucket, no acumulados
+                bucket_counts = [cumulative[0]] + [b - a for a, b in zip(cumulative, cumulative[1:])]
+                series = monitoring_v3.TimeSeries()
+                series.metric.type = f"custom.googleapis.com/{self.prefix}/{histogram.name}"
+                series.metric.labels.update(dict(zip(histogram.label_names, labels)))
+                series.resource.type = "global"
+                series.metric_kind = monitoring_v3.MetricDescriptor.MetricKind.CUMULATIVE
+                series.value_type = monitoring_v3.MetricDescriptor.ValueType.DISTRIBUTION
+                series.points = [monitoring_v3.Point({"interval": interval, "value": {"distribution_value": {
+                    "count": count,
+                    "mean": total / count if count else 0.0,
+                    "bucket_options": {"explicit_buckets": {"bounds": list(histogram.buckets)}},
+                    "bucket_counts": bucket_counts,
+                }}})]
+                series_list.append(series)
+        return series_list
+
+    def flush(self) -> int:
+        """Enviar el estado actual (bloqueante). Devuelve el número de series"""
+        from google.cloud import monitoring_v3
+
+        if self._client is None:
+            self._client = monitoring_v3.MetricServiceClient()
+        series_list = self._time_series()
+        for i in range(0, len(series_list), self.BATCH_SIZE):
+            self._client.create_time_series(
+                name=f"projects/{self.project_id}",
+                time_series=series_list[i:i + self.BATCH_SIZE]
+            )
+        return len(series_list)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await loop.run_in_executor(None, self.flush)
+            except Exception as e:
+                logger.warning(f"Error enviando métricas a Cloud Monitoring: {e}")
+
+    def start(self) -> bool:
+        """Iniciar el flush en segundo plano si la librería está disponible"""
+        try:
+            from google.cloud import monitoring_v3  # noqa: F401
+        except ImportError:
+            logger.warning("google-cloud-monitoring no instalado; flush a Cloud Monitoring desactivado")
+            return False
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return True
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+# Registro global
+metrics_registry = MetricsRegistry()
@@ -4,12 +4,17 @@ Handles token verification and user authentication
 """
 
 import os
+import logging
 from typing import Optional
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from firebase_admin import auth, credentials, initialize_app, firestore
 from dotenv import load_dotenv
 
+from app.middleware.auth_context import get_auth_context
+
+logger = logging.getLogger(__name__)
+
 # Load environment variables
 load_dotenv()
 
@@ -64,12 +69,17 @@ security = HTTPBearer(auto_error=False)
 
 
 async def get_current_user(
+    request: Request,
     token: Optional[HTTPAuthorizationCredentials] = Depends(security)
 ) -> dict:
     """
     Verify Firebase ID token and return user information
 
+    The token is verified once per request through the request's
+    AuthContext and shared with every other auth dependency.
+
     Args:
+        request: Current request
         token: HTTP Bearer token from Authorization header
 
     Returns:
@@ -91,37 +101,22 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    # Raises 401 for invalid/expired/revoked tokens (503 if certificates are unavailable)
     try:
-        # Verify the ID token
-        decoded_token = auth.verify_id_token(token.credentials)
-        return decoded_token
-    except auth.ExpiredIdTokenError:
+        return await get_auth_context(request).verify_id_token()
+    except HTTPException as e:
+        if e.status_code != status.HTTP_500_INTERNAL_SERVER_ERROR:
+            raise
+        # Any other verification error rejects the token here (401), never a 500
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token expirado. Por favor, inicia sesión de nuevo.",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    except auth.RevokedIdTokenError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token revocado. Por favor, inicia sesión de nuevo.",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    except auth.InvalidIdTokenError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token inválido. Verifica que el token sea válido.",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"Error al verificar el token: {str(e)}",
+            detail="Error al verificar el token.",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
 
 async def get_optional_user(
+    request: Request,
     token: Optional[HTTPAuthorizationCredentials] = Depends(security)
 ) -> Optional[dict]:
     """
@@ -129,6 +124,7 @@ async def get_optional_user(
     Returns None if no token provided, otherwise validates it
 
     Args:
+        request: Current request
         token: HTTP Bearer token from Authorization header
 
     Returns:
@@ -138,8 +134,7 @@ async def get_optional_user(
         return None
 
     try:
-        decoded_token = auth.verify_id_token(token.credentials)
-        return decoded_token
-    except Exception as e:
-        logger.warning(f"Error decoding optional token: {e}")
+        return await get_auth_context(request).verify_id_token()
+    except HTTPException as e:
+        logger.warning(f"Error decoding optional token: {e.detail}")
         return None
@@ -1,25 +1,40 @@
 """
 Firebase Storage utilities for file uploads
 Handles file uploads to Firebase Cloud Storage
+
+All functions are async: the blocking Cloud Storage calls run on the
+shared StorageIO thread pool, so concurrent uploads don't serialize the
+event loop. Set STORAGE_BACKEND=local to write to the filesystem instead
+(tests and development).
 """
 
 import os
-from firebase_admin import storage
 from dotenv import load_dotenv
 from uuid import uuid4
 
+from app.services.storage.image_derivatives import image_derivative_pipeline
+from app.services.storage.storage_io import StorageIO, create_storage_backend
+
 load_dotenv()
 
 bucket_name = os.getenv("FIREBASE_STORAGE_BUCKET", "tuscitasseguras-2d1a6.firebasestorage.app")
 
+# One backend (bucket/client) and one bounded I/O pool per process
+storage_io = StorageIO(create_storage_backend(bucket_name))
+
 
-def upload_file_to_storage(file, filename_prefix="upload"):
+async def upload_file_to_storage(file, filename_prefix="upload", content_type=None, size=None):
     """
     Upload a file to Firebase Storage
 
+    The upload streams from file.file, so a file already validated with
+    FileValidator.validate_upload_stream is not copied again.
+
     Args:
         file: UploadFile object from FastAPI
         filename_prefix: Prefix for the generated filename
+        content_type: Content type to store (defaults to file.content_type)
+        size: Size in bytes, if already known
 
     Returns:
         str: Public URL of the uploaded file
@@ -28,23 +43,21 @@ def upload_file_to_storage(file, filename_prefix="upload"):
         Exception: If upload fails
     """
     try:
-        bucket = storage.bucket(bucket_name)
-
         # Generate unique filename
         unique_name = f"{filename_prefix}_{uuid4().hex}.jpg"
 
-        # Create blob and upload
-        blob = bucket.blob(unique_name)
-        blob.upload_from_file(file.file, content_type=file.content_type)
-
-        # Make public and return URL
-        blob.make_public()
-        return blob.public_url
+        # Upload with a public ACL and return URL
+        return await storage_io.upload(
+            unique_name,
+            file.file,
+            content_type=content_type or file.content_type,
+            size=size
+        )
     except Exception as e:
         raise Exception(f"Error uploading file to Firebase Storage: {str(e)}")
 
 
-def upload_profile_photo(file, user_id: str, photo_type: str = "avatar"):
+async def upload_profile_photo(file, user_id: str, photo_type: str = "avatar", content_type=None, size=None):
     """
     Upload a profile photo to Firebase Storage
 
@@ -52,26 +65,54 @@ def upload_profile_photo(file, user_id: str, photo_type: str = "avatar"):
         file: UploadFile object
         user_id: User's Firebase UID
         photo_type: Type of photo (avatar, gallery_1, gallery_2, etc.)
+        content_type: Content type to store (defaults to file.content_type)
+        size: Size in bytes, if already known
 
     Returns:
         str: Public URL of the uploaded photo
     """
     try:
-        bucket = storage.bucket(bucket_name)
-
         # Create path: profile_photos/{user_id}/{photo_type}
         blob_path = f"profile_photos/{user_id}/{photo_type}"
 
-        blob = bucket.blob(blob_path)
-        blob.upload_from_file(file.file, content_type=file.content_type)
-        blob.make_public()
-
-        return blob.public_url
+        return await storage_io.upload(
+            blob_path,
+            file.file,
+            content_type=content_type or file.content_type,
+            size=size
+        )
     except Exception as e:
         raise Exception(f"Error uploading profile photo: {str(e)}")
 
 
-def delete_file_from_storage(file_path: str):
+async def generate_profile_photo_derivatives(file, user_id: str, photo_type: str = "avatar"):
+    """
+    Generate resized, EXIF-free variants of a profile photo and store them
+    next to the original (profile_photos/{user_id}/{photo_type}_{size}.webp)
+
+    Args:
+        file: UploadFile object already uploaded with upload_profile_photo
+        user_id: User's Firebase UID
+        photo_type: Type of photo (avatar, gallery_1, gallery_2, etc.)
+
+    Returns:
+        dict: Public URL of each derivative keyed by size ("96", "320", ...)
+    """
+    try:
+        original_path = f"profile_photos/{user_id}/{photo_type}"
+
+        def store(path, data, content_type):
+            return storage_io.backend.upload(path, data, content_type=content_type)
+
+        file.file.seek(0)
+        return await storage_io.run(
+            image_derivative_pipeline.generate, file.file, original_path, store
+        )
+    except Exception as e:
+        raise Exception(f"Error generating profile photo derivatives: {str(e)}")
+
+
+async def delete_file_from_storage(file_path: str):
     """
     Delete a file from Firebase Storage
 
@@ -82,9 +123,7 @@ def delete_file_from_storage(file_path: str):
         bool: True if deleted successfully
     """
     try:
-        bucket = storage.bucket(bucket_name)
-        blob = bucket.blob(file_path)
-        blob.delete()
+        await storage_io.delete(file_path)
         return True
     except Exception as e:
         print(f"Error deleting file: {str(e)}")
@@ -3,6 +3,7 @@ FastAPI Backend for TuCitaSegura (FZ6)
 Provides protected API endpoints with Firebase authentication
 """
 
+import hmac
 import os
 from dotenv import load_dotenv
 
@@ -12,9 +13,9 @@ load_dotenv()
 from enum import Enum
 from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from auth_utils import get_current_user, get_optional_user, firebase_initialized, db
-from firebase_storage import upload_file_to_storage, upload_profile_photo
+from firebase_storage import upload_file_to_storage, upload_profile_photo, generate_profile_photo_derivatives
 
 # Import logger for error handling
 import logging
@@ -24,11 +25,11 @@ logger = logging.getLogger(__name__)
 from app.api.v1 import recommendations, validation, moderation, debug_auth
 
 # Import rate limiting
-from app.middleware.rate_limit import limiter, custom_rate_limit_handler
+from app.middleware.rate_limit import limiter, custom_rate_limit_handler, rate_limit
 from slowapi.errors import RateLimitExceeded
 
 # Import CSRF protection
-from app.middleware.csrf_protection import CSRFProtection
+from app.middleware.csrf_protection import CSRFProtection, CSRFTokenSigner
 
 # Import Security Headers
 from app.middleware.security_headers import SecurityHeadersMiddleware
@@ -36,6 +37,26 @@ from app.middleware.security_headers import SecurityHeadersMiddleware
 # Import App Check Middleware
 from app.middleware.app_check import AppCheckMiddleware
 
+# Import request-scoped auth context
+from app.middleware.auth_context import AuthContextMiddleware, get_auth_context
+
+# Import local JWT verifier (background key refresh)
+from app.services.auth.jwt_verifier import local_jwt_verifier
+from app.services.security.event_sink import security_event_sink
+from app.services.health import health_service
+from app.services.payments.paypal_service import paypal_service
+from app.services.email import email_service
+
+# Import scheduled jobs
+from app.services.firestore.presence_cleanup import PresenceCleanupJob
+
+# Async Firestore data access (one shared AsyncClient per process)
+from app.services.firestore.repository import UserRepository
+
+# Import metrics (Prometheus exposition / Cloud Monitoring flush)
+from app.core.config import settings
+from app.utils.metrics_core import CloudMonitoringExporter, metrics_registry, render_prometheus
+
 # Create FastAPI app
 app = FastAPI(
     title="TuCitaSegura API",
@@ -45,6 +66,9 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
+# Repository for the users collection (non-blocking profile reads/writes)
+user_repository = UserRepository()
+
 # Add rate limiter state
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, custom_rate_limit_handler)
@@ -70,11 +94,31 @@ app.add_middleware(
 app.add_middleware(SecurityHeadersMiddleware)
 
 # Add CSRF Protection (must be added after CORS)
-# app.add_middleware(CSRFProtection)
+# Stateless signed tokens; requests with an Authorization header skip the check.
+# Never signs with an empty key: without CSRF_SECRET_KEYS/SECRET_KEY startup
+# fails, except in development where the middleware is left out with a warning
+csrf_enabled = settings.CSRF_ENABLED
+if csrf_enabled:
+    try:
+        csrf_signer = CSRFTokenSigner.from_settings()
+    except ValueError as e:
+        if settings.ENVIRONMENT != "development":
+            raise RuntimeError(f"CSRF protection is enabled but cannot start: {e}") from e
+        logger.warning(f"⚠️ CSRF Protection disabled in development: {e}")
+        csrf_enabled = False
+    else:
+        app.add_middleware(CSRFProtection, signer=csrf_signer)
 
 # Add App Check Protection (Validates X-Firebase-AppCheck header)
 # Exempt documentation and health check endpoints
-app.add_middleware(AppCheckMiddleware, exempt_paths=["/docs", "/redoc", "/openapi.json", "/api/health", "/", "/api/v1/debug/login"])
+# ("/" is only the root; prefix rules end in "/". Strict rules: APP_CHECK_HARD_PATHS)
+app.add_middleware(
+    AppCheckMiddleware,
+    exempt_paths=["/docs", "/redoc", "/openapi.json", "/api/health", "/health", "/metrics", "/", "/api/v1/debug/login", "/api/jobs/", "/api/payments/paypal/webhook"]
+)
+
+# Add request-scoped auth context (must run before App Check and the auth dependencies)
+app.add_middleware(AuthContextMiddleware)
 
 # Include routers
 app.include_router(recommendations.router, prefix="/api/v1/recommendations", tags=["Recommendations"])
@@ -82,9 +126,17 @@ app.include_router(validation.router, prefix="/api/v1/validation", tags=["Valida
 app.include_router(moderation.router, prefix="/api/v1/moderation", tags=["Moderation"])
 app.include_router(debug_auth.router, prefix="/api/v1/debug", tags=["Debug"])
 
+# PayPal webhooks only (the webhook queue and its handlers need Firebase Admin).
+# The rest of the payments API is not served from here
+paypal_webhook_queue = None
+if firebase_initialized:
+    from app.api import payments
+    from app.services.payments.webhook_processor import paypal_webhook_queue
+    app.include_router(payments.webhook_router, prefix="/api/payments")
+
 print(f"✅ CORS enabled for origins: {origins}")
 print("✅ Security Headers enabled (CSP, HSTS, X-Frame-Options, etc.)")
-print("✅ CSRF Protection enabled")
+print(f"✅ CSRF Protection {'enabled' if csrf_enabled else 'disabled'}")
 print("✅ App Check Validation enabled")
 
 # ============================================================================
@@ -117,14 +169,18 @@ class AllowedMimeType(str, Enum):
 # ============================================================================
 # APP CHECK ENFORCEMENT
 # ============================================================================
-def require_app_check(request: Request):
-    """App Check enforcement via HTTP header"""
+async def require_app_check(request: Request):
+    """App Check enforcement via HTTP header (reuses the middleware's verification)"""
     enforce = os.getenv("APP_CHECK_ENFORCE", "false").lower() == "true"
     if not enforce:
         return
-    token = request.headers.get("X-Firebase-AppCheck")
-    if not token or not token.strip():
+    context = get_auth_context(request)
+    if not context.app_check_token:
         raise HTTPException(status_code=401, detail="App Check token missing")
+    try:
+        await context.verify_app_check()
+    except Exception:
+        raise HTTPException(status_code=401, detail="App Check token invalid")
 
 
 # ============================================================================
@@ -153,6 +209,35 @@ def health_check():
     }
 
 
+def _metrics_authorized(request: Request) -> bool:
+    """Bearer METRICS_TOKEN check (open only in development without a token)"""
+    if not settings.METRICS_TOKEN and settings.ENVIRONMENT == "development":
+        return True
+    auth_header = request.headers.get("Authorization", "")
+    expected = f"Bearer {settings.METRICS_TOKEN}"
+    return bool(settings.METRICS_TOKEN) and hmac.compare_digest(auth_header.encode(), expected.encode())
+
+
+@app.get("/api/health")
+async def dependencies_health(request: Request):
+    """Dependency health from the background probes (no per-request I/O); details need METRICS_TOKEN"""
+    snapshot = await health_service.check_all()
+    if _metrics_authorized(request):
+        return snapshot
+    return health_service.public_view(snapshot)
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics(request: Request):
+    """Counters in Prometheus text format (bearer METRICS_TOKEN; open only in development without one)"""
+    if not _metrics_authorized(request):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return PlainTextResponse(
+        render_prometheus(metrics_registry),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 @app.get("/api/public")
 def public_route():
     """Public API endpoint - no authentication required"""
@@ -189,10 +274,8 @@ async def get_user_profile(user: dict = Depends(get_current_user)):
     # Fetch additional data from Firestore if available
     if db:
         try:
-            doc_ref = db.collection("users").document(user["uid"])
-            doc = doc_ref.get()
-            if doc.exists:
-                profile_data = doc.to_dict()
+            profile_data = await user_repository.get(user["uid"]) or {}
+            profile_data.pop("id", None)
         except Exception as e:
             logger.error(f"Error fetching user profile from Firestore: {e}")
 
@@ -211,7 +294,7 @@ async def get_user_profile(user: dict = Depends(get_current_user)):
     }
 
 
-@app.post("/api/upload")
+@app.post("/api/upload", dependencies=[Depends(rate_limit("upload"))])
 async def upload_image(
     file: UploadFile = File(...),
     user: dict = Depends(get_current_user),
@@ -222,8 +305,20 @@ async def upload_image(
     Requires authentication
     """
     try:
+        from app.services.security.file_validator import file_validator
+
+        # SECURITY: Stream-validate the upload (type sniffing, size limit) without buffering it
+        validation = await file_validator.validate_upload_stream(file, category="image")
+        if not validation.is_valid:
+            raise HTTPException(status_code=400, detail="; ".join(validation.errors))
+
         # Upload file with user ID prefix
-        url = upload_file_to_storage(file, filename_prefix=f"user_{user['uid']}")
+        url = await upload_file_to_storage(
+            file,
+            filename_prefix=f"user_{user['uid']}",
+            content_type=validation.mime_type,
+            size=validation.size_bytes
+        )
 
         return {
             "success": True,
@@ -231,6 +326,8 @@ async def upload_image(
             "message": "Imagen subida con éxito ✔️",
             "uploaded_by": user.get("uid")
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -238,7 +335,7 @@ async def upload_image(
         )
 
 
-@app.post("/api/upload/profile")
+@app.post("/api/upload/profile", dependencies=[Depends(rate_limit("upload"))])
 async def upload_profile_image(
     file: UploadFile = File(...),
     photo_type: PhotoType = PhotoType.avatar,  # SECURITY: Enum validation prevents injection
@@ -262,6 +359,7 @@ async def upload_profile_image(
     """
     try:
         from app.services.cv.photo_verifier import photo_verifier
+        from app.services.security.file_validator import file_validator
 
         # SECURITY: Validate file type (whitelist approach)
         if file.content_type not in [mime.value for mime in AllowedMimeType]:
@@ -270,17 +368,22 @@ async def upload_profile_image(
                 detail=f"Tipo de archivo no permitido. Tipos aceptados: {', '.join([mime.value for mime in AllowedMimeType])}"
             )
 
-        # SECURITY: Validate file size (max 5MB)
+        # SECURITY: Validate real type and size (max 5MB) by streaming the upload in chunks;
+        # oversized or wrong-type files are rejected before being fully read
         MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
-        file_content = await file.read()
-        if len(file_content) > MAX_FILE_SIZE:
+        validation = await file_validator.validate_upload_stream(
+            file, category="image", max_size=MAX_FILE_SIZE
+        )
+        if validation.metadata.get("truncated"):
             raise HTTPException(
                 status_code=400,
                 detail=f"Archivo muy grande. Tamaño máximo: 5MB"
             )
-
-        # Reset file pointer for upload
-        await file.seek(0)
+        if not validation.is_valid:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Archivo no válido: {'; '.join(validation.errors)}"
+            )
 
         # Validate photo type (now handled by Enum, but keeping for backwards compatibility)
         valid_types = ["avatar"] + [f"gallery_{i}" for i in range(1, 6)]
@@ -291,7 +394,27 @@ async def upload_profile_image(
             )
 
         # 1. Upload profile photo to Storage
-        url = upload_profile_photo(file, user["uid"], photo_type)
+        url = await upload_profile_photo(
+            file,
+            user["uid"],
+            photo_type,
+            content_type=validation.mime_type,
+            size=validation.size_bytes
+        )
+
+        # 1b. Generate thumbnails/WebP variants and record them on the profile,
+        # so feeds and cards don't download the full-size original
+        derivatives = {}
+        try:
+            derivatives = await generate_profile_photo_derivatives(file, user["uid"], photo_type)
+            if derivatives and db:
+                await user_repository.set(
+                    user["uid"],
+                    {"photoDerivatives": {photo_type.value: derivatives}},
+                    merge=True
+                )
+        except Exception as e:
+            logger.error(f"Error generating derivatives for user {user['uid']}: {e}")
 
         # 2. Verify photo using Computer Vision service
         # Note: In a real async architecture, this should be a background task
@@ -310,6 +433,7 @@ async def upload_profile_image(
             "success": True,
             "url": url,
             "photo_type": photo_type,
+            "derivatives": derivatives,
             "message": f"Foto procesada ({verification_result.recommendation})",
             "verification": {
                 "status": verification_result.recommendation,
@@ -392,6 +516,8 @@ async def cleanup_presence_job(request: Request):
     """
     Job to mark inactive users as offline.
     Should be called every 15-30 minutes by a scheduler.
+    Server-side query, paged with cursors, concurrent batch commits and a
+    per-page checkpoint (see PresenceCleanupJob).
     Protected by a secret header or App Check (basic version here).
     """
     # Security: In production, verify a secret "cron" header
@@ -402,64 +528,20 @@ async def cleanup_presence_job(request: Request):
     if not db:
         raise HTTPException(status_code=503, detail="Database not available")
 
-    try:
-        from datetime import datetime, timedelta, timezone
-        
-        # Threshold: 1 hour ago
-        threshold_time = datetime.now(timezone.utc) - timedelta(hours=1)
-        
-        # Query: isOnline == true
-        users_ref = db.collection("users")
-        query = users_ref.where("isOnline", "==", True)
-        
-        # Execute query
-        docs = query.stream()
-        
-        batch = db.batch()
-        count = 0
-        updated_uids = []
-
-        for doc in docs:
-            user_data = doc.to_dict()
-            last_activity = user_data.get("lastActivity")
-            
-            # Check if lastActivity is older than threshold
-            # Firestore timestamps need conversion
-            if last_activity:
-                # Handle Firestore Timestamp object or datetime string
-                last_active_date = None
-                if hasattr(last_activity, 'timestamp'):
-                    last_active_date = last_activity.timestamp() # datetime
-                elif hasattr(last_activity, 'to_datetime'):
-                    last_active_date = last_activity.to_datetime()
-                
-                # If we have a valid date and it's older than threshold
-                if last_active_date and last_active_date < threshold_time:
-                    batch.update(doc.reference, {"isOnline": False})
-                    updated_uids.append(doc.id)
-                    count += 1
-            else:
-                # No activity date? Mark offline to be safe if they are stuck
-                batch.update(doc.reference, {"isOnline": False})
-                updated_uids.append(doc.id)
-                count += 1
-                
-            # Commit batches of 500
-            if count >= 400:
-                batch.commit()
-                batch = db.batch()
-                count = 0
-
-        # Commit remaining
-        if count > 0:
-            batch.commit()
-
-        logger.info(f"Cleanup Job: Marked {len(updated_uids)} users offline. UIDs: {updated_uids}")
+    job = PresenceCleanupJob(
+        db,
+        timeout_minutes=settings.PRESENCE_TIMEOUT_MINUTES,
+        page_size=settings.PRESENCE_CLEANUP_PAGE_SIZE,
+        max_in_flight=settings.PRESENCE_CLEANUP_MAX_IN_FLIGHT
+    )
 
+    try:
+        stats = await job.run()
         return {
             "success": True,
-            "processed": len(updated_uids),
-            "start_time": threshold_time.isoformat()
+            "processed": stats["updated"],
+            "start_time": stats["threshold"],
+            "stats": stats
         }
 
     except Exception as e:
@@ -485,6 +567,63 @@ async def startup_event():
     print(f"📚 API Docs: /docs")
     print("=" * 60)
 
+    # Keep Google signing keys for ID/App Check tokens warm in the background
+    await local_jwt_verifier.start()
+
+    # Batched background writer for security/audit logs
+    security_event_sink.start()
+
+    # Read-only dependency probes on their own schedules (served by /api/health)
+    health_service.start()
+
+    # Email outbox workers; resume messages left pending by a previous instance
+    try:
+        await email_service.outbox.recover()
+    except Exception as e:
+        logger.error(f"Could not recover pending outbox emails: {e}")
+
+    # PayPal webhook workers; resume events left unprocessed (or with an expired claim)
+    if paypal_webhook_queue is not None:
+        paypal_webhook_queue.start()
+        try:
+            await paypal_webhook_queue.recover()
+        except Exception as e:
+            logger.error(f"Could not recover pending PayPal webhooks: {e}")
+
+    # Optional periodic flush of the metrics to Cloud Monitoring
+    if settings.METRICS_CLOUD_MONITORING_ENABLED and settings.FIREBASE_PROJECT_ID:
+        app.state.metrics_exporter = CloudMonitoringExporter(
+            metrics_registry,
+            settings.FIREBASE_PROJECT_ID,
+            interval=settings.METRICS_FLUSH_INTERVAL
+        )
+        app.state.metrics_exporter.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Run on application shutdown"""
+    await local_jwt_verifier.stop()
+
+    # Write whatever security/audit events are still queued
+    await security_event_sink.stop()
+
+    await health_service.stop()
+
+    # Close pooled keep-alive connections to PayPal
+    await paypal_service.aclose()
+
+    # Stop outbox workers and close pooled SMTP connections (unsent mail stays pending)
+    await email_service.outbox.stop()
+
+    # Stop webhook workers (queued events stay in Firestore for the next start)
+    if paypal_webhook_queue is not None:
+        await paypal_webhook_queue.stop()
+
+    exporter = getattr(app.state, "metrics_exporter", None)
+    if exporter is not None:
+        await exporter.stop()
+
 
 if __name__ == "__main__":
     import uvicorn
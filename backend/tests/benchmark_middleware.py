@@ -0,0 +1,132 @@
+"""
+Micro-benchmark: per-request overhead of the middleware stack
+
+Compares the pure ASGI middlewares against the previous
+BaseHTTPMiddleware-based implementation (reproduced below with the same
+logic) by calling the ASGI app directly, without a server or HTTP client.
+
+Usage:
+    python -m tests.benchmark_middleware [requests]
+"""
+
+import asyncio
+import sys
+import time
+
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse
+
+from app.middleware.app_check import AppCheckMiddleware
+from app.middleware.csrf_protection import CSRFProtection
+from app.middleware.security_headers import SecurityHeadersMiddleware
+
+
+async def endpoint(scope, receive, send):
+    await JSONResponse({"ok": True})(scope, receive, send)
+
+
+class LegacySecurityHeaders(BaseHTTPMiddleware):
+    """Previous implementation: header block rebuilt on every response"""
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.builder = SecurityHeadersMiddleware(app, environment="development")
+
+    async def dispatch(self, request, call_next):
+        response = await call_next(request)
+        headers = self.builder._build_static_headers()
+        if request.url.path.startswith("/api/"):
+            headers.update(self.builder._build_api_headers())
+        response.headers.update(headers)
+        return response
+
+
+class LegacyAppCheck(BaseHTTPMiddleware):
+    def __init__(self, app):
+        super().__init__(app)
+        self.checker = AppCheckMiddleware(app, exempt_paths=["/docs"])
+
+    async def dispatch(self, request, call_next):
+        await self.checker._check(request)
+        return await call_next(request)
+
+
+class LegacyCSRF(BaseHTTPMiddleware):
+    def __init__(self, app):
+        super().__init__(app)
+        self.csrf = CSRFProtection(app, secret_key="benchmark")
+
+    async def dispatch(self, request, call_next):
+        response = await call_next(request)
+        token = request.cookies.get(self.csrf.cookie_name) or self.csrf._generate_csrf_token()
+        response.set_cookie(self.csrf.cookie_name, token, max_age=3600 * 24, httponly=True, samesite="lax")
+        response.headers[self.csrf.header_name] = token
+        return response
+
+
+def build_stacks():
+    legacy = LegacySecurityHeaders(LegacyAppCheck(LegacyCSRF(endpoint)))
+    asgi = SecurityHeadersMiddleware(
+        AppCheckMiddleware(CSRFProtection(endpoint, secret_key="benchmark"), exempt_paths=["/docs"]),
+        environment="development",
+    )
+    return {"bare endpoint": endpoint, "BaseHTTPMiddleware stack": legacy, "pure ASGI stack": asgi}
+
+
+def _scope():
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/api/items",
+        "raw_path": b"/api/items",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"testserver"), (b"user-agent", b"benchmark")],
+        "client": ("203.0.113.1", 50000),
+        "server": ("testserver", 80),
+    }
+
+
+def _receiver():
+    """Request body once, then wait (like a client that stays connected)"""
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    return receive
+
+
+async def _send(message):
+    pass
+
+
+async def run(app, requests: int) -> float:
+    """Average microseconds per request"""
+    for _ in range(200):  # warm-up
+        await app(_scope(), _receiver(), _send)
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(_scope(), _receiver(), _send)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+async def main(requests: int) -> None:
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    results = {name: await run(app, requests) for name, app in build_stacks().items()}
+    baseline = results["bare endpoint"]
+    for name, micros in results.items():
+        print(f"{name:28s} {micros:8.1f} us/request  (+{micros - baseline:.1f} us overhead)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
@@ -0,0 +1,172 @@
+"""
+Tests for the sharded App Check metrics and Prometheus exposition
+"""
+
+import threading
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.middleware.app_check import AppCheckMiddleware
+from app.middleware.route_policy import RoutePolicyEngine
+from app.utils.app_check_metrics import AppCheckMetrics
+from app.utils.metrics_core import OVERFLOW_LABEL, LabeledCounter, MetricsRegistry, render_prometheus
+
+
+class TestLabeledCounter:
+    """Test suite for LabeledCounter"""
+
+    def test_shards_merged_on_read(self):
+        counter = LabeledCounter("requests_total", "Requests", ("result",))
+
+        def work():
+            for _ in range(1000):
+                counter.inc("ok")
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert counter.collect() == {("ok",): 8000}
+
+    def test_cardinality_bounded_with_overflow(self):
+        counter = LabeledCounter("by_path_total", "By path", ("path",), max_series=3)
+
+        for i in range(10):
+            counter.inc(f"/phones/{i}")
+
+        collected = counter.collect()
+        assert len(collected) == 4
+        assert collected[(OVERFLOW_LABEL,)] == 7
+
+    def test_render_prometheus(self):
+        registry = MetricsRegistry()
+        registry.counter("app_requests_total", "Requests", ("path",)).inc('/a"b')
+        registry.counter("app_legacy_total", "Legacy").inc(amount=2)
+
+        text = render_prometheus(registry)
+
+        assert "# TYPE app_requests_total counter" in text
+        assert 'app_requests_total{path="/a\\"b"} 1' in text
+        assert "app_legacy_total 2" in text
+
+    def test_render_prometheus_histogram_family(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("op_latency_ms", "Latency", ("op",), buckets=(10, 100))
+        histogram.observe("read", value=50)
+
+        text = render_prometheus(registry)
+
+        assert text.count("# TYPE op_latency_ms") == 1
+        assert "# TYPE op_latency_ms histogram" in text
+        assert 'op_latency_ms_bucket{op="read",le="10"} 0' in text
+        assert 'op_latency_ms_bucket{op="read",le="100"} 1' in text
+        assert 'op_latency_ms_bucket{op="read",le="+Inf"} 1' in text
+        assert 'op_latency_ms_sum{op="read"} 50' in text
+        assert 'op_latency_ms_count{op="read"} 1' in text
+        assert "counter" not in text
+
+
+class TestAppCheckMetrics:
+    """Test suite for AppCheckMetrics"""
+
+    def test_stats_shape(self):
+        metrics = AppCheckMetrics()
+        metrics.record_request(True, "webapp/1.0.0", "/api/items", token_valid=True)
+        metrics.record_request(False, "0.9", "/api/items", is_legacy=True)
+        metrics.record_request(True, None, "/api/items", token_valid=False)
+
+        stats = metrics.get_stats()
+
+        assert stats["counters"] == {
+            "with_app_check": 1, "without_app_check": 1, "invalid_token": 1, "legacy_sdk": 1
+        }
+        assert stats["by_path"]["/api/items"] == {
+            "with_app_check": 1, "without_app_check": 1, "invalid_token": 1
+        }
+        assert stats["by_client_version"]["0.9"] == {"without_app_check": 1, "legacy_sdk": 1}
+        assert stats["last_missing_app_check"] is not None
+
+    def test_middleware_records_route_template(self):
+        app = FastAPI()
+
+        @app.get("/api/phones/{phone_id}")
+        async def get_phone(phone_id: str):
+            return {"id": phone_id}
+
+        app.add_middleware(AppCheckMiddleware, exempt_paths=["/docs"])
+        client = TestClient(app)
+        for phone_id in ("a1", "b2", "c3"):
+            client.get(f"/api/phones/{phone_id}")
+        client.get("/nowhere")
+
+        middleware = app.middleware_stack
+        while not isinstance(middleware, AppCheckMiddleware):
+            middleware = middleware.app
+        by_path = middleware.metrics.get_stats()["by_path"]
+
+        assert by_path["/api/phones/{phone_id}"]["without_app_check"] >= 3
+        assert "/api/phones/a1" not in by_path
+        assert "<unmatched>" in by_path
+
+
+class TestRoutePolicy:
+    """Test suite for the compiled App Check route policies"""
+
+    def test_root_exemption_is_exact(self):
+        engine = RoutePolicyEngine(exempt=["/", "/docs"], hard=["/api/admin/*", "/api/phones/{phone_id}"])
+
+        assert engine.decide("/").policy == "exempt"
+        assert engine.decide("/api/items").policy == "soft"
+        assert engine.decide("/api/admin/users").policy == "hard"
+        assert engine.decide("/api/phones/a1") == ("/api/phones/{phone_id}", "hard")
+        assert engine.decide("/api/phones/a1/calls").policy == "soft"
+
+    def test_hard_routes_rejected_without_token(self):
+        app = FastAPI()
+
+        @app.get("/api/admin/stats")
+        async def stats():
+            return {"ok": True}
+
+        @app.get("/api/items")
+        async def items():
+            return {"items": []}
+
+        app.add_middleware(AppCheckMiddleware, exempt_paths=["/"], hard_paths=["/api/admin/"])
+        client = TestClient(app)
+
+        assert client.get("/api/admin/stats").status_code == 401
+        assert client.get("/api/items").status_code == 200
+
+        middleware = app.middleware_stack
+        while not isinstance(middleware, AppCheckMiddleware):
+            middleware = middleware.app
+        stats = middleware.policy.stats()
+        assert stats["/api/admin/"]["rejected"] >= 1
+        assert stats["<default>"]["soft_fail"] >= 1
+
+
+class TestMetricsEndpoint:
+    """Test suite for GET /metrics in main.py"""
+
+    def _get(self, monkeypatch, environment, token, authorization=None):
+        from app.core.config import settings
+        from main import app
+
+        monkeypatch.setattr(settings, "ENVIRONMENT", environment)
+        monkeypatch.setattr(settings, "METRICS_TOKEN", token)
+        headers = {"Authorization": authorization} if authorization else {}
+        return TestClient(app).get("/metrics", headers=headers)
+
+    def test_open_only_in_development_without_token(self, monkeypatch):
+        assert self._get(monkeypatch, "development", "").status_code == 200
+        assert self._get(monkeypatch, "production", "").status_code == 401
+        assert self._get(monkeypatch, "production", "", "Bearer ").status_code == 401
+
+    def test_bearer_token_required_when_configured(self, monkeypatch):
+        assert self._get(monkeypatch, "development", "s3cret").status_code == 401
+        assert self._get(monkeypatch, "production", "s3cret", "Bearer wrong").status_code == 401
+        assert self._get(monkeypatch, "production", "s3cret", "Bearer s3cret").status_code == 200
@@ -0,0 +1,127 @@
+"""
+Tests for the request-scoped auth context
+"""
+
+import base64
+import json
+
+import pytest
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+import auth_utils
+from app.middleware import auth_context as auth_context_module
+from app.middleware.auth_context import AuthContext, AuthContextMiddleware, get_auth_context
+
+
+def _unsigned_token(claims):
+    def b64(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=").decode()
+    return f"{b64({'alg': 'none'})}.{b64(claims)}.sig"
+
+
+class FakeAuthService:
+    def __init__(self):
+        self.calls = 0
+
+    async def verify_token(self, token):
+        self.calls += 1
+        if token == "bad":
+            raise HTTPException(status_code=401, detail="Token de autenticación inválido")
+        if token == "broken":
+            raise HTTPException(status_code=500, detail="Error interno al verificar autenticación")
+        return {"uid": "user-1", "email_verified": True}
+
+
+@pytest.fixture
+def fake_auth(monkeypatch):
+    service = FakeAuthService()
+    monkeypatch.setattr(auth_context_module, "firebase_auth_service", service)
+    return service
+
+
+class TestAuthContext:
+    """Test suite for AuthContext"""
+
+    def test_headers_parsed_once(self):
+        context = AuthContext.from_scope({
+            "headers": [
+                (b"authorization", f"Bearer {_unsigned_token({'user_id': 'u1'})}".encode()),
+                (b"x-firebase-appcheck", b"app-check-token"),
+            ]
+        })
+
+        assert context.unverified_uid == "u1"
+        assert context.app_check_token == "app-check-token"
+
+    def test_no_credentials(self):
+        context = AuthContext(None, "  ")
+
+        assert context.id_token is None
+        assert context.app_check_token is None
+        assert context.unverified_uid is None
+
+    @pytest.mark.asyncio
+    async def test_verification_memoized(self, fake_auth):
+        context = AuthContext("Bearer good", None)
+
+        first = await context.verify_id_token()
+        second = await context.verify_id_token()
+
+        assert first is second
+        assert fake_auth.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_failure_memoized(self, fake_auth):
+        context = AuthContext("Bearer bad", None)
+
+        for _ in range(2):
+            with pytest.raises(HTTPException):
+                await context.verify_id_token()
+        assert fake_auth.calls == 1
+
+    def test_dependencies_share_one_verification(self, fake_auth):
+        app = FastAPI()
+
+        async def first_dependency(request: Request):
+            return await get_auth_context(request).verify_id_token()
+
+        async def second_dependency(request: Request):
+            return await get_auth_context(request).verify_id_token()
+
+        @app.get("/me")
+        async def me(a=Depends(first_dependency), b=Depends(second_dependency)):
+            return {"uid": a["uid"], "same": a is b}
+
+        app.add_middleware(AuthContextMiddleware)
+        response = TestClient(app).get("/me", headers={"Authorization": "Bearer good"})
+
+        assert response.json() == {"uid": "user-1", "same": True}
+        assert fake_auth.calls == 1
+
+
+class TestAuthUtilsGetCurrentUser:
+    """Test suite for auth_utils.get_current_user (main.py routes)"""
+
+    def _client(self, monkeypatch):
+        monkeypatch.setattr(auth_utils, "firebase_initialized", True)
+        app = FastAPI()
+
+        @app.get("/me")
+        async def me(user=Depends(auth_utils.get_current_user)):
+            return {"uid": user["uid"]}
+
+        app.add_middleware(AuthContextMiddleware)
+        return TestClient(app)
+
+    def test_valid_and_invalid_tokens(self, fake_auth, monkeypatch):
+        client = self._client(monkeypatch)
+
+        assert client.get("/me", headers={"Authorization": "Bearer good"}).json() == {"uid": "user-1"}
+        assert client.get("/me", headers={"Authorization": "Bearer bad"}).status_code == 401
+
+    def test_unexpected_verification_error_is_unauthorized(self, fake_auth, monkeypatch):
+        response = self._client(monkeypatch).get("/me", headers={"Authorization": "Bearer broken"})
+
+        assert response.status_code == 401
+        assert response.headers["www-authenticate"] == "Bearer"
@@ -0,0 +1,210 @@
+"""
+Tests for manifest-driven backup listing (prefix listing + backups/index.json)
+"""
+
+import json
+from collections import Counter
+from datetime import datetime
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from app.services.backup.firestore_backup_service import MANIFEST_PATH, FirestoreBackupService
+
+
+class FakeBlob:
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+        self.size = len(storage.objects.get(name, b""))
+        self.generation = None
+
+    def download_as_bytes(self):
+        self.storage.calls["download"] += 1
+        if self.name not in self.storage.objects:
+            raise google_exceptions.NotFound(self.name)
+        self.generation = self.storage.generations.get(self.name, 0)
+        return self.storage.objects[self.name]
+
+    def download_as_text(self):
+        return self.download_as_bytes().decode()
+
+    def upload_from_string(self, data, content_type=None, if_generation_match=None):
+        self.storage.calls["upload"] += 1
+        current = self.storage.generations.get(self.name, 0)
+        if if_generation_match is not None and if_generation_match != current:
+            raise google_exceptions.PreconditionFailed(self.name)
+        self.storage.objects[self.name] = data.encode() if isinstance(data, str) else data
+        self.storage.generations[self.name] = current + 1
+
+
+class FakeBucket:
+    def __init__(self, storage):
+        self.storage = storage
+
+    def blob(self, name):
+        return FakeBlob(self.storage, name)
+
+    def reload(self):
+        self.storage.calls["reload"] += 1
+
+
+class FakeIterator:
+    def __init__(self, blobs, prefixes):
+        self._blobs = blobs
+        self.prefixes = set()
+        self._pending_prefixes = prefixes
+
+    @property
+    def pages(self):
+        self.prefixes = set(self._pending_prefixes)
+        yield self._blobs
+
+    def __iter__(self):
+        return iter(self._blobs)
+
+
+class FakeStorageClient:
+    def __init__(self):
+        self.objects = {}
+        self.generations = {}
+        self.calls = Counter()
+
+    def bucket(self, name):
+        return FakeBucket(self)
+
+    def list_blobs(self, bucket_name, prefix="", delimiter=None):
+        self.calls["list"] += 1
+        blobs, prefixes = [], set()
+        for name in sorted(self.objects):
+            if not name.startswith(prefix):
+                continue
+            rest = name[len(prefix):]
+            if delimiter and delimiter in rest:
+                prefixes.add(prefix + rest.split(delimiter, 1)[0] + delimiter)
+            else:
+                blobs.append(FakeBlob(self, name))
+        return FakeIterator(blobs, prefixes)
+
+    def add_export(self, folder, data_bytes=100, metadata=None):
+        self.objects[f"{folder}/{folder.rsplit('/', 1)[-1]}.overall_export_metadata"] = b"x" * 10
+        self.objects[f"{folder}/all_namespaces/output-0"] = b"x" * data_bytes
+        if metadata is not None:
+            self.objects[f"{folder}/metadata.json"] = json.dumps(metadata).encode()
+
+
+@pytest.fixture
+def storage():
+    storage = FakeStorageClient()
+    today = datetime.utcnow().strftime("%Y%m%d")
+    storage.add_export("backups/daily/20240101-020000", 100, metadata={"by": "scheduler"})
+    storage.add_export("backups/daily/20240102-020000", 200)
+    storage.add_export(f"backups/manual/{today}-090000", 300)
+    return storage
+
+
+@pytest.fixture
+def service(storage):
+    service = FirestoreBackupService()
+    service.bucket_name = "proj-backups"
+    service.storage_client = storage
+    service.initialized = True
+    return service
+
+
+@pytest.mark.asyncio
+async def test_first_listing_inspects_folders_and_writes_manifest(service, storage):
+    result = await service.list_backups(limit=10)
+
+    assert [b["timestamp"] for b in result["backups"]][-2:] == ["20240102-020000", "20240101-020000"]
+    oldest = result["backups"][-1]
+    assert oldest["size_bytes"] == 10 + 100 + len(json.dumps({"by": "scheduler"}))
+    assert oldest["metadata"] == {"by": "scheduler"}
+    assert oldest["status"] == "completed"
+
+    manifest = json.loads(storage.objects[MANIFEST_PATH])
+    assert set(manifest["backups"]) == {
+        "backups/daily/20240101-020000",
+        "backups/daily/20240102-020000",
+        result["backups"][0]["path"].split("/", 3)[-1],
+    }
+
+
+@pytest.mark.asyncio
+async def test_listing_from_manifest_costs_constant_requests(service, storage):
+    await service.list_backups()
+    for day in range(3, 28):
+        storage.add_export(f"backups/daily/202401{day:02d}-020000")
+    await service.list_backups(limit=100)
+
+    storage.calls.clear()
+    result = await service.list_backups(limit=100)
+
+    assert result["count"] == 28
+    # One manifest read + one prefix listing for the types + one per type
+    assert storage.calls == Counter({"download": 1, "list": 3})
+
+
+@pytest.mark.asyncio
+async def test_unfinished_folders_are_not_reinspected_on_every_listing(service, storage):
+    today = datetime.utcnow().strftime("%Y%m%d")
+    # Abandoned export (no overall_export_metadata) and one still running
+    storage.objects["backups/daily/20231231-020000/all_namespaces/output-0"] = b"x"
+    storage.objects[f"backups/manual/{today}-100000/all_namespaces/output-0"] = b"x"
+
+    first = await service.list_backups(limit=10)
+    statuses = {b["timestamp"]: b["status"] for b in first["backups"]}
+    assert statuses["20231231-020000"] == "failed"
+    assert statuses[f"{today}-100000"] == "in_progress"
+
+    storage.calls.clear()
+    await service.list_backups(limit=10)
+
+    # Manifest read + prefix listings only: neither folder is walked again
+    assert storage.calls == Counter({"download": 1, "list": 3})
+
+
+@pytest.mark.asyncio
+async def test_deleted_folders_are_dropped_from_manifest(service, storage):
+    await service.list_backups()
+    for name in [n for n in storage.objects if n.startswith("backups/daily/20240101-020000/")]:
+        del storage.objects[name]
+
+    result = await service.list_backups(backup_type="daily")
+
+    assert [b["timestamp"] for b in result["backups"]] == ["20240102-020000"]
+    manifest = json.loads(storage.objects[MANIFEST_PATH])["backups"]
+    assert "backups/daily/20240101-020000" not in manifest
+    assert any(folder.startswith("backups/manual/") for folder in manifest)
+
+
+@pytest.mark.asyncio
+async def test_record_backup_retries_on_concurrent_manifest_update(service, storage):
+    original = service._save_manifest
+    raced = []
+
+    def racing_save(bucket, entries, generation):
+        if not raced:
+            raced.append(True)
+            # Another instance writes the manifest between our read and write
+            FakeBlob(storage, MANIFEST_PATH).upload_from_string(
+                json.dumps({"backups": {"backups/weekly/20240107-030000": {"status": "completed"}}})
+            )
+        original(bucket, entries, generation)
+
+    service._save_manifest = racing_save
+    await service.record_backup(
+        "gs://proj-backups/backups/manual/20240110-100000", operation_name="op-1", status="in_progress"
+    )
+
+    manifest = json.loads(storage.objects[MANIFEST_PATH])["backups"]
+    assert manifest["backups/manual/20240110-100000"]["operation_name"] == "op-1"
+    assert "backups/weekly/20240107-030000" in manifest
+
+
+@pytest.mark.asyncio
+async def test_backup_health_uses_latest_backup(service, storage):
+    health = await service.get_backup_health()
+
+    assert health["status"] == "healthy"
+    assert health["checks"]["recent_backup_exists"] is True
@@ -0,0 +1,155 @@
+"""
+Tests for stateless CSRF tokens and the path-prefix trie
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.middleware.csrf_protection import CSRFProtection, CSRFTokenSigner, check_csrf_tokens, parse_key_ring
+from app.middleware.path_trie import PathPrefixTrie
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _app(signer):
+    app = FastAPI()
+
+    @app.get("/api/items")
+    async def items():
+        return {"items": []}
+
+    @app.post("/api/items")
+    async def create_item():
+        return {"created": True}
+
+    @app.post("/api/payments/paypal/webhook")
+    async def webhook():
+        return {"ok": True}
+
+    @app.post("/api/jobs/cleanup-presence")
+    async def job():
+        return {"ok": True}
+
+    app.add_middleware(CSRFProtection, signer=signer)
+    return TestClient(app)
+
+
+class TestCSRFTokenSigner:
+    """Test suite for CSRFTokenSigner"""
+
+    def test_token_is_compact_and_valid(self):
+        signer = CSRFTokenSigner({"k1": "secret"})
+
+        token = signer.generate()
+
+        assert token.startswith("k1.")
+        assert len(token) < 60
+        assert signer.verify(token)[0] == "k1"
+
+    def test_tampered_token_rejected(self):
+        signer = CSRFTokenSigner({"k1": "secret"})
+        token = signer.generate()
+        forged = token[:-2] + ("AA" if token[-2:] != "AA" else "BB")
+
+        with pytest.raises(ValueError):
+            signer.verify(forged)
+        with pytest.raises(ValueError):
+            CSRFTokenSigner({"k1": "other"}).verify(token)
+
+    def test_expired_token_rejected(self):
+        clock = FakeClock()
+        signer = CSRFTokenSigner({"k1": "secret"}, max_age=100, clock=clock)
+        token = signer.generate()
+
+        clock.now += 60
+        assert signer.needs_refresh(token)
+        signer.verify(token)
+
+        clock.now += 41
+        with pytest.raises(ValueError):
+            signer.verify(token)
+
+    def test_key_rotation(self):
+        old = CSRFTokenSigner({"k1": "old-secret"})
+        rotated = CSRFTokenSigner(parse_key_ring("k2:new-secret,k1:old-secret"))
+        token = old.generate()
+
+        assert rotated.verify(token)[0] == "k1"
+        assert rotated.needs_refresh(token)
+        assert rotated.generate().startswith("k2.")
+
+    def test_double_submit_mismatch(self):
+        signer = CSRFTokenSigner({"k1": "secret"})
+
+        assert check_csrf_tokens(signer, signer.generate(), signer.generate(), "X-CSRF-Token") == "CSRF token mismatch"
+
+    def test_empty_keys_are_refused(self, monkeypatch):
+        monkeypatch.setattr(settings, "CSRF_SECRET_KEYS", "")
+        monkeypatch.setattr(settings, "SECRET_KEY", "")
+
+        with pytest.raises(ValueError):
+            CSRFTokenSigner.from_settings()
+        with pytest.raises(ValueError):
+            CSRFTokenSigner({"k1": ""})
+
+        monkeypatch.setattr(settings, "CSRF_SECRET_KEYS", "k2:ring-secret")
+        assert CSRFTokenSigner.from_settings().active_key_id == "k2"
+
+
+class TestCSRFMiddleware:
+    """Test suite for the CSRFProtection middleware"""
+
+    def test_cookie_reused_until_refresh(self):
+        client = _app(CSRFTokenSigner({"k1": "secret"}))
+
+        first = client.get("/api/items")
+        second = client.get("/api/items")
+
+        assert "set-cookie" in first.headers
+        assert "set-cookie" not in second.headers
+        assert second.headers["x-csrf-token"] == first.headers["x-csrf-token"]
+
+    def test_post_requires_token(self):
+        client = _app(CSRFTokenSigner({"k1": "secret"}))
+        token = client.get("/api/items").headers["x-csrf-token"]
+
+        assert client.post("/api/items").status_code == 403
+        assert client.post("/api/items", headers={"X-CSRF-Token": token}).status_code == 200
+
+    def test_bearer_and_exempt_requests_skip_check(self):
+        client = _app(CSRFTokenSigner({"k1": "secret"}))
+
+        assert client.post("/api/items", headers={"Authorization": "Bearer abc"}).status_code == 200
+        assert client.post("/api/payments/paypal/webhook").status_code == 200
+        assert client.post("/api/jobs/cleanup-presence").status_code == 200
+
+
+class TestPathPrefixTrie:
+    """Test suite for PathPrefixTrie"""
+
+    def test_exact_and_prefix_rules(self):
+        trie = PathPrefixTrie.from_paths(["/", "/docs", "/api/v1/debug/"])
+
+        assert "/" in trie
+        assert "/docs" in trie
+        assert "/api/v1/debug/login" in trie
+        assert "/api/v1/debug/" in trie
+        assert "/api/v1/debug" not in trie
+        assert "/docs/x" not in trie
+        assert "/api/items" not in trie
+
+    def test_most_specific_rule_wins(self):
+        trie = PathPrefixTrie([("/api/", "api"), ("/api/admin/", "admin"), ("/api/admin/health", "health")])
+
+        assert trie.match("/api/items") == "api"
+        assert trie.match("/api/admin/users") == "admin"
+        assert trie.match("/api/admin/health") == "health"
+        assert trie.match("/other", default="none") == "none"
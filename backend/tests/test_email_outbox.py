@@ -0,0 +1,279 @@
+"""
+Tests for the email outbox and the pooled SMTP sender against a local SMTP sink
+"""
+
+import asyncio
+import base64
+
+import pytest
+
+from app.services.email.outbox import (
+    STATUS_FAILED,
+    STATUS_PENDING,
+    STATUS_SENDING,
+    STATUS_SENT,
+    EmailOutbox,
+    EmailOutboxRepository,
+    SMTPConnectionPool,
+)
+from app.services.firestore.memory import InMemoryFirestore
+
+COLLECTION = EmailOutboxRepository.collection_path
+
+
+class SMTPSink:
+    """Minimal SMTP server: AUTH PLAIN, 550 for "reject", one 451 for "tempfail" addresses"""
+
+    def __init__(self, drop_after=None):
+        self.connections = 0
+        self.auths = 0
+        self.messages = []
+        self.drop_after = drop_after
+        self._tempfailed = set()
+        self._server = None
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._session, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _session(self, reader, writer):
+        self.connections += 1
+        sent_here = 0
+        rcpts = []
+
+        async def reply(line):
+            writer.write(line.encode() + b"\r\n")
+            await writer.drain()
+
+        await reply("220 sink ready")
+        try:
+            while True:
+                line = (await reader.readline()).decode().strip()
+                if not line:
+                    break
+                command = line.split(" ", 1)[0].upper()
+                if command in ("EHLO", "HELO"):
+                    await reply("250-sink\r\n250 AUTH PLAIN")
+                elif command == "AUTH":
+                    _, user, password = base64.b64decode(line.split()[-1]).split(b"\0")
+                    self.auths += 1
+                    await reply("235 ok" if password == b"secret" else "535 bad credentials")
+                elif command == "MAIL":
+                    rcpts = []
+                    await reply("250 ok")
+                elif command == "RCPT":
+                    address = line.split(":", 1)[1].strip("<> ")
+                    if "reject" in address:
+                        await reply("550 no such user")
+                    elif "tempfail" in address and address not in self._tempfailed:
+                        self._tempfailed.add(address)
+                        await reply("451 try again later")
+                    else:
+                        rcpts.append(address)
+                        await reply("250 ok")
+                elif command == "DATA":
+                    await reply("354 go ahead")
+                    data = []
+                    while (chunk := await reader.readline()) != b".\r\n":
+                        data.append(chunk)
+                    self.messages.append((rcpts, b"".join(data)))
+                    sent_here += 1
+                    await reply("250 queued")
+                    if self.drop_after and sent_here >= self.drop_after:
+                        break
+                elif command == "QUIT":
+                    await reply("221 bye")
+                    break
+                else:  # RSET, NOOP
+                    await reply("250 ok")
+        finally:
+            writer.close()
+
+
+class RecordingSender:
+    """Sender stub tracking concurrent sends per recipient domain"""
+
+    def __init__(self):
+        self.sent = []
+        self.active = {}
+        self.max_active = {}
+
+    async def send(self, message):
+        domain = message["To"].rsplit("@", 1)[-1]
+        self.active[domain] = self.active.get(domain, 0) + 1
+        self.max_active[domain] = max(self.max_active.get(domain, 0), self.active[domain])
+        await asyncio.sleep(0.005)
+        self.active[domain] -= 1
+        self.sent.append(message["To"])
+
+
+def message(to, subject="Hola"):
+    return {"to": to, "from": "TuCitaSegura <no-reply@tucitasegura.com>", "subject": subject, "html": "<p>Hola</p>", "text": "Hola"}
+
+
+def statuses(db):
+    return {data["to"]: data["status"] for data in db.dump(COLLECTION).values()}
+
+
+@pytest.fixture
+def db():
+    return InMemoryFirestore()
+
+
+def pool_for(sink, size=2):
+    return SMTPConnectionPool("127.0.0.1", sink.port, "mailer", "secret", starttls=False, size=size, timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_messages_reuse_authenticated_connections(db):
+    async with SMTPSink() as sink:
+        outbox = EmailOutbox(pool_for(sink), EmailOutboxRepository(db), workers=4, per_domain_limit=4)
+        for i in range(20):
+            await outbox.enqueue(message(f"user{i}@example.com"))
+        await outbox.drain()
+        await outbox.stop()
+
+    assert len(sink.messages) == 20
+    assert sink.connections <= 2
+    assert sink.auths == sink.connections
+    assert set(statuses(db).values()) == {STATUS_SENT}
+    assert b"Subject: Hola" in sink.messages[0][1]
+
+
+@pytest.mark.asyncio
+async def test_permanent_rejections_fail_and_temporary_ones_retry(db):
+    async with SMTPSink() as sink:
+        outbox = EmailOutbox(pool_for(sink, size=1), EmailOutboxRepository(db), workers=2, base_backoff=0)
+        await outbox.enqueue(message("reject@example.com"))
+        await outbox.enqueue(message("tempfail@example.com"))
+        await outbox.enqueue(message("ok@example.com"))
+        await outbox.drain()
+        await outbox.stop()
+
+    stored = {data["to"]: data for data in db.dump(COLLECTION).values()}
+    assert stored["reject@example.com"]["status"] == STATUS_FAILED
+    assert stored["reject@example.com"]["attempts"] == 1
+    assert stored["tempfail@example.com"]["status"] == STATUS_SENT
+    assert stored["tempfail@example.com"]["attempts"] == 2
+    assert stored["ok@example.com"]["status"] == STATUS_SENT
+    # Rejections do not cost a new connection
+    assert sink.connections == 1
+
+
+@pytest.mark.asyncio
+async def test_dropped_connection_is_replaced_transparently(db):
+    async with SMTPSink(drop_after=1) as sink:
+        outbox = EmailOutbox(pool_for(sink, size=1), EmailOutboxRepository(db), workers=1, max_attempts=1)
+        for i in range(3):
+            await outbox.enqueue(message(f"user{i}@example.com"))
+        await outbox.drain()
+        await outbox.stop()
+
+    assert len(sink.messages) == 3
+    assert set(statuses(db).values()) == {STATUS_SENT}
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_limited_per_domain(db):
+    sender = RecordingSender()
+    outbox = EmailOutbox(sender, EmailOutboxRepository(db), workers=8, per_domain_limit=2)
+    for i in range(12):
+        await outbox.enqueue(message(f"user{i}@{'gmail.com' if i % 2 else 'outlook.com'}"))
+    await outbox.drain()
+    await outbox.stop()
+
+    assert len(sender.sent) == 12
+    assert sender.max_active == {"gmail.com": 2, "outlook.com": 2}
+
+
+@pytest.mark.asyncio
+async def test_backlog_beyond_buffer_is_read_back_from_firestore(db):
+    sender = RecordingSender()
+    outbox = EmailOutbox(sender, EmailOutboxRepository(db), workers=2, max_buffer=3)
+
+    queued = await outbox.enqueue_many(message(f"user{i}@example.com") for i in range(20))
+    assert queued == 20
+    await outbox.drain()
+    await outbox.stop()
+
+    assert sorted(sender.sent) == sorted(f"user{i}@example.com" for i in range(20))
+    assert set(statuses(db).values()) == {STATUS_SENT}
+
+
+@pytest.mark.asyncio
+async def test_recover_sends_messages_left_pending(db):
+    stopped = EmailOutbox(RecordingSender(), EmailOutboxRepository(db), workers=1)
+    await stopped.enqueue(message("late@example.com"))
+    await stopped.stop()  # stopped before the worker ran
+    assert statuses(db) == {"late@example.com": STATUS_PENDING}
+
+    sender = RecordingSender()
+    restarted = EmailOutbox(sender, EmailOutboxRepository(db), workers=1)
+    assert await restarted.recover() == 1
+    await restarted.drain()
+    await restarted.stop()
+
+    assert sender.sent == ["late@example.com"]
+    assert statuses(db) == {"late@example.com": STATUS_SENT}
+
+
+class FlakySender(RecordingSender):
+    async def send(self, message):
+        raise OSError("connection reset")
+
+
+@pytest.mark.asyncio
+async def test_instances_sharing_the_outbox_send_each_message_once(db):
+    first_sender, second_sender = RecordingSender(), RecordingSender()
+    first = EmailOutbox(first_sender, EmailOutboxRepository(db), workers=2)
+    second = EmailOutbox(second_sender, EmailOutboxRepository(db), workers=2)
+
+    for i in range(10):
+        await first.enqueue(message(f"user{i}@example.com"))
+    await second.recover()  # cold start while the first instance still holds them
+    await asyncio.gather(first.drain(), second.drain())
+    await first.stop()
+    await second.stop()
+
+    assert sorted(first_sender.sent + second_sender.sent) == sorted(f"user{i}@example.com" for i in range(10))
+    assert first.stats()["claimed_elsewhere"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_message_waiting_for_retry_is_not_taken_over(db):
+    failing = EmailOutbox(FlakySender(), EmailOutboxRepository(db), workers=1, base_backoff=60)
+    await failing.enqueue(message("retry@example.com"))
+    await failing._queue.join()
+    await failing.stop()  # dies during the backoff
+    stored = next(iter(db.dump(COLLECTION).values()))
+    assert stored["status"] == STATUS_SENDING
+    assert stored["owner"] == failing.owner
+
+    sender = RecordingSender()
+    other = EmailOutbox(sender, EmailOutboxRepository(db), workers=1)
+    assert await other.recover() == 0
+    await other.stop()
+    assert sender.sent == []
+
+
+@pytest.mark.asyncio
+async def test_expired_claim_is_recovered(db):
+    # Claimed by an instance that died after one attempt
+    orphan = {**message("orphan@example.com"), "status": STATUS_SENDING, "attempts": 1, "owner": "gone", "lease_until": 0}
+    await EmailOutboxRepository(db).add(orphan)
+
+    sender = RecordingSender()
+    restarted = EmailOutbox(sender, EmailOutboxRepository(db), workers=1)
+    assert await restarted.recover() == 1
+    await restarted.drain()
+    await restarted.stop()
+
+    assert sender.sent == ["orphan@example.com"]
+    stored = next(iter(db.dump(COLLECTION).values()))
+    assert stored["status"] == STATUS_SENT
+    assert stored["attempts"] == 2
@@ -0,0 +1,107 @@
+"""
+Tests for the compiled, cached email template engine
+"""
+
+import types
+
+import pytest
+
+from app.services.email.templates import (
+    CompiledTemplate,
+    EmailTemplate,
+    Markup,
+    TemplateRegistry,
+    inline_css,
+)
+
+PAGE = """<html><head><style>
+    body { color: #333; }
+    .button { background: #667eea; color: white; }
+    a.button { padding: 12px; }
+    .tips:hover { color: red; }
+</style></head>
+<body>
+  <p class="tips">Hola $name</p>
+  <a href="$url" class="button" style="color: black">Entrar</a>
+</body></html>"""
+
+
+def test_compiled_template_renders_like_string_template():
+    template = CompiledTemplate.parse("Hola $name, ${amount}€ ($$5 de descuento)")
+
+    assert template.names == ("name", "amount")
+    assert template.render({"name": "Ana", "amount": 9.99}) == "Hola Ana, 9.99€ ($5 de descuento)"
+    with pytest.raises(KeyError):
+        template.render({"name": "Ana"})
+    with pytest.raises(ValueError):
+        CompiledTemplate.parse("Precio: $ 5")
+
+
+def test_html_variables_are_escaped_unless_markup():
+    fragment = CompiledTemplate.parse("<b>$value</b>", escape=True)
+    page = CompiledTemplate.parse("<div>$body</div>", escape=True)
+
+    rendered = fragment.render({"value": "<script>"})
+
+    assert rendered == "<b>&lt;script&gt;</b>"
+    assert isinstance(rendered, Markup)
+    assert page.render({"body": rendered}) == "<div><b>&lt;script&gt;</b></div>"
+    assert page.render({"body": "<i>"}) == "<div>&lt;i&gt;</div>"
+
+
+def test_bind_prerenders_common_variables():
+    template = CompiledTemplate.parse("$greeting $name, $campaign")
+
+    bound = template.bind({"greeting": "Hola", "campaign": "Navidad"})
+
+    assert bound.names == ("name",)
+    assert bound.static == ("Hola ", ", Navidad")
+    assert bound.render({"name": "Ana"}) == template.render({"greeting": "Hola", "campaign": "Navidad", "name": "Ana"})
+
+
+def test_css_is_inlined_into_body_tags():
+    inlined = inline_css(PAGE)
+
+    assert '<body style="color: #333">' in inlined
+    assert '<p class="tips">' in inlined  # pseudo-class rules are not inlined
+    # class rule, then the more specific tag.class rule, then the element's own style
+    assert 'class="button" style="background: #667eea; color: black; padding: 12px"' in inlined
+    assert "<style>" in inlined
+
+
+def test_registry_compiles_once_per_version():
+    registry = TemplateRegistry()
+    template = registry.register(EmailTemplate("welcome", "Hola $name", PAGE, "Hola $name: $url"))
+    compiled = template.compile
+    calls = []
+    template.compile = lambda: calls.append(1) or compiled()
+
+    first = registry.render("welcome", {"name": "Ana", "url": "https://x/?a=1&b=2"})
+    registry.render("welcome", {"name": "Luis", "url": "https://x"})
+
+    assert len(calls) == 1
+    assert first["subject"] == "Hola Ana"
+    assert 'href="https://x/?a=1&amp;b=2"' in first["html"]
+    assert first["text"] == "Hola Ana: https://x/?a=1&b=2"
+
+    updated = registry.register(EmailTemplate("welcome", "Bienvenida $name", PAGE))
+    assert updated.version != template.version
+    assert registry.render("welcome", {"name": "Ana", "url": "x"})["subject"] == "Bienvenida Ana"
+
+
+def test_render_batch_is_lazy():
+    registry = TemplateRegistry()
+    registry.register(EmailTemplate("promo", "$campaign para $name", "<p>$name: $code</p>"))
+    consumed = []
+
+    def recipients():
+        for i in range(100000):
+            consumed.append(i)
+            yield {"email": f"user{i}@example.com", "name": f"User {i}"}
+
+    batch = registry.render_batch("promo", recipients(), common={"campaign": "Navidad", "code": "XMAS"})
+
+    assert isinstance(batch, types.GeneratorType)
+    first = next(batch)
+    assert first == {"to": "user0@example.com", "subject": "Navidad para User 0", "html": "<p>User 0: XMAS</p>", "text": None}
+    assert len(consumed) == 1
@@ -0,0 +1,94 @@
+"""
+Tests for batched/cached encryption and key rotation
+"""
+
+import pytest
+from cryptography.fernet import Fernet
+
+from app.services.security.encryption_service import (
+    ENCRYPTED_PLACEHOLDER,
+    DecryptedValueCache,
+    EncryptionService,
+)
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setenv("ENCRYPTION_KEY", Fernet.generate_key().decode())
+    monkeypatch.delenv("ENCRYPTION_OLD_KEYS", raising=False)
+    return EncryptionService()
+
+
+class TestBatchOperations:
+    """Test suite for encrypt_many / decrypt_many"""
+
+    def test_round_trip_preserves_order(self, service):
+        values = [f"+3460000{i:04d}" for i in range(100)]
+
+        assert service.decrypt_many(service.encrypt_many(values)) == values
+
+    def test_bad_values_use_placeholder(self, service):
+        tokens = service.encrypt_many(["+34111"]) + ["not-a-token"]
+
+        assert service.decrypt_many(tokens, on_error=ENCRYPTED_PLACEHOLDER) == ["+34111", ENCRYPTED_PLACEHOLDER]
+        with pytest.raises(ValueError):
+            service.decrypt_many(tokens)
+
+    @pytest.mark.asyncio
+    async def test_async_batches_use_thread_pool(self, service):
+        values = [f"+3470000{i:04d}" for i in range(300)]
+        tokens = await service.encrypt_many_async(values)
+        service.cache.clear()
+
+        assert await service.decrypt_many_async(tokens) == values
+
+    def test_decrypted_values_cached(self, service):
+        token = service.encrypt("+34222")
+        service.cache.clear()
+
+        service.decrypt(token)
+        service.decrypt(token)
+
+        assert service.cache.stats()["hits"] >= 1
+
+
+class TestKeyRotation:
+    """Test suite for MultiFernet rotation"""
+
+    def test_old_keys_decrypt_and_rotate(self, monkeypatch):
+        old_key, new_key = Fernet.generate_key().decode(), Fernet.generate_key().decode()
+        monkeypatch.setenv("ENCRYPTION_KEY", old_key)
+        old_service = EncryptionService()
+        token = old_service.encrypt("+34333")
+
+        monkeypatch.setenv("ENCRYPTION_KEY", new_key)
+        monkeypatch.setenv("ENCRYPTION_OLD_KEYS", old_key)
+        monkeypatch.setenv("ENCRYPTION_CACHE_TTL", "0")
+        service = EncryptionService()
+
+        assert service.decrypt(token) == "+34333"
+        rotated, current, broken = service.rotate_many([token, service.encrypt("+34444"), "junk"])
+        assert Fernet(new_key.encode()).decrypt(rotated.encode()) == b"+34333"
+        assert current is None
+        assert broken == ENCRYPTED_PLACEHOLDER
+
+
+class TestDecryptedValueCache:
+    """Test suite for DecryptedValueCache"""
+
+    def test_entries_expire(self):
+        now = [0.0]
+        cache = DecryptedValueCache(ttl=10, clock=lambda: now[0])
+        cache.put("token", "plain")
+
+        assert cache.get("token") == "plain"
+        now[0] = 11
+        assert cache.get("token") is None
+
+    def test_size_bounded(self):
+        cache = DecryptedValueCache(ttl=10, max_size=2)
+        for i in range(3):
+            cache.put(f"t{i}", str(i))
+
+        assert cache.get("t0") is None
+        assert cache.stats()["size"] == 2
@@ -0,0 +1,93 @@
+"""
+Tests for streaming upload validation
+"""
+
+import hashlib
+from io import BytesIO
+
+import pytest
+from fastapi import UploadFile
+
+Image = pytest.importorskip("PIL.Image")
+
+from app.services.security.file_validator import FileValidator, sniff_mime_type
+
+
+class CountingBytesIO(BytesIO):
+    """BytesIO that records how many bytes were read"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def _png_bytes(width=200, height=150):
+    buffer = BytesIO()
+    Image.new("RGB", (width, height), (120, 80, 40)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _upload(data, filename="photo.png"):
+    return UploadFile(file=CountingBytesIO(data), filename=filename)
+
+
+class TestStreamingValidation:
+    """Test suite for FileValidator.validate_upload_stream"""
+
+    def test_sniff_mime_type(self):
+        assert sniff_mime_type(b"\xff\xd8\xff\xe0rest") == "image/jpeg"
+        assert sniff_mime_type(_png_bytes()[:16]) == "image/png"
+        assert sniff_mime_type(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "image/webp"
+        assert sniff_mime_type(b"GIF89a....") == "image/gif"
+
+    @pytest.mark.asyncio
+    async def test_valid_image_metadata_and_hash(self):
+        data = _png_bytes()
+        upload = _upload(data)
+
+        result = await FileValidator().validate_upload_stream(upload, chunk_size=1024)
+
+        assert result.is_valid, result.errors
+        assert result.mime_type == "image/png"
+        assert result.size_bytes == len(data)
+        assert result.metadata["sha256"] == hashlib.sha256(data).hexdigest()
+        assert (result.metadata["width"], result.metadata["height"]) == (200, 150)
+        # The stream is rewound for the storage upload
+        assert upload.file.tell() == 0
+
+    @pytest.mark.asyncio
+    async def test_oversized_upload_rejected_early(self):
+        data = _png_bytes() + b"\x00" * (512 * 1024)
+        upload = _upload(data)
+
+        result = await FileValidator().validate_upload_stream(
+            upload, max_size=64 * 1024, chunk_size=16 * 1024
+        )
+
+        assert not result.is_valid
+        assert result.metadata["truncated"] is True
+        assert upload.file.bytes_read <= 64 * 1024 + 16 * 1024
+
+    @pytest.mark.asyncio
+    async def test_wrong_type_rejected_after_first_chunk(self):
+        data = b"MZ" + b"\x00" * (256 * 1024)
+        upload = _upload(data, filename="photo.jpg")
+
+        result = await FileValidator().validate_upload_stream(upload, chunk_size=4096)
+
+        assert not result.is_valid
+        assert upload.file.bytes_read == 4096
+
+    @pytest.mark.asyncio
+    async def test_dangerous_extension_rejected(self):
+        result = await FileValidator().validate_upload_stream(
+            _upload(_png_bytes(), filename="photo.php")
+        )
+
+        assert not result.is_valid
+        assert any("Dangerous file extension" in e for e in result.errors)
@@ -0,0 +1,162 @@
+"""
+Tests for the async Firestore repository layer (backed by the in-memory fake)
+"""
+
+import pytest
+
+from app.services.firestore import repository
+from app.services.firestore.emergency_phones_service import EmergencyPhoneService
+from app.services.firestore.memory import InMemoryFirestore, NotFound
+from app.services.firestore.repository import (
+    EmergencyPhoneRepository,
+    Repository,
+    UserRepository,
+    get_async_client,
+    set_async_client,
+)
+
+
+@pytest.fixture
+def client():
+    return InMemoryFirestore({
+        "users/u1": {"name": "Ana", "age": 30},
+        "users/u2": {"name": "Luis", "age": 25},
+        "users/u3": {"name": "Eva", "age": 41},
+    })
+
+
+def test_shared_client_is_created_once(monkeypatch):
+    created = []
+    monkeypatch.setattr(repository, "_create_async_client", lambda: created.append(1) or InMemoryFirestore())
+    set_async_client(None)
+    try:
+        assert get_async_client() is get_async_client()
+        assert UserRepository().client is get_async_client()
+        assert len(created) == 1
+    finally:
+        set_async_client(None)
+
+
+@pytest.mark.asyncio
+async def test_get_returns_document_with_id(client):
+    users = UserRepository(client)
+
+    assert await users.get("u1") == {"id": "u1", "name": "Ana", "age": 30}
+    assert await users.get("missing") is None
+
+
+@pytest.mark.asyncio
+async def test_get_many_uses_single_get_all(client):
+    users = UserRepository(client)
+
+    documents = await users.get_many(["u1", "u3", "missing", "u1", None])
+
+    assert set(documents) == {"u1", "u3"}
+    assert documents["u3"]["name"] == "Eva"
+    assert client.calls["get_all"] == 1
+    assert client.calls["get"] == 0
+    assert await users.get_many([]) == {}
+    assert client.calls["get_all"] == 1
+
+
+@pytest.mark.asyncio
+async def test_find_filters_orders_and_limits(client):
+    users = UserRepository(client)
+
+    older = await users.find(("age", ">=", 30), order_by=["-age"])
+    assert [doc["id"] for doc in older] == ["u3", "u1"]
+
+    youngest = await users.find(order_by=["age"], limit=1)
+    assert [doc["id"] for doc in youngest] == ["u2"]
+
+
+@pytest.mark.asyncio
+async def test_writes(client):
+    users = UserRepository(client)
+
+    new_id = await users.add({"name": "Sara"})
+    assert (await users.get(new_id))["name"] == "Sara"
+
+    await users.update("u1", {"age": 31})
+    assert (await users.get("u1"))["age"] == 31
+
+    await users.set("u2", {"city": "Madrid"}, merge=True)
+    assert await users.get("u2") == {"id": "u2", "name": "Luis", "age": 25, "city": "Madrid"}
+
+    await users.delete("u3")
+    assert await users.get("u3") is None
+
+    with pytest.raises(NotFound):
+        await users.update("missing", {"age": 1})
+
+
+@pytest.mark.asyncio
+async def test_claim_is_compare_and_set(client):
+    users = UserRepository(client)
+    is_free = lambda document: "owner" not in document
+
+    claimed = await users.claim("u1", is_free, {"owner": "a"})
+    assert claimed == {"id": "u1", "name": "Ana", "age": 30, "owner": "a"}
+    assert await users.claim("u1", is_free, {"owner": "b"}) is None
+    assert await users.claim("missing", is_free, {"owner": "b"}) is None
+
+    # Another writer changes the document between the read and the write
+    ref = users.ref("u2")
+    original_get = ref.get
+
+    async def racing_get():
+        snapshot = await original_get()
+        await users.update("u2", {"owner": "c"})
+        return snapshot
+
+    ref.get = racing_get
+    users.ref = lambda doc_id=None: ref
+    assert await users.claim("u2", is_free, {"owner": "b"}) is None
+    assert client.dump("users")["users/u2"]["owner"] == "c"
+
+
+@pytest.mark.asyncio
+async def test_subcollection_repository(client):
+    phones = EmergencyPhoneRepository("u1", client)
+    await phones.add({"phone_number": "enc-1"}, doc_id="p1")
+    await phones.add({"note": "sin número"}, doc_id="p2")
+    await EmergencyPhoneRepository("u2", client).add({"phone_number": "enc-2"})
+
+    assert [doc["id"] for doc in await phones.list_phones()] == ["p1"]
+    assert "users/u1/private_info/p1" in client.dump("users/u1/private_info")
+    # Una colección no incluye las subcolecciones de sus documentos
+    assert len(await Repository(client, "users").find()) == 3
+
+
+class FakeEncryption:
+    def encrypt(self, value):
+        return f"enc:{value}"
+
+    def decrypt(self, value):
+        return value[len("enc:"):]
+
+    async def decrypt_many_async(self, values, on_error=None):
+        return [self.decrypt(value) for value in values]
+
+
+@pytest.mark.asyncio
+async def test_emergency_phone_service_overlaps_user_queries(client):
+    service = EmergencyPhoneService(client)
+    service.encryption = FakeEncryption()
+
+    created = await service.create_emergency_phone("u1", {"phone_number": "600111222", "name": "Madre"})
+    assert created["phone_number"] == "600111222"
+    assert client.dump("users/u1/private_info")[f"users/u1/private_info/{created['id']}"]["phone_number"] == "enc:600111222"
+
+    await service.create_emergency_phone("u2", {"phone_number": "600333444"})
+    phones = await service.get_emergency_phones_for_users(["u1", "u2", "u3"])
+
+    assert [phone["phone_number"] for phone in phones["u1"]] == ["600111222"]
+    assert [phone["phone_number"] for phone in phones["u2"]] == ["600333444"]
+    assert phones["u3"] == []
+
+    verified = await service.verify_emergency_phone("u1", created["id"])
+    assert verified["is_verified"] is True
+    assert await service.delete_emergency_phone("u1", created["id"]) is True
+    assert await service.get_emergency_phone("u1", created["id"]) is None
+
@@ -0,0 +1,122 @@
+"""
+Tests for the background-probed, single-flight health check service
+"""
+
+import asyncio
+
+import pytest
+
+from app.services.health.health_service import HealthCheckService, HealthStatus, ProbeHistory
+
+
+class CountingHealthService(HealthCheckService):
+    """Replaces the real dependency checks with counted, slow fakes"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = {name: 0 for name in self.probes}
+        self.fail = set()
+
+    async def _fake(self, name):
+        self.calls[name] += 1
+        await asyncio.sleep(0.01)
+        if name in self.fail:
+            raise RuntimeError(f"{name} down")
+        return {"status": HealthStatus.HEALTHY, "timestamp": "now"}
+
+    async def check_firestore(self):
+        return await self._fake("firestore")
+
+    async def check_firebase_auth(self):
+        return await self._fake("firebase_auth")
+
+    async def check_paypal(self):
+        return await self._fake("paypal")
+
+    async def check_recaptcha(self):
+        return await self._fake("recaptcha")
+
+
+@pytest.mark.asyncio
+async def test_concurrent_checks_share_one_probe_per_dependency():
+    service = CountingHealthService()
+
+    results = await asyncio.gather(*[service.check_all() for _ in range(20)])
+
+    assert all(result["status"] == HealthStatus.HEALTHY for result in results)
+    assert service.calls == {name: 1 for name in service.probes}
+
+
+@pytest.mark.asyncio
+async def test_fresh_results_are_served_without_probing():
+    service = CountingHealthService()
+    await service.check_all()
+
+    result = await service.check_all()
+
+    assert service.calls == {name: 1 for name in service.probes}
+    assert result["latency"]["firestore"]["samples"] == 1
+
+    await service.check_all(use_cache=False)
+    assert service.calls == {name: 2 for name in service.probes}
+
+
+@pytest.mark.asyncio
+async def test_failed_probe_degrades_overall_status():
+    service = CountingHealthService()
+    service.fail.add("paypal")
+
+    result = await service.check_all()
+
+    assert result["status"] == HealthStatus.DEGRADED
+    assert result["checks"]["paypal"]["status"] == HealthStatus.UNHEALTHY
+    assert result["checks"]["paypal"]["error"] == "paypal down"
+    assert result["latency"]["paypal"]["statuses"] == {HealthStatus.UNHEALTHY: 1}
+
+
+@pytest.mark.asyncio
+async def test_public_view_hides_errors_and_history():
+    service = CountingHealthService()
+    service.fail.add("paypal")
+
+    public = service.public_view(await service.check_all())
+
+    assert public["status"] == HealthStatus.DEGRADED
+    assert public["checks"]["paypal"] == {"status": HealthStatus.UNHEALTHY}
+    assert "latency" not in public
+    assert "paypal down" not in str(public)
+
+
+@pytest.mark.asyncio
+async def test_background_probes_fill_the_snapshot():
+    service = CountingHealthService(probe_interval=0.01, external_probe_interval=0.01)
+    service.start()
+    try:
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            if all(len(history) >= 2 for history in service.history.values()):
+                break
+    finally:
+        await service.stop()
+
+    calls = dict(service.calls)
+    await service.check_all()
+    assert service.calls == calls
+    assert all(count >= 2 for count in calls.values())
+
+
+def test_history_ring_buffer_percentiles():
+    history = ProbeHistory(size=100)
+    for latency in range(1, 201):
+        history.record(HealthStatus.HEALTHY if latency % 10 else HealthStatus.UNHEALTHY, float(latency))
+
+    stats = history.stats()
+
+    # Only the last 100 samples (101..200) are kept
+    assert stats["samples"] == 100
+    assert stats["p50_ms"] == 150.0
+    assert stats["p95_ms"] == 195.0
+    assert stats["p99_ms"] == 199.0
+    assert stats["max_ms"] == 200.0
+    assert stats["healthy_ratio"] == 0.9
+    assert ProbeHistory().stats() == {"samples": 0}
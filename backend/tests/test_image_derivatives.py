@@ -0,0 +1,67 @@
+"""
+Tests for the upload-time image derivative pipeline
+"""
+
+from io import BytesIO
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from app.services.storage.image_derivatives import (
+    ImageDerivativePipeline,
+    derivative_path,
+    is_derivative_path,
+)
+
+
+def _jpeg_with_exif(width=1600, height=1200):
+    image = Image.new("RGB", (width, height), (200, 150, 100))
+    exif = Image.Exif()
+    exif[0x010F] = "TestCamera"  # Make
+    exif[0x0112] = 6  # Orientation: rotate 90 CW
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def test_derivative_paths():
+    path = derivative_path("profile_photos/uid/avatar", 320)
+    assert path == "profile_photos/uid/avatar_320.webp"
+    assert is_derivative_path(path)
+    assert not is_derivative_path("profile_photos/uid/avatar")
+    assert not is_derivative_path("profile_photos/uid/gallery_1")
+
+
+def test_generate_sizes_strips_exif_and_applies_orientation():
+    stored = {}
+
+    def store(path, data, content_type):
+        stored[path] = (data, content_type)
+        return f"https://cdn.test/{path}"
+
+    pipeline = ImageDerivativePipeline(sizes=(96, 320, 1080), fmt="WEBP", max_workers=2)
+    urls = pipeline.generate(_jpeg_with_exif(), "profile_photos/uid/avatar", store)
+
+    assert set(urls) == {"96", "320", "1080"}
+    assert urls["96"] == "https://cdn.test/profile_photos/uid/avatar_96.webp"
+
+    data, content_type = stored["profile_photos/uid/avatar_320.webp"]
+    derivative = Image.open(BytesIO(data))
+    assert content_type == "image/webp"
+    assert derivative.format == "WEBP"
+    # Orientation 6 turns the 1600x1200 original into a portrait image
+    assert derivative.size == (240, 320)
+    assert not derivative.getexif()
+
+
+def test_small_originals_are_not_upscaled():
+    pipeline = ImageDerivativePipeline(sizes=(96, 1080), fmt="JPEG", max_workers=1)
+    buffer = BytesIO()
+    Image.new("RGB", (200, 100)).save(buffer, format="PNG")
+
+    stored = {}
+    pipeline.generate(buffer.getvalue(), "orig", lambda p, d, c: stored.setdefault(p, d) and p)
+
+    assert Image.open(BytesIO(stored["orig_1080.jpg"])).size == (200, 100)
+    assert Image.open(BytesIO(stored["orig_96.jpg"])).size == (96, 48)
@@ -0,0 +1,158 @@
+"""
+Tests for local Firebase ID token / App Check verification
+"""
+
+import datetime
+import json
+import time
+
+import jwt
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from firebase_admin import auth
+
+from app.services.auth.jwt_verifier import (
+    APP_CHECK_ISSUER_PREFIX,
+    ID_TOKEN_CERT_URL,
+    ID_TOKEN_ISSUER_PREFIX,
+    LocalJWTVerifier,
+    parse_max_age,
+)
+
+PROJECT_ID = "test-project"
+KID = "key-1"
+
+_private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def _certificate_pem():
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken")])
+    now = datetime.datetime.utcnow()
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(_private_key.public_key())
+        .serial_number(1)
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(_private_key, hashes.SHA256())
+    )
+    return cert.public_bytes(serialization.Encoding.PEM).decode("utf-8")
+
+
+def _jwks():
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(_private_key.public_key()))
+    jwk.update({"kid": KID, "alg": "RS256", "use": "sig"})
+    return {"keys": [jwk]}
+
+
+class FakeKeyServer:
+    """http_get stand-in serving both key endpoints"""
+
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+
+    def __call__(self, url):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("key server unavailable")
+        headers = {"Cache-Control": "public, max-age=19800, must-revalidate"}
+        if url == ID_TOKEN_CERT_URL:
+            return {KID: _certificate_pem()}, headers
+        return _jwks(), headers
+
+
+def _id_token(**overrides):
+    now = int(time.time())
+    claims = {
+        "iss": ID_TOKEN_ISSUER_PREFIX + PROJECT_ID,
+        "aud": PROJECT_ID,
+        "sub": "user-1",
+        "iat": now - 10,
+        "exp": now + 3600,
+    }
+    claims.update(overrides)
+    return jwt.encode(claims, _private_key, algorithm="RS256", headers={"kid": KID})
+
+
+def _app_check_token():
+    now = int(time.time())
+    claims = {
+        "iss": APP_CHECK_ISSUER_PREFIX + "123456",
+        "aud": ["projects/123456", f"projects/{PROJECT_ID}"],
+        "sub": "1:123456:web:abc",
+        "iat": now - 10,
+        "exp": now + 3600,
+    }
+    return jwt.encode(claims, _private_key, algorithm="RS256", headers={"kid": KID, "typ": "JWT"})
+
+
+@pytest.fixture
+def key_server():
+    return FakeKeyServer()
+
+
+@pytest.fixture
+def verifier(key_server):
+    return LocalJWTVerifier(project_id=PROJECT_ID, enabled=True, max_workers=2, http_get=key_server)
+
+
+class TestLocalJWTVerifier:
+    """Test suite for LocalJWTVerifier"""
+
+    def test_parse_max_age(self):
+        assert parse_max_age("public, max-age=19800, must-revalidate") == 19800
+        assert parse_max_age("no-cache") is None
+        assert parse_max_age(None) is None
+
+    def test_valid_id_token_uses_cached_keys(self, verifier, key_server):
+        for _ in range(5):
+            claims = verifier.verify_id_token(_id_token())
+            assert claims["uid"] == "user-1"
+
+        assert key_server.calls == 1
+        assert verifier.id_token_keys.seconds_until_refresh > 3600
+
+    def test_expired_and_wrong_audience_rejected(self, verifier):
+        with pytest.raises(auth.ExpiredIdTokenError):
+            verifier.verify_id_token(_id_token(exp=int(time.time()) - 60))
+
+        with pytest.raises(auth.InvalidIdTokenError):
+            verifier.verify_id_token(_id_token(aud="other-project"))
+
+    def test_key_server_failure_keeps_last_keys(self, verifier, key_server):
+        verifier.verify_id_token(_id_token())
+
+        key_server.fail = True
+        with pytest.raises(ConnectionError):
+            verifier.id_token_keys.refresh()
+
+        assert verifier.verify_id_token(_id_token())["uid"] == "user-1"
+        assert verifier.id_token_keys.stats()["last_error"]
+
+    def test_check_revoked(self, key_server):
+        class User:
+            disabled = False
+            tokens_valid_after_timestamp = int(time.time() * 1000)
+
+        verifier = LocalJWTVerifier(
+            project_id=PROJECT_ID, enabled=True, max_workers=1,
+            http_get=key_server, get_user_fn=lambda uid: User()
+        )
+
+        with pytest.raises(auth.RevokedIdTokenError):
+            verifier.verify_id_token(_id_token(), check_revoked=True)
+
+    @pytest.mark.asyncio
+    async def test_app_check_token(self, verifier):
+        claims = await verifier.verify_app_check_token_async(_app_check_token())
+
+        assert claims["app_id"] == "1:123456:web:abc"
+
+        with pytest.raises(ValueError):
+            await verifier.verify_app_check_token_async(_id_token())
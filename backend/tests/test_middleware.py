@@ -0,0 +1,97 @@
+"""
+Tests for the ASGI middleware stack
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.middleware.app_check import AppCheckMiddleware
+from app.middleware.csrf_protection import CSRFProtection
+from app.middleware.security_headers import SecurityHeadersMiddleware
+
+
+def _app():
+    app = FastAPI()
+
+    @app.get("/api/items")
+    async def items():
+        return {"items": []}
+
+    @app.post("/api/items")
+    async def create_item():
+        return {"created": True}
+
+    @app.get("/page")
+    async def page():
+        return {"ok": True}
+
+    @app.get("/api/stream")
+    async def stream():
+        async def chunks():
+            for i in range(3):
+                yield f"chunk-{i}\n".encode()
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    return app
+
+
+@pytest.fixture
+def client():
+    app = _app()
+    app.add_middleware(CSRFProtection, secret_key="test-secret")
+    app.add_middleware(AppCheckMiddleware, exempt_paths=["/docs"])
+    app.add_middleware(SecurityHeadersMiddleware, environment="development")
+    return TestClient(app)
+
+
+class TestSecurityHeadersMiddleware:
+    """Test suite for SecurityHeadersMiddleware"""
+
+    def test_headers_precomputed_once(self):
+        middleware = SecurityHeadersMiddleware(_app(), environment="development")
+
+        names = [name for name, _ in middleware.static_headers]
+        assert b"content-security-policy" in names
+        assert b"permissions-policy" in names
+        assert all(isinstance(value, bytes) for _, value in middleware.static_headers)
+
+    def test_api_and_non_api_headers(self, client):
+        api = client.get("/api/items")
+        page = client.get("/page")
+
+        assert api.headers["x-frame-options"] == "DENY"
+        assert api.headers["cache-control"].startswith("no-store")
+        assert page.headers["x-content-type-options"] == "nosniff"
+        assert "cache-control" not in page.headers
+
+    def test_streaming_response_passes_through(self, client):
+        response = client.get("/api/stream")
+
+        assert response.text == "chunk-0\nchunk-1\nchunk-2\n"
+        assert "content-security-policy" in response.headers
+
+
+class TestCSRFProtection:
+    """Test suite for the ASGI CSRFProtection middleware"""
+
+    def test_safe_request_sets_cookie_and_header(self, client):
+        response = client.get("/api/items")
+
+        assert response.status_code == 200
+        assert response.cookies.get("csrf_token") == response.headers["x-csrf-token"]
+
+    def test_post_without_token_rejected(self, client):
+        response = client.post("/api/items")
+
+        assert response.status_code == 403
+        assert "CSRF" in response.json()["detail"]
+
+    def test_post_with_token_accepted(self, client):
+        token = client.get("/api/items").headers["x-csrf-token"]
+
+        response = client.post("/api/items", headers={"X-CSRF-Token": token})
+
+        assert response.status_code == 200
+        assert response.json() == {"created": True}
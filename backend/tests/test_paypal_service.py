@@ -0,0 +1,163 @@
+"""
+Tests for the pooled PayPal client: single-flight token refresh, retries and metrics
+"""
+
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from app.services.payments import paypal_service as paypal_module
+from app.services.payments.paypal_service import TOKEN_PREFETCH_MARGIN, PayPalService
+from app.utils.metrics_core import MetricsRegistry
+
+
+class FakePayPal:
+    """httpx.MockTransport handler emulating the PayPal endpoints used"""
+
+    def __init__(self):
+        self.token_requests = 0
+        self.requests = []
+        self.failures = []  # status codes to return before succeeding
+        self.expires_in = 32400
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if request.url.path == "/v1/oauth2/token":
+            self.token_requests += 1
+            await asyncio.sleep(0.01)
+            return httpx.Response(200, json={
+                "access_token": f"token-{self.token_requests}",
+                "expires_in": self.expires_in
+            })
+        if self.failures:
+            return httpx.Response(self.failures.pop(0), json={"name": "INTERNAL_SERVER_ERROR"})
+        if request.url.path == "/v2/checkout/orders":
+            return httpx.Response(201, json={"id": "ORDER-1", "status": "CREATED"})
+        if request.url.path.endswith("/capture"):
+            return httpx.Response(201, json={"id": "ORDER-1", "status": "COMPLETED"})
+        if request.url.path == "/v1/notifications/verify-webhook-signature":
+            return httpx.Response(200, json={"verification_status": "SUCCESS"})
+        return httpx.Response(200, json={"id": request.url.path.rsplit("/", 1)[-1]})
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(paypal_module, "PAYPAL_BACKOFF_BASE", 0.0)
+
+
+@pytest.fixture
+def paypal():
+    return FakePayPal()
+
+
+@pytest.fixture
+def service(paypal):
+    service = PayPalService(transport=httpx.MockTransport(paypal))
+    service.client_id, service.client_secret = "client", "secret"
+    return service
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_token_and_client(service, paypal):
+    results = await asyncio.gather(*[service.get_order_details(f"O{i}") for i in range(20)])
+
+    assert [r["id"] for r in results] == [f"O{i}" for i in range(20)]
+    assert paypal.token_requests == 1
+    client = service._http_client()
+    await service.get_order_details("again")
+    assert service._http_client() is client
+    assert all(r.headers["Authorization"] == "Bearer token-1" for r in paypal.requests[1:])
+    await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_token_is_refreshed_in_background_before_expiry(service, paypal):
+    await service.get_access_token()
+    # Token now inside the prefetch window but still usable
+    service._token_expires_at = time.monotonic() + TOKEN_PREFETCH_MARGIN - 1
+
+    assert await service.get_access_token() == "token-1"
+    await service._prefetch_task
+
+    assert paypal.token_requests == 2
+    assert await service.get_access_token() == "token-2"
+    await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_transient_errors_are_retried_with_same_request_id(service, paypal):
+    paypal.failures = [503, 502]
+
+    order = await service.create_order(9.99, custom_id="user-1")
+
+    assert order["id"] == "ORDER-1"
+    attempts = [r for r in paypal.requests if r.url.path == "/v2/checkout/orders"]
+    assert len(attempts) == 3
+    assert len({r.headers["PayPal-Request-Id"] for r in attempts}) == 1
+    assert json.loads(attempts[0].content)["purchase_units"][0]["custom_id"] == "user-1"
+    await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried(service, paypal):
+    paypal.failures = [422]
+
+    with pytest.raises(Exception, match="No se pudo capturar el pago"):
+        await service.capture_order("ORDER-1")
+
+    assert len([r for r in paypal.requests if r.url.path.endswith("/capture")]) == 1
+    await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_each_capture_call_gets_its_own_request_id(service, paypal):
+    paypal.failures = [422, 503]
+
+    with pytest.raises(Exception):
+        await service.capture_order("ORDER-1")  # e.g. INSTRUMENT_DECLINED
+    await service.capture_order("ORDER-1")  # buyer picked another funding source
+
+    attempts = [r.headers["PayPal-Request-Id"] for r in paypal.requests if r.url.path.endswith("/capture")]
+    assert len(attempts) == 3
+    assert attempts[0] != attempts[1] == attempts[2]
+    await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_rejected_token_is_renewed_once(service, paypal):
+    await service.get_access_token()
+    paypal.failures = [401]
+
+    assert await service.verify_webhook_signature({}, b'{"id": "WH-1"}') is True
+    assert paypal.token_requests == 2
+    await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_latency_metrics_per_endpoint(service, paypal):
+    await service.get_order_details("O1")
+    await service.capture_order("O1")
+
+    stats = service.stats()
+
+    assert stats["get_order_details"]["count"] >= 1
+    assert stats["capture_order"]["p99"] is not None
+    assert "oauth2_token" in stats
+    await service.aclose()
+
+
+def test_histogram_buckets_and_summary():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("op_latency_ms", "Latency", ("op",), buckets=(10, 100, 1000))
+    for value in (5, 50, 50, 500):
+        histogram.observe("read", value=value)
+
+    assert registry.histogram("op_latency_ms", "Latency") is histogram
+    summary = histogram.summary()[("read",)]
+    assert summary == {"count": 4, "mean": 151.25, "p50": 100, "p95": 1000, "p99": 1000}
+    cumulative, total, count = histogram.collect()[("read",)]
+    assert cumulative == [1, 3, 4, 4]  # 10, 100, 1000, +Inf
+    assert (total, count) == (605, 4)
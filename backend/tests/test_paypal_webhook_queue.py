@@ -0,0 +1,183 @@
+"""
+Tests for the persisted, deduplicated PayPal webhook queue
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from app.services.firestore.memory import InMemoryFirestore
+from app.services.payments.webhook_queue import (
+    STATUS_DEAD_LETTER,
+    STATUS_PROCESSED,
+    STATUS_PROCESSING,
+    STATUS_RECEIVED,
+    PayPalWebhookQueue,
+    WebhookEventRepository,
+)
+
+COLLECTION = WebhookEventRepository.collection_path
+
+
+def make_event(event_id, user_id="user-1", event_type="PAYMENT.CAPTURE.COMPLETED"):
+    return {
+        "id": event_id,
+        "event_type": event_type,
+        "resource": {"id": f"CAP-{event_id}", "custom_id": user_id}
+    }
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.processed = []
+        self.failures = {}  # event_id -> failures left
+        self.active = set()
+        self.overlaps = 0
+
+    async def __call__(self, event):
+        user_id = event["resource"]["custom_id"]
+        if user_id in self.active:
+            self.overlaps += 1
+        self.active.add(user_id)
+        try:
+            await asyncio.sleep(0.001)
+            if self.failures.get(event["id"], 0) > 0:
+                self.failures[event["id"]] -= 1
+                raise RuntimeError("Firestore unavailable")
+            self.processed.append(event["id"])
+        finally:
+            self.active.discard(user_id)
+
+
+@pytest.fixture
+def db():
+    return InMemoryFirestore()
+
+
+@pytest.fixture
+def handler():
+    return RecordingHandler()
+
+
+@pytest.fixture
+def queue(db, handler):
+    return PayPalWebhookQueue(handler, WebhookEventRepository(db), workers=4, max_attempts=3, base_backoff=0)
+
+
+@pytest.mark.asyncio
+async def test_redelivered_event_is_acknowledged_but_processed_once(queue, handler, db):
+    assert await queue.accept(make_event("WH-1")) is True
+    assert await queue.accept(make_event("WH-1")) is False
+    await queue.drain()
+
+    assert handler.processed == ["WH-1"]
+    stored = db.dump(COLLECTION)[f"{COLLECTION}/WH-1"]
+    assert stored["status"] == STATUS_PROCESSED
+    assert stored["payload"]["resource"]["custom_id"] == "user-1"
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_events_of_one_resource_keep_their_order(queue, handler):
+    events = [make_event(f"WH-{i}", user_id=f"user-{i % 3}") for i in range(30)]
+    for event in events:
+        await queue.accept(event)
+    await queue.drain()
+
+    assert handler.overlaps == 0
+    for user in range(3):
+        expected = [e["id"] for e in events if e["resource"]["custom_id"] == f"user-{user}"]
+        assert [i for i in handler.processed if i in expected] == expected
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_failures_are_retried_then_dead_lettered(queue, handler, db):
+    handler.failures = {"WH-retry": 2, "WH-dead": 10}
+
+    await queue.accept(make_event("WH-retry", user_id="a"))
+    await queue.accept(make_event("WH-dead", user_id="b"))
+    await queue.drain()
+
+    stored = db.dump(COLLECTION)
+    assert stored[f"{COLLECTION}/WH-retry"]["status"] == STATUS_PROCESSED
+    assert stored[f"{COLLECTION}/WH-retry"]["attempts"] == 3
+    assert stored[f"{COLLECTION}/WH-dead"]["status"] == STATUS_DEAD_LETTER
+    assert stored[f"{COLLECTION}/WH-dead"]["last_error"] == "Firestore unavailable"
+    assert handler.processed == ["WH-retry"]
+
+    stats = queue.stats()
+    assert stats["events"]["PAYMENT.CAPTURE.COMPLETED/dead_letter"] >= 1
+    assert stats["lag_ms"]["PAYMENT.CAPTURE.COMPLETED"]["count"] >= 2
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_recover_requeues_events_left_unprocessed(db, handler):
+    crashed = PayPalWebhookQueue(handler, WebhookEventRepository(db), workers=2)
+    await crashed.accept(make_event("WH-1"))
+    await crashed.stop()  # stopped before the worker ran
+    assert db.dump(COLLECTION)[f"{COLLECTION}/WH-1"]["status"] == STATUS_RECEIVED
+
+    restarted = PayPalWebhookQueue(handler, WebhookEventRepository(db), workers=2)
+    assert await restarted.recover() == 1
+    await restarted.drain()
+
+    assert handler.processed == ["WH-1"]
+    assert await restarted.recover() == 0
+    await restarted.stop()
+
+
+@pytest.mark.asyncio
+async def test_event_claimed_by_another_instance_is_skipped(db, handler):
+    busy = PayPalWebhookQueue(handler, WebhookEventRepository(db), workers=1)
+    await busy.accept(make_event("WH-1"))
+    await busy.stop()
+    await busy._claim("WH-1")  # the other instance is still working on it
+    assert db.dump(COLLECTION)[f"{COLLECTION}/WH-1"]["status"] == STATUS_PROCESSING
+
+    cold_start = PayPalWebhookQueue(handler, WebhookEventRepository(db), workers=1)
+    assert await cold_start.recover() == 0
+    cold_start._enqueue(make_event("WH-1"), time.monotonic())  # e.g. a stale in-memory copy
+    await cold_start.drain()
+
+    assert handler.processed == []
+    assert db.dump(COLLECTION)[f"{COLLECTION}/WH-1"]["owner"] == busy.owner
+    await cold_start.stop()
+
+
+@pytest.mark.asyncio
+async def test_expired_claim_is_recovered(db, handler):
+    crashed = PayPalWebhookQueue(handler, WebhookEventRepository(db), workers=1, lease_seconds=-1)
+    await crashed.accept(make_event("WH-1"))
+    await crashed.stop()
+    await crashed._claim("WH-1")  # claimed, then the instance died
+
+    restarted = PayPalWebhookQueue(handler, WebhookEventRepository(db), workers=1)
+    assert await restarted.recover() == 1
+    await restarted.drain()
+
+    assert handler.processed == ["WH-1"]
+    assert db.dump(COLLECTION)[f"{COLLECTION}/WH-1"]["status"] == STATUS_PROCESSED
+    await restarted.stop()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_instances_process_an_event_once(db, handler):
+    first = PayPalWebhookQueue(handler, WebhookEventRepository(db), workers=1)
+    second = PayPalWebhookQueue(handler, WebhookEventRepository(db), workers=1)
+    await first.accept(make_event("WH-1"))
+    assert await second.recover() == 1  # received, not yet claimed by the first
+
+    await asyncio.gather(first.drain(), second.drain())
+
+    assert handler.processed == ["WH-1"]
+    await first.stop()
+    await second.stop()
+
+
+@pytest.mark.asyncio
+async def test_event_without_id_is_rejected(queue):
+    with pytest.raises(ValueError):
+        await queue.accept({"event_type": "PAYMENT.CAPTURE.COMPLETED"})
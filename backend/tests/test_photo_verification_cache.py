@@ -0,0 +1,81 @@
+"""
+Tests for the content-addressed photo verification cache
+"""
+
+import numpy as np
+import pytest
+
+from app.services.cv.verification_cache import (
+    PhotoVerificationCache,
+    hash_pixels,
+    pipeline_fingerprint,
+)
+
+
+def _result(score=0.8):
+    return {
+        "is_real_person": np.bool_(True),
+        "verification_score": np.float64(score),
+        "warnings": [],
+        "details": {"quality_score": 0.7},
+    }
+
+
+class TestPhotoVerificationCache:
+    """Test suite for PhotoVerificationCache"""
+
+    def test_pixel_hash_depends_on_content_and_shape(self):
+        image = np.zeros((10, 10, 3), dtype=np.uint8)
+        assert hash_pixels(image) == hash_pixels(image.copy())
+        assert hash_pixels(image) != hash_pixels(image.reshape(10, 30, 1))
+
+        other = image.copy()
+        other[0, 0, 0] = 1
+        assert hash_pixels(image) != hash_pixels(other)
+
+    def test_fingerprint_changes_with_thresholds(self):
+        base = pipeline_fingerprint("1", {"max_filter_intensity": 0.3})
+        assert base == pipeline_fingerprint("1", {"max_filter_intensity": 0.3})
+        assert base != pipeline_fingerprint("1", {"max_filter_intensity": 0.4})
+        assert base != pipeline_fingerprint("2", {"max_filter_intensity": 0.3})
+
+    def test_memory_hit_returns_native_copy(self):
+        cache = PhotoVerificationCache("fp", max_entries=4)
+        key = cache.make_key("abc", 28)
+        cache.set(key, _result())
+
+        cached = cache.get(key)
+        assert cached["is_real_person"] is True
+        assert cached["verification_score"] == pytest.approx(0.8)
+
+        cached["warnings"].append("mutated")
+        assert cache.get(key)["warnings"] == []
+        assert cache.stats()["hits"] == 2
+
+    def test_lru_eviction(self):
+        cache = PhotoVerificationCache("fp", max_entries=2)
+        for name in ("a", "b"):
+            cache.set(cache.make_key(name), _result())
+        cache.get(cache.make_key("a"))
+        cache.set(cache.make_key("c"), _result())
+
+        assert cache.get(cache.make_key("b")) is None
+        assert cache.get(cache.make_key("a")) is not None
+
+    def test_disk_tier_survives_restart(self, tmp_path):
+        cache = PhotoVerificationCache("fp", cache_dir=str(tmp_path))
+        key = cache.make_key("abc")
+        cache.set(key, _result(0.9))
+
+        restarted = PhotoVerificationCache("fp", cache_dir=str(tmp_path))
+        assert restarted.get(key)["verification_score"] == pytest.approx(0.9)
+
+    def test_fingerprint_change_invalidates(self, tmp_path):
+        cache = PhotoVerificationCache("fp1", cache_dir=str(tmp_path))
+        old_key = cache.make_key("abc")
+        cache.set(old_key, _result())
+
+        cache.set_fingerprint("fp2")
+        assert cache.stats()["entries"] == 0
+        assert cache.get(old_key) is None
+        assert cache.get(cache.make_key("abc")) is None
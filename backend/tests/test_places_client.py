@@ -0,0 +1,165 @@
+"""
+Tests for the pooled Google Places client and its geo-tile result cache
+"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.services.geo.places_client import (
+    GooglePlacesClient,
+    PlacesCache,
+    cache_key,
+    geohash_center,
+    geohash_encode,
+    radius_bucket,
+)
+
+MADRID = (40.4168, -3.7038)
+PLACE_TYPES = [
+    "cafe", "restaurant", "bar", "bakery", "shopping_mall",
+    "park", "movie_theater", "museum", "art_gallery", "book_store"
+]
+
+
+class PlacesAPI:
+    """Fake Nearby Search endpoint recording requests and peak concurrency"""
+
+    def __init__(self, delay=0.01, status="OK", failing_types=()):
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.delay = delay
+        self.status = status
+        self.failing_types = set(failing_types)
+
+    async def handler(self, request):
+        place_type = request.url.params["type"]
+        self.requests.append(request)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        if place_type in self.failing_types:
+            return httpx.Response(200, json={"status": "OVER_QUERY_LIMIT", "results": []})
+        return httpx.Response(200, json={
+            "status": self.status,
+            "results": [{"place_id": f"{place_type}-1", "name": place_type, "types": [place_type]}]
+        })
+
+    def client(self, cache=None):
+        return GooglePlacesClient("test-key", cache=cache or PlacesCache(), transport=httpx.MockTransport(self.handler))
+
+
+def test_geohash_round_trip():
+    assert geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    lat, lng = geohash_center(geohash_encode(*MADRID, 7))
+    assert abs(lat - MADRID[0]) < 0.001
+    assert abs(lng - MADRID[1]) < 0.001
+
+
+def test_nearby_locations_share_a_cache_key():
+    assert radius_bucket(1800) == 2000
+    assert cache_key(MADRID, 2000, "cafe") == cache_key((40.4170, -3.7040), 1800, "cafe")
+    assert cache_key(MADRID, 2000, "cafe") != cache_key((41.3874, 2.1686), 2000, "cafe")
+    assert cache_key(MADRID, 2000, "cafe") != cache_key(MADRID, 500, "cafe")
+
+
+@pytest.mark.asyncio
+async def test_types_are_fetched_concurrently_and_cached():
+    api = PlacesAPI()
+    client = api.client()
+
+    results = await client.nearby_many(MADRID, 2000, PLACE_TYPES)
+
+    assert list(results) == PLACE_TYPES
+    assert results["cafe"][0]["place_id"] == "cafe-1"
+    assert len(api.requests) == 10
+    assert api.max_active == 10
+    sent = api.requests[0].url.params
+    assert sent["key"] == "test-key" and sent["language"] == "es" and sent["radius"] == "2000"
+
+    # Second search a few metres away: same tiles, no requests
+    await client.nearby_many((40.4170, -3.7040), 1800, PLACE_TYPES)
+    assert len(api.requests) == 10
+    assert client.stats()["cache"]["hits"] == 10
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_requests_are_coalesced():
+    api = PlacesAPI(delay=0.05)
+    client = api.client()
+
+    responses = await asyncio.gather(*(client.nearby(MADRID, 2000, "cafe") for _ in range(5)))
+
+    assert len(api.requests) == 1
+    assert all(response == responses[0] for response in responses)
+    assert client.stats()["inflight"] == 0
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_errors_are_not_cached():
+    api = PlacesAPI(failing_types={"bar"})
+    client = api.client()
+
+    results = await client.nearby_many(MADRID, 2000, ["cafe", "bar"])
+    assert results["bar"] == []
+    assert results["cafe"]
+
+    api.failing_types.clear()
+    assert (await client.nearby(MADRID, 2000, "bar"))[0]["place_id"] == "bar-1"
+    assert len(api.requests) == 3
+
+    with pytest.raises(RuntimeError):
+        await PlacesAPI(status="REQUEST_DENIED").client().nearby(MADRID, 2000, "cafe")
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_zero_results_are_cached():
+    api = PlacesAPI(status="ZERO_RESULTS")
+    client = api.client()
+
+    await client.nearby(MADRID, 2000, "museum")
+    await client.nearby(MADRID, 2000, "museum")
+
+    assert len(api.requests) == 1
+    await client.aclose()
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    key = cache_key(MADRID, 2000, "cafe")
+    PlacesCache(cache_dir=str(tmp_path)).set(key, [{"place_id": "a"}])
+
+    restarted = PlacesCache(cache_dir=str(tmp_path))
+
+    assert restarted.get(key) == [{"place_id": "a"}]
+    assert restarted.stats()["entries"] == 1
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_expired_entries_are_dropped(tmp_path, monkeypatch):
+    cache = PlacesCache(ttl=60, max_entries=2, cache_dir=str(tmp_path))
+    key = cache_key(MADRID, 2000, "cafe")
+    cache.set(key, [{"place_id": "a"}])
+
+    later = time.time() + 61
+    monkeypatch.setattr(time, "time", lambda: later)
+
+    assert cache.get(key) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_memory_tier_is_bounded():
+    cache = PlacesCache(max_entries=2)
+    keys = [cache_key(MADRID, 2000, place_type) for place_type in ("cafe", "bar", "park")]
+    for key in keys:
+        cache.set(key, [])
+
+    assert cache.stats()["entries"] == 2
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) == []
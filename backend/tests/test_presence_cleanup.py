@@ -0,0 +1,161 @@
+"""
+Tests for the paged, checkpointed presence-cleanup job
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.services.firestore.presence_cleanup import PresenceCleanupJob
+
+
+class FakeSnapshot:
+    def __init__(self, ref, data):
+        self.reference = ref
+        self.id = ref.id
+        self._data = data
+        self.exists = data is not None
+
+    def get(self, field):
+        return self._data.get(field)
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocRef:
+    def __init__(self, db, collection, doc_id):
+        self.db = db
+        self.collection = collection
+        self.id = doc_id
+
+    def get(self):
+        return FakeSnapshot(self, self.db.data[self.collection].get(self.id))
+
+    def set(self, data):
+        self.db.data[self.collection][self.id] = dict(data)
+
+
+class FakeQuery:
+    def __init__(self, db, collection, filters=(), limit=None, after=None):
+        self.db = db
+        self.collection = collection
+        self.filters = list(filters)
+        self._limit = limit
+        self._after = after
+
+    def where(self, field, op, value):
+        return FakeQuery(self.db, self.collection, self.filters + [(field, op, value)], self._limit, self._after)
+
+    def order_by(self, field):
+        return self
+
+    def limit(self, n):
+        return FakeQuery(self.db, self.collection, self.filters, n, self._after)
+
+    def start_after(self, values):
+        key = (values["lastActivity"], values["__name__"].id)
+        return FakeQuery(self.db, self.collection, self.filters, self._limit, key)
+
+    def get(self):
+        self.db.queries += 1
+        docs = []
+        for doc_id, data in self.db.data[self.collection].items():
+            if all(
+                (data.get(f) == v) if op == "==" else (data.get(f) is not None and data.get(f) < v)
+                for f, op, v in self.filters
+            ):
+                docs.append((data["lastActivity"], doc_id))
+        docs.sort()
+        if self._after is not None:
+            docs = [d for d in docs if d > self._after]
+        return [
+            FakeSnapshot(FakeDocRef(self.db, self.collection, doc_id), self.db.data[self.collection][doc_id])
+            for _, doc_id in docs[:self._limit]
+        ]
+
+
+class FakeCollection(FakeQuery):
+    def document(self, doc_id):
+        return FakeDocRef(self.db, self.collection, doc_id)
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.updates = []
+
+    def update(self, ref, data):
+        self.updates.append((ref, data))
+
+    def commit(self):
+        self.db.commits += 1
+        if self.db.fail_on_commit is not None and self.db.commits == self.db.fail_on_commit:
+            raise ConnectionError("firestore unavailable")
+        for ref, data in self.updates:
+            self.db.data[ref.collection][ref.id].update(data)
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.data = {"users": {}, "jobs": {}}
+        self.commits = 0
+        self.queries = 0
+        self.fail_on_commit = None
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+@pytest.fixture
+def db():
+    db = FakeFirestore()
+    now = datetime.now(timezone.utc)
+    for i in range(1200):
+        db.data["users"][f"stale{i:04d}"] = {"isOnline": True, "lastActivity": now - timedelta(hours=2, seconds=i)}
+    for i in range(10):
+        db.data["users"][f"active{i}"] = {"isOnline": True, "lastActivity": now}
+    db.data["users"]["offline"] = {"isOnline": False, "lastActivity": now - timedelta(days=1)}
+    return db
+
+
+def _online(db):
+    return sum(1 for data in db.data["users"].values() if data["isOnline"])
+
+
+class TestPresenceCleanupJob:
+    """Test suite for PresenceCleanupJob"""
+
+    @pytest.mark.asyncio
+    async def test_marks_only_inactive_users(self, db):
+        job = PresenceCleanupJob(db, page_size=500, max_in_flight=4)
+
+        stats = await job.run()
+
+        assert stats["status"] == "completed"
+        assert stats["updated"] == 1200
+        assert stats["pages"] == 3
+        assert _online(db) == 10
+        assert db.data["jobs"]["presence_cleanup"]["status"] == "completed"
+
+    @pytest.mark.asyncio
+    async def test_resumes_from_checkpoint_after_failure(self, db):
+        db.fail_on_commit = 2
+        job = PresenceCleanupJob(db, page_size=300, max_in_flight=1, commit_retries=1)
+
+        with pytest.raises(RuntimeError):
+            await job.run()
+        checkpoint = db.data["jobs"]["presence_cleanup"]
+        assert checkpoint["status"] == "failed"
+        assert 0 < _online(db) - 10 < 1200
+        assert checkpoint["processed"] == 1200 - (_online(db) - 10)
+
+        db.fail_on_commit = None
+        stats = await job.run()
+
+        assert stats["resumed"] is True
+        assert stats["processed"] == 1200
+        assert _online(db) == 10
@@ -0,0 +1,117 @@
+"""
+Tests for the distributed rate limiter
+"""
+
+import pytest
+
+from app.services.security.rate_limiter import (
+    DistributedRateLimiter,
+    InMemoryRateLimitStore,
+    parse_rate,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingStore(InMemoryRateLimitStore):
+    """Shared-store fake that counts round-trips"""
+
+    def __init__(self, clock):
+        super().__init__(clock)
+        self.calls = 0
+
+    async def acquire(self, key, limit, period, requested):
+        self.calls += 1
+        return await super().acquire(key, limit, period, requested)
+
+
+class FailingStore:
+    async def acquire(self, key, limit, period, requested):
+        raise ConnectionError("redis down")
+
+
+class TestDistributedRateLimiter:
+    """Test suite for DistributedRateLimiter"""
+
+    def test_parse_rate(self):
+        assert parse_rate("5/minute") == (5, 60)
+        assert parse_rate("200/hour") == (200, 3600)
+        assert parse_rate("10/5minutes") == (10, 300)
+        with pytest.raises(ValueError):
+            parse_rate("lots")
+
+    @pytest.mark.asyncio
+    async def test_limit_enforced_and_recovers(self):
+        clock = FakeClock()
+        limiter = DistributedRateLimiter(InMemoryRateLimitStore(clock), local_fraction=0.1, clock=clock)
+
+        results = [await limiter.hit("auth:user:1", 5, 60) for _ in range(6)]
+
+        assert [r.allowed for r in results] == [True] * 5 + [False]
+        assert results[-1].retry_after == pytest.approx(12.0)
+
+        clock.now += 12
+        assert (await limiter.hit("auth:user:1", 5, 60)).allowed
+
+    @pytest.mark.asyncio
+    async def test_local_fast_path_batches_store_calls(self):
+        clock = FakeClock()
+        store = CountingStore(clock)
+        limiter = DistributedRateLimiter(store, local_fraction=0.1, clock=clock)
+
+        for _ in range(100):
+            assert (await limiter.hit("search:user:1", 100, 60)).allowed
+
+        assert store.calls == 10
+        assert not (await limiter.hit("search:user:1", 100, 60)).allowed
+
+    @pytest.mark.asyncio
+    async def test_workers_share_the_budget(self):
+        clock = FakeClock()
+        store = InMemoryRateLimitStore(clock)
+        workers = [DistributedRateLimiter(store, local_fraction=0.1, clock=clock) for _ in range(4)]
+
+        allowed = 0
+        for i in range(200):
+            allowed += (await workers[i % 4].hit("upload:user:1", 50, 60)).allowed
+
+        assert allowed == 50
+
+    @pytest.mark.asyncio
+    async def test_keys_are_independent(self):
+        limiter = DistributedRateLimiter(local_fraction=0.1)
+
+        for _ in range(5):
+            await limiter.hit("auth:user:1", 5, 60)
+
+        assert not (await limiter.hit("auth:user:1", 5, 60)).allowed
+        assert (await limiter.hit("auth:user:2", 5, 60)).allowed
+
+    @pytest.mark.asyncio
+    async def test_store_failure_falls_back_to_local_limits(self):
+        limiter = DistributedRateLimiter(FailingStore(), local_fraction=0.1)
+
+        results = [await limiter.hit("auth:ip:1.2.3.4", 5, 60) for _ in range(6)]
+
+        assert [r.allowed for r in results] == [True] * 5 + [False]
+        assert limiter.stats()["store_errors"] == 6
+
+    @pytest.mark.asyncio
+    async def test_memory_store_drops_idle_buckets(self):
+        clock = FakeClock()
+        store = InMemoryRateLimitStore(clock, max_keys=100)
+
+        for ip in range(100):
+            await store.acquire(f"api:ip:{ip}", 10, 60, 1)
+        clock.now += 60  # every bucket is full again
+        await store.acquire("api:ip:new", 10, 60, 1)
+
+        assert list(store._tat) == ["api:ip:new"]
+        # A pruned key behaves like a fresh one
+        assert await store.acquire("api:ip:1", 10, 60, 10) == (10, 0.0)
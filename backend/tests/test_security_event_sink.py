@@ -0,0 +1,130 @@
+"""
+Tests for the batched security/audit event sink
+"""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app.services.security.event_sink import SecurityEventSink
+from app.services.security.security_logger import SecurityEventType, SecurityLogger, SecuritySeverity
+
+
+class FakeDocRef:
+    def __init__(self, path):
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+
+class FakeBatch:
+    def __init__(self, client):
+        self.client = client
+        self.writes = []
+
+    def set(self, ref, data):
+        self.writes.append((ref.path, data))
+
+    def commit(self):
+        if self.client.fail:
+            raise ConnectionError("firestore unavailable")
+        self.client.commits.append(self.writes)
+
+
+class FakeClient:
+    def __init__(self):
+        self.commits = []
+        self.fail = False
+        self._next_id = 0
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def document(self, path):
+        return FakeDocRef(path)
+
+    def collection(self, name):
+        client = self
+
+        class _Collection:
+            def document(self):
+                client._next_id += 1
+                return FakeDocRef(f"{name}/doc{client._next_id}")
+
+        return _Collection()
+
+
+@pytest.fixture
+def client():
+    return FakeClient()
+
+
+class TestSecurityEventSink:
+    """Test suite for SecurityEventSink"""
+
+    @pytest.mark.asyncio
+    async def test_events_written_in_batches(self, client):
+        sink = SecurityEventSink(lambda: client, batch_size=500)
+        for i in range(1200):
+            sink.submit(client.document(f"security_logs/e{i}"), {"n": i})
+
+        assert await sink.flush() == 1200
+        assert [len(batch) for batch in client.commits] == [500, 500, 200]
+
+    @pytest.mark.asyncio
+    async def test_background_writer_flushes_on_interval(self, client):
+        sink = SecurityEventSink(lambda: client, flush_interval=0.01)
+        sink.start()
+        sink.submit(client.document("audit_logs/a1"), {"action": "x"})
+
+        await asyncio.sleep(0.05)
+        await sink.stop()
+
+        assert client.commits == [[("audit_logs/a1", {"action": "x"})]]
+
+    @pytest.mark.asyncio
+    async def test_overflow_dropped_without_spill(self, client):
+        sink = SecurityEventSink(lambda: client, max_queue_size=2)
+        before = sink.stats().get("dropped", 0)
+        for i in range(5):
+            sink.submit(client.document(f"security_logs/e{i}"), {})
+
+        assert sink.stats()["queue_size"] == 2
+        assert sink.stats()["dropped"] - before == 3
+
+    @pytest.mark.asyncio
+    async def test_failed_batch_spilled_and_replayed(self, client, tmp_path):
+        spill = tmp_path / "spill.jsonl"
+        sink = SecurityEventSink(lambda: client, spill_path=str(spill))
+        when = datetime(2024, 1, 1, 12, 0)
+        sink.submit(client.document("security_logs/e1"), {"timestamp": when})
+
+        client.fail = True
+        assert await sink.flush() == 0
+        assert spill.exists()
+
+        client.fail = False
+        await sink.flush()  # replays the spilled event into the queue
+        assert await sink.flush() == 1
+        assert client.commits == [[("security_logs/e1", {"timestamp": when})]]
+        assert not spill.exists()
+
+
+class TestSecurityLoggerSink:
+    """SecurityLogger returns the document id without waiting for the write"""
+
+    @pytest.mark.asyncio
+    async def test_log_event_enqueues(self, client, monkeypatch):
+        from app.services.security import security_logger as module
+        monkeypatch.setattr(module, "db", client)
+        sink = SecurityEventSink(lambda: client)
+        security_logger = SecurityLogger(sink=sink)
+
+        doc_id = await security_logger.log_event(
+            SecurityEventType.LOGIN_FAILED, SecuritySeverity.MEDIUM, user_id="u1", success=False
+        )
+
+        assert doc_id == "doc1"
+        assert client.commits == []
+        await sink.flush()
+        assert client.commits[0][0][1]["event_type"] == "login_failed"
@@ -0,0 +1,61 @@
+"""
+Tests for the storage I/O layer (local backend)
+"""
+
+import asyncio
+import threading
+import time
+from io import BytesIO
+
+import pytest
+
+from app.services.storage.storage_io import LocalStorageBackend, StorageIO
+
+
+class SlowBackend(LocalStorageBackend):
+    """Local backend whose uploads block, like a network round-trip"""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.threads = set()
+
+    def upload(self, *args, **kwargs):
+        self.threads.add(threading.get_ident())
+        time.sleep(0.05)
+        return super().upload(*args, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_local_upload_stream_and_bytes(tmp_path):
+    io = StorageIO(LocalStorageBackend(str(tmp_path), base_url="https://cdn.test"), max_workers=2)
+
+    url = await io.upload("profile_photos/uid/avatar", BytesIO(b"original"), content_type="image/jpeg")
+    await io.upload("profile_photos/uid/avatar_96.webp", b"thumb", content_type="image/webp")
+
+    assert url == "https://cdn.test/profile_photos/uid/avatar"
+    assert (tmp_path / "profile_photos" / "uid" / "avatar").read_bytes() == b"original"
+    assert (tmp_path / "profile_photos" / "uid" / "avatar_96.webp").read_bytes() == b"thumb"
+
+    await io.delete("profile_photos/uid/avatar")
+    assert not (tmp_path / "profile_photos" / "uid" / "avatar").exists()
+
+
+@pytest.mark.asyncio
+async def test_local_backend_rejects_path_traversal(tmp_path):
+    io = StorageIO(LocalStorageBackend(str(tmp_path)), max_workers=1)
+
+    with pytest.raises(ValueError):
+        await io.upload("../outside", b"data")
+
+
+@pytest.mark.asyncio
+async def test_uploads_run_concurrently_off_the_event_loop(tmp_path):
+    backend = SlowBackend(str(tmp_path))
+    io = StorageIO(backend, max_workers=4)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(io.upload(f"f{i}", b"x") for i in range(4)))
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.15
+    assert threading.get_ident() not in backend.threads
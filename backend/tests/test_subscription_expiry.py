@@ -0,0 +1,163 @@
+"""
+Tests for the bulk subscription expiry pipeline
+"""
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.firestore.subscription_expiry import SubscriptionExpiryPipeline
+
+
+class FakeSnapshot:
+    def __init__(self, ref, data):
+        self.reference = ref
+        self.id = ref.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeRef:
+    def __init__(self, db, collection, doc_id):
+        self.db, self.collection, self.id = db, collection, doc_id
+
+
+class FakeQuery:
+    def __init__(self, db, collection, filters=(), limit=None, after=None):
+        self.db, self.collection = db, collection
+        self.filters, self._limit, self._after = list(filters), limit, after
+
+    def where(self, field, op, value):
+        return FakeQuery(self.db, self.collection, self.filters + [(field, op, value)], self._limit, self._after)
+
+    def order_by(self, field):
+        return self
+
+    def limit(self, n):
+        return FakeQuery(self.db, self.collection, self.filters, n, self._after)
+
+    def start_after(self, snapshot):
+        return FakeQuery(self.db, self.collection, self.filters, self._limit, snapshot.id)
+
+    def document(self, doc_id):
+        return FakeRef(self.db, self.collection, doc_id)
+
+    def get(self):
+        def matches(data):
+            return all(
+                data.get(f) == v if op == "==" else data.get(f) < v
+                for f, op, v in self.filters
+            )
+        ids = sorted(i for i, d in self.db.data[self.collection].items() if matches(d))
+        if self._after is not None:
+            ids = [i for i in ids if i > self._after]
+        return [FakeSnapshot(self.document(i), self.db.data[self.collection][i]) for i in ids[:self._limit]]
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db, self.writes = db, []
+
+    def update(self, ref, data):
+        self.writes.append((ref, data))
+
+    def commit(self):
+        assert len(self.writes) <= 500
+        self.db.commits += 1
+        for ref, data in self.writes:
+            self.db.data[ref.collection][ref.id].update(data)
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.data = {"subscriptions": {}, "users": {}}
+        self.commits = 0
+
+    def collection(self, name):
+        return FakeQuery(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def get_all(self, refs):
+        return [FakeSnapshot(ref, self.data[ref.collection].get(ref.id)) for ref in refs]
+
+
+class RateLimited(Exception):
+    http_response = SimpleNamespace(status_code=429)
+
+
+class FakeAuth:
+    def __init__(self, failures=None):
+        self.claims = {}
+        self.failures = dict(failures or {})
+        self.calls = 0
+
+    def get_user(self, uid):
+        self.calls += 1
+        if self.failures.get(uid):
+            self.failures[uid] -= 1
+            raise RateLimited("quota exceeded")
+        return SimpleNamespace(custom_claims=self.claims.get(uid, {"role": "user"}))
+
+    def set_custom_user_claims(self, uid, claims):
+        self.claims[uid] = claims
+
+
+@pytest.fixture
+def db():
+    db = FakeFirestore()
+    past = datetime.now() - timedelta(days=1)
+    for i in range(1200):
+        db.data["subscriptions"][f"s{i:04d}"] = {"user_id": f"u{i:04d}", "status": "active", "end_date": past}
+        db.data["users"][f"u{i:04d}"] = {"subscription_id": f"s{i:04d}"}
+    # Renewed user: the expired subscription is no longer the current one
+    db.data["users"]["u0000"]["subscription_id"] = "renewed"
+    db.data["subscriptions"]["future"] = {
+        "user_id": "u9999", "status": "active", "end_date": datetime.now() + timedelta(days=10)
+    }
+    return db
+
+
+class TestSubscriptionExpiryPipeline:
+    """Test suite for SubscriptionExpiryPipeline"""
+
+    @pytest.mark.asyncio
+    async def test_expires_in_batches_and_updates_claims(self, db):
+        auth = FakeAuth(failures={"u0005": 2})
+        pipeline = SubscriptionExpiryPipeline(db, auth, page_size=500, base_backoff=0.001)
+
+        stats = await pipeline.run()
+
+        assert stats["expired"] == 1200
+        assert stats["claims_updated"] == 1199
+        assert db.data["subscriptions"]["future"]["status"] == "active"
+        assert db.data["users"]["u0000"].get("subscription_status") is None
+        assert "u0000" not in auth.claims
+        assert auth.claims["u0005"] == {
+            "role": "user", "hasActiveSubscription": False, "subscriptionUpdatedAt": auth.claims["u0005"]["subscriptionUpdatedAt"]
+        }
+        assert not any(s.get("claims_pending") for s in db.data["subscriptions"].values())
+        assert db.commits < 20
+
+    @pytest.mark.asyncio
+    async def test_pending_claims_retried_on_next_run(self, db):
+        auth = FakeAuth(failures={"u0007": 10})
+        pipeline = SubscriptionExpiryPipeline(db, auth, max_retries=1, base_backoff=0.001)
+
+        first = await pipeline.run()
+        assert first["claims_failed"] == 1
+        assert db.data["subscriptions"]["s0007"]["claims_pending"] is True
+
+        auth.failures.clear()
+        auth.calls = 0
+        second = await pipeline.run()
+
+        assert second["expired"] == 0
+        assert second["claims_updated"] == 1
+        assert auth.calls == 1
+        assert db.data["subscriptions"]["s0007"]["claims_pending"] is False
@@ -0,0 +1,114 @@
+"""
+Tests for the verified ID-token cache
+"""
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from firebase_admin import auth
+
+from app.services.auth.token_cache import VerifiedTokenCache
+
+
+class FakeVerifier:
+    """verify_id_token stand-in that counts calls"""
+
+    def __init__(self, claims, delay=0.0):
+        self.claims = claims
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, token, check_revoked=False):
+        with self._lock:
+            self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return dict(self.claims)
+
+
+def _claims(uid="user-1", ttl=3600):
+    now = time.time()
+    return {"uid": uid, "iat": now - 10, "exp": now + ttl}
+
+
+def _cache(verifier, get_user=None, interval=300):
+    return VerifiedTokenCache(
+        max_entries=8,
+        revocation_check_interval=interval,
+        max_workers=4,
+        verify_fn=verifier,
+        get_user_fn=get_user or (lambda uid: SimpleNamespace(tokens_valid_after_timestamp=0, disabled=False)),
+    )
+
+
+class TestVerifiedTokenCache:
+    """Test suite for VerifiedTokenCache"""
+
+    @pytest.mark.asyncio
+    async def test_warm_hit_skips_verification(self):
+        verifier = FakeVerifier(_claims())
+        cache = _cache(verifier)
+
+        first = await cache.verify("token-a")
+        second = await cache.verify("token-a")
+
+        assert first["uid"] == second["uid"] == "user-1"
+        assert verifier.calls == 1
+        assert cache.stats()["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_expired_entry_is_reverified(self):
+        verifier = FakeVerifier(_claims(ttl=-1))
+        cache = _cache(verifier)
+
+        await cache.verify("token-a")
+        await cache.verify("token-a")
+
+        assert verifier.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_mark_revoked_rejects_cached_token(self):
+        cache = _cache(FakeVerifier(_claims()))
+        await cache.verify("token-a")
+
+        cache.mark_revoked("user-1")
+
+        with pytest.raises(auth.RevokedIdTokenError):
+            await cache.verify("token-a")
+
+    @pytest.mark.asyncio
+    async def test_token_issued_in_the_revocation_second_is_valid(self):
+        cache = _cache(FakeVerifier({**_claims(), "iat": int(time.time())}))
+
+        cache.mark_revoked("user-1")
+        await cache.verify("token-b")  # re-login right after the revocation
+
+        assert (await cache.verify("token-b"))["uid"] == "user-1"
+        assert cache.stats()["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_background_check_picks_up_disabled_user(self):
+        get_user = lambda uid: SimpleNamespace(tokens_valid_after_timestamp=0, disabled=True)
+        cache = _cache(FakeVerifier(_claims()), get_user=get_user, interval=0)
+        await cache.verify("token-a")
+
+        # Stale state: the hit is served and a background check is scheduled
+        await cache.verify("token-a")
+        await asyncio.gather(*cache._background_tasks)
+
+        with pytest.raises(auth.UserDisabledError):
+            await cache.verify("token-a")
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_are_coalesced(self):
+        verifier = FakeVerifier(_claims(), delay=0.05)
+        cache = _cache(verifier)
+
+        results = await asyncio.gather(*(cache.verify("token-a") for _ in range(10)))
+
+        assert all(r["uid"] == "user-1" for r in results)
+        assert verifier.calls == 1